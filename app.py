@@ -1,11 +1,11 @@
+import os
+
 import streamlit as st
-import pandas as pd
-from database import DatabaseManager
-import plotly.express as px
-import plotly.graph_objects as go
-from modules.movimentacao import show_movimentacao_page
-from modules.equipamentos import show_equipamentos_page
-from datetime import datetime, date
+from database import DatabaseManager, ATOR_PADRAO, definir_ator
+from profiler import iniciar_perfil, secao, mostrar_perfil
+
+# pandas/plotly e os módulos de página são importados sob demanda em cada página
+# para que o primeiro acesso após o app "dormir" não pague por bibliotecas que não usa
 
 # Configuração da página
 st.set_page_config(
@@ -15,16 +15,51 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Sidebar para navegação
+st.sidebar.title("🏗️ CMMS Andaimes")
+st.sidebar.markdown("---")
+
 # Inicializar banco de dados
 @st.cache_resource
 def init_database():
     return DatabaseManager()
 
-db = init_database()
+# Modo com um banco por cliente/grupo (shards), ativado por CMMS_SHARDS_DIR
+@st.cache_resource
+def init_roteador():
+    from shards import RoteadorShards
+    return RoteadorShards.do_ambiente()
 
-# Sidebar para navegação
-st.sidebar.title("🏗️ CMMS Andaimes")
-st.sidebar.markdown("---")
+roteador = init_roteador()
+shards = roteador.get_shards() if roteador else []
+if shards:
+    # A sessão trabalha sobre o banco do cliente/grupo escolhido
+    shard_nomes = {s['nome']: s['id'] for s in shards}
+    shard_id = shard_nomes[st.sidebar.selectbox("🗄️ Base:", list(shard_nomes), key="shard_selector")]
+    db = roteador.db(shard_id)
+else:
+    db = init_database()
+
+# Backup online agendado (uma thread por banco e por processo), ativado por CMMS_BACKUP_INTERVALO_H
+@st.cache_resource
+def iniciar_backups(db_path, pasta):
+    from backup import AgendadorBackup
+    agendador = AgendadorBackup(db_path, float(os.environ["CMMS_BACKUP_INTERVALO_H"]), pasta)
+    agendador.start()
+    return agendador
+
+if os.environ.get("CMMS_BACKUP_INTERVALO_H"):
+    from backup import PASTA_PADRAO
+    if shards:
+        # Todos os shards e o catálogo, cada um na sua pasta: o intervalo e a retenção contam por banco
+        for caminho in [roteador.catalogo] + [roteador.db(s['id']).db_path for s in shards]:
+            iniciar_backups(caminho, os.path.join(PASTA_PADRAO, os.path.splitext(os.path.basename(caminho))[0]))
+    else:
+        iniciar_backups(db.db_path, PASTA_PADRAO)
+
+# Usuário que assina as alterações desta sessão na trilha de auditoria
+st.sidebar.text_input("🪪 Usuário:", key="usuario", placeholder=ATOR_PADRAO)
+definir_ator(st.session_state.usuario)
 
 # Seção de seleção de Cliente e Obra
 st.sidebar.subheader("🏢 Contexto Atual")
@@ -104,7 +139,8 @@ pages = {
     "Equipamentos": "equipamentos",
     "Movimentação": "movimentacao",
     "Checklists": "checklists",
-    "Relatórios": "relatorios"
+    "Relatórios": "relatorios",
+    "Faturamento": "faturamento"
 }
 
 selected_page = st.sidebar.selectbox("📍 Navegação", list(pages.keys()))
@@ -114,98 +150,113 @@ contexto = {
     'cliente_id': st.session_state.cliente_selecionado_id,
     'obra_id': st.session_state.obra_selecionada_id,
     'cliente_nome': next((c['nome'] for c in clientes if c['id'] == st.session_state.cliente_selecionado_id), None) if st.session_state.cliente_selecionado_id else None,
-    'obra_nome': next((o['nome'] for o in obras if o['id'] == st.session_state.obra_selecionada_id), None) if st.session_state.obra_selecionada_id else None
+    'obra_nome': next((o['nome'] for o in obras if o['id'] == st.session_state.obra_selecionada_id), None) if st.session_state.obra_selecionada_id else None,
+    'roteador': roteador if shards else None
 }
 
-# Dashboard principal
-if selected_page == "Dashboard":
-    st.title("📊 Dashboard - Sistema CMMS")
+# Perfil opcional de desempenho (?perfil=1 ou CMMS_PROFILE=1)
+iniciar_perfil()
+
+with secao(selected_page):
+    # Dashboard principal
+    if selected_page == "Dashboard":
+        # plotly.graph_objects dispensa o pandas: o dashboard (primeira página) não o importa
+        import plotly.graph_objects as go
+        
+        st.title("📊 Dashboard - Sistema CMMS")
     
-    # Mostrar contexto se selecionado
-    if st.session_state.obra_selecionada_id:
-        obra_atual = next(o for o in obras if o['id'] == st.session_state.obra_selecionada_id)
-        cliente_atual = next(c for c in clientes if c['id'] == obra_atual['cliente_id']) if obra_atual['cliente_id'] else None
+        # Mostrar contexto se selecionado
+        if st.session_state.obra_selecionada_id:
+            obra_atual = next(o for o in obras if o['id'] == st.session_state.obra_selecionada_id)
+            cliente_atual = next(c for c in clientes if c['id'] == obra_atual['cliente_id']) if obra_atual['cliente_id'] else None
         
-        cliente_info = f"- {cliente_atual['nome']}" if cliente_atual else ""
-        st.info(f"📊 Dashboard para: **{obra_atual['nome']}** {cliente_info}")
+            cliente_info = f"- {cliente_atual['nome']}" if cliente_atual else ""
+            st.info(f"📊 Dashboard para: **{obra_atual['nome']}** {cliente_info}")
     
-    # Métricas principais
-    col1, col2, col3, col4 = st.columns(4)
+        # Métricas principais
+        col1, col2, col3, col4 = st.columns(4)
     
-    with col1:
-        if st.session_state.obra_selecionada_id:
-            # Contar equipamentos enviados para esta obra específica
-            equipamentos_obra = db.get_equipamentos_enviados_obra(st.session_state.obra_selecionada_id)
-            total_equipamentos_obra = sum(eq.get('quantidade_enviada', 0) for eq in equipamentos_obra)
-            st.metric("Equipamentos na Obra", total_equipamentos_obra)
-        else:
-            total_equipamentos = db.get_total_equipamentos()
-            st.metric("Total de Equipamentos", total_equipamentos)
+        with col1:
+            if st.session_state.obra_selecionada_id:
+                # Contar equipamentos enviados para esta obra específica
+                equipamentos_obra = db.get_equipamentos_enviados_obra(st.session_state.obra_selecionada_id)
+                total_equipamentos_obra = sum(eq.get('quantidade_enviada', 0) for eq in equipamentos_obra)
+                st.metric("Equipamentos na Obra", total_equipamentos_obra)
+            else:
+                total_equipamentos = db.get_total_equipamentos()
+                st.metric("Total de Equipamentos", total_equipamentos)
     
-    with col2:
-        if st.session_state.obra_selecionada_id:
-            # Tipos de equipamentos na obra
-            tipos_obra = len(db.get_equipamentos_enviados_obra(st.session_state.obra_selecionada_id))
-            st.metric("Tipos de Equipamentos", tipos_obra)
-        else:
-            equipamentos_enviados = db.get_equipamentos_by_status("enviado")
-            st.metric("Equipamentos Enviados", len(equipamentos_enviados))
+        with col2:
+            if st.session_state.obra_selecionada_id:
+                # Tipos de equipamentos na obra
+                tipos_obra = len(db.get_equipamentos_enviados_obra(st.session_state.obra_selecionada_id))
+                st.metric("Tipos de Equipamentos", tipos_obra)
+            else:
+                equipamentos_enviados = db.get_equipamentos_by_status("enviado")
+                st.metric("Equipamentos Enviados", len(equipamentos_enviados))
     
-    with col3:
-        equipamentos_manutencao = db.get_equipamentos_by_status("manutencao")
-        st.metric("Em Manutenção", len(equipamentos_manutencao))
+        with col3:
+            equipamentos_manutencao = db.get_equipamentos_by_status("manutencao")
+            st.metric("Em Manutenção", len(equipamentos_manutencao))
     
-    with col4:
-        total_clientes = db.get_total_clientes()
-        st.metric("Total de Clientes", total_clientes)
+        with col4:
+            total_clientes = db.get_total_clientes()
+            st.metric("Total de Clientes", total_clientes)
     
-    st.markdown("---")
+        st.markdown("---")
     
-    # Gráficos
-    col1, col2 = st.columns(2)
+        # Gráficos
+        col1, col2 = st.columns(2)
     
-    with col1:
-        st.subheader("Status dos Equipamentos")
-        status_data = db.get_equipamentos_status_summary()
-        if status_data:
-            df_status = pd.DataFrame(status_data)
-            fig = px.pie(df_status, values='quantidade', names='status', 
-                        title="Distribuição por Status")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("Nenhum equipamento cadastrado ainda")
+        with col1:
+            st.subheader("Status dos Equipamentos")
+            status_data = db.get_equipamentos_status_summary()
+            if status_data:
+                fig = go.Figure(go.Pie(values=[s['quantidade'] for s in status_data],
+                                       labels=[s['status'] for s in status_data]))
+                fig.update_layout(title="Distribuição por Status")
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Nenhum equipamento cadastrado ainda")
     
-    with col2:
-        st.subheader("Movimentações Recentes")
-        movimentacoes = db.get_recent_movimentacoes(10)
-        if movimentacoes:
-            df_mov = pd.DataFrame(movimentacoes)
-            st.dataframe(df_mov, use_container_width=True)
-        else:
-            st.info("Nenhuma movimentação registrada ainda")
-
-# Importar módulos
-elif selected_page == "Clientes":
-    from modules.clientes import show_clientes_page
-    show_clientes_page(db, contexto)
-
-elif selected_page == "Obras":
-    from modules.obras import show_obras_page
-    show_obras_page(db, contexto)
-
-elif selected_page == "Equipamentos":
-    show_equipamentos_page(db, contexto)
-
-elif selected_page == "Movimentação":
-    show_movimentacao_page(db, contexto)
-
-elif selected_page == "Checklists":
-    from modules.checklists import show_checklists_page
-    show_checklists_page(db, contexto)
-
-elif selected_page == "Relatórios":
-    from modules.relatorios import show_relatorios_page
-    show_relatorios_page(db, contexto)
+        with col2:
+            st.subheader("Movimentações Recentes")
+            movimentacoes = db.get_recent_movimentacoes(10)
+            if movimentacoes:
+                st.dataframe(movimentacoes, use_container_width=True)
+            else:
+                st.info("Nenhuma movimentação registrada ainda")
+
+    # Importar módulos
+    elif selected_page == "Clientes":
+        from modules.clientes import show_clientes_page
+        show_clientes_page(db, contexto)
+
+    elif selected_page == "Obras":
+        from modules.obras import show_obras_page
+        show_obras_page(db, contexto)
+
+    elif selected_page == "Equipamentos":
+        from modules.equipamentos import show_equipamentos_page
+        show_equipamentos_page(db, contexto)
+
+    elif selected_page == "Movimentação":
+        from modules.movimentacao import show_movimentacao_page
+        show_movimentacao_page(db, contexto)
+
+    elif selected_page == "Checklists":
+        from modules.checklists import show_checklists_page
+        show_checklists_page(db, contexto)
+
+    elif selected_page == "Relatórios":
+        from modules.relatorios import show_relatorios_page
+        show_relatorios_page(db, contexto)
+
+    elif selected_page == "Faturamento":
+        from modules.faturamento import show_faturamento_page
+        show_faturamento_page(db, contexto)
+
+mostrar_perfil()
 
 # Footer
 st.sidebar.markdown("---")
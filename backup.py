@@ -0,0 +1,303 @@
+"""Backup online do banco com a API de backup incremental do SQLite.
+
+A cópia é feita em passos de poucas páginas com uma pausa entre eles. Em modo WAL (padrão do
+DatabaseManager) ela lê de um snapshot: quem grava nunca espera e a cópia não recomeça. Cada backup é
+verificado (integrity_check), comprimido com gzip e descrito em um manifesto JSON com o sha256 do banco;
+a política de retenção mantém os mais recentes e um por dia.
+
+    python backup.py                      # um backup agora
+    python backup.py --agendar 6          # a cada 6 horas
+    python backup.py --verificar backups/cmms_andaimes-20260101-030000.db.gz
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Configuração padrão (pode ser sobrescrita por variáveis de ambiente)
+PASTA_PADRAO = os.environ.get("CMMS_BACKUP_DIR", "backups")
+PAGINAS_POR_PASSO = int(os.environ.get("CMMS_BACKUP_PAGINAS", "256"))
+PAUSA_PADRAO_MS = float(os.environ.get("CMMS_BACKUP_PAUSA_MS", "5"))
+MANTER_PADRAO = int(os.environ.get("CMMS_BACKUP_MANTER", "7"))
+DIAS_PADRAO = int(os.environ.get("CMMS_BACKUP_DIAS", "30"))
+# Sem WAL a cópia recomeça a cada escrita de outra conexão; depois disso ela é feita em um passo só
+MAXIMO_REINICIOS = 20
+BLOCO = 1024 * 1024
+
+
+class BackupReiniciado(Exception):
+    pass
+
+
+def _copiar_em_passos(origem, destino, paginas, pausa):
+    """Copia o banco em passos de `paginas` páginas; retorna (passos, reinícios)"""
+    estado = {"passos": 0, "reinicios": 0, "restantes": None}
+
+    def progresso(status, restantes, total):
+        estado["passos"] += 1
+        if estado["restantes"] is not None and restantes > estado["restantes"]:
+            estado["reinicios"] += 1
+            if estado["reinicios"] > MAXIMO_REINICIOS:
+                raise BackupReiniciado()
+        estado["restantes"] = restantes
+        if pausa:
+            time.sleep(pausa)
+
+    origem.backup(destino, pages=paginas, progress=progresso)
+    return estado["passos"], estado["reinicios"]
+
+
+def _comprimir(caminho, destino):
+    """gzip do arquivo em blocos; retorna o sha256 do conteúdo original"""
+    resumo = hashlib.sha256()
+    with open(caminho, "rb") as entrada, gzip.open(destino, "wb", compresslevel=6) as saida:
+        while bloco := entrada.read(BLOCO):
+            resumo.update(bloco)
+            saida.write(bloco)
+    return resumo.hexdigest()
+
+
+def caminho_manifesto(caminho):
+    """backups/x.db.gz (ou x.db) -> backups/x.json"""
+    return re.sub(r"\.db(\.gz)?$", "", caminho) + ".json"
+
+
+def verificar_integridade(caminho, rapido=False):
+    """Resultado de PRAGMA integrity_check (ou quick_check) do banco: 'ok' se íntegro"""
+    # immutable: arquivo parado, sem trava nem -shm/-wal ao lado dele
+    conn = sqlite3.connect(f"file:{caminho}?mode=ro&immutable=1", uri=True)
+    try:
+        linhas = conn.execute("PRAGMA quick_check" if rapido else "PRAGMA integrity_check").fetchall()
+        return "; ".join(linha[0] for linha in linhas)
+    finally:
+        conn.close()
+
+
+def fazer_backup(db_path, pasta=PASTA_PADRAO, paginas=PAGINAS_POR_PASSO, pausa_ms=PAUSA_PADRAO_MS, comprimir=True,
+                 verificar=True, manter=MANTER_PADRAO, dias=DIAS_PADRAO):
+    """Backup online de `db_path` em `pasta`; retorna o manifesto (também gravado em <backup>.json).
+
+    Um backup que falha na verificação de integridade é descartado e gera RuntimeError.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    inicio = time.perf_counter()
+    criado_em = datetime.now()
+    nome = base = f"{os.path.splitext(os.path.basename(db_path))[0]}-{criado_em:%Y%m%d-%H%M%S}"
+    sufixo = 1
+    while os.path.exists(os.path.join(pasta, f"{nome}.json")):
+        sufixo += 1
+        nome = f"{base}_{sufixo}"
+    parcial = os.path.join(pasta, f"{nome}.db.parcial")
+
+    origem = sqlite3.connect(db_path)
+    destino = sqlite3.connect(parcial)
+    try:
+        wal = origem.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if wal:
+            # Snapshot de leitura: as escritas seguem no WAL e não alteram o que está sendo copiado
+            origem.execute("BEGIN")
+            origem.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        inicio_copia = time.perf_counter()
+        try:
+            passos, reinicios = _copiar_em_passos(origem, destino, paginas, pausa_ms / 1000)
+        except BackupReiniciado:
+            passos, reinicios = 1, MAXIMO_REINICIOS + 1
+            origem.backup(destino)
+        if wal:
+            origem.rollback()
+        copia_s = round(time.perf_counter() - inicio_copia, 2)
+        versao_schema = destino.execute("PRAGMA user_version").fetchone()[0]
+        paginas_total = destino.execute("PRAGMA page_count").fetchone()[0]
+        # A cópia herda o modo WAL da origem; o backup fica autocontido em um único arquivo
+        # (o DatabaseManager volta para WAL ao abrir um banco restaurado)
+        destino.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        destino.close()
+        origem.close()
+
+    integridade = verificar_integridade(parcial) if verificar else None
+    if verificar and integridade != "ok":
+        os.remove(parcial)
+        raise RuntimeError(f"Backup de {db_path} corrompido: {integridade}")
+
+    tamanho = os.path.getsize(parcial)
+    if comprimir:
+        arquivo = f"{nome}.db.gz"
+        sha256 = _comprimir(parcial, os.path.join(pasta, arquivo))
+        os.remove(parcial)
+    else:
+        arquivo = f"{nome}.db"
+        with open(parcial, "rb") as entrada:
+            sha256 = hashlib.file_digest(entrada, "sha256").hexdigest()
+        os.replace(parcial, os.path.join(pasta, arquivo))
+
+    manifesto = {
+        "arquivo": arquivo,
+        "origem": os.path.abspath(db_path),
+        "criado_em": criado_em.isoformat(timespec="seconds"),
+        "versao_schema": versao_schema,
+        "paginas": paginas_total,
+        "bytes": tamanho,
+        "bytes_arquivo": os.path.getsize(os.path.join(pasta, arquivo)),
+        "sha256": sha256,
+        "passos": passos,
+        "reinicios": reinicios,
+        "copia_s": copia_s,
+        "integridade": integridade,
+        "duracao_s": round(time.perf_counter() - inicio, 2),
+    }
+    with open(os.path.join(pasta, f"{nome}.json"), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    aplicar_retencao(pasta, manter, dias)
+    return manifesto
+
+
+def listar_backups(pasta=PASTA_PADRAO):
+    """Manifestos dos backups da pasta, do mais recente para o mais antigo"""
+    if not os.path.isdir(pasta):
+        return []
+    manifestos = []
+    for nome in os.listdir(pasta):
+        if nome.endswith(".json"):
+            with open(os.path.join(pasta, nome), encoding="utf-8") as f:
+                manifestos.append(json.load(f))
+    return sorted(manifestos, key=lambda m: m["criado_em"], reverse=True)
+
+
+def aplicar_retencao(pasta=PASTA_PADRAO, manter=MANTER_PADRAO, dias=DIAS_PADRAO, agora=None):
+    """Mantém os `manter` backups mais recentes e o mais recente de cada um dos últimos `dias` dias.
+
+    Retorna os arquivos removidos.
+    """
+    agora = agora or datetime.now()
+    limite = (agora - timedelta(days=dias)).date()
+    dias_mantidos, removidos = set(), []
+    for posicao, manifesto in enumerate(listar_backups(pasta)):
+        dia = datetime.fromisoformat(manifesto["criado_em"]).date()
+        if posicao < manter or (dia > limite and dia not in dias_mantidos):
+            dias_mantidos.add(dia)
+            continue
+        for arquivo in (manifesto["arquivo"], caminho_manifesto(manifesto["arquivo"])):
+            caminho = os.path.join(pasta, arquivo)
+            if os.path.exists(caminho):
+                os.remove(caminho)
+                removidos.append(arquivo)
+    return removidos
+
+
+def verificar_backup(caminho, rapido=False):
+    """Confere um backup já gravado: sha256 do manifesto (se houver) e integridade do banco restaurado.
+
+    Retorna (ok, mensagem).
+    """
+    manifesto = None
+    if os.path.exists(caminho_manifesto(caminho)):
+        with open(caminho_manifesto(caminho), encoding="utf-8") as f:
+            manifesto = json.load(f)
+    with tempfile.TemporaryDirectory(prefix="cmms_verificacao_") as pasta:
+        restaurado = os.path.join(pasta, "restaurado.db")
+        resumo = hashlib.sha256()
+        with (gzip.open(caminho, "rb") if caminho.endswith(".gz") else open(caminho, "rb")) as entrada, \
+                open(restaurado, "wb") as saida:
+            while bloco := entrada.read(BLOCO):
+                resumo.update(bloco)
+                saida.write(bloco)
+        if manifesto and resumo.hexdigest() != manifesto["sha256"]:
+            return False, "sha256 diferente do manifesto"
+        integridade = verificar_integridade(restaurado, rapido)
+    if integridade != "ok":
+        return False, integridade
+    return True, "ok" if manifesto else "ok (sem manifesto)"
+
+
+def restaurar_backup(caminho, destino):
+    """Descomprime um backup em `destino` (que não pode existir)"""
+    if os.path.exists(destino):
+        raise FileExistsError(destino)
+    with (gzip.open(caminho, "rb") if caminho.endswith(".gz") else open(caminho, "rb")) as entrada, \
+            open(destino, "wb") as saida:
+        shutil.copyfileobj(entrada, saida, BLOCO)
+
+
+class AgendadorBackup(threading.Thread):
+    """Executa fazer_backup a cada `intervalo_h` horas em uma thread daemon.
+
+    O intervalo conta a partir do último backup existente na pasta, então reinícios do app
+    (ou vários processos) não geram backups a mais.
+    """
+
+    def __init__(self, db_path, intervalo_h, pasta=PASTA_PADRAO, **opcoes):
+        super().__init__(name="cmms-backup", daemon=True)
+        self.db_path = db_path
+        self.intervalo = timedelta(hours=intervalo_h)
+        self.pasta = pasta
+        self.opcoes = opcoes
+        self.ultimo = None
+        self.ultimo_erro = None
+        self._parar = threading.Event()
+
+    def proxima_execucao(self):
+        backups = listar_backups(self.pasta)
+        if not backups:
+            return datetime.now()
+        return datetime.fromisoformat(backups[0]["criado_em"]) + self.intervalo
+
+    def run(self):
+        while not self._parar.is_set():
+            espera = (self.proxima_execucao() - datetime.now()).total_seconds()
+            if espera > 0:
+                self._parar.wait(min(espera, 60))
+                continue
+            try:
+                self.ultimo = fazer_backup(self.db_path, self.pasta, **self.opcoes)
+                self.ultimo_erro = None
+            except Exception as erro:  # a thread continua agendando; o erro fica visível em ultimo_erro
+                self.ultimo_erro = f"{type(erro).__name__}: {erro}"
+                self._parar.wait(60)
+
+    def parar(self):
+        self._parar.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--banco", default="cmms_andaimes.db")
+    parser.add_argument("--pasta", default=PASTA_PADRAO)
+    parser.add_argument("--agendar", type=float, metavar="HORAS", help="Repetir o backup a cada HORAS horas")
+    parser.add_argument("--verificar", metavar="ARQUIVO", help="Verificar um backup existente e sair")
+    parser.add_argument("--sem-compressao", action="store_true")
+    parser.add_argument("--manter", type=int, default=MANTER_PADRAO)
+    parser.add_argument("--dias", type=int, default=DIAS_PADRAO)
+    args = parser.parse_args(argv)
+
+    if args.verificar:
+        ok, mensagem = verificar_backup(args.verificar)
+        print(mensagem)
+        return 0 if ok else 1
+    opcoes = {"comprimir": not args.sem_compressao, "manter": args.manter, "dias": args.dias}
+    if args.agendar:
+        agendador = AgendadorBackup(args.banco, args.agendar, args.pasta, **opcoes)
+        agendador.start()
+        try:
+            while agendador.is_alive():
+                agendador.join(60)
+                if agendador.ultimo_erro:
+                    print(agendador.ultimo_erro, file=sys.stderr)
+        except KeyboardInterrupt:
+            agendador.parar()
+        return 0
+    print(json.dumps(fazer_backup(args.banco, args.pasta, **opcoes), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Partes comuns dos benchmarks: raiz do repositório no sys.path, commit medido, percentis de latência e
+histórico das execuções em jsonl"""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Os benchmarks importam os módulos do app a partir da raiz do repositório
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+def versao_git():
+    try:
+        return subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentis(latencias):
+    if not latencias:
+        return None
+    valores = np.array(latencias)
+    return {"gravacoes": len(valores), "p50_ms": round(float(np.percentile(valores, 50)), 2),
+            "p99_ms": round(float(np.percentile(valores, 99)), 2), "max_ms": round(float(valores.max()), 2)}
+
+
+def publicar(resumo, historico=None):
+    """Imprime o resumo da execução e, com `historico`, acrescenta-o como uma linha desse arquivo jsonl"""
+    print(json.dumps(resumo, indent=2, ensure_ascii=False))
+    if historico:
+        with open(historico, "a", encoding="utf-8") as f:
+            f.write(json.dumps(resumo, ensure_ascii=False) + "\n")
@@ -0,0 +1,108 @@
+"""Benchmark do backup online: latência de gravação enquanto o backup de um banco grande roda.
+
+Gera um banco com o schema do app e um lastro de blobs até o tamanho pedido; um processo separado grava
+movimentações (add_movimentacao) em ritmo constante, primeiro sem backup e depois durante fazer_backup.
+Compara a latência dos commits antes, durante a cópia e durante verificação/compressão.
+
+    python benchmarks/bench_backup.py --tamanho-mb 2048
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from _comum import RAIZ, percentis, publicar, versao_git
+
+from backup import fazer_backup
+from database import DatabaseManager, DEPOSITO_PRINCIPAL
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "backup_history.jsonl")
+
+
+def popular(db, tamanho_mb):
+    """Cadastros mínimos e um lastro de blobs (parte aleatória, parte compressível) até tamanho_mb"""
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO clientes (nome) VALUES ('CLIENTE')")
+        conn.execute("INSERT INTO obras (nome, cliente_id, status) VALUES ('OBRA', 1, 'ativa')")
+        conn.execute("INSERT INTO equipamentos (descricao, quantidade) VALUES ('EQUIPAMENTO', 1000000000)")
+        conn.execute("INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (1, ?, 1000000000)",
+                     (DEPOSITO_PRINCIPAL,))
+        conn.execute("CREATE TABLE lastro (dados BLOB)")
+        linhas = tamanho_mb * 256
+        for inicio in range(0, linhas, 50000):
+            conn.executemany("INSERT INTO lastro VALUES (randomblob(1024) || zeroblob(3000))",
+                             [()] * min(50000, linhas - inicio))
+            conn.commit()
+
+
+def gravador(db_path, intervalo, parar, fila):
+    """Processo que grava uma movimentação a cada `intervalo` s e envia (instante, latência em ms)"""
+    db = DatabaseManager(db_path)
+    medidas = []
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        db.add_movimentacao("envio", 1, 1, 1, "bench", None)
+        medidas.append((time.time(), (time.perf_counter() - inicio) * 1000))
+        time.sleep(intervalo)
+    fila.put(medidas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanho-mb", type=int, default=2048)
+    parser.add_argument("--intervalo-ms", type=float, default=10, help="Pausa do gravador entre movimentações")
+    parser.add_argument("--referencia-s", type=float, default=5, help="Duração da medição sem backup")
+    parser.add_argument("--paginas", type=int, default=256, help="Páginas copiadas por passo")
+    parser.add_argument("--pausa-ms", type=float, default=5, help="Pausa entre passos")
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em backup_history.jsonl")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="cmms_backup_") as pasta:
+        caminho = os.path.join(pasta, "bench.db")
+        inicio = time.perf_counter()
+        popular(DatabaseManager(caminho), args.tamanho_mb)
+        print(f"banco de {os.path.getsize(caminho) / 2 ** 20:.0f} MB gerado em {time.perf_counter() - inicio:.1f} s")
+
+        parar, fila = multiprocessing.Event(), multiprocessing.Queue()
+        processo = multiprocessing.Process(target=gravador, args=(caminho, args.intervalo_ms / 1000, parar, fila))
+        processo.start()
+        time.sleep(1)
+        inicio_referencia = time.time()
+        time.sleep(args.referencia_s)
+
+        inicio_backup = time.time()
+        manifesto = fazer_backup(caminho, os.path.join(pasta, "backups"), paginas=args.paginas, pausa_ms=args.pausa_ms)
+        fim_backup = time.time()
+        parar.set()
+        medidas = fila.get()
+        processo.join()
+
+    fim_copia = inicio_backup + manifesto["copia_s"]
+
+    def entre(a, b):
+        return [latencia for instante, latencia in medidas if a <= instante < b]
+
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "banco_mb": round(manifesto["bytes"] / 2 ** 20),
+        "backup_mb": round(manifesto["bytes_arquivo"] / 2 ** 20),
+        "paginas_por_passo": args.paginas,
+        "pausa_ms": args.pausa_ms,
+        "passos": manifesto["passos"],
+        "reinicios": manifesto["reinicios"],
+        "copia_s": manifesto["copia_s"],
+        "backup_total_s": manifesto["duracao_s"],
+        "integridade": manifesto["integridade"],
+        "sem_backup": percentis(entre(inicio_referencia, inicio_backup)),
+        "durante_copia": percentis(entre(inicio_backup, fim_copia)),
+        "durante_verificacao_compressao": percentis(entre(fim_copia, fim_backup)),
+    }
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Benchmark do faturamento de locação: faturas mensais de todas as obras em um lote.
+
+Gera um banco sintético com N movimentações de envio/retorno e mede a leitura do
+ledger, o cálculo vetorizado de equipamento-dias e a geração completa das faturas.
+
+    python benchmarks/bench_faturamento.py --movimentacoes 1000000 --obras 300 --equipamentos 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from _comum import RAIZ, publicar, versao_git
+
+from database import DatabaseManager, ENVIO, RETORNO
+from locacao import equipamento_dias, gerar_faturas_mensais, numero_dia, ordenar_ledger, periodo_mes, SEGUNDOS_DIA
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "faturamento_history.jsonl")
+
+
+def popular(db, movimentacoes, obras, equipamentos, dias, semente=42):
+    """Envios seguidos de retornos parciais, espalhados pelos últimos `dias` dias"""
+    rng = np.random.default_rng(semente)
+    with db.get_connection() as conn:
+        conn.executemany("INSERT INTO clientes (nome) VALUES (?)", [(f"CLIENTE {i}",) for i in range(obras // 5 + 1)])
+        conn.executemany("INSERT INTO obras (nome, cliente_id, status) VALUES (?, ?, 'ativa')",
+                         [(f"OBRA {i}", i // 5 + 1) for i in range(obras)])
+        conn.executemany("INSERT INTO equipamentos (descricao, quantidade, valor_diaria) VALUES (?, ?, ?)",
+                         [(f"EQUIPAMENTO {i}", 100000, round(float(v), 2))
+                          for i, v in enumerate(rng.uniform(0.5, 5.0, equipamentos))])
+
+        fim = int(time.time())
+        envios = movimentacoes // 2
+        obra = rng.integers(1, obras + 1, envios)
+        equip = rng.integers(1, equipamentos + 1, envios)
+        quantidade = rng.integers(1, 50, envios)
+        data_envio = fim - rng.integers(0, dias * SEGUNDOS_DIA, envios)
+        # Cada retorno devolve parte do envio correspondente algum tempo depois
+        data_retorno = np.minimum(data_envio + rng.integers(SEGUNDOS_DIA, 90 * SEGUNDOS_DIA, envios), fim)
+        retorno = np.maximum(1, (quantidade * rng.uniform(0.3, 1.0, envios)).astype(np.int64))
+
+        linhas = [(ENVIO, e, o, q, d) for o, e, q, d in zip(obra.tolist(), equip.tolist(), quantidade.tolist(),
+                                                            data_envio.tolist())]
+        linhas += [(RETORNO, e, o, q, d) for o, e, q, d in zip(obra.tolist(), equip.tolist(), retorno.tolist(),
+                                                               data_retorno.tolist())]
+        conn.executemany("""
+            INSERT INTO movimentacoes_dados (tipo_id, equipamento_id, obra_id, quantidade, data_epoch)
+            VALUES (?, ?, ?, ?, ?)
+        """, linhas)
+        conn.commit()
+        return len(linhas)
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, round(min(tempos), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movimentacoes", type=int, default=1_000_000)
+    parser.add_argument("--obras", type=int, default=300)
+    parser.add_argument("--equipamentos", type=int, default=2000)
+    parser.add_argument("--dias", type=int, default=730, help="Período coberto pelo histórico sintético")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em faturamento_history.jsonl")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="cmms_faturamento_") as pasta:
+        db = DatabaseManager(os.path.join(pasta, "bench.db"))
+        inicio = time.perf_counter()
+        total = popular(db, args.movimentacoes, args.obras, args.equipamentos, args.dias)
+        print(f"{total} movimentações geradas em {time.perf_counter() - inicio:.1f} s")
+
+        hoje = time.gmtime()
+        ano, mes = (hoje.tm_year, hoje.tm_mon - 1) if hoje.tm_mon > 1 else (hoje.tm_year - 1, 12)
+        data_inicio, data_fim = periodo_mes(ano, mes)
+        dia_inicio, dia_fim = numero_dia(data_inicio), numero_dia(data_fim)
+
+        linhas, leitura_ms = medir(lambda: db.get_ledger_obras(ate_epoch=(dia_fim + 1) * SEGUNDOS_DIA),
+                                   args.repeticoes)
+        colunas, ordenacao_ms = medir(lambda: ordenar_ledger(linhas), args.repeticoes)
+        pares, calculo_ms = medir(lambda: equipamento_dias(*colunas, dia_inicio, dia_fim), args.repeticoes)
+        faturas, lote_ms = medir(lambda: gerar_faturas_mensais(db, ano, mes), args.repeticoes)
+
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "movimentacoes": total,
+        "ledger_ate_fim_do_mes": len(linhas),
+        "pares_obra_equipamento": int(len(pares[0])),
+        "faturas": len(faturas),
+        "leitura_ledger_ms": leitura_ms,
+        "ordenacao_ms": ordenacao_ms,
+        "calculo_vetorizado_ms": calculo_ms,
+        "lote_completo_ms": lote_ms,
+    }
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Benchmark das conexões somente leitura: latência dos commits enquanto relatórios pesados rodam.
+
+Gera um histórico grande de movimentações; um processo grava movimentações (add_movimentacao) em ritmo
+constante enquanto processos leitores rodam, em laço, os relatórios da página de Relatórios pela visão
+somente_leitura() (DataFrame do histórico inteiro, saldos de estoque, movimentações por dia). Compara a
+latência dos commits sem relatórios, com relatórios e com um leitor que segura um snapshot durante toda
+a fase. Mede também consultas curtas pelo pool contra uma conexão nova por consulta.
+
+    python benchmarks/bench_leitura.py --movimentacoes 300000 --leitores 2
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+
+from _comum import RAIZ, percentis, publicar, versao_git
+
+from database import DatabaseManager, DEPOSITO_PRINCIPAL
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "leitura_history.jsonl")
+
+
+def popular(db, movimentacoes, obras, equipamentos, rng):
+    """Cadastros e um histórico de envios e retornos distribuído pelos últimos 3 anos"""
+    estoque = 10 ** 9
+    agora = int(time.time())
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO clientes (nome) VALUES ('CLIENTE')")
+        cursor.executemany("INSERT INTO obras (nome, cliente_id, status) VALUES (?, 1, 'ativa')",
+                           [(f"OBRA {i}",) for i in range(obras)])
+        cursor.executemany("INSERT INTO equipamentos (descricao, quantidade) VALUES (?, ?)",
+                           [(f"EQUIPAMENTO {i}", estoque) for i in range(equipamentos)])
+        cursor.executemany("INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (?, ?, ?)",
+                           [(i + 1, DEPOSITO_PRINCIPAL, estoque) for i in range(equipamentos)])
+        datas = np.sort(agora - rng.integers(0, 3 * 365 * 86400, movimentacoes // 2))
+        for data_epoch in datas.tolist():
+            obra, equip = int(rng.integers(1, obras + 1)), int(rng.integers(1, equipamentos + 1))
+            quantidade = int(rng.integers(1, 40))
+            db._registrar_movimentacao(cursor, "envio", equip, obra, quantidade, "Encarregado", None, data_epoch)
+            db._registrar_movimentacao(cursor, "retorno", equip, obra, max(1, quantidade // 2), "Encarregado", None,
+                                       data_epoch)
+        conn.commit()
+
+
+def gravador(db_path, intervalo, parar, fila):
+    """Processo que grava uma movimentação a cada `intervalo` s e envia (instante, latência em ms)"""
+    db = DatabaseManager(db_path)
+    medidas = []
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        db.add_movimentacao("envio", 1, 1, 1, "bench", None)
+        medidas.append((time.time(), (time.perf_counter() - inicio) * 1000))
+        time.sleep(intervalo)
+    fila.put(medidas)
+
+
+def leitor(db_path, parar, fila):
+    """Processo que roda os relatórios pesados em laço pelo pool somente leitura; envia as durações em ms"""
+    leitura = DatabaseManager(db_path).somente_leitura()
+    duracoes = []
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        leitura.get_movimentacoes_df()
+        leitura.get_estoque_snapshot()
+        leitura.get_movimentacoes_por_dia(date(2000, 1, 1), date.today())
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+    fila.put(duracoes)
+
+
+def snapshot_longo(db_path, parar, fila):
+    """Processo que abre uma leitura e segura o snapshot até o fim da fase"""
+    db = DatabaseManager(db_path)
+    with db.get_read_connection() as conn:
+        cursor = conn.execute("SELECT id FROM movimentacoes_dados")
+        cursor.fetchone()
+        parar.wait()
+    fila.put([])
+
+
+def fase(db_path, alvo, processos, duracao, intervalo):
+    """Roda o gravador e `processos` cópias de `alvo` por `duracao` s; retorna (latências, resultados dos alvos)"""
+    parar, fila_gravador, fila = multiprocessing.Event(), multiprocessing.Queue(), multiprocessing.Queue()
+    outros = [multiprocessing.Process(target=alvo, args=(db_path, parar, fila)) for _ in range(processos)]
+    for processo in outros:
+        processo.start()
+    gravacao = multiprocessing.Process(target=gravador, args=(db_path, intervalo, parar, fila_gravador))
+    gravacao.start()
+    time.sleep(duracao)
+    parar.set()
+    latencias = [latencia for _, latencia in fila_gravador.get()]
+    resultados = [valor for _ in outros for valor in fila.get()]
+    for processo in outros + [gravacao]:
+        processo.join()
+    return latencias, resultados
+
+
+def medir(funcao, repeticoes=200):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return round((time.perf_counter() - inicio) * 1000 / repeticoes, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movimentacoes", type=int, default=300000)
+    parser.add_argument("--obras", type=int, default=200)
+    parser.add_argument("--equipamentos", type=int, default=300)
+    parser.add_argument("--leitores", type=int, default=2, help="Processos rodando relatórios ao mesmo tempo")
+    parser.add_argument("--duracao-s", type=float, default=10, help="Duração de cada fase")
+    parser.add_argument("--intervalo-ms", type=float, default=10, help="Pausa do gravador entre movimentações")
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em leitura_history.jsonl")
+    args = parser.parse_args(argv)
+    intervalo = args.intervalo_ms / 1000
+
+    with tempfile.TemporaryDirectory(prefix="cmms_leitura_") as pasta:
+        caminho = os.path.join(pasta, "bench.db")
+        db = DatabaseManager(caminho)
+        inicio = time.perf_counter()
+        popular(db, args.movimentacoes, args.obras, args.equipamentos, np.random.default_rng(42))
+        geracao_s = round(time.perf_counter() - inicio, 1)
+
+        sem_relatorios, _ = fase(caminho, leitor, 0, args.duracao_s, intervalo)
+        com_relatorios, relatorios_ms = fase(caminho, leitor, args.leitores, args.duracao_s, intervalo)
+        com_snapshot, _ = fase(caminho, snapshot_longo, 1, args.duracao_s, intervalo)
+
+        leitura = db.somente_leitura()
+        conexao_nova_ms = medir(db.get_total_clientes)
+        pool_ms = medir(leitura.get_total_clientes)
+
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "cpus": os.cpu_count(),
+        "movimentacoes": args.movimentacoes,
+        "geracao_s": geracao_s,
+        "leitores": args.leitores,
+        "sem_relatorios": percentis(sem_relatorios),
+        "com_relatorios": percentis(com_relatorios),
+        "com_snapshot_longo": percentis(com_snapshot),
+        "relatorios_executados": len(relatorios_ms),
+        "relatorio_p50_ms": round(float(np.percentile(relatorios_ms, 50)), 1) if relatorios_ms else None,
+        "consulta_curta_conexao_nova_ms": conexao_nova_ms,
+        "consulta_curta_pool_ms": pool_ms,
+    }
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
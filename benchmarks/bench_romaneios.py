@@ -0,0 +1,141 @@
+"""Benchmark dos romaneios: consultas pelo cabeçalho e geração das notas de entrega em lote.
+
+Gera um histórico de movimentações avulsas e de romaneios (lotes de envio para obras sorteadas). Mede
+exibir um romaneio (cabeçalho pela chave primária e linhas pelo índice de romaneio_id) e listar os de uma
+obra, contra o equivalente sem cabeçalho: reagrupar as linhas pela data e pelo responsável. Depois gera
+as notas de entrega (PDF) de todos os romaneios no próprio processo e no pool de processos.
+
+    python benchmarks/bench_romaneios.py --romaneios 5000 --linhas 8 --avulsas 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from _comum import RAIZ, publicar, versao_git
+
+from database import DatabaseManager, DEPOSITO_PRINCIPAL, ENVIO
+from romaneios import gerar_notas
+from tarefas import WORKERS_PADRAO
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "romaneios_history.jsonl")
+
+
+def popular(db, romaneios, linhas, avulsas, obras, equipamentos, rng):
+    """Cadastros, movimentações avulsas e romaneios espalhados pelos últimos 3 anos"""
+    estoque = 10 ** 9
+    agora = int(time.time())
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO clientes (nome) VALUES ('CLIENTE')")
+        cursor.executemany("INSERT INTO obras (nome, cliente_id, status) VALUES (?, 1, 'ativa')",
+                           [(f"OBRA {i}",) for i in range(obras)])
+        cursor.executemany("INSERT INTO equipamentos (descricao, codigo, quantidade, valor_diaria) VALUES (?, ?, ?, ?)",
+                           [(f"EQUIPAMENTO {i}", f"EQ{i:04d}", estoque, 1.5) for i in range(equipamentos)])
+        cursor.executemany("INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (?, ?, ?)",
+                           [(i + 1, DEPOSITO_PRINCIPAL, estoque) for i in range(equipamentos)])
+        for data_epoch in np.sort(agora - rng.integers(0, 3 * 365 * 86400, avulsas)).tolist():
+            db._registrar_movimentacao(cursor, "envio", int(rng.integers(1, equipamentos + 1)),
+                                       int(rng.integers(1, obras + 1)), int(rng.integers(1, 40)), "Encarregado", None,
+                                       data_epoch)
+        conn.commit()
+    for i, data_epoch in enumerate(np.sort(agora - rng.integers(0, 3 * 365 * 86400, romaneios)).tolist()):
+        itens = [(int(equipamento_id), int(rng.integers(1, 40)))
+                 for equipamento_id in rng.choice(np.arange(1, equipamentos + 1), linhas, replace=False)]
+        db.add_romaneio("envio", itens, int(rng.integers(1, obras + 1)), f"Motorista {i % 50}", None,
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(data_epoch)))
+
+
+def lote_sem_cabecalho(db, data_epoch, responsavel):
+    """Linhas e totais de um lote sem romaneio: mesma data e mesmo responsável"""
+    with db.get_connection() as conn:
+        return conn.execute("""
+            SELECT COUNT(*), SUM(quantidade) FROM movimentacoes_dados
+            WHERE data_epoch = ? AND responsavel = ? AND tipo_id = ?
+        """, (data_epoch, responsavel, ENVIO)).fetchall()
+
+
+def lotes_da_obra_sem_cabecalho(db, obra_id):
+    with db.get_connection() as conn:
+        return conn.execute("""
+            SELECT data_epoch, responsavel, COUNT(*), SUM(quantidade) FROM movimentacoes_dados
+            WHERE obra_id = ? AND tipo_id = ?
+            GROUP BY data_epoch, responsavel
+            ORDER BY data_epoch DESC
+        """, (obra_id, ENVIO)).fetchall()
+
+
+def medir(funcao, repeticoes=200):
+    inicio = time.perf_counter()
+    for i in range(repeticoes):
+        funcao(i)
+    return round((time.perf_counter() - inicio) * 1000 / repeticoes, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--romaneios", type=int, default=5000)
+    parser.add_argument("--linhas", type=int, default=8, help="Equipamentos por romaneio")
+    parser.add_argument("--avulsas", type=int, default=100000, help="Movimentações fora de romaneios")
+    parser.add_argument("--obras", type=int, default=200)
+    parser.add_argument("--equipamentos", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=WORKERS_PADRAO, help="Processos na geração das notas")
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em romaneios_history.jsonl")
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(42)
+
+    with tempfile.TemporaryDirectory(prefix="cmms_romaneios_") as pasta:
+        db = DatabaseManager(os.path.join(pasta, "bench.db"))
+        inicio = time.perf_counter()
+        popular(db, args.romaneios, args.linhas, args.avulsas, args.obras, args.equipamentos, rng)
+        geracao_s = round(time.perf_counter() - inicio, 1)
+
+        leitura = db.somente_leitura()
+        amostra = rng.integers(1, args.romaneios + 1, 200).tolist()
+        cabecalhos = [leitura.get_romaneio(romaneio_id) for romaneio_id in amostra]
+        with db.get_connection() as conn:
+            chaves = [tuple(conn.execute("SELECT data_epoch, responsavel FROM romaneios WHERE id = ?",
+                                         (romaneio_id,)).fetchone()) for romaneio_id in amostra]
+        obras = rng.integers(1, args.obras + 1, 200).tolist()
+
+        romaneio_ms = medir(lambda i: (leitura.get_romaneio(amostra[i]), leitura.get_itens_romaneio(amostra[i])))
+        romaneio_sem_cabecalho_ms = medir(lambda i: lote_sem_cabecalho(leitura, *chaves[i]), repeticoes=20)
+        lista_obra_ms = medir(lambda i: leitura.get_romaneios(obras[i], limite=-1))
+        lista_obra_sem_cabecalho_ms = medir(lambda i: lotes_da_obra_sem_cabecalho(leitura, obras[i]), repeticoes=20)
+
+        ids = list(range(1, args.romaneios + 1))
+        inicio = time.perf_counter()
+        notas = gerar_notas(db.db_path, ids, workers=1)
+        notas_sequencial_s = round(time.perf_counter() - inicio, 2)
+        inicio = time.perf_counter()
+        notas_pool = gerar_notas(db.db_path, ids, workers=args.workers)
+        notas_pool_s = round(time.perf_counter() - inicio, 2)
+
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "cpus": os.cpu_count(),
+        "romaneios": args.romaneios,
+        "linhas_por_romaneio": args.linhas,
+        "avulsas": args.avulsas,
+        "geracao_s": geracao_s,
+        "exibir_romaneio_ms": romaneio_ms,
+        "exibir_lote_sem_cabecalho_ms": romaneio_sem_cabecalho_ms,
+        "listar_obra_ms": lista_obra_ms,
+        "listar_obra_sem_cabecalho_ms": lista_obra_sem_cabecalho_ms,
+        "totais_conferem": all(cabecalho['total_linhas'] == args.linhas for cabecalho in cabecalhos),
+        "workers": args.workers,
+        "notas_sequencial_s": notas_sequencial_s,
+        "notas_pool_s": notas_pool_s,
+        "notas_iguais": notas == notas_pool,
+        "kb_por_nota": round(sum(map(len, notas.values())) / len(notas) / 1024, 1),
+    }
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Benchmark do modo com shards: gravação concorrente e relatórios consolidados com muitos bancos.
+
+Gera N grupos de clientes com obras, frota e histórico de movimentações, uma vez em um banco único e uma
+vez em um shard por grupo. Processos gravadores registram envios em obras sorteadas (no modo com shards
+cada gravador atende os seus grupos) e o benchmark compara vazão e latência dos commits. Depois mede os
+KPIs do dashboard e o total da frota de todos os shards, em sequência e em paralelo, renderiza em cada
+shard os DataFrames e as análises das páginas (histórico, estoque, projeção, utilização e locação) e
+confere que tudo soma o mesmo que o banco único.
+
+    python benchmarks/bench_shards.py --shards 64 --gravadores 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from _comum import RAIZ, percentis, publicar, versao_git
+
+import locacao
+import projecao
+import utilizacao
+from database import DatabaseManager, DEPOSITO_PRINCIPAL
+from shards import RoteadorShards
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "shards_history.jsonl")
+
+
+def popular(db, grupo, obras, equipamentos, movimentacoes, estoque, rng):
+    """Um cliente com suas obras, frota própria e histórico; retorna (obra_ids, equipamento_ids)"""
+    agora = int(time.time())
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cliente_id = cursor.execute("INSERT INTO clientes (nome) VALUES (?)", (f"CLIENTE {grupo}",)).lastrowid
+        obra_ids = [cursor.execute("INSERT INTO obras (nome, cliente_id, status) VALUES (?, ?, 'ativa')",
+                                   (f"OBRA {grupo}-{i}", cliente_id)).lastrowid for i in range(obras)]
+        equipamento_ids = []
+        for i in range(equipamentos):
+            equipamento_id = cursor.execute("INSERT INTO equipamentos (descricao, quantidade) VALUES (?, ?)",
+                                            (f"EQUIPAMENTO {i}", estoque)).lastrowid
+            cursor.execute("INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (?, ?, ?)",
+                           (equipamento_id, DEPOSITO_PRINCIPAL, estoque))
+            equipamento_ids.append(equipamento_id)
+        for i in range(movimentacoes):
+            db._registrar_movimentacao(cursor, "envio", int(rng.choice(equipamento_ids)), int(rng.choice(obra_ids)),
+                                       int(rng.integers(1, 5)), "Encarregado", None, agora - 86400 * int(rng.integers(0, 60)))
+        conn.commit()
+    return obra_ids, equipamento_ids
+
+
+def gravador(alvos, gravacoes, fila):
+    """Processo que registra `gravacoes` envios em alvos sorteados [(banco, obra_ids, equipamento_ids)]"""
+    rng = np.random.default_rng(os.getpid())
+    bancos = {caminho: DatabaseManager(caminho) for caminho, _, _ in alvos}
+    latencias = []
+    for _ in range(gravacoes):
+        caminho, obra_ids, equipamento_ids = alvos[int(rng.integers(len(alvos)))]
+        inicio = time.perf_counter()
+        bancos[caminho].add_movimentacao("envio", int(rng.choice(equipamento_ids)), int(rng.choice(obra_ids)), 1,
+                                         "bench", None)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    fila.put(latencias)
+
+
+def gravar_concorrente(alvos_por_gravador, gravacoes):
+    fila = multiprocessing.Queue()
+    processos = [multiprocessing.Process(target=gravador, args=(alvos, gravacoes, fila)) for alvos in alvos_por_gravador]
+    inicio = time.perf_counter()
+    for processo in processos:
+        processo.start()
+    latencias = [latencia for _ in processos for latencia in fila.get()]
+    for processo in processos:
+        processo.join()
+    duracao = time.perf_counter() - inicio
+    return {"commits_por_segundo": round(len(latencias) / duracao), **percentis(latencias)}
+
+
+def medir(funcao, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, round(min(tempos), 1)
+
+
+def paginas(db, data_inicio, data_fim):
+    """Caminhos de DataFrame e de análise que as páginas executam em um banco; devolve totais comparáveis"""
+    movimentacoes = db.get_movimentacoes_df(data_inicio, data_fim)
+    equipamentos = db.get_equipamentos_df()
+    disponivel = projecao.disponibilidade_projetada(db, hoje=data_fim)
+    utilizacao.utilizacao(db, data_inicio, data_fim, granularidade="Semana")
+    itens = locacao.calcular_locacao(db, data_inicio, data_fim)
+    return np.array([len(movimentacoes), len(equipamentos), int(disponivel.to_numpy().sum()),
+                     sum(item['equipamento_dias'] for item in itens)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=64, help="Grupos de clientes (um shard cada)")
+    parser.add_argument("--obras", type=int, default=10, help="Obras por grupo")
+    parser.add_argument("--equipamentos", type=int, default=50, help="Equipamentos na frota de cada grupo")
+    parser.add_argument("--movimentacoes", type=int, default=2000, help="Histórico por grupo")
+    parser.add_argument("--gravadores", type=int, default=4, help="Processos gravando ao mesmo tempo")
+    parser.add_argument("--gravacoes", type=int, default=300, help="Commits por gravador")
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em shards_history.jsonl")
+    args = parser.parse_args(argv)
+    estoque = 10 ** 6
+    data_fim = date.today()
+    data_inicio = data_fim - timedelta(days=30)
+
+    with tempfile.TemporaryDirectory(prefix="cmms_shards_") as pasta:
+        inicio = time.perf_counter()
+        unico = DatabaseManager(os.path.join(pasta, "unico.db"))
+        roteador = RoteadorShards(os.path.join(pasta, "shards"))
+        alvos_unico, alvos_shards = [], []
+        for grupo in range(args.shards):
+            obras_equipamentos = popular(unico, grupo, args.obras, args.equipamentos, args.movimentacoes, estoque,
+                                         np.random.default_rng(grupo))
+            alvos_unico.append((unico.db_path, *obras_equipamentos))
+            shard = roteador.db(roteador.criar_shard(f"GRUPO {grupo}"))
+            obras_equipamentos = popular(shard, grupo, args.obras, args.equipamentos, args.movimentacoes, estoque,
+                                         np.random.default_rng(grupo))
+            alvos_shards.append((shard.db_path, *obras_equipamentos))
+        geracao_s = round(time.perf_counter() - inicio, 1)
+
+        gravadores = args.gravadores
+        banco_unico = gravar_concorrente([alvos_unico[g::gravadores] for g in range(gravadores)], args.gravacoes)
+        com_shards = gravar_concorrente([alvos_shards[g::gravadores] for g in range(gravadores)], args.gravacoes)
+
+        sequencial = RoteadorShards(roteador.pasta, workers=1)
+        kpis, kpis_sequencial_ms = medir(lambda: sequencial.get_kpis(data_inicio, data_fim))
+        _, kpis_paralelo_ms = medir(lambda: roteador.get_kpis(data_inicio, data_fim))
+        frota, frota_sequencial_ms = medir(sequencial.get_frota)
+        _, frota_paralelo_ms = medir(roteador.get_frota)
+        kpis_unico, kpis_unico_ms = medir(lambda: unico.get_resumo_dashboard(data_inicio, data_fim))
+        enviado_unico = sum(saldo['enviado'] for saldo in unico.get_estoque_snapshot().values())
+
+        # Os ids de cada shard começam em shard << 32: as páginas precisam funcionar além do shard 0
+        por_shard, paginas_sequencial_ms = medir(lambda: sequencial.em_paralelo(
+            lambda db: paginas(db, data_inicio, data_fim)))
+        _, paginas_paralelo_ms = medir(lambda: roteador.em_paralelo(lambda db: paginas(db, data_inicio, data_fim)))
+        paginas_unico, paginas_unico_ms = medir(lambda: paginas(unico, data_inicio, data_fim))
+        paginas_shards = sum(por_shard.values())
+
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "cpus": os.cpu_count(),
+        "shards": args.shards,
+        "movimentacoes_por_shard": args.movimentacoes,
+        "geracao_s": geracao_s,
+        "gravadores": gravadores,
+        "gravacao_banco_unico": banco_unico,
+        "gravacao_shards": com_shards,
+        "kpis_banco_unico_ms": kpis_unico_ms,
+        "kpis_sequencial_ms": kpis_sequencial_ms,
+        "kpis_paralelo_ms": kpis_paralelo_ms,
+        "frota_sequencial_ms": frota_sequencial_ms,
+        "frota_paralelo_ms": frota_paralelo_ms,
+        "paginas_banco_unico_ms": paginas_unico_ms,
+        "paginas_sequencial_ms": paginas_sequencial_ms,
+        "paginas_paralelo_ms": paginas_paralelo_ms,
+        "workers": roteador.workers,
+        # Mesmo histórico e mesmo número de envios de 1 peça nos dois modos: os totais precisam coincidir
+        "totais_iguais_ao_banco_unico": (kpis == kpis_unico and sum(f['enviado'] for f in frota) == enviado_unico
+                                         and bool((paginas_shards == paginas_unico).all())),
+        "kpis": kpis,
+    }
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Benchmark da sincronização offline dos tablets de campo.
+
+Provisiona um tablet a partir de um servidor sintético, grava N movimentações offline no tablet e M no
+servidor (parte delas disputando o mesmo estoque) e mede o envio (conferência contra os saldos do
+servidor) e o recebimento do delta, com a ida e a volta serializadas em JSON. Depois confere se o tablet
+convergiu para o servidor (estoque, saldos em obra, contadores de uso, resumos e ordens de manutenção) e
+registra no tablet um retorno de uma obra abastecida pelo servidor.
+
+    python benchmarks/bench_sincronizacao.py --offline 5000 --servidor 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from _comum import RAIZ, publicar, versao_git
+
+from database import DatabaseManager, DEPOSITO_PRINCIPAL
+from sincronizacao import ClienteSincronizacao, TransporteLocal, provisionar_tablet
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "sincronizacao_history.jsonl")
+# Tabelas derivadas das movimentações que o tablet precisa manter iguais às do servidor
+CONFERIDAS = {
+    "estoque_depositos": "SELECT equipamento_id, deposito_id, disponivel FROM estoque_depositos",
+    "saldos_obras": "SELECT obra_id, equipamento_id, em_campo, dia_referencia FROM saldos_obras WHERE em_campo != 0",
+    "contadores_uso": "SELECT equipamento_id, peca_dias, em_campo, dia_referencia, unidades_enviadas FROM contadores_uso",
+    "uso_obras_mensal": "SELECT mes, obra_id, equipamento_id, peca_dias FROM uso_obras_mensal WHERE peca_dias != 0",
+    "manutencoes": "SELECT id, equipamento_id, quantidade, quantidade_retornada, ROUND(custo, 2), status FROM manutencoes",
+    "manutencoes_resumo": """SELECT equipamento_id, mes, tipo, abertas, concluidas, quantidade_aberta, quantidade_concluida,
+                                    ROUND(custo, 2), dias_reparo FROM manutencoes_resumo""",
+}
+
+
+def popular(db, obras, equipamentos, estoque):
+    """Cadastros e estoque inicial no depósito principal"""
+    with db.get_connection() as conn:
+        conn.executemany("INSERT INTO clientes (nome) VALUES (?)", [(f"CLIENTE {i}",) for i in range(obras // 5 + 1)])
+        conn.executemany("INSERT INTO obras (nome, cliente_id, status) VALUES (?, ?, 'ativa')",
+                         [(f"OBRA {i}", i // 5 + 1) for i in range(obras)])
+        conn.executemany("INSERT INTO equipamentos (descricao, quantidade) VALUES (?, ?)",
+                         [(f"EQUIPAMENTO {i}", estoque) for i in range(equipamentos)])
+        conn.executemany("INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (?, ?, ?)",
+                         [(i + 1, DEPOSITO_PRINCIPAL, estoque) for i in range(equipamentos)])
+        conn.commit()
+
+
+def movimentar(db, total, obras, equipamentos, rng):
+    """Envios e retornos parciais gravados pelo caminho normal (_registrar_movimentacao) em uma transação;
+    a cada 10 pares, uma ida à manutenção e o retorno com custo de reparo"""
+    agora = int(time.time())
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(total // 2):
+            obra, equip = int(rng.integers(1, obras + 1)), int(rng.integers(1, equipamentos + 1))
+            quantidade = int(rng.integers(1, 40))
+            db._registrar_movimentacao(cursor, "envio", equip, obra, quantidade, "Encarregado", None, agora + i)
+            db._registrar_movimentacao(cursor, "retorno", equip, obra, max(1, quantidade // 2), "Encarregado", None,
+                                       agora + i)
+            if i % 10 == 0:
+                db._registrar_movimentacao(cursor, "manutencao", equip, None, 2, "Oficina", None, agora + i)
+                db._registrar_movimentacao(cursor, "retorno_manutencao", equip, None, 2, "Oficina", None, agora + i,
+                                           custo=float(rng.integers(50, 500)))
+        conn.commit()
+
+
+def divergentes(servidor, tablet):
+    """Tabelas de CONFERIDAS em que o tablet difere do servidor"""
+    with servidor.get_connection() as conn_servidor, tablet.get_connection() as conn_tablet:
+        return [tabela for tabela, sql in CONFERIDAS.items()
+                if sorted(map(tuple, conn_servidor.execute(sql))) != sorted(map(tuple, conn_tablet.execute(sql)))]
+
+
+def retorno_no_tablet(servidor, tablet, cliente):
+    """Retorno, registrado no tablet e sincronizado, de um par (obra, equipamento) abastecido pelo servidor"""
+    with servidor.get_connection() as conn:
+        obra_id, equipamento_id, em_campo = conn.execute(f"""
+            SELECT s.obra_id, s.equipamento_id, s.em_campo FROM saldos_obras s
+            WHERE s.em_campo > 0 AND NOT EXISTS (SELECT 1 FROM sincronizacao_recebidas r
+                                                 JOIN movimentacoes_dados m ON m.id = r.movimentacao_id
+                                                 WHERE m.obra_id = s.obra_id AND m.equipamento_id = s.equipamento_id)
+            ORDER BY s.em_campo DESC LIMIT 1
+        """).fetchone()
+    valida, _ = tablet.validar_movimentacao("retorno", equipamento_id, obra_id, em_campo)
+    tablet.add_movimentacao("retorno", equipamento_id, obra_id, em_campo, "Encarregado", "Retorno no tablet")
+    situacoes = cliente.sincronizar()['situacoes']
+    return valida and situacoes == {"aceita": 1}
+
+
+def medir(funcao, repeticoes=1):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, round(min(tempos), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offline", type=int, default=5000, help="Movimentações gravadas no tablet sem conexão")
+    parser.add_argument("--servidor", type=int, default=20000, help="Movimentações gravadas no servidor enquanto isso")
+    parser.add_argument("--obras", type=int, default=100)
+    parser.add_argument("--equipamentos", type=int, default=500)
+    parser.add_argument("--estoque", type=int, default=400, help="Estoque inicial por equipamento (menor = mais conflitos)")
+    parser.add_argument("--lote", type=int, default=5000, help="Entradas do log por pacote de delta")
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em sincronizacao_history.jsonl")
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(42)
+
+    with tempfile.TemporaryDirectory(prefix="cmms_sincronizacao_") as pasta:
+        servidor = DatabaseManager(os.path.join(pasta, "servidor.db"))
+        popular(servidor, args.obras, args.equipamentos, args.estoque)
+        tablet = provisionar_tablet(servidor, os.path.join(pasta, "tablet.db"), "tablet-bench")
+        transporte = TransporteLocal(servidor)
+        cliente = ClienteSincronizacao(tablet, transporte)
+
+        _, offline_ms = medir(lambda: movimentar(tablet, args.offline, args.obras, args.equipamentos, rng))
+        _, servidor_ms = medir(lambda: movimentar(servidor, args.servidor, args.obras, args.equipamentos, rng))
+        log_servidor = servidor.get_ultimo_seq()
+
+        resultados, envio_ms = medir(cliente.enviar_pendentes)
+        bytes_envio = transporte.bytes_trafegados
+        recebidos, recebimento_ms = medir(cliente.receber)
+        bytes_recebimento = transporte.bytes_trafegados - bytes_envio
+        # Sem alterações novas: o custo fixo de uma sincronização em dia
+        _, vazia_ms = medir(cliente.sincronizar, 5)
+
+        divergentes_sincronizacao = divergentes(servidor, tablet)
+        retorno_aceito = retorno_no_tablet(servidor, tablet, cliente)
+        divergentes_retorno = divergentes(servidor, tablet)
+
+    situacoes = {}
+    for resultado in resultados:
+        situacoes[resultado['situacao']] = situacoes.get(resultado['situacao'], 0) + 1
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "movimentacoes_offline": len(resultados),
+        "movimentacoes_servidor": args.servidor,
+        "entradas_log_servidor": log_servidor,
+        "situacoes": situacoes,
+        "gravacao_offline_ms": offline_ms,
+        "gravacao_servidor_ms": servidor_ms,
+        "envio_ms": envio_ms,
+        "envio_por_segundo": round(len(resultados) / envio_ms * 1000) if envio_ms else None,
+        "envio_kb": round(bytes_envio / 1024),
+        "registros_recebidos": recebidos,
+        "recebimento_ms": recebimento_ms,
+        "recebimento_por_segundo": round(recebidos / recebimento_ms * 1000) if recebimento_ms else None,
+        "recebimento_kb": round(bytes_recebimento / 1024),
+        "sincronizacao_vazia_ms": vazia_ms,
+        "tabelas_divergentes": divergentes_sincronizacao,
+        "retorno_no_tablet_aceito": retorno_aceito,
+        "tabelas_divergentes_apos_retorno": divergentes_retorno,
+    }
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Benchmark de inicialização a frio: tempo até a primeira renderização.
+
+Cada amostra roda em um interpretador novo (como após o app "dormir"), com o
+streamlit já importado (o servidor já está no ar quando a primeira sessão chega)
+e mede a primeira execução de app.py sobre uma cópia do banco.
+
+    python benchmarks/bench_startup.py --amostras 5 --pagina Dashboard
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from _comum import RAIZ, publicar, versao_git
+
+HISTORICO = os.path.join(RAIZ, "benchmarks", "startup_history.jsonl")
+
+AMOSTRA = r"""
+import json, os, sys, time
+from streamlit.testing.v1 import AppTest
+os.chdir(sys.argv[1])
+sys.path.insert(0, sys.argv[1])
+pagina = sys.argv[2]
+modulos_antes = set(sys.modules)
+at = AppTest.from_file(os.path.join(sys.argv[1], "app.py"), default_timeout=120)
+inicio = time.perf_counter()
+at.run()
+primeira = time.perf_counter() - inicio
+pagina_ms = None
+if pagina != "Dashboard":
+    nav = [s for s in at.sidebar.selectbox if s.label.startswith("📍")][0]
+    inicio = time.perf_counter()
+    nav.set_value(pagina).run()
+    pagina_ms = (time.perf_counter() - inicio) * 1000
+pesados = sorted(m for m in ("pandas", "plotly.express", "plotly.graph_objects") if m in set(sys.modules) - modulos_antes)
+print(json.dumps({"primeira_renderizacao_ms": primeira * 1000, "pagina_ms": pagina_ms,
+                  "importados": pesados, "erros": [str(e.value) for e in at.exception]}))
+"""
+
+
+def medir(pagina, banco):
+    with tempfile.TemporaryDirectory(prefix="cmms_startup_") as destino:
+        for nome in os.listdir(RAIZ):
+            if nome.endswith(".py"):
+                shutil.copy(os.path.join(RAIZ, nome), destino)
+        shutil.copytree(os.path.join(RAIZ, "modules"), os.path.join(destino, "modules"),
+                        ignore=shutil.ignore_patterns("__pycache__"))
+        if banco:
+            shutil.copy(banco, os.path.join(destino, "cmms_andaimes.db"))
+        inicio = time.perf_counter()
+        saida = subprocess.run([sys.executable, "-c", AMOSTRA, destino, pagina],
+                               capture_output=True, text=True, check=True)
+        resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+        resultado["processo_ms"] = (time.perf_counter() - inicio) * 1000
+        return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--amostras", type=int, default=5)
+    parser.add_argument("--pagina", default="Dashboard", help="Página aberta após a primeira renderização")
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "cmms_andaimes.db"),
+                        help="Banco copiado para cada amostra (vazio = banco novo)")
+    parser.add_argument("--sem-historico", action="store_true", help="Não gravar em startup_history.jsonl")
+    args = parser.parse_args(argv)
+
+    amostras = [medir(args.pagina, args.banco) for _ in range(args.amostras)]
+    for amostra in amostras:
+        if amostra["erros"]:
+            print("Erros na renderização:", amostra["erros"])
+            return 1
+
+    primeira = [a["primeira_renderizacao_ms"] for a in amostras]
+    resumo = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": versao_git(),
+        "pagina": args.pagina,
+        "amostras": len(amostras),
+        "primeira_renderizacao_mediana_ms": round(statistics.median(primeira), 1),
+        "primeira_renderizacao_min_ms": round(min(primeira), 1),
+        "processo_mediana_ms": round(statistics.median(a["processo_ms"] for a in amostras), 1),
+        "importados_na_primeira": amostras[0]["importados"],
+    }
+    if args.pagina != "Dashboard":
+        resumo["pagina_mediana_ms"] = round(statistics.median(a["pagina_ms"] for a in amostras), 1)
+
+    publicar(resumo, None if args.sem_historico else HISTORICO)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
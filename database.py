@@ -1,117 +1,1035 @@
 import sqlite3
-import pandas as pd
-from datetime import datetime
+import calendar
+import contextvars
+import json
+import copy
+import math
+import os
+import threading
+import time
 from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from slow_query_log import SlowQueryLog, InstrumentedConnection
+from disk_cache import DiskCache, caminho_cache, cache_persistente
+
+# Versão do schema gravada em PRAGMA user_version; cada _migracao_N leva da versão N-1 para N
+SCHEMA_VERSION = 16
+
+# Valores conhecidos das colunas categóricas (ordem das categorias nos DataFrames)
+TIPOS_MOVIMENTACAO = ["envio", "retorno", "manutencao", "retorno_manutencao", "perda", "retorno_perda", "transferencia"]
+STATUS_EQUIPAMENTO = ["disponivel", "enviado", "manutencao", "perdido"]
+TIPOS_MANUTENCAO = ["corretiva", "preventiva", "inspecao"]
+# Medidas de uso das regras de manutenção preventiva (por peça): dias em obra e ciclos de envio
+MEDIDAS_USO = {"dias_campo": "Dias em obra por peça", "ciclos": "Envios por peça"}
+
+# Código inteiro gravado em movimentacoes_dados.tipo_id (posição em TIPOS_MOVIMENTACAO + 1)
+ENVIO, RETORNO, MANUTENCAO, RETORNO_MANUTENCAO, PERDA, RETORNO_PERDA, TRANSFERENCIA = range(1, len(TIPOS_MOVIMENTACAO) + 1)
+TIPO_ID = {nome: codigo for codigo, nome in enumerate(TIPOS_MOVIMENTACAO, start=1)}
+
+# Depósito criado na migração: recebe o estoque existente, cadastros sem depósito e movimentações antigas
+DEPOSITO_PRINCIPAL = 1
+# Efeito de cada tipo no estoque do depósito da movimentação (a transferência também soma no destino)
+EFEITO_DEPOSITO = {ENVIO: -1, RETORNO: 1, MANUTENCAO: -1, RETORNO_MANUTENCAO: 1, PERDA: -1, RETORNO_PERDA: 1,
+                   TRANSFERENCIA: -1}
+
+# Peças com serial: (estado, local) exigidos antes de cada tipo de movimentação e (estado, local) depois dela.
+# O local é o depósito da movimentação, a obra, o depósito de destino da transferência ou None (qualquer/nenhum);
+# em pecas.local_atual fica o deposito_id (disponível, manutenção) ou o obra_id (enviado)
+TRANSICOES_PECA = {
+    ENVIO: (("disponivel", "deposito"), ("enviado", "obra")),
+    RETORNO: (("enviado", "obra"), ("disponivel", "deposito")),
+    MANUTENCAO: (("disponivel", "deposito"), ("manutencao", "deposito")),
+    RETORNO_MANUTENCAO: (("manutencao", None), ("disponivel", "deposito")),
+    PERDA: (("disponivel", "deposito"), ("perdido", None)),
+    RETORNO_PERDA: (("perdido", None), ("disponivel", "deposito")),
+    TRANSFERENCIA: (("disponivel", "deposito"), ("disponivel", "destino")),
+}
+# Perda em obra: a peça sai da obra
+TRANSICAO_PERDA_OBRA = (("enviado", "obra"), ("perdido", None))
+
+# Saldos por equipamento sobre movimentacoes_dados (alias m), para consultas com GROUP BY
+SQL_SALDOS = f"""
+    COALESCE(SUM(CASE m.tipo_id WHEN {ENVIO} THEN m.quantidade
+                                WHEN {RETORNO} THEN -m.quantidade END), 0) as enviado,
+    COALESCE(SUM(CASE m.tipo_id WHEN {MANUTENCAO} THEN m.quantidade
+                                WHEN {RETORNO_MANUTENCAO} THEN -m.quantidade END), 0) as em_manutencao,
+    COALESCE(SUM(CASE m.tipo_id WHEN {PERDA} THEN m.quantidade
+                                WHEN {RETORNO_PERDA} THEN -m.quantidade END), 0) as perdido
+"""
+
+# Colunas aceitas na ordenação da lista paginada de equipamentos
+ORDENACAO_EQUIPAMENTOS = {
+    "Descrição": "e.descricao COLLATE NOCASE, e.id",
+    "Quantidade": "e.quantidade DESC, e.descricao COLLATE NOCASE, e.id",
+    "Status": "e.status, e.descricao COLLATE NOCASE, e.id",
+}
+
+# Tabelas cujas alterações incrementam versoes_dados (usadas para invalidar caches)
+TABELAS_VERSIONADAS = ("clientes", "obras", "equipamentos", "movimentacoes", "checklists", "manutencoes", "depositos",
+                       "pecas", "romaneios")
+
+# Tabelas replicadas nos tablets de campo -> colunas da chave primária; toda escrita nelas entra no log alteracoes
+TABELAS_SINCRONIZADAS = {
+    "clientes": ("id",), "obras": ("id",), "depositos": ("id",), "equipamentos": ("id",),
+    "estoque_depositos": ("equipamento_id", "deposito_id"), "movimentacoes_dados": ("id",),
+    "manutencoes": ("id",), "manutencoes_resumo": ("equipamento_id", "mes", "tipo"), "pecas": ("serial",),
+}
+# Primeiro id das movimentações (e ordens de manutenção) gravadas no tablet: não colidem com os ids do
+# servidor recebidos depois
+MOVIMENTACAO_LOCAL = 1 << 40
+
+# Tabelas com trilha de auditoria (inclusão, colunas alteradas, exclusão) na tabela auditoria
+TABELAS_AUDITADAS = ("clientes", "obras", "equipamentos", "depositos", "checklists")
+OPERACOES_AUDITORIA = {"I": "Inclusão", "U": "Alteração", "E": "Exclusão", "R": "Restauração", "D": "Remoção física"}
+# Conexões somente leitura abertas ao mesmo tempo para relatórios e exportações
+TAMANHO_POOL_LEITURA = int(os.environ.get("CMMS_POOL_LEITURA", "4"))
+# Autor gravado na auditoria quando a sessão não informou o usuário
+ATOR_PADRAO = os.environ.get("CMMS_USUARIO", "sistema")
+_ator = contextvars.ContextVar("ator", default=None)
+
+
+def definir_ator(ator):
+    """Usuário responsável pelas próximas alterações feitas nesta thread (cada sessão do Streamlit tem a sua)"""
+    _ator.set(ator or None)
+
+
+def ator_atual():
+    return _ator.get() or ATOR_PADRAO
+
+
+def para_epoch(valor):
+    """date, datetime ou texto ISO -> segundos desde 1970, mantendo o horário informado (sem fuso)"""
+    if isinstance(valor, datetime):
+        momento = valor
+    elif isinstance(valor, date):
+        momento = datetime(valor.year, valor.month, valor.day)
+    else:
+        momento = datetime.fromisoformat(str(valor))
+    return calendar.timegm(momento.timetuple())
+
+
+DIA_ZERO = date(1970, 1, 1)
+
+
+def dias_por_mes(dia_inicio, dia_fim):
+    """Divide o intervalo de dias [dia_inicio, dia_fim) por mês: pares ("AAAA-MM", dias)"""
+    dia = dia_inicio
+    while dia < dia_fim:
+        data = DIA_ZERO + timedelta(days=dia)
+        proximo_mes = (data.replace(day=28) + timedelta(days=4)).replace(day=1)
+        fim_trecho = min(dia_fim, (proximo_mes - DIA_ZERO).days)
+        yield data.strftime("%Y-%m"), fim_trecho - dia
+        dia = fim_trecho
+
+
+def normalizar_seriais(seriais):
+    """Seriais lidos (texto com um por linha/espaço/vírgula ou lista) -> (únicos na ordem de leitura, repetidos)"""
+    if isinstance(seriais, str):
+        seriais = seriais.replace(",", " ").replace(";", " ").split()
+    lidos = [serial.strip().upper() for serial in seriais if serial and serial.strip()]
+    unicos = list(dict.fromkeys(lidos))
+    return unicos, len(lidos) - len(unicos)
+
+
+def descrever_local_peca(estado, local):
+    """Estado e local de uma peça em texto (local_atual é obra_id quando enviada, senão deposito_id)"""
+    if local is None:
+        return f"'{estado}'"
+    return f"'{estado}' na obra {local}" if estado == "enviado" else f"'{estado}' no depósito {local}"
+
+
+def dia_vencimento_uso(medida, limite, base, peca_dias, em_campo, dia_referencia, unidades_enviadas, quantidade):
+    """Dia em que o uso por peça acumulado desde `base` atinge `limite` (None se o uso não avança com o tempo)"""
+    alvo = base + limite * quantidade
+    if medida == "ciclos":
+        return dia_referencia if unidades_enviadas >= alvo else None
+    if peca_dias >= alvo:
+        return dia_referencia
+    if em_campo <= 0:
+        return None
+    return dia_referencia + math.ceil((alvo - peca_dias) / em_campo)
+
+
+class PoolLeitura:
+    """Conexões somente leitura (mode=ro e query_only) reaproveitadas por relatórios e exportações.
+    
+    Em WAL cada leitura vê um snapshot e não segura lock que atrase os commits. Ao devolver a conexão as
+    leituras pendentes são encerradas, para que um snapshot esquecido não impeça o checkpoint do WAL.
+    """
+    
+    def __init__(self, db_path, tamanho=TAMANHO_POOL_LEITURA):
+        self.uri = Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+        self._livres = []
+        self._trava = threading.Lock()
+        # Além de `tamanho` leituras simultâneas, as próximas esperam uma conexão livre
+        self._vagas = threading.BoundedSemaphore(tamanho)
+    
+    def _abrir(self):
+        conn = sqlite3.connect(self.uri, uri=True, factory=InstrumentedConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # Com a função dos triggers de auditoria, uma escrita falha por ser somente leitura
+        conn.create_function("ator_atual", 0, ator_atual)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    @contextmanager
+    def conexao(self):
+        with self._vagas:
+            with self._trava:
+                conn = self._livres.pop() if self._livres else None
+            conn = conn or self._abrir()
+            try:
+                yield conn
+            finally:
+                try:
+                    conn.fechar_cursores()
+                    if conn.in_transaction:
+                        conn.rollback()
+                except sqlite3.Error:
+                    conn.close()
+                else:
+                    with self._trava:
+                        self._livres.append(conn)
+    
+    def fechar(self):
+        with self._trava:
+            livres, self._livres = self._livres, []
+        for conn in livres:
+            conn.close()
+
 
 class DatabaseManager:
-    def __init__(self, db_path="cmms_andaimes.db"):
+    def __init__(self, db_path="cmms_andaimes.db", slow_query_log=None, cache=None):
         self.db_path = db_path
+        # Log de consultas lentas (limiar/amostragem configuráveis via CMMS_SLOW_QUERY_*)
+        self.slow_query_log = slow_query_log if slow_query_log is not None else SlowQueryLog()
         self.init_database()
+        # Cache em disco de resultados derivados, válido entre restarts do app
+        self.cache = cache if cache is not None else DiskCache(caminho_cache(db_path))
+        # Compartilhado com as visões somente_leitura()
+        self.pool_leitura = PoolLeitura(db_path)
     
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=InstrumentedConnection)
         conn.row_factory = sqlite3.Row
+        # Usado pelos triggers de auditoria
+        conn.create_function("ator_atual", 0, ator_atual)
+        conn.slow_query_log = self.slow_query_log
+        conn.owner = self
         try:
             yield conn
         finally:
             conn.close()
     
+    @contextmanager
+    def get_read_connection(self):
+        """Conexão somente leitura do pool: relatórios longos não atrasam quem grava"""
+        with self.pool_leitura.conexao() as conn:
+            conn.slow_query_log = self.slow_query_log
+            conn.owner = self
+            yield conn
+    
+    def somente_leitura(self):
+        """Visão deste DatabaseManager em que todas as consultas usam o pool de leitura.
+        
+        Usada pelos relatórios e exportações; uma escrita por ela falha com "readonly database".
+        """
+        leitura = copy.copy(self)
+        leitura.get_connection = leitura.get_read_connection
+        return leitura
+    
     def init_database(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
+
+            # WAL (persistente no arquivo): leituras longas, como o backup online, não bloqueiam quem grava
+            if cursor.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+                cursor.execute("PRAGMA journal_mode=WAL")
+
+            # Banco já atualizado: uma única leitura em vez de recriar o schema a cada inicialização
+            if cursor.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
             
-            # Tabela de clientes
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS clientes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nome TEXT NOT NULL,
-                    contato TEXT,
-                    telefone TEXT,
-                    email TEXT,
-                    endereco TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Tabela de obras
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS obras (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nome TEXT NOT NULL,
-                    cliente_id INTEGER,
-                    endereco TEXT,
-                    responsavel TEXT,
-                    telefone TEXT,
-                    data_inicio DATE,
-                    data_fim DATE,
-                    status TEXT DEFAULT 'ativa',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (cliente_id) REFERENCES clientes (id)
-                )
+            cursor.execute("BEGIN IMMEDIATE")
+            versao = cursor.execute("PRAGMA user_version").fetchone()[0]
+            for numero in range(versao + 1, SCHEMA_VERSION + 1):
+                getattr(self, f"_migracao_{numero}")(cursor)
+                cursor.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+    
+    def _migracao_1(self, cursor):
+        """Schema inicial"""
+        # Tabela de clientes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS clientes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                contato TEXT,
+                telefone TEXT,
+                email TEXT,
+                endereco TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Tabela de obras
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS obras (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                cliente_id INTEGER,
+                endereco TEXT,
+                responsavel TEXT,
+                telefone TEXT,
+                data_inicio DATE,
+                data_fim DATE,
+                status TEXT DEFAULT 'ativa',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (cliente_id) REFERENCES clientes (id)
+            )
+        """)
+        
+        # Tabela de equipamentos
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS equipamentos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                descricao TEXT NOT NULL,
+                codigo TEXT,
+                medida TEXT,
+                quantidade INTEGER NOT NULL,
+                status TEXT DEFAULT 'disponivel',
+                observacoes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Tabela de movimentações
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS movimentacoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                equipamento_id INTEGER,
+                obra_id INTEGER,
+                quantidade INTEGER NOT NULL,
+                data_movimentacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                responsavel TEXT,
+                observacoes TEXT,
+                FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id),
+                FOREIGN KEY (obra_id) REFERENCES obras (id)
+            )
+        """)
+        
+        # Tabela de checklists
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS checklists (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                obra_id INTEGER,
+                responsavel TEXT,
+                data_checklist TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                itens_verificados TEXT,
+                observacoes TEXT,
+                status TEXT DEFAULT 'pendente',
+                FOREIGN KEY (obra_id) REFERENCES obras (id)
+            )
+        """)
+        
+        # Tabela de manutenções
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS manutencoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                equipamento_id INTEGER,
+                tipo TEXT NOT NULL,
+                descricao TEXT,
+                data_manutencao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                responsavel TEXT,
+                custo REAL,
+                status TEXT DEFAULT 'pendente',
+                FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id)
+            )
+        """)
+    
+    def _migracao_2(self, cursor):
+        """Versão dos dados por tabela, incrementada por triggers a cada escrita"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS versoes_dados (
+                tabela TEXT PRIMARY KEY,
+                versao INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Tabelas existentes nesta versão; as criadas depois ganham seus triggers na própria migração
+        for tabela in ("clientes", "obras", "equipamentos", "movimentacoes", "checklists", "manutencoes"):
+            cursor.execute("INSERT OR IGNORE INTO versoes_dados (tabela, versao) VALUES (?, 0)", (tabela,))
+            for evento in ("INSERT", "UPDATE", "DELETE"):
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+                    AFTER {evento} ON {tabela}
+                    BEGIN
+                        UPDATE versoes_dados SET versao = versao + 1 WHERE tabela = '{tabela}';
+                    END
+                """)
+    
+    def _migracao_3(self, cursor):
+        """Índices para saldos por equipamento e para a lista paginada de equipamentos"""
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_movimentacoes_equipamento
+            ON movimentacoes (equipamento_id, tipo, quantidade)
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_equipamentos_descricao ON equipamentos (descricao COLLATE NOCASE)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_equipamentos_status ON equipamentos (status)")
+    
+    def _migracao_4(self, cursor):
+        """Movimentações com tipo inteiro (CHECK) e data em epoch; a view movimentacoes mantém o formato antigo"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tipos_movimentacao (
+                id INTEGER PRIMARY KEY,
+                nome TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.executemany("INSERT OR IGNORE INTO tipos_movimentacao (id, nome) VALUES (?, ?)",
+                           [(codigo, nome) for nome, codigo in TIPO_ID.items()])
+        
+        cursor.execute(f"""
+            CREATE TABLE movimentacoes_dados (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo_id INTEGER NOT NULL CHECK (tipo_id BETWEEN 1 AND {len(TIPOS_MOVIMENTACAO)})
+                    REFERENCES tipos_movimentacao (id),
+                equipamento_id INTEGER,
+                obra_id INTEGER,
+                quantidade INTEGER NOT NULL,
+                data_epoch INTEGER NOT NULL,
+                responsavel TEXT,
+                observacoes TEXT,
+                FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id),
+                FOREIGN KEY (obra_id) REFERENCES obras (id)
+            )
+        """)
+        # Datas nulas ou inválidas no formato antigo ficam com o instante da migração
+        cursor.execute("""
+            INSERT INTO movimentacoes_dados (id, tipo_id, equipamento_id, obra_id, quantidade, data_epoch,
+                                             responsavel, observacoes)
+            SELECT m.id, t.id, m.equipamento_id, m.obra_id, m.quantidade,
+                   COALESCE(CAST(strftime('%s', m.data_movimentacao) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)),
+                   m.responsavel, m.observacoes
+            FROM movimentacoes m
+            JOIN tipos_movimentacao t ON t.nome = m.tipo
+        """)
+        migradas = cursor.rowcount
+        descartadas = cursor.execute("SELECT COUNT(*) FROM movimentacoes").fetchone()[0] - migradas
+        if descartadas:
+            raise sqlite3.IntegrityError(f"{descartadas} movimentação(ões) com tipo desconhecido; migração cancelada")
+        
+        # Remove a tabela antiga junto com seus índices e triggers
+        cursor.execute("DROP TABLE movimentacoes")
+        cursor.execute("""
+            CREATE INDEX idx_movimentacoes_equipamento
+            ON movimentacoes_dados (equipamento_id, tipo_id, quantidade)
+        """)
+        cursor.execute("""
+            CREATE INDEX idx_movimentacoes_obra
+            ON movimentacoes_dados (obra_id, equipamento_id, tipo_id, quantidade)
+        """)
+        cursor.execute("CREATE INDEX idx_movimentacoes_data ON movimentacoes_dados (data_epoch)")
+        
+        # Mesmas colunas e formatos da tabela antiga, para leituras existentes
+        cursor.execute("""
+            CREATE VIEW movimentacoes AS
+            SELECT m.id, t.nome as tipo, m.equipamento_id, m.obra_id, m.quantidade,
+                   datetime(m.data_epoch, 'unixepoch') as data_movimentacao,
+                   m.responsavel, m.observacoes
+            FROM movimentacoes_dados m
+            JOIN tipos_movimentacao t ON t.id = m.tipo_id
+        """)
+        # Escritas pela view continuam funcionando
+        cursor.execute("""
+            CREATE TRIGGER movimentacoes_insert INSTEAD OF INSERT ON movimentacoes
+            BEGIN
+                INSERT INTO movimentacoes_dados (id, tipo_id, equipamento_id, obra_id, quantidade, data_epoch,
+                                                 responsavel, observacoes)
+                VALUES (NEW.id, (SELECT id FROM tipos_movimentacao WHERE nome = NEW.tipo),
+                        NEW.equipamento_id, NEW.obra_id, NEW.quantidade,
+                        COALESCE(CAST(strftime('%s', NEW.data_movimentacao) AS INTEGER),
+                                 CAST(strftime('%s', 'now') AS INTEGER)),
+                        NEW.responsavel, NEW.observacoes);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER movimentacoes_update INSTEAD OF UPDATE ON movimentacoes
+            BEGIN
+                UPDATE movimentacoes_dados
+                SET tipo_id = (SELECT id FROM tipos_movimentacao WHERE nome = NEW.tipo),
+                    equipamento_id = NEW.equipamento_id, obra_id = NEW.obra_id, quantidade = NEW.quantidade,
+                    data_epoch = CAST(strftime('%s', NEW.data_movimentacao) AS INTEGER),
+                    responsavel = NEW.responsavel, observacoes = NEW.observacoes
+                WHERE id = OLD.id;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER movimentacoes_delete INSTEAD OF DELETE ON movimentacoes
+            BEGIN
+                DELETE FROM movimentacoes_dados WHERE id = OLD.id;
+            END
+        """)
+        # A versão continua sendo contada como 'movimentacoes'
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER trg_versao_movimentacoes_{evento.lower()}
+                AFTER {evento} ON movimentacoes_dados
+                BEGIN
+                    UPDATE versoes_dados SET versao = versao + 1 WHERE tabela = 'movimentacoes';
+                END
             """)
-            
-            # Tabela de equipamentos
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS equipamentos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    descricao TEXT NOT NULL,
-                    codigo TEXT,
-                    medida TEXT,
-                    quantidade INTEGER NOT NULL,
-                    status TEXT DEFAULT 'disponivel',
-                    observacoes TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
+    
+    def _migracao_5(self, cursor):
+        """Valor da diária por equipamento e faturas mensais de locação"""
+        cursor.execute("ALTER TABLE equipamentos ADD COLUMN valor_diaria REAL NOT NULL DEFAULT 0")
+        cursor.execute("""
+            CREATE TABLE faturas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                obra_id INTEGER NOT NULL,
+                competencia TEXT NOT NULL,
+                data_inicio DATE NOT NULL,
+                data_fim DATE NOT NULL,
+                equipamento_dias INTEGER NOT NULL,
+                valor_total REAL NOT NULL,
+                gerada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (obra_id, competencia),
+                FOREIGN KEY (obra_id) REFERENCES obras (id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE faturas_itens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fatura_id INTEGER NOT NULL,
+                equipamento_id INTEGER NOT NULL,
+                equipamento_dias INTEGER NOT NULL,
+                saldo_final INTEGER NOT NULL,
+                valor_diaria REAL NOT NULL,
+                valor REAL NOT NULL,
+                FOREIGN KEY (fatura_id) REFERENCES faturas (id) ON DELETE CASCADE,
+                FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id)
+            )
+        """)
+        cursor.execute("CREATE INDEX idx_faturas_itens_fatura ON faturas_itens (fatura_id)")
+    
+    def _migracao_6(self, cursor):
+        """Índice de cobertura por dia para as séries de utilização (GROUP BY sem ordenação)"""
+        cursor.execute("""
+            CREATE INDEX idx_movimentacoes_dia
+            ON movimentacoes_dados (data_epoch / 86400, tipo_id, quantidade)
+        """)
+    
+    def _migracao_7(self, cursor):
+        """Ordens de manutenção abertas/fechadas pelas movimentações e resumo de custos e prazos"""
+        cursor.execute("ALTER TABLE manutencoes ADD COLUMN quantidade INTEGER NOT NULL DEFAULT 1")
+        cursor.execute("ALTER TABLE manutencoes ADD COLUMN quantidade_retornada INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE manutencoes ADD COLUMN data_conclusao TIMESTAMP")
+        cursor.execute("ALTER TABLE manutencoes ADD COLUMN movimentacao_id INTEGER REFERENCES movimentacoes_dados (id)")
+        # Fila das ordens em aberto de cada equipamento (fechadas na ordem de abertura)
+        cursor.execute("""
+            CREATE INDEX idx_manutencoes_abertas ON manutencoes (equipamento_id, id)
+            WHERE status != 'concluida'
+        """)
+        cursor.execute("CREATE INDEX idx_manutencoes_data ON manutencoes (data_manutencao)")
+        # Totais por (equipamento, mês, tipo): aberturas contam no mês de abertura e
+        # conclusões, custo e dias de reparo (por unidade) no mês do retorno
+        cursor.execute("""
+            CREATE TABLE manutencoes_resumo (
+                equipamento_id INTEGER NOT NULL,
+                mes TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                abertas INTEGER NOT NULL DEFAULT 0,
+                concluidas INTEGER NOT NULL DEFAULT 0,
+                quantidade_aberta INTEGER NOT NULL DEFAULT 0,
+                quantidade_concluida INTEGER NOT NULL DEFAULT 0,
+                custo REAL NOT NULL DEFAULT 0,
+                dias_reparo INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (equipamento_id, mes, tipo)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX idx_manutencoes_resumo_mes ON manutencoes_resumo (mes)")
+        
+        # Ordens já cadastradas entram no resumo; o histórico de movimentações é reprocessado em ordem
+        for row in cursor.execute("""
+            SELECT equipamento_id, tipo, data_manutencao, custo, status FROM manutencoes
+            WHERE equipamento_id IS NOT NULL
+        """).fetchall():
+            epoch = para_epoch(row[2]) if row[2] else int(time.time())
+            self._somar_resumo_manutencao(cursor, row[0], epoch, row[1], abertas=1, quantidade_aberta=1,
+                                          custo=row[3] or 0)
+        for row in cursor.execute(f"""
+            SELECT id, tipo_id, equipamento_id, quantidade, data_epoch, responsavel, observacoes
+            FROM movimentacoes_dados
+            WHERE tipo_id IN ({MANUTENCAO}, {RETORNO_MANUTENCAO}) AND equipamento_id IS NOT NULL
+            ORDER BY data_epoch, id
+        """).fetchall():
+            movimentacao_id, tipo_id, equipamento_id, quantidade, data_epoch, responsavel, observacoes = row
+            if tipo_id == MANUTENCAO:
+                self._abrir_manutencao(cursor, movimentacao_id, equipamento_id, quantidade, data_epoch,
+                                       TIPOS_MANUTENCAO[0], responsavel, observacoes)
+            else:
+                self._fechar_manutencoes(cursor, equipamento_id, quantidade, data_epoch, None)
+    
+    def _migracao_8(self, cursor):
+        """Contadores de uso por equipamento, regras de manutenção preventiva e agenda de vencimentos"""
+        # Peça-dias em obra acumulados até dia_referencia; o uso atual é peca_dias + em_campo * (hoje - dia_referencia)
+        cursor.execute("""
+            CREATE TABLE contadores_uso (
+                equipamento_id INTEGER PRIMARY KEY REFERENCES equipamentos (id),
+                peca_dias INTEGER NOT NULL DEFAULT 0,
+                em_campo INTEGER NOT NULL DEFAULT 0,
+                dia_referencia INTEGER NOT NULL,
+                unidades_enviadas INTEGER NOT NULL DEFAULT 0,
+                alterado INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        cursor.execute("CREATE INDEX idx_contadores_alterados ON contadores_uso (equipamento_id) WHERE alterado = 1")
+        cursor.execute("""
+            CREATE TABLE regras_manutencao (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                descricao TEXT NOT NULL,
+                equipamento_id INTEGER REFERENCES equipamentos (id),
+                medida TEXT NOT NULL CHECK (medida IN ('dias_campo', 'ciclos')),
+                limite REAL NOT NULL CHECK (limite > 0),
+                tolerancia REAL NOT NULL DEFAULT 0,
+                ativa INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Uma linha por (regra, equipamento): contador na última conclusão e dias previstos de vencimento/atraso
+        cursor.execute("""
+            CREATE TABLE agenda_manutencao (
+                regra_id INTEGER NOT NULL REFERENCES regras_manutencao (id),
+                equipamento_id INTEGER NOT NULL REFERENCES equipamentos (id),
+                base INTEGER NOT NULL DEFAULT 0,
+                dia_previsto INTEGER,
+                dia_atraso INTEGER,
+                ordem_id INTEGER REFERENCES manutencoes (id),
+                PRIMARY KEY (regra_id, equipamento_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX idx_agenda_previsto ON agenda_manutencao (dia_previsto) WHERE ordem_id IS NULL")
+        cursor.execute("CREATE INDEX idx_agenda_ordem ON agenda_manutencao (ordem_id) WHERE ordem_id IS NOT NULL")
+        
+        # Contadores do histórico, acumulados até hoje (ou até a movimentação mais recente, se futura)
+        ultimo_dia = cursor.execute("SELECT MAX(data_epoch) / 86400 FROM movimentacoes_dados").fetchone()[0]
+        referencia = max(int(time.time()) // 86400, ultimo_dia or 0)
+        cursor.execute(f"""
+            INSERT INTO contadores_uso (equipamento_id, peca_dias, em_campo, dia_referencia, unidades_enviadas)
+            SELECT equipamento_id,
+                   SUM(CASE tipo_id WHEN {ENVIO} THEN 1 ELSE -1 END * quantidade * (? - data_epoch / 86400)),
+                   SUM(CASE tipo_id WHEN {ENVIO} THEN quantidade ELSE -quantidade END),
+                   ?,
+                   SUM(CASE tipo_id WHEN {ENVIO} THEN quantidade ELSE 0 END)
+            FROM movimentacoes_dados
+            WHERE tipo_id IN ({ENVIO}, {RETORNO}) AND equipamento_id IS NOT NULL
+            GROUP BY equipamento_id
+        """, (referencia, referencia))
+    
+    def _migracao_9(self, cursor):
+        """Resumos para as taxas de perda por obra, cliente e equipamento"""
+        # Perdas e recuperações por mês; obra_id/cliente_id 0 = perda no estoque, sem obra
+        cursor.execute("""
+            CREATE TABLE perdas_resumo (
+                mes TEXT NOT NULL,
+                obra_id INTEGER NOT NULL,
+                equipamento_id INTEGER NOT NULL,
+                cliente_id INTEGER NOT NULL,
+                perdidas INTEGER NOT NULL DEFAULT 0,
+                recuperadas INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (mes, obra_id, equipamento_id)
+            ) WITHOUT ROWID
+        """)
+        # Equipamento-dias em obra por mês, acumulados até o dia_referencia de saldos_obras
+        cursor.execute("""
+            CREATE TABLE uso_obras_mensal (
+                mes TEXT NOT NULL,
+                obra_id INTEGER NOT NULL,
+                equipamento_id INTEGER NOT NULL,
+                peca_dias INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (mes, obra_id, equipamento_id)
+            ) WITHOUT ROWID
+        """)
+        # Saldo atual em obra por par; os dias a partir de dia_referencia ainda não entraram no uso mensal
+        cursor.execute("""
+            CREATE TABLE saldos_obras (
+                obra_id INTEGER NOT NULL,
+                equipamento_id INTEGER NOT NULL,
+                em_campo INTEGER NOT NULL DEFAULT 0,
+                dia_referencia INTEGER NOT NULL,
+                PRIMARY KEY (obra_id, equipamento_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX idx_saldos_obras_em_campo ON saldos_obras (obra_id) WHERE em_campo != 0")
+        
+        cursor.execute(f"""
+            INSERT INTO perdas_resumo (mes, obra_id, equipamento_id, cliente_id, perdidas, recuperadas)
+            SELECT strftime('%Y-%m', m.data_epoch, 'unixepoch'), COALESCE(m.obra_id, 0), m.equipamento_id,
+                   COALESCE(MAX(o.cliente_id), 0),
+                   SUM(CASE m.tipo_id WHEN {PERDA} THEN m.quantidade ELSE 0 END),
+                   SUM(CASE m.tipo_id WHEN {RETORNO_PERDA} THEN m.quantidade ELSE 0 END)
+            FROM movimentacoes_dados m
+            LEFT JOIN obras o ON o.id = m.obra_id
+            WHERE m.tipo_id IN ({PERDA}, {RETORNO_PERDA}) AND m.equipamento_id IS NOT NULL
+            GROUP BY 1, 2, 3
+        """)
+        
+        # Envios e retornos de cada par em ordem: o saldo entre duas movimentações vira uso mensal
+        uso, saldos = {}, []
+        par_atual, em_campo, referencia = None, 0, 0
+        for obra_id, equipamento_id, dia, delta in cursor.execute(f"""
+            SELECT obra_id, equipamento_id, data_epoch / 86400,
+                   SUM(CASE tipo_id WHEN {ENVIO} THEN quantidade ELSE -quantidade END)
+            FROM movimentacoes_dados
+            WHERE tipo_id IN ({ENVIO}, {RETORNO}) AND obra_id IS NOT NULL AND equipamento_id IS NOT NULL
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+        """).fetchall():
+            if (obra_id, equipamento_id) != par_atual:
+                if par_atual is not None:
+                    saldos.append(par_atual + (em_campo, referencia))
+                par_atual, em_campo, referencia = (obra_id, equipamento_id), 0, dia
+            for mes, dias in dias_por_mes(referencia, dia) if em_campo else ():
+                chave = (mes, obra_id, equipamento_id)
+                uso[chave] = uso.get(chave, 0) + em_campo * dias
+            em_campo, referencia = em_campo + delta, dia
+        if par_atual is not None:
+            saldos.append(par_atual + (em_campo, referencia))
+        cursor.executemany("INSERT INTO uso_obras_mensal VALUES (?, ?, ?, ?)",
+                           [chave + (peca_dias,) for chave, peca_dias in uso.items() if peca_dias])
+        cursor.executemany("INSERT INTO saldos_obras VALUES (?, ?, ?, ?)", saldos)
+    
+    def _criar_triggers_versao(self, cursor, tabela):
+        """Versão da tabela em versoes_dados, incrementada a cada escrita (tabelas criadas após a migração 2)"""
+        cursor.execute("INSERT OR IGNORE INTO versoes_dados (tabela, versao) VALUES (?, 0)", (tabela,))
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER trg_versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE versoes_dados SET versao = versao + 1 WHERE tabela = '{tabela}';
+                END
             """)
-            
-            # Tabela de movimentações
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS movimentacoes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tipo TEXT NOT NULL,
-                    equipamento_id INTEGER,
-                    obra_id INTEGER,
-                    quantidade INTEGER NOT NULL,
-                    data_movimentacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    responsavel TEXT,
-                    observacoes TEXT,
-                    FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id),
-                    FOREIGN KEY (obra_id) REFERENCES obras (id)
-                )
+    
+    def _migracao_10(self, cursor):
+        """Depósitos, estoque por (equipamento, depósito) e transferências entre depósitos"""
+        cursor.execute("""
+            CREATE TABLE depositos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL UNIQUE,
+                endereco TEXT,
+                ativo INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("INSERT INTO depositos (id, nome) VALUES (?, 'Depósito Principal')", (DEPOSITO_PRINCIPAL,))
+        self._criar_triggers_versao(cursor, "depositos")
+        cursor.executemany("INSERT OR IGNORE INTO tipos_movimentacao (id, nome) VALUES (?, ?)",
+                           [(codigo, nome) for nome, codigo in TIPO_ID.items()])
+        
+        # O CHECK do tipo_id não pode ser alterado: a tabela é recriada com as colunas de depósito e os
+        # índices, triggers e a view de compatibilidade são recriados a partir do próprio schema
+        dependentes = cursor.execute("""
+            SELECT sql FROM sqlite_master
+            WHERE tbl_name IN ('movimentacoes_dados', 'movimentacoes') AND type IN ('view', 'index', 'trigger')
+                  AND sql IS NOT NULL
+            ORDER BY type = 'trigger', type = 'index'
+        """).fetchall()
+        sequencia = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'movimentacoes_dados'").fetchone()
+        cursor.execute("DROP VIEW movimentacoes")
+        cursor.execute(f"""
+            CREATE TABLE movimentacoes_nova (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo_id INTEGER NOT NULL CHECK (tipo_id BETWEEN 1 AND {len(TIPOS_MOVIMENTACAO)})
+                    REFERENCES tipos_movimentacao (id),
+                equipamento_id INTEGER,
+                obra_id INTEGER,
+                quantidade INTEGER NOT NULL,
+                data_epoch INTEGER NOT NULL,
+                responsavel TEXT,
+                observacoes TEXT,
+                deposito_id INTEGER NOT NULL DEFAULT {DEPOSITO_PRINCIPAL},
+                deposito_destino_id INTEGER CHECK ((tipo_id = {TRANSFERENCIA}) = (deposito_destino_id IS NOT NULL)),
+                FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id),
+                FOREIGN KEY (obra_id) REFERENCES obras (id),
+                FOREIGN KEY (deposito_id) REFERENCES depositos (id),
+                FOREIGN KEY (deposito_destino_id) REFERENCES depositos (id)
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO movimentacoes_nova (id, tipo_id, equipamento_id, obra_id, quantidade, data_epoch, responsavel, observacoes)
+            SELECT id, tipo_id, equipamento_id, obra_id, quantidade, data_epoch, responsavel, observacoes
+            FROM movimentacoes_dados
+        """)
+        cursor.execute("DROP TABLE movimentacoes_dados")
+        cursor.execute("ALTER TABLE movimentacoes_nova RENAME TO movimentacoes_dados")
+        if sequencia:
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'movimentacoes_dados'",
+                           (sequencia[0],))
+        for (sql,) in dependentes:
+            cursor.execute(sql)
+        
+        # Peças fisicamente em cada depósito; a soma por equipamento é o disponível (sem o piso em zero)
+        cursor.execute("""
+            CREATE TABLE estoque_depositos (
+                equipamento_id INTEGER NOT NULL REFERENCES equipamentos (id),
+                deposito_id INTEGER NOT NULL REFERENCES depositos (id),
+                disponivel INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (equipamento_id, deposito_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX idx_estoque_depositos_deposito ON estoque_depositos (deposito_id, equipamento_id, disponivel)")
+        efeito = " ".join(f"WHEN {tipo_id} THEN {sinal}" for tipo_id, sinal in EFEITO_DEPOSITO.items())
+        cursor.execute(f"""
+            INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel)
+            SELECT e.id, ?, e.quantidade + COALESCE(s.saldo, 0)
+            FROM equipamentos e
+            LEFT JOIN (
+                SELECT equipamento_id, SUM(CASE tipo_id {efeito} END * quantidade) as saldo
+                FROM movimentacoes_dados
+                GROUP BY equipamento_id
+            ) s ON s.equipamento_id = e.id
+        """, (DEPOSITO_PRINCIPAL,))
+    
+    def _migracao_11(self, cursor):
+        """Peças com serial (rastreadas individualmente) e seriais de cada movimentação"""
+        cursor.execute(f"""
+            CREATE TABLE pecas (
+                serial TEXT PRIMARY KEY,
+                equipamento_id INTEGER NOT NULL REFERENCES equipamentos (id),
+                estado TEXT NOT NULL DEFAULT 'disponivel' CHECK (estado IN ({", ".join(f"'{e}'" for e in STATUS_EQUIPAMENTO)})),
+                local_atual INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """)
+        # Contagem de peças etiquetadas por local (consistência com os saldos agregados)
+        cursor.execute("CREATE INDEX idx_pecas_local ON pecas (estado, local_atual, equipamento_id)")
+        cursor.execute("CREATE INDEX idx_pecas_equipamento ON pecas (equipamento_id)")
+        cursor.execute("""
+            CREATE TABLE movimentacoes_pecas (
+                movimentacao_id INTEGER NOT NULL REFERENCES movimentacoes_dados (id),
+                serial TEXT NOT NULL REFERENCES pecas (serial),
+                PRIMARY KEY (movimentacao_id, serial)
+            ) WITHOUT ROWID
+        """)
+        # Histórico de uma peça
+        cursor.execute("CREATE INDEX idx_movimentacoes_pecas_serial ON movimentacoes_pecas (serial, movimentacao_id)")
+        self._criar_triggers_versao(cursor, "pecas")
+    
+    def _criar_triggers_alteracoes(self, cursor, tabela, colunas_chave):
+        """Registra em alteracoes cada escrita na tabela, exceto as aplicadas pela própria sincronização"""
+        for evento, operacao, linha in (("INSERT", "I", "NEW"), ("UPDATE", "U", "NEW"), ("DELETE", "D", "OLD")):
+            chave = ", ".join(f"{linha}.{coluna}" for coluna in colunas_chave)
+            cursor.execute(f"""
+                CREATE TRIGGER trg_alteracoes_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                WHEN (SELECT aplicando_remoto FROM estado_sincronizacao) = 0
+                BEGIN
+                    INSERT INTO alteracoes (tabela, chave, operacao) VALUES ('{tabela}', json_array({chave}), '{operacao}');
+                END
             """)
-            
-            # Tabela de checklists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS checklists (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tipo TEXT NOT NULL,
-                    obra_id INTEGER,
-                    responsavel TEXT,
-                    data_checklist TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    itens_verificados TEXT,
-                    observacoes TEXT,
-                    status TEXT DEFAULT 'pendente',
-                    FOREIGN KEY (obra_id) REFERENCES obras (id)
-                )
+    
+    def _migracao_12(self, cursor):
+        """Log de alterações com sequência crescente (feed de deltas dos tablets) e estado da sincronização"""
+        cursor.execute("""
+            CREATE TABLE alteracoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tabela TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                operacao TEXT NOT NULL CHECK (operacao IN ('I', 'U', 'D'))
+            )
+        """)
+        # Compactação: última alteração de cada registro
+        cursor.execute("CREATE INDEX idx_alteracoes_chave ON alteracoes (tabela, chave, seq)")
+        # Uma linha: no tablet guarda o dispositivo e a última sequência do servidor já aplicada;
+        # aplicando_remoto = 1 enquanto dados recebidos são gravados (não voltam para o log)
+        cursor.execute("""
+            CREATE TABLE estado_sincronizacao (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                dispositivo TEXT,
+                ultimo_seq_recebido INTEGER NOT NULL DEFAULT 0,
+                aplicando_remoto INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT INTO estado_sincronizacao (id) VALUES (1)")
+        # Movimentações recebidas de cada tablet: reenvios (resposta perdida) devolvem o mesmo resultado
+        cursor.execute("""
+            CREATE TABLE sincronizacao_recebidas (
+                dispositivo TEXT NOT NULL,
+                id_local INTEGER NOT NULL,
+                situacao TEXT NOT NULL,
+                movimentacao_id INTEGER,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (dispositivo, id_local)
+            ) WITHOUT ROWID
+        """)
+        for tabela, colunas_chave in (("clientes", ("id",)), ("obras", ("id",)), ("depositos", ("id",)),
+                                      ("equipamentos", ("id",)), ("estoque_depositos", ("equipamento_id", "deposito_id")),
+                                      ("movimentacoes_dados", ("id",))):
+            self._criar_triggers_alteracoes(cursor, tabela, colunas_chave)
+    
+    def _criar_triggers_auditoria(self, cursor, tabela):
+        """Auditoria da tabela: inclusão, {coluna: [antes, depois]} das colunas alteradas e remoção física.
+        
+        As colunas são lidas do schema atual; migrações que adicionarem colunas recriam estes triggers.
+        """
+        colunas = [row[1] for row in cursor.execute(f"PRAGMA table_info({tabela})") if row[1] != "id"]
+        mudou = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in colunas)
+        # json_patch descarta as chaves com valor NULL: ficam só as colunas alteradas
+        diferencas = ", ".join(f"'{c}', CASE WHEN OLD.{c} IS NOT NEW.{c} THEN json_array(OLD.{c}, NEW.{c}) END"
+                               for c in colunas)
+        antigos = ", ".join(f"'{c}', OLD.{c}" for c in colunas)
+        operacao = "'U'"
+        if "excluido_em" in colunas:
+            operacao = """CASE WHEN OLD.excluido_em IS NULL AND NEW.excluido_em IS NOT NULL THEN 'E'
+                               WHEN OLD.excluido_em IS NOT NULL AND NEW.excluido_em IS NULL THEN 'R' ELSE 'U' END"""
+        # No tablet, deltas recebidos do servidor já estão na auditoria de lá
+        local = "(SELECT aplicando_remoto FROM estado_sincronizacao) = 0"
+        gatilhos = {
+            "insert": ("INSERT", f"WHEN {local}", "NEW.id", "'I'", "NULL"),
+            "update": ("UPDATE", f"WHEN {local} AND ({mudou})", "NEW.id", operacao,
+                       f"json_patch('{{}}', json_object({diferencas}))"),
+            "delete": ("DELETE", f"WHEN {local}", "OLD.id", "'D'", f"json_object({antigos})"),
+        }
+        for nome, (evento, condicao, registro_id, operacao_sql, alteracoes) in gatilhos.items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_auditoria_{tabela}_{nome}")
+            cursor.execute(f"""
+                CREATE TRIGGER trg_auditoria_{tabela}_{nome}
+                AFTER {evento} ON {tabela} {condicao}
+                BEGIN
+                    INSERT INTO auditoria (tabela, registro_id, momento, operacao, ator, alteracoes)
+                    VALUES ('{tabela}', {registro_id}, CAST(strftime('%s', 'now') AS INTEGER), {operacao_sql},
+                            ator_atual(), {alteracoes});
+                END
             """)
-            
-            # Tabela de manutenções
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS manutencoes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    equipamento_id INTEGER,
-                    tipo TEXT NOT NULL,
-                    descricao TEXT,
-                    data_manutencao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    responsavel TEXT,
-                    custo REAL,
-                    status TEXT DEFAULT 'pendente',
-                    FOREIGN KEY (equipamento_id) REFERENCES equipamentos (id)
-                )
+    
+    def _migracao_13(self, cursor):
+        """Trilha de auditoria (somente inclusão) e exclusão lógica de clientes, obras e equipamentos"""
+        cursor.execute("""
+            CREATE TABLE auditoria (
+                id INTEGER PRIMARY KEY,
+                tabela TEXT NOT NULL,
+                registro_id INTEGER NOT NULL,
+                momento INTEGER NOT NULL,
+                operacao TEXT NOT NULL,
+                ator TEXT,
+                alteracoes TEXT
+            )
+        """)
+        # Histórico de um registro: uma leitura de faixa; e consultas por período
+        cursor.execute("CREATE INDEX idx_auditoria_registro ON auditoria (tabela, registro_id, momento)")
+        cursor.execute("CREATE INDEX idx_auditoria_momento ON auditoria (momento)")
+        for evento in ("UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER trg_auditoria_somente_inclusao_{evento.lower()}
+                BEFORE {evento} ON auditoria
+                BEGIN
+                    SELECT RAISE(ABORT, 'A auditoria aceita apenas inclusões');
+                END
             """)
-            
-            conn.commit()
+        for tabela in ("clientes", "obras", "equipamentos"):
+            cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN excluido_em TIMESTAMP")
+        for tabela in ("clientes", "obras", "equipamentos", "depositos", "checklists"):
+            self._criar_triggers_auditoria(cursor, tabela)
+    
+    def _migracao_14(self, cursor):
+        """Romaneios: cabeçalho numerado de cada lote de movimentações, com os totais já somados"""
+        cursor.execute(f"""
+            CREATE TABLE romaneios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo_id INTEGER NOT NULL CHECK (tipo_id BETWEEN 1 AND {len(TIPOS_MOVIMENTACAO)})
+                    REFERENCES tipos_movimentacao (id),
+                obra_id INTEGER REFERENCES obras (id),
+                deposito_id INTEGER NOT NULL REFERENCES depositos (id),
+                deposito_destino_id INTEGER REFERENCES depositos (id),
+                data_epoch INTEGER NOT NULL,
+                responsavel TEXT,
+                observacoes TEXT,
+                total_linhas INTEGER NOT NULL DEFAULT 0,
+                total_itens INTEGER NOT NULL DEFAULT 0,
+                valor_diario REAL NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Romaneios de uma obra e do período, mais recentes primeiro
+        cursor.execute("CREATE INDEX idx_romaneios_obra ON romaneios (obra_id, data_epoch)")
+        cursor.execute("CREATE INDEX idx_romaneios_data ON romaneios (data_epoch)")
+        self._criar_triggers_versao(cursor, "romaneios")
+        cursor.execute("ALTER TABLE movimentacoes_dados ADD COLUMN romaneio_id INTEGER REFERENCES romaneios (id)")
+        # Linhas de um romaneio; movimentações avulsas (sem romaneio) ficam fora do índice
+        cursor.execute("""
+            CREATE INDEX idx_movimentacoes_romaneio ON movimentacoes_dados (romaneio_id) WHERE romaneio_id IS NOT NULL
+        """)
+    
+    def _migracao_15(self, cursor):
+        """Manutenções e peças replicadas nos tablets; custo do retorno de manutenção gravado na movimentação"""
+        cursor.execute("ALTER TABLE movimentacoes_dados ADD COLUMN custo REAL")
+        for tabela in ("manutencoes", "manutencoes_resumo", "pecas"):
+            self._criar_triggers_alteracoes(cursor, tabela, TABELAS_SINCRONIZADAS[tabela])
+    
+    def _migracao_16(self, cursor):
+        """Marca os retornos gravados como baixa do saldo da obra por uma perda (não são retornos de fato)"""
+        cursor.execute("ALTER TABLE movimentacoes_dados ADD COLUMN baixa_perda INTEGER NOT NULL DEFAULT 0")
+        # A baixa é gravada logo antes da perda, na mesma transação e com os mesmos dados
+        cursor.execute(f"""
+            UPDATE movimentacoes_dados SET baixa_perda = 1
+            WHERE tipo_id = {RETORNO} AND EXISTS (
+                SELECT 1 FROM movimentacoes_dados p
+                WHERE p.id = movimentacoes_dados.id + 1 AND p.tipo_id = {PERDA}
+                  AND p.equipamento_id = movimentacoes_dados.equipamento_id AND p.obra_id = movimentacoes_dados.obra_id
+                  AND p.quantidade = movimentacoes_dados.quantidade AND p.data_epoch = movimentacoes_dados.data_epoch
+            )
+        """)
+        # Contagens por período continuam só no índice, já sem as baixas
+        cursor.execute("DROP INDEX idx_movimentacoes_data")
+        cursor.execute("CREATE INDEX idx_movimentacoes_data ON movimentacoes_dados (data_epoch, baixa_perda)")
+    
+    def get_versoes_dados(self, tabelas=None):
+        """Versão atual de cada tabela (muda sempre que a tabela é alterada, inclusive por outro processo)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT tabela, versao FROM versoes_dados")
+            versoes = {row[0]: row[1] for row in cursor.fetchall()}
+        tabelas = tabelas or TABELAS_VERSIONADAS
+        return tuple((tabela, versoes.get(tabela, 0)) for tabela in tabelas)
+    
+    def _consulta_df(self, sql, parametros=(), categorias=None, datas=(), inteiros=(), codigos=None, epochs=()):
+        """Executa a consulta e monta um DataFrame coluna a coluna, com tipos compactos.
+        
+        `categorias` mapeia coluna -> lista de categorias (ou None para inferir), `datas` são
+        convertidas uma única vez para datetime64 e `inteiros` (ids) ficam em Int64 (os ids dos shards e
+        as movimentações locais dos tablets passam de 2^31).
+        `codigos` mapeia coluna de códigos 0..n-1 -> categorias e `epochs` são datas em segundos.
+        """
+        import pandas as pd
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Tuplas em vez de sqlite3.Row: sem alocar um dict por linha
+            cursor.row_factory = None
+            cursor.execute(sql, parametros)
+            nomes = [coluna[0] for coluna in cursor.description]
+            linhas = cursor.fetchall()
+        
+        colunas = list(zip(*linhas)) if linhas else [()] * len(nomes)
+        dados = {}
+        for nome, valores in zip(nomes, colunas):
+            if codigos and nome in codigos:
+                dados[nome] = pd.Categorical.from_codes(valores, categories=codigos[nome])
+            elif nome in epochs:
+                dados[nome] = pd.to_datetime(pd.Series(valores, dtype="int64"), unit="s")
+            elif categorias and nome in categorias:
+                dtype = pd.CategoricalDtype(categorias[nome]) if categorias[nome] else "category"
+                dados[nome] = pd.Series(valores, dtype=dtype)
+            elif nome in datas:
+                dados[nome] = pd.to_datetime(pd.Series(valores, dtype=object), format="ISO8601")
+            elif nome in inteiros:
+                dados[nome] = pd.Series(valores, dtype="Int64")
+            else:
+                dados[nome] = pd.Series(valores)
+        return pd.DataFrame(dados, columns=nomes)
     
     # Métodos para clientes
     def add_cliente(self, nome, contato, telefone, email, endereco):
@@ -127,13 +1045,13 @@ class DatabaseManager:
     def get_clientes(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM clientes ORDER BY nome")
+            cursor.execute("SELECT * FROM clientes WHERE excluido_em IS NULL ORDER BY nome")
             return [dict(row) for row in cursor.fetchall()]
     
     def get_total_clientes(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM clientes")
+            cursor.execute("SELECT COUNT(*) FROM clientes WHERE excluido_em IS NULL")
             return cursor.fetchone()[0]
     
     def update_cliente(self, id, nome, contato, telefone, email, endereco):
@@ -147,9 +1065,10 @@ class DatabaseManager:
             conn.commit()
     
     def delete_cliente(self, id):
+        """Exclusão lógica: o cliente sai das listas, mas obras, faturas e auditoria continuam apontando para ele"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM clientes WHERE id=?", (id,))
+            cursor.execute("UPDATE clientes SET excluido_em = CURRENT_TIMESTAMP WHERE id=? AND excluido_em IS NULL", (id,))
             conn.commit()
     
     # Métodos para obras
@@ -163,13 +1082,14 @@ class DatabaseManager:
             conn.commit()
             return cursor.lastrowid
     
-    def get_obras(self):
+    def get_obras(self, incluir_excluidas=False):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT o.*, c.nome as cliente_nome 
                 FROM obras o 
                 LEFT JOIN clientes c ON o.cliente_id = c.id 
+                {"" if incluir_excluidas else "WHERE o.excluido_em IS NULL"}
                 ORDER BY o.nome
             """)
             return [dict(row) for row in cursor.fetchall()]
@@ -185,26 +1105,85 @@ class DatabaseManager:
             conn.commit()
     
     def delete_obra(self, id):
+        """Exclusão lógica: a obra sai das listas, mas suas movimentações e faturas continuam referenciando-a"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE obras SET excluido_em = CURRENT_TIMESTAMP WHERE id=? AND excluido_em IS NULL", (id,))
+            conn.commit()
+    
+    # Métodos para depósitos
+    def add_deposito(self, nome, endereco=None):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO depositos (nome, endereco) VALUES (?, ?)", (nome, endereco))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def get_depositos(self, incluir_inativos=False):
+        """Depósitos com o total de peças em estoque em cada um"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT d.*, COALESCE((SELECT SUM(s.disponivel) FROM estoque_depositos s
+                                      WHERE s.deposito_id = d.id), 0) as pecas
+                FROM depositos d
+                {"" if incluir_inativos else "WHERE d.ativo = 1"}
+                ORDER BY d.id = {DEPOSITO_PRINCIPAL} DESC, d.nome
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def update_deposito(self, id, nome, endereco, ativo=True):
+        """Atualiza o cadastro; o depósito principal não pode ser desativado"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM obras WHERE id=?", (id,))
+            cursor.execute("UPDATE depositos SET nome=?, endereco=?, ativo=? WHERE id=?",
+                           (nome, endereco, 1 if ativo or id == DEPOSITO_PRINCIPAL else 0, id))
             conn.commit()
     
+    def get_estoque_deposito(self, deposito_id):
+        """{equipamento_id: peças no depósito} pelo índice do depósito (só saldos positivos)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute("""
+                SELECT equipamento_id, disponivel FROM estoque_depositos
+                WHERE deposito_id = ? AND disponivel > 0
+            """, (deposito_id,))
+            return dict(cursor.fetchall())
+    
+    def get_estoque_por_deposito(self, equipamento_id):
+        """Peças do equipamento em cada depósito"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT d.id, d.nome, s.disponivel
+                FROM estoque_depositos s
+                JOIN depositos d ON d.id = s.deposito_id
+                WHERE s.equipamento_id = ? AND s.disponivel != 0
+                ORDER BY d.nome
+            """, (equipamento_id,))
+            return [dict(row) for row in cursor.fetchall()]
+    
     # Métodos para equipamentos
-    def add_equipamento(self, descricao, codigo, medida, quantidade, observacoes):
+    def add_equipamento(self, descricao, codigo, medida, quantidade, observacoes, valor_diaria=0, deposito_id=None):
+        """Cadastra o equipamento com o estoque inicial no depósito informado (padrão: principal)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO equipamentos (descricao, codigo, medida, quantidade, observacoes)
-                VALUES (?, ?, ?, ?, ?)
-            """, (descricao, codigo, medida, quantidade, observacoes))
+                INSERT INTO equipamentos (descricao, codigo, medida, quantidade, observacoes, valor_diaria)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (descricao, codigo, medida, quantidade, observacoes, valor_diaria or 0))
+            equipamento_id = cursor.lastrowid
+            self._somar_estoque_deposito(cursor, equipamento_id, deposito_id or DEPOSITO_PRINCIPAL, quantidade)
             conn.commit()
-            return cursor.lastrowid
+            return equipamento_id
     
-    def get_equipamentos(self):
+    def get_equipamentos(self, incluir_excluidos=False):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM equipamentos ORDER BY descricao")
+            cursor.execute(f"""
+                SELECT * FROM equipamentos {"" if incluir_excluidos else "WHERE excluido_em IS NULL"} ORDER BY descricao
+            """)
             return [dict(row) for row in cursor.fetchall()]
     
     def equipamento_existe(self, descricao, equipamento_id=None):
@@ -213,25 +1192,31 @@ class DatabaseManager:
             cursor = conn.cursor()
             if equipamento_id:
                 # Para edição, excluir o próprio equipamento da verificação
-                cursor.execute("SELECT COUNT(*) FROM equipamentos WHERE descricao = ? AND id != ?", 
+                cursor.execute("SELECT COUNT(*) FROM equipamentos WHERE descricao = ? AND id != ? AND excluido_em IS NULL",
                              (descricao, equipamento_id))
             else:
                 # Para novo cadastro
-                cursor.execute("SELECT COUNT(*) FROM equipamentos WHERE descricao = ?", (descricao,))
+                cursor.execute("SELECT COUNT(*) FROM equipamentos WHERE descricao = ? AND excluido_em IS NULL", (descricao,))
             
             return cursor.fetchone()[0] > 0
     
     def get_total_equipamentos(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT SUM(quantidade) FROM equipamentos")
+            cursor.execute("SELECT SUM(quantidade) FROM equipamentos WHERE excluido_em IS NULL")
             result = cursor.fetchone()[0]
             return result if result else 0
     
+    def get_equipamentos_df(self):
+        return self._consulta_df("SELECT * FROM equipamentos WHERE excluido_em IS NULL ORDER BY descricao",
+                                 categorias={"status": STATUS_EQUIPAMENTO},
+                                 datas=("created_at",),
+                                 inteiros=("id",))
+    
     def get_equipamentos_by_status(self, status):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM equipamentos WHERE status=?", (status,))
+            cursor.execute("SELECT * FROM equipamentos WHERE status=? AND excluido_em IS NULL", (status,))
             return [dict(row) for row in cursor.fetchall()]
     
     def get_equipamentos_status_summary(self):
@@ -240,48 +1225,304 @@ class DatabaseManager:
             cursor.execute("""
                 SELECT status, SUM(quantidade) as quantidade 
                 FROM equipamentos 
+                WHERE excluido_em IS NULL
                 GROUP BY status
             """)
             return [dict(row) for row in cursor.fetchall()]
     
-    def update_equipamento(self, id, descricao, codigo, medida, quantidade, status, observacoes):
+    def _filtro_equipamentos(self, busca=None, status=None):
+        condicoes, parametros = ["e.excluido_em IS NULL"], []
+        if busca:
+            # LIKE só ignora maiúsculas em ASCII; descrições são gravadas em MAIÚSCULAS (ex.: "BRAÇ")
+            condicoes.append("(e.descricao LIKE ? OR e.descricao LIKE ? OR e.codigo LIKE ?)")
+            parametros += [f"%{busca}%", f"%{busca.upper()}%", f"%{busca}%"]
+        if status:
+            condicoes.append("e.status = ?")
+            parametros.append(status)
+        return " WHERE " + " AND ".join(condicoes), parametros
+    
+    def get_equipamentos_pagina(self, busca=None, status=None, ordenar_por="Descrição", pagina=0, por_pagina=50):
+        """Uma página de equipamentos já filtrada/ordenada no banco, com saldos apenas das linhas da página.
+        
+        Retorna (linhas, total de equipamentos que atendem ao filtro).
+        """
+        where, parametros = self._filtro_equipamentos(busca, status)
+        ordem = ORDENACAO_EQUIPAMENTOS.get(ordenar_por, ORDENACAO_EQUIPAMENTOS["Descrição"])
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM equipamentos e{where}", parametros)
+            total = cursor.fetchone()[0]
+            cursor.execute(f"""
+                WITH pagina AS (
+                    SELECT e.* FROM equipamentos e{where}
+                    ORDER BY {ordem}
+                    LIMIT ? OFFSET ?
+                )
+                SELECT e.id, e.descricao, e.codigo, e.medida, e.quantidade, e.status, e.observacoes, e.valor_diaria,
+                    {SQL_SALDOS}
+                FROM pagina e
+                LEFT JOIN movimentacoes_dados m ON m.equipamento_id = e.id
+                GROUP BY e.id
+                ORDER BY {ordem}
+            """, parametros + [por_pagina, pagina * por_pagina])
+            linhas = []
+            for row in cursor.fetchall():
+                linha = dict(row)
+                # Mesma regra de get_estoque_snapshot
+                linha['disponivel'] = max(0, linha['quantidade'] - linha['enviado'] - linha['em_manutencao'] - linha['perdido'])
+                linha['em_manutencao'] = max(0, linha['em_manutencao'])
+                linha['perdido'] = max(0, linha['perdido'])
+                linhas.append(linha)
+            return linhas, total
+    
+    @cache_persistente("equipamentos", "movimentacoes")
+    def get_equipamentos_resumo(self, busca=None, status=None):
+        """Totais (itens, quantidade, disponível, em manutenção) dos equipamentos que atendem ao filtro"""
+        where, parametros = self._filtro_equipamentos(busca, status)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH saldos AS (
+                    SELECT m.equipamento_id, {SQL_SALDOS}
+                    FROM movimentacoes_dados m
+                    GROUP BY m.equipamento_id
+                )
+                SELECT COUNT(*) as itens,
+                    COALESCE(SUM(e.quantidade), 0) as quantidade,
+                    COALESCE(SUM(MAX(0, e.quantidade - COALESCE(s.enviado, 0) - COALESCE(s.em_manutencao, 0)
+                                        - COALESCE(s.perdido, 0))), 0) as disponivel,
+                    COALESCE(SUM(MAX(0, COALESCE(s.em_manutencao, 0))), 0) as em_manutencao
+                FROM equipamentos e
+                LEFT JOIN saldos s ON s.equipamento_id = e.id{where}
+            """, parametros)
+            return dict(cursor.fetchone())
+    
+    def update_equipamento(self, id, descricao, codigo, medida, quantidade, status, observacoes, valor_diaria=None):
+        """Atualiza o cadastro; a diferença de quantidade entra (ou sai) do depósito principal"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            anterior = cursor.execute("SELECT quantidade FROM equipamentos WHERE id=?", (id,)).fetchone()
+            if anterior and quantidade != anterior[0]:
+                self._somar_estoque_deposito(cursor, id, DEPOSITO_PRINCIPAL, quantidade - anterior[0])
             cursor.execute("""
                 UPDATE equipamentos 
-                SET descricao=?, codigo=?, medida=?, quantidade=?, status=?, observacoes=?
+                SET descricao=?, codigo=?, medida=?, quantidade=?, status=?, observacoes=?,
+                    valor_diaria=COALESCE(?, valor_diaria)
                 WHERE id=?
-            """, (descricao, codigo, medida, quantidade, status, observacoes, id))
+            """, (descricao, codigo, medida, quantidade, status, observacoes, valor_diaria, id))
+            conn.commit()
+    
+    def update_valor_diaria(self, id, valor_diaria):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE equipamentos SET valor_diaria=? WHERE id=?", (valor_diaria, id))
             conn.commit()
     
     def delete_equipamento(self, id):
+        """Exclusão lógica: o equipamento sai das listas e do estoque, mas o histórico de movimentações,
+        peças e auditoria continua ligado a ele (o saldo por depósito é preservado)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM equipamentos WHERE id=?", (id,))
+            cursor.execute("UPDATE equipamentos SET excluido_em = CURRENT_TIMESTAMP WHERE id=? AND excluido_em IS NULL", (id,))
             conn.commit()
     
     # Métodos para movimentações
-    def add_movimentacao(self, tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_movimentacao=None):
+    def add_movimentacao(self, tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_movimentacao=None,
+                         tipo_manutencao=None, custo=None, deposito_id=None, deposito_destino_id=None):
+        """Registra a movimentação; envio para manutenção abre uma ordem e o retorno fecha as ordens
+        em aberto do equipamento (mais antigas primeiro), na mesma transação.
+        
+        `tipo_manutencao` vale para "manutencao" e `custo` (total do retorno) para "retorno_manutencao".
+        Perda com obra é registrada como baixa do saldo da obra (retorno) seguida da perda atribuída a ela.
+        `deposito_id` é a origem (envio, manutenção, perda, transferência) ou o destino (retornos) no
+        estoque; `deposito_destino_id` é o destino da transferência.
+        """
+        # Sem data informada vale o instante atual (UTC, como o CURRENT_TIMESTAMP anterior)
+        data_epoch = para_epoch(data_movimentacao) if data_movimentacao else int(time.time())
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            if data_movimentacao:
-                # Converter date para datetime se necessário
-                if hasattr(data_movimentacao, 'strftime'):
-                    data_str = data_movimentacao.strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    data_str = str(data_movimentacao) + ' 00:00:00'
-                
-                cursor.execute("""
-                    INSERT INTO movimentacoes (tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_movimentacao)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_str))
-            else:
-                cursor.execute("""
-                    INSERT INTO movimentacoes (tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes))
+            movimentacao_id = self._registrar_movimentacao(cursor, tipo, equipamento_id, obra_id, quantidade, responsavel,
+                                                           observacoes, data_epoch, tipo_manutencao, custo,
+                                                           deposito_id, deposito_destino_id)
             conn.commit()
-            return cursor.lastrowid
+            return movimentacao_id
+    
+    def _registrar_movimentacao(self, cursor, tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes,
+                                data_epoch, tipo_manutencao=None, custo=None, deposito_id=None, deposito_destino_id=None,
+                                romaneio_id=None):
+        """Corpo de add_movimentacao, sem commit (para gravar várias movimentações em uma transação)"""
+        deposito_id = deposito_id or DEPOSITO_PRINCIPAL
+        if tipo == "perda" and obra_id:
+            self._inserir_movimentacao(cursor, RETORNO, equipamento_id, obra_id, quantidade, responsavel,
+                                       f"Baixa por perda na obra. {observacoes or ''}".strip(), data_epoch,
+                                       deposito_id, romaneio_id=romaneio_id, baixa_perda=True)
+        movimentacao_id = self._inserir_movimentacao(cursor, TIPO_ID.get(tipo), equipamento_id, obra_id, quantidade,
+                                                     responsavel, observacoes, data_epoch, deposito_id,
+                                                     deposito_destino_id if tipo == "transferencia" else None,
+                                                     romaneio_id, custo if tipo == "retorno_manutencao" else None)
+        if tipo == "manutencao":
+            self._abrir_manutencao(cursor, movimentacao_id, equipamento_id, quantidade, data_epoch,
+                                   tipo_manutencao or TIPOS_MANUTENCAO[0], responsavel, observacoes)
+        elif tipo == "retorno_manutencao":
+            self._fechar_manutencoes(cursor, equipamento_id, quantidade, data_epoch, custo)
+        return movimentacao_id
+    
+    def _inserir_movimentacao(self, cursor, tipo_id, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_epoch,
+                              deposito_id=DEPOSITO_PRINCIPAL, deposito_destino_id=None, romaneio_id=None, custo=None,
+                              baixa_perda=False):
+        """Insere a linha e atualiza, na mesma transação, os contadores e resumos derivados dela.
+        
+        `baixa_perda` marca o retorno que tira do saldo da obra o que foi perdido nela: ele conta nos saldos,
+        mas fica fora das listas e das contagens por tipo.
+        """
+        cursor.execute("""
+            INSERT INTO movimentacoes_dados (tipo_id, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_epoch,
+                                             deposito_id, deposito_destino_id, romaneio_id, custo, baixa_perda)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (tipo_id, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_epoch,
+              deposito_id, deposito_destino_id, romaneio_id, custo, int(baixa_perda)))
+        movimentacao_id = cursor.lastrowid
+        self._somar_estoque_deposito(cursor, equipamento_id, deposito_id, EFEITO_DEPOSITO[tipo_id] * quantidade)
+        if deposito_destino_id:
+            self._somar_estoque_deposito(cursor, equipamento_id, deposito_destino_id, quantidade)
+        self._atualizar_resumos_movimentacao(cursor, tipo_id, equipamento_id, obra_id, quantidade, data_epoch)
+        return movimentacao_id
+    
+    def _atualizar_resumos_movimentacao(self, cursor, tipo_id, equipamento_id, obra_id, quantidade, data_epoch):
+        """Contadores de uso, saldo em obra (e uso mensal) e resumo de perdas da movimentação; quantidade
+        negativa desfaz o que a mesma movimentação somou"""
+        if tipo_id in (ENVIO, RETORNO):
+            self._atualizar_contadores_uso(cursor, equipamento_id, tipo_id, quantidade, data_epoch)
+            if obra_id:
+                self._atualizar_saldo_obra(cursor, obra_id, equipamento_id, quantidade if tipo_id == ENVIO else -quantidade,
+                                           data_epoch // 86400)
+        elif tipo_id in (PERDA, RETORNO_PERDA):
+            self._somar_resumo_perdas(cursor, data_epoch, obra_id, equipamento_id,
+                                      perdidas=quantidade if tipo_id == PERDA else 0,
+                                      recuperadas=quantidade if tipo_id == RETORNO_PERDA else 0)
+    
+    def _somar_estoque_deposito(self, cursor, equipamento_id, deposito_id, delta):
+        cursor.execute("""
+            INSERT INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (?, ?, ?)
+            ON CONFLICT (equipamento_id, deposito_id) DO UPDATE SET disponivel = disponivel + excluded.disponivel
+        """, (equipamento_id, deposito_id, delta))
+    
+    def _somar_resumo_perdas(self, cursor, data_epoch, obra_id, equipamento_id, perdidas=0, recuperadas=0):
+        """Perdas por (mês, obra, equipamento), com o cliente da obra no momento da perda (0 = sem obra/cliente)"""
+        cursor.execute("""
+            INSERT INTO perdas_resumo (mes, obra_id, equipamento_id, cliente_id, perdidas, recuperadas)
+            VALUES (strftime('%Y-%m', ?, 'unixepoch'), ?, ?,
+                    COALESCE((SELECT cliente_id FROM obras WHERE id = ?), 0), ?, ?)
+            ON CONFLICT (mes, obra_id, equipamento_id) DO UPDATE SET
+                perdidas = perdidas + excluded.perdidas,
+                recuperadas = recuperadas + excluded.recuperadas
+        """, (data_epoch, obra_id or 0, equipamento_id, obra_id, perdidas, recuperadas))
+    
+    def _somar_uso_mensal(self, cursor, obra_id, equipamento_id, quantidade, dia_inicio, dia_fim):
+        """Soma quantidade x dias de [dia_inicio, dia_fim) ao uso mensal do par, mês a mês"""
+        if not quantidade:
+            return
+        cursor.executemany("""
+            INSERT INTO uso_obras_mensal (mes, obra_id, equipamento_id, peca_dias) VALUES (?, ?, ?, ?)
+            ON CONFLICT (mes, obra_id, equipamento_id) DO UPDATE SET peca_dias = peca_dias + excluded.peca_dias
+        """, [(mes, obra_id, equipamento_id, quantidade * dias) for mes, dias in dias_por_mes(dia_inicio, dia_fim)])
+    
+    def _atualizar_saldo_obra(self, cursor, obra_id, equipamento_id, delta, dia):
+        """Saldo em obra do par e equipamento-dias mensais já decorridos (antes de dia_referencia)"""
+        linha = cursor.execute("""
+            SELECT em_campo, dia_referencia FROM saldos_obras WHERE obra_id = ? AND equipamento_id = ?
+        """, (obra_id, equipamento_id)).fetchone()
+        em_campo, referencia = (linha[0], linha[1]) if linha else (0, dia)
+        if dia >= referencia:
+            # Fecha os dias decorridos com o saldo anterior
+            self._somar_uso_mensal(cursor, obra_id, equipamento_id, em_campo, referencia, dia)
+            referencia = dia
+        else:
+            # Movimentação retroativa: corrige os dias já contabilizados
+            self._somar_uso_mensal(cursor, obra_id, equipamento_id, delta, dia, referencia)
+        cursor.execute("""
+            INSERT INTO saldos_obras (obra_id, equipamento_id, em_campo, dia_referencia) VALUES (?, ?, ?, ?)
+            ON CONFLICT (obra_id, equipamento_id) DO UPDATE SET
+                em_campo = excluded.em_campo, dia_referencia = excluded.dia_referencia
+        """, (obra_id, equipamento_id, em_campo + delta, referencia))
+    
+    def _atualizar_contadores_uso(self, cursor, equipamento_id, tipo_id, quantidade, data_epoch):
+        """Acumula peça-dias e envios do equipamento e o marca para reavaliação das regras preventivas.
+        
+        Movimentação retroativa (antes de dia_referencia) corrige os peça-dias dos dias já contados.
+        """
+        sinal = 1 if tipo_id == ENVIO else -1
+        cursor.execute("""
+            INSERT INTO contadores_uso (equipamento_id, peca_dias, em_campo, dia_referencia, unidades_enviadas, alterado)
+            VALUES (?, 0, ?, ?, ?, 1)
+            ON CONFLICT (equipamento_id) DO UPDATE SET
+                peca_dias = peca_dias + em_campo * MAX(0, excluded.dia_referencia - dia_referencia)
+                            + excluded.em_campo * MAX(0, dia_referencia - excluded.dia_referencia),
+                em_campo = em_campo + excluded.em_campo,
+                dia_referencia = MAX(dia_referencia, excluded.dia_referencia),
+                unidades_enviadas = unidades_enviadas + excluded.unidades_enviadas,
+                alterado = 1
+        """, (equipamento_id, sinal * quantidade, data_epoch // 86400, quantidade if sinal > 0 else 0))
+    
+    def _somar_resumo_manutencao(self, cursor, equipamento_id, epoch, tipo, abertas=0, concluidas=0,
+                                 quantidade_aberta=0, quantidade_concluida=0, custo=0, dias_reparo=0):
+        cursor.execute("""
+            INSERT INTO manutencoes_resumo (equipamento_id, mes, tipo, abertas, concluidas, quantidade_aberta,
+                                            quantidade_concluida, custo, dias_reparo)
+            VALUES (?, strftime('%Y-%m', ?, 'unixepoch'), ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (equipamento_id, mes, tipo) DO UPDATE SET
+                abertas = abertas + excluded.abertas,
+                concluidas = concluidas + excluded.concluidas,
+                quantidade_aberta = quantidade_aberta + excluded.quantidade_aberta,
+                quantidade_concluida = quantidade_concluida + excluded.quantidade_concluida,
+                custo = custo + excluded.custo,
+                dias_reparo = dias_reparo + excluded.dias_reparo
+        """, (equipamento_id, epoch, tipo, abertas, concluidas, quantidade_aberta, quantidade_concluida,
+              custo, dias_reparo))
+    
+    def _abrir_manutencao(self, cursor, movimentacao_id, equipamento_id, quantidade, data_epoch, tipo,
+                          responsavel, descricao):
+        cursor.execute("""
+            INSERT INTO manutencoes (equipamento_id, tipo, descricao, data_manutencao, responsavel, status,
+                                     quantidade, movimentacao_id)
+            VALUES (?, ?, ?, datetime(?, 'unixepoch'), ?, 'em_andamento', ?, ?)
+        """, (equipamento_id, tipo, descricao, data_epoch, responsavel, quantidade, movimentacao_id))
+        self._somar_resumo_manutencao(cursor, equipamento_id, data_epoch, tipo, abertas=1, quantidade_aberta=quantidade)
+    
+    def _fechar_manutencoes(self, cursor, equipamento_id, quantidade, data_epoch, custo):
+        """Baixa `quantidade` unidades das ordens abertas do equipamento; o custo é rateado por unidade"""
+        custo_unidade = (custo or 0) / quantidade if quantidade else 0
+        restante = quantidade
+        ordens = cursor.execute("""
+            SELECT id, tipo, quantidade - quantidade_retornada, CAST(strftime('%s', data_manutencao) AS INTEGER)
+            FROM manutencoes
+            WHERE equipamento_id = ? AND status != 'concluida' AND movimentacao_id IS NOT NULL
+            ORDER BY id
+        """, (equipamento_id,)).fetchall()
+        for ordem_id, tipo, pendente, aberta_em in ordens:
+            if restante <= 0:
+                break
+            baixa = min(restante, pendente)
+            if baixa <= 0:
+                continue
+            restante -= baixa
+            concluida = baixa == pendente
+            cursor.execute("""
+                UPDATE manutencoes
+                SET quantidade_retornada = quantidade_retornada + ?,
+                    custo = COALESCE(custo, 0) + ?,
+                    status = CASE WHEN ? THEN 'concluida' ELSE status END,
+                    data_conclusao = CASE WHEN ? THEN datetime(?, 'unixepoch') ELSE data_conclusao END
+                WHERE id = ?
+            """, (baixa, baixa * custo_unidade, concluida, concluida, data_epoch, ordem_id))
+            dias = max(0, (data_epoch - (aberta_em or data_epoch)) // 86400)
+            self._somar_resumo_manutencao(cursor, equipamento_id, data_epoch, tipo, concluidas=int(concluida),
+                                          quantidade_concluida=baixa, custo=baixa * custo_unidade,
+                                          dias_reparo=dias * baixa)
+        if restante > 0 and custo_unidade:
+            # Retorno sem ordem aberta correspondente: o custo ainda entra no resumo
+            self._somar_resumo_manutencao(cursor, equipamento_id, data_epoch, TIPOS_MANUTENCAO[0],
+                                          custo=restante * custo_unidade)
     
     def get_movimentacoes(self):
         with self.get_connection() as conn:
@@ -295,19 +1536,315 @@ class DatabaseManager:
             """)
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_movimentacoes_df(self, data_inicio=None, data_fim=None):
+        """Movimentações como DataFrame tipado (tipo categórico, ids Int64, data já convertida)"""
+        # Baixas de saldo por perda não são retornos de fato: a perda já aparece na lista
+        condicoes, parametros = ["NOT m.baixa_perda"], []
+        if data_inicio:
+            condicoes.append("m.data_epoch >= ?")
+            parametros.append(para_epoch(data_inicio))
+        if data_fim:
+            condicoes.append("m.data_epoch < ?")
+            parametros.append(para_epoch(data_fim) + 86400)
+        where = " WHERE " + " AND ".join(condicoes)
+        # Lê a tabela compacta direto: tipo e data chegam como inteiros, sem conversão de texto
+        return self._consulta_df(f"""
+            SELECT m.id, m.tipo_id - 1 as tipo, m.equipamento_id, m.obra_id, m.quantidade,
+                   m.data_epoch as data_movimentacao, m.responsavel, m.observacoes,
+                   e.descricao as equipamento_descricao, o.nome as obra_nome,
+                   d.nome as deposito_nome, dd.nome as deposito_destino_nome
+            FROM movimentacoes_dados m
+            LEFT JOIN equipamentos e ON m.equipamento_id = e.id
+            LEFT JOIN obras o ON m.obra_id = o.id
+            LEFT JOIN depositos d ON m.deposito_id = d.id
+            LEFT JOIN depositos dd ON m.deposito_destino_id = dd.id{where}
+            ORDER BY m.data_epoch DESC
+        """, parametros,
+            # Nomes se repetem em milhares de linhas: categóricos guardam cada texto uma vez
+            categorias={"equipamento_descricao": None, "obra_nome": None, "responsavel": None,
+                        "deposito_nome": None, "deposito_destino_nome": None},
+            codigos={"tipo": TIPOS_MOVIMENTACAO},
+            epochs=("data_movimentacao",),
+            inteiros=("id", "equipamento_id", "obra_id"))
+    
     def get_recent_movimentacoes(self, limit=10):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT m.tipo, e.descricao as equipamento, o.nome as obra, m.quantidade, m.data_movimentacao
-                FROM movimentacoes m
+                SELECT t.nome as tipo, e.descricao as equipamento, o.nome as obra, m.quantidade,
+                       datetime(m.data_epoch, 'unixepoch') as data_movimentacao
+                FROM movimentacoes_dados m
+                JOIN tipos_movimentacao t ON t.id = m.tipo_id
                 LEFT JOIN equipamentos e ON m.equipamento_id = e.id
                 LEFT JOIN obras o ON m.obra_id = o.id
-                ORDER BY m.data_movimentacao DESC
+                WHERE NOT m.baixa_perda
+                ORDER BY m.data_epoch DESC
                 LIMIT ?
             """, (limit,))
             return [dict(row) for row in cursor.fetchall()]
     
+    @cache_persistente("movimentacoes")
+    def get_movimentacoes_por_dia(self, data_inicio, data_fim):
+        """Quantidade de movimentações por dia e tipo no período (agregado no banco)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT date(m.data_epoch / 86400 * 86400, 'unixepoch') as data, m.tipo_id, COUNT(*) as quantidade
+                FROM movimentacoes_dados m
+                WHERE m.data_epoch >= ? AND m.data_epoch < ? AND NOT m.baixa_perda
+                GROUP BY m.data_epoch / 86400, m.tipo_id
+                ORDER BY data
+            """, (para_epoch(data_inicio), para_epoch(data_fim) + 86400))
+            return [{'data': row['data'], 'tipo': TIPOS_MOVIMENTACAO[row['tipo_id'] - 1], 'quantidade': row['quantidade']}
+                    for row in cursor.fetchall()]
+    
+    def get_resumo_dashboard(self, data_inicio, data_fim):
+        """KPIs do dashboard executivo em uma conexão: frota, clientes, obras ativas e movimentações no período"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT (SELECT COALESCE(SUM(quantidade), 0) FROM equipamentos WHERE excluido_em IS NULL),
+                       (SELECT COUNT(*) FROM clientes WHERE excluido_em IS NULL),
+                       (SELECT COUNT(*) FROM obras WHERE status = 'ativa' AND excluido_em IS NULL),
+                       (SELECT COUNT(*) FROM movimentacoes_dados
+                        WHERE data_epoch >= ? AND data_epoch < ? AND NOT baixa_perda)
+            """, (para_epoch(data_inicio), para_epoch(data_fim) + 86400))
+            return dict(zip(('total_equipamentos', 'total_clientes', 'obras_ativas', 'movimentacoes'), cursor.fetchone()))
+    
+    def get_quantidades_por_dia(self, equipamento_id=None):
+        """Quantidade movimentada por (dia, tipo_id) em todo o histórico, como tuplas.
+        
+        `dia` é o número do dia desde 1970; sem `equipamento_id` soma a frota inteira
+        (percorre apenas idx_movimentacoes_dia).
+        """
+        condicao, parametros = "", ()
+        if equipamento_id is not None:
+            condicao, parametros = "WHERE equipamento_id = ?", (equipamento_id,)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT data_epoch / 86400 AS dia, tipo_id, SUM(quantidade)
+                FROM movimentacoes_dados
+                {condicao}
+                GROUP BY data_epoch / 86400, tipo_id
+            """, parametros)
+            return cursor.fetchall()
+    
+    def get_estoque_total(self, equipamento_id=None):
+        """Quantidade total em estoque de um equipamento (ou da frota inteira)"""
+        if equipamento_id is None:
+            return self.get_total_equipamentos()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT quantidade FROM equipamentos WHERE id = ?", (equipamento_id,))
+            row = cursor.fetchone()
+            return row[0] if row else 0
+    
+    # Métodos para romaneios
+    def add_romaneio(self, tipo, itens, obra_id, responsavel, observacoes, data_movimentacao=None, tipo_manutencao=None,
+                     custo_unidade=0, deposito_id=None, deposito_destino_id=None):
+        """Registra um lote de movimentações sob um romaneio numerado, em uma transação; retorna o número.
+        
+        `itens` são pares (equipamento_id, quantidade). O cabeçalho guarda os totais do lote (linhas, peças
+        e diária somada pelo valor vigente), então exibir ou listar romaneios não percorre as movimentações.
+        """
+        data_epoch = para_epoch(data_movimentacao) if data_movimentacao else int(time.time())
+        deposito_id = deposito_id or DEPOSITO_PRINCIPAL
+        tipo_id = TIPO_ID[tipo]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO romaneios (tipo_id, obra_id, deposito_id, deposito_destino_id, data_epoch, responsavel, observacoes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (tipo_id, obra_id, deposito_id, deposito_destino_id if tipo == "transferencia" else None, data_epoch,
+                  responsavel, observacoes))
+            romaneio_id = cursor.lastrowid
+            for equipamento_id, quantidade in itens:
+                self._registrar_movimentacao(cursor, tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes,
+                                             data_epoch, tipo_manutencao, (custo_unidade or 0) * quantidade,
+                                             deposito_id, deposito_destino_id, romaneio_id)
+            cursor.execute("""
+                UPDATE romaneios SET (total_linhas, total_itens, valor_diario) = (
+                    SELECT COUNT(*), COALESCE(SUM(m.quantidade), 0), COALESCE(SUM(m.quantidade * e.valor_diaria), 0)
+                    FROM movimentacoes_dados m
+                    JOIN equipamentos e ON e.id = m.equipamento_id
+                    WHERE m.romaneio_id = ? AND m.tipo_id = ?
+                )
+                WHERE id = ?
+            """, (romaneio_id, tipo_id, romaneio_id))
+            conn.commit()
+            return romaneio_id
+    
+    def _consultar_romaneios(self, cursor, condicoes, parametros, limite=-1):
+        cursor.execute(f"""
+            SELECT r.id, t.nome as tipo, r.obra_id, o.nome as obra_nome, c.nome as cliente_nome, o.endereco as obra_endereco,
+                   d.nome as deposito_nome, dd.nome as deposito_destino_nome,
+                   date(r.data_epoch, 'unixepoch') as data_movimentacao, r.responsavel, r.observacoes,
+                   r.total_linhas, r.total_itens, r.valor_diario
+            FROM romaneios r
+            JOIN tipos_movimentacao t ON t.id = r.tipo_id
+            LEFT JOIN obras o ON o.id = r.obra_id
+            LEFT JOIN clientes c ON c.id = o.cliente_id
+            LEFT JOIN depositos d ON d.id = r.deposito_id
+            LEFT JOIN depositos dd ON dd.id = r.deposito_destino_id
+            WHERE {" AND ".join(condicoes) or "1"}
+            ORDER BY r.data_epoch DESC, r.id DESC
+            LIMIT ?
+        """, parametros + [limite])
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_romaneio(self, romaneio_id):
+        """Cabeçalho do romaneio com os totais (busca pela chave primária), ou None"""
+        with self.get_connection() as conn:
+            romaneios = self._consultar_romaneios(conn.cursor(), ["r.id = ?"], [romaneio_id])
+            return romaneios[0] if romaneios else None
+    
+    def get_itens_romaneio(self, romaneio_id):
+        """Linhas do romaneio pelo índice de romaneio_id (sem as baixas automáticas de perdas em obra)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT m.id, m.equipamento_id, e.codigo, e.descricao, e.medida, m.quantidade
+                FROM movimentacoes_dados m
+                JOIN romaneios r ON r.id = m.romaneio_id
+                LEFT JOIN equipamentos e ON e.id = m.equipamento_id
+                WHERE m.romaneio_id = ? AND m.tipo_id = r.tipo_id
+                ORDER BY m.id
+            """, (romaneio_id,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_romaneios(self, obra_id=None, data_inicio=None, data_fim=None, limite=200):
+        """Cabeçalhos dos romaneios (mais recentes primeiro), de uma obra e/ou de um período"""
+        condicoes, parametros = [], []
+        if obra_id:
+            condicoes.append("r.obra_id = ?")
+            parametros.append(obra_id)
+        if data_inicio:
+            condicoes.append("r.data_epoch >= ?")
+            parametros.append(para_epoch(data_inicio))
+        if data_fim:
+            condicoes.append("r.data_epoch < ?")
+            parametros.append(para_epoch(data_fim) + 86400)
+        with self.get_connection() as conn:
+            return self._consultar_romaneios(conn.cursor(), condicoes, parametros, limite)
+    
+    # Métodos para projeção de disponibilidade
+    def get_movimentacoes_agregadas(self, apos_id=0):
+        """Soma das quantidades por (obra_id, equipamento_id, tipo_id) das movimentações com id > apos_id.
+        
+        Retorna (ultimo_id, total_linhas, linhas); `ultimo_id` delimita a leitura para que a próxima
+        chamada continue exatamente de onde esta parou.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute("SELECT MAX(id), COUNT(*) FROM movimentacoes_dados WHERE id > ?", (apos_id,))
+            ultimo_id, total = cursor.fetchone()
+            if not total:
+                return apos_id, 0, []
+            # Leitura completa: percorre idx_movimentacoes_obra já na ordem do GROUP BY ("+" ignora o rowid)
+            filtro = "+id > ? AND +id <= ?" if apos_id == 0 else "id > ? AND id <= ?"
+            cursor.execute(f"""
+                SELECT obra_id, equipamento_id, tipo_id, SUM(quantidade)
+                FROM movimentacoes_dados
+                WHERE {filtro} AND equipamento_id IS NOT NULL
+                GROUP BY obra_id, equipamento_id, tipo_id
+            """, (apos_id, ultimo_id))
+            return ultimo_id, total, cursor.fetchall()
+    
+    def get_historico_retorno_obras(self):
+        """Todas as obras como (obra_id, cliente_id, status, dia_fim, dia_ultimo_retorno, saldo_em_obra).
+        
+        Dias contados desde 1970; `dia_fim` é None sem data prevista e `dia_ultimo_retorno` se nunca houve retorno.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT o.id, o.cliente_id, o.status, CAST(strftime('%s', o.data_fim) AS INTEGER) / 86400,
+                       MAX(CASE m.tipo_id WHEN {RETORNO} THEN m.data_epoch END) / 86400,
+                       COALESCE(SUM(CASE m.tipo_id WHEN {ENVIO} THEN m.quantidade
+                                                   WHEN {RETORNO} THEN -m.quantidade END), 0)
+                FROM obras o
+                LEFT JOIN movimentacoes_dados m ON m.obra_id = o.id
+                GROUP BY o.id
+            """)
+            return cursor.fetchall()
+    
+    # Métodos para faturamento de locação
+    def get_ledger_obras(self, ate_epoch=None):
+        """Envios/retornos com obra como (obra_id, equipamento_id, dia, delta), sem ordem definida.
+        
+        `dia` é o número do dia desde 1970 e `delta` é +quantidade no envio e -quantidade no retorno.
+        """
+        condicao, parametros = "", [ENVIO, RETORNO]
+        if ate_epoch is not None:
+            # "+" impede o uso de idx_movimentacoes_data: o filtro pega quase a tabela toda e a
+            # varredura sequencial é bem mais rápida que percorrer o índice
+            condicao = " AND +data_epoch < ?"
+            parametros.append(ate_epoch)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT obra_id, equipamento_id, data_epoch / 86400,
+                       CASE tipo_id WHEN {ENVIO} THEN quantidade ELSE -quantidade END
+                FROM movimentacoes_dados
+                WHERE tipo_id IN (?, ?) AND obra_id IS NOT NULL AND equipamento_id IS NOT NULL{condicao}
+            """, parametros)
+            return cursor.fetchall()
+    
+    def salvar_faturas(self, competencia, data_inicio, data_fim, faturas):
+        """Substitui as faturas da competência em uma única transação.
+        
+        `faturas` é uma lista de dicts com obra_id, equipamento_dias, valor_total e itens
+        (equipamento_id, equipamento_dias, saldo_final, valor_diaria, valor).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM faturas_itens WHERE fatura_id IN (SELECT id FROM faturas WHERE competencia = ?)",
+                           (competencia,))
+            cursor.execute("DELETE FROM faturas WHERE competencia = ?", (competencia,))
+            for fatura in faturas:
+                cursor.execute("""
+                    INSERT INTO faturas (obra_id, competencia, data_inicio, data_fim, equipamento_dias, valor_total)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (fatura['obra_id'], competencia, str(data_inicio), str(data_fim),
+                      fatura['equipamento_dias'], fatura['valor_total']))
+                fatura_id = cursor.lastrowid
+                cursor.executemany("""
+                    INSERT INTO faturas_itens (fatura_id, equipamento_id, equipamento_dias, saldo_final, valor_diaria, valor)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [(fatura_id, item['equipamento_id'], item['equipamento_dias'], item['saldo_final'],
+                       item['valor_diaria'], item['valor']) for item in fatura['itens']])
+            conn.commit()
+    
+    def get_faturas(self, competencia=None):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT f.*, o.nome as obra_nome, c.nome as cliente_nome
+                FROM faturas f
+                LEFT JOIN obras o ON f.obra_id = o.id
+                LEFT JOIN clientes c ON o.cliente_id = c.id
+                WHERE ? IS NULL OR f.competencia = ?
+                ORDER BY f.competencia DESC, o.nome
+            """, (competencia, competencia))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_itens_fatura(self, fatura_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT i.*, e.descricao as equipamento_descricao
+                FROM faturas_itens i
+                LEFT JOIN equipamentos e ON i.equipamento_id = e.id
+                WHERE i.fatura_id = ?
+                ORDER BY e.descricao
+            """, (fatura_id,))
+            return [dict(row) for row in cursor.fetchall()]
+    
     # Métodos para checklists
     def add_checklist(self, tipo, obra_id, responsavel, itens_verificados, observacoes):
         with self.get_connection() as conn:
@@ -330,6 +1867,16 @@ class DatabaseManager:
             """)
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_checklists_df(self):
+        return self._consulta_df("""
+            SELECT c.*, o.nome as obra_nome
+            FROM checklists c
+            LEFT JOIN obras o ON c.obra_id = o.id
+            ORDER BY c.data_checklist DESC
+        """, categorias={"tipo": None, "status": None},
+            datas=("data_checklist",),
+            inteiros=("id", "obra_id"))
+    
     def update_checklist_status(self, id, status):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -338,14 +1885,19 @@ class DatabaseManager:
     
     # Métodos para manutenções
     def add_manutencao(self, equipamento_id, tipo, descricao, responsavel, custo):
+        """Ordem avulsa (sem movimentação de estoque)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO manutencoes (equipamento_id, tipo, descricao, responsavel, custo)
                 VALUES (?, ?, ?, ?, ?)
             """, (equipamento_id, tipo, descricao, responsavel, custo))
+            manutencao_id = cursor.lastrowid
+            if equipamento_id is not None:
+                self._somar_resumo_manutencao(cursor, equipamento_id, int(time.time()), tipo, abertas=1,
+                                              quantidade_aberta=1, custo=custo or 0)
             conn.commit()
-            return cursor.lastrowid
+            return manutencao_id
     
     def get_manutencoes(self):
         with self.get_connection() as conn:
@@ -358,60 +1910,851 @@ class DatabaseManager:
             """)
             return [dict(row) for row in cursor.fetchall()]
     
-    # Métodos para controle de estoque
-    def get_quantidade_disponivel(self, equipamento_id):
-        """Calcula quantidade disponível baseada no estoque total menos envios e manutenções não retornados"""
+    def get_manutencoes_df(self, data_inicio=None, data_fim=None):
+        """Ordens de manutenção (abertas no período, se informado) como DataFrame tipado"""
+        condicoes, parametros = [], []
+        if data_inicio:
+            condicoes.append("m.data_manutencao >= ?")
+            parametros.append(str(data_inicio))
+        if data_fim:
+            condicoes.append("m.data_manutencao < date(?, '+1 day')")
+            parametros.append(str(data_fim))
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        return self._consulta_df(f"""
+            SELECT m.*, e.descricao as equipamento_descricao
+            FROM manutencoes m
+            LEFT JOIN equipamentos e ON m.equipamento_id = e.id
+            {where}
+            ORDER BY m.data_manutencao DESC
+        """, parametros, categorias={"tipo": None, "status": None},
+            datas=("data_manutencao", "data_conclusao"),
+            inteiros=("id", "equipamento_id", "movimentacao_id"))
+    
+    def get_total_manutencoes_abertas(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM manutencoes WHERE status != 'concluida'")
+            return cursor.fetchone()[0]
+    
+    def get_resumo_manutencoes(self, mes_inicio, mes_fim, agrupar_por="mes"):
+        """Totais de manutenção entre os meses (YYYY-MM, inclusive) a partir do resumo incremental.
+        
+        `agrupar_por` é "mes", "tipo", "equipamento" ou None (total geral); o prazo médio é em dias por unidade.
+        """
+        grupos = {"mes": "r.mes", "tipo": "r.tipo", "equipamento": "e.descricao", None: "NULL"}
+        grupo = grupos[agrupar_por]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {grupo} as grupo,
+                       SUM(r.abertas) as abertas, SUM(r.concluidas) as concluidas,
+                       SUM(r.quantidade_aberta) as quantidade_aberta,
+                       SUM(r.quantidade_concluida) as quantidade_concluida,
+                       SUM(r.custo) as custo,
+                       CAST(SUM(r.dias_reparo) AS REAL) / NULLIF(SUM(r.quantidade_concluida), 0) as prazo_medio
+                FROM manutencoes_resumo r
+                LEFT JOIN equipamentos e ON r.equipamento_id = e.id
+                WHERE r.mes BETWEEN ? AND ?
+                GROUP BY {grupo}
+                ORDER BY {"custo DESC" if agrupar_por == "equipamento" else "grupo"}
+            """, (mes_inicio, mes_fim))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    # Métodos para análise de perdas
+    def get_perdas_por_mes(self):
+        """Perdas e recuperações por mês, do resumo incremental"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Buscar quantidade total do equipamento
-            cursor.execute("SELECT quantidade FROM equipamentos WHERE id = ?", (equipamento_id,))
-            result = cursor.fetchone()
-            if not result:
-                return 0
-            quantidade_total = result[0]
-            
-            # Calcular saldo de movimentações
             cursor.execute("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN tipo = 'envio' THEN quantidade ELSE 0 END), 0) as total_enviado,
-                    COALESCE(SUM(CASE WHEN tipo = 'retorno' THEN quantidade ELSE 0 END), 0) as total_retornado,
-                    COALESCE(SUM(CASE WHEN tipo = 'manutencao' THEN quantidade ELSE 0 END), 0) as total_manutencao,
-                    COALESCE(SUM(CASE WHEN tipo = 'retorno_manutencao' THEN quantidade ELSE 0 END), 0) as total_retorno_manutencao,
-                    COALESCE(SUM(CASE WHEN tipo = 'perda' THEN quantidade ELSE 0 END), 0) as total_perdas,
-                    COALESCE(SUM(CASE WHEN tipo = 'retorno_perda' THEN quantidade ELSE 0 END), 0) as total_retorno_perdas
-                FROM movimentacoes 
-                WHERE equipamento_id = ?
-            """, (equipamento_id,))
-            
-            movimentacao = cursor.fetchone()
-            total_enviado = movimentacao[0] if movimentacao else 0
-            total_retornado = movimentacao[1] if movimentacao else 0
-            total_manutencao = movimentacao[2] if movimentacao else 0
-            total_retorno_manutencao = movimentacao[3] if movimentacao else 0
-            total_perdas = movimentacao[4] if movimentacao else 0
-            total_retorno_perdas = movimentacao[5] if movimentacao else 0
+                SELECT mes, SUM(perdidas) as quantidade, SUM(recuperadas) as recuperadas
+                FROM perdas_resumo
+                GROUP BY mes
+                ORDER BY mes
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_ranking_perdas(self, mes_inicio, mes_fim, agrupar_por="obra", limite=10, hoje=None):
+        """Obras, clientes ou equipamentos com maior taxa de perda entre os meses (YYYY-MM, inclusive).
+        
+        A taxa é de perdas líquidas (perdidas - recuperadas) por 1000 equipamento-dias em obra no período;
+        os dias ainda em aberto (saldo atual desde dia_referencia) contam até `hoje`. Perdas sem obra
+        ficam no grupo 0 e sem taxa.
+        """
+        hoje = hoje or date.today()
+        ano, mes = map(int, mes_fim.split("-"))
+        dia_inicio = (date(*map(int, mes_inicio.split("-")), 1) - DIA_ZERO).days
+        dia_fim = (date(ano + mes // 12, mes % 12 + 1, 1) - DIA_ZERO).days
+        dia_fim = min(dia_fim, (hoje - DIA_ZERO).days + 1)
+        
+        chaves = {
+            "obra": ("p.obra_id", "u.obra_id", "obras n", "n.nome"),
+            "cliente": ("p.cliente_id", "COALESCE(uo.cliente_id, 0)", "clientes n", "n.nome"),
+            "equipamento": ("p.equipamento_id", "u.equipamento_id", "equipamentos n", "n.descricao"),
+        }
+        chave_perda, chave_uso, tabela_nome, nome = chaves[agrupar_por]
+        juncao_uso = "LEFT JOIN obras uo ON uo.id = u.obra_id" if agrupar_por == "cliente" else ""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH totais AS (
+                    SELECT {chave_perda} as chave, p.perdidas, p.recuperadas, 0 as equipamento_dias
+                    FROM perdas_resumo p
+                    WHERE p.mes BETWEEN :mes_inicio AND :mes_fim
+                    UNION ALL
+                    SELECT {chave_uso}, 0, 0, u.peca_dias
+                    FROM uso_obras_mensal u {juncao_uso}
+                    WHERE u.mes BETWEEN :mes_inicio AND :mes_fim
+                    UNION ALL
+                    SELECT {chave_uso}, 0, 0, u.em_campo * (:dia_fim - MAX(u.dia_referencia, :dia_inicio))
+                    FROM saldos_obras u {juncao_uso}
+                    WHERE u.em_campo != 0 AND u.dia_referencia < :dia_fim AND :dia_inicio < :dia_fim
+                ), grupos AS (
+                    SELECT chave, SUM(perdidas) as perdidas, SUM(recuperadas) as recuperadas,
+                           SUM(equipamento_dias) as equipamento_dias
+                    FROM totais
+                    GROUP BY chave
+                    HAVING SUM(perdidas) > 0
+                )
+                SELECT g.chave as id, {nome} as nome, g.perdidas, g.recuperadas,
+                       g.perdidas - g.recuperadas as perdas_liquidas, g.equipamento_dias,
+                       1000.0 * (g.perdidas - g.recuperadas) / NULLIF(g.equipamento_dias, 0) as taxa
+                FROM grupos g
+                LEFT JOIN {tabela_nome} ON n.id = g.chave
+                ORDER BY taxa IS NULL, taxa DESC, perdas_liquidas DESC
+                LIMIT :limite
+            """, {"mes_inicio": mes_inicio, "mes_fim": mes_fim, "dia_inicio": dia_inicio, "dia_fim": dia_fim,
+                  "limite": limite})
+            return [dict(row) for row in cursor.fetchall()]
+    
+    # Métodos para manutenção preventiva por uso
+    def add_regra_manutencao(self, descricao, medida, limite, tolerancia=0, equipamento_id=None):
+        """Nova regra (para um equipamento ou, sem equipamento_id, para todos)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO regras_manutencao (descricao, equipamento_id, medida, limite, tolerancia)
+                VALUES (?, ?, ?, ?, ?)
+            """, (descricao, equipamento_id, medida, limite, tolerancia))
+            cursor.execute("UPDATE contadores_uso SET alterado = 1 WHERE ? IS NULL OR equipamento_id = ?",
+                           (equipamento_id, equipamento_id))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def desativar_regra_manutencao(self, id):
+        """Desativa a regra; ordens já abertas continuam pendentes"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE regras_manutencao SET ativa = 0 WHERE id = ?", (id,))
+            cursor.execute("DELETE FROM agenda_manutencao WHERE regra_id = ? AND ordem_id IS NULL", (id,))
+            conn.commit()
+    
+    def get_regras_manutencao(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT r.*, e.descricao as equipamento_descricao
+                FROM regras_manutencao r
+                LEFT JOIN equipamentos e ON r.equipamento_id = e.id
+                WHERE r.ativa = 1
+                ORDER BY r.descricao
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def avaliar_manutencoes_preventivas(self, hoje=None):
+        """Recalcula a agenda apenas dos equipamentos com contadores alterados e abre as ordens vencidas.
+        
+        Retorna o número de ordens preventivas abertas nesta avaliação.
+        """
+        dia_hoje = para_epoch(hoje or date.today()) // 86400
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute("BEGIN IMMEDIATE")
+            alterados = cursor.execute("""
+                SELECT c.equipamento_id, c.peca_dias, c.em_campo, c.dia_referencia, c.unidades_enviadas,
+                       MAX(COALESCE(e.quantidade, 1), 1)
+                FROM contadores_uso c
+                LEFT JOIN equipamentos e ON e.id = c.equipamento_id
+                WHERE c.alterado = 1
+            """).fetchall()
+            if alterados:
+                regras = cursor.execute("""
+                    SELECT id, equipamento_id, medida, limite, tolerancia FROM regras_manutencao WHERE ativa = 1
+                """).fetchall()
+                for equipamento_id, peca_dias, em_campo, dia_referencia, enviadas, quantidade in alterados:
+                    for regra_id, regra_equipamento, medida, limite, tolerancia in regras:
+                        if regra_equipamento is not None and regra_equipamento != equipamento_id:
+                            continue
+                        linha = cursor.execute("""
+                            SELECT base FROM agenda_manutencao WHERE regra_id = ? AND equipamento_id = ?
+                        """, (regra_id, equipamento_id)).fetchone()
+                        base = linha[0] if linha else 0
+                        uso = (peca_dias, em_campo, dia_referencia, enviadas, quantidade)
+                        cursor.execute("""
+                            INSERT INTO agenda_manutencao (regra_id, equipamento_id, base, dia_previsto, dia_atraso)
+                            VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT (regra_id, equipamento_id) DO UPDATE SET
+                                dia_previsto = excluded.dia_previsto, dia_atraso = excluded.dia_atraso
+                        """, (regra_id, equipamento_id, base,
+                              dia_vencimento_uso(medida, limite, base, *uso),
+                              dia_vencimento_uso(medida, limite + tolerancia, base, *uso)))
+                cursor.execute("UPDATE contadores_uso SET alterado = 0 WHERE alterado = 1")
             
-            # Quantidade fora do estoque = enviados não retornados + em manutenção + perdas líquidas
-            quantidade_enviada = total_enviado - total_retornado
-            quantidade_em_manutencao = total_manutencao - total_retorno_manutencao
-            quantidade_perdida_liquida = total_perdas - total_retorno_perdas
-            quantidade_indisponivel = quantidade_enviada + quantidade_em_manutencao + quantidade_perdida_liquida
+            # Vencimentos até hoje ainda sem ordem (faixa de idx_agenda_previsto)
+            vencidas = cursor.execute("""
+                SELECT a.regra_id, a.equipamento_id, r.descricao
+                FROM agenda_manutencao a
+                JOIN regras_manutencao r ON r.id = a.regra_id AND r.ativa = 1
+                WHERE a.ordem_id IS NULL AND a.dia_previsto <= ?
+            """, (dia_hoje,)).fetchall()
+            agora = int(time.time())
+            for regra_id, equipamento_id, descricao in vencidas:
+                cursor.execute("""
+                    INSERT INTO manutencoes (equipamento_id, tipo, descricao, data_manutencao, status)
+                    VALUES (?, 'preventiva', ?, datetime(?, 'unixepoch'), 'pendente')
+                """, (equipamento_id, descricao, agora))
+                cursor.execute("UPDATE agenda_manutencao SET ordem_id = ? WHERE regra_id = ? AND equipamento_id = ?",
+                               (cursor.lastrowid, regra_id, equipamento_id))
+                self._somar_resumo_manutencao(cursor, equipamento_id, agora, "preventiva", abertas=1, quantidade_aberta=1)
+            conn.commit()
+            return len(vencidas)
+    
+    def _uso_atual_sql(self, dia_hoje):
+        """Expressão do uso por peça desde a última conclusão (aliases a, r, c, e)"""
+        return f"""
+            CASE r.medida
+                WHEN 'ciclos' THEN (COALESCE(c.unidades_enviadas, 0) - a.base)
+                ELSE (COALESCE(c.peca_dias, 0) + COALESCE(c.em_campo, 0) * MAX(0, {int(dia_hoje)} - c.dia_referencia) - a.base)
+            END * 1.0 / MAX(COALESCE(e.quantidade, 1), 1)
+        """
+    
+    def get_manutencoes_preventivas(self, hoje=None, dias_a_frente=30):
+        """Ordens preventivas pendentes e vencimentos dos próximos dias, sem percorrer o histórico.
+        
+        Retorna (pendentes, proximas); `atrasada` indica que o uso já passou do limite + tolerância.
+        """
+        dia_hoje = para_epoch(hoje or date.today()) // 86400
+        uso = self._uso_atual_sql(dia_hoje)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT a.ordem_id, a.regra_id, a.equipamento_id, e.descricao as equipamento_descricao,
+                       r.descricao as regra, r.medida, r.limite, r.tolerancia, m.data_manutencao,
+                       a.dia_atraso IS NOT NULL AND a.dia_atraso <= ? as atrasada,
+                       {uso} as uso_atual
+                FROM agenda_manutencao a
+                JOIN manutencoes m ON m.id = a.ordem_id
+                JOIN regras_manutencao r ON r.id = a.regra_id
+                LEFT JOIN equipamentos e ON e.id = a.equipamento_id
+                LEFT JOIN contadores_uso c ON c.equipamento_id = a.equipamento_id
+                WHERE a.ordem_id IS NOT NULL AND m.status != 'concluida'
+                ORDER BY atrasada DESC, m.data_manutencao
+            """, (dia_hoje,))
+            pendentes = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(f"""
+                SELECT a.regra_id, a.equipamento_id, e.descricao as equipamento_descricao,
+                       r.descricao as regra, r.medida, r.limite,
+                       date(a.dia_previsto * 86400, 'unixepoch') as data_prevista,
+                       {uso} as uso_atual
+                FROM agenda_manutencao a
+                JOIN regras_manutencao r ON r.id = a.regra_id AND r.ativa = 1
+                LEFT JOIN equipamentos e ON e.id = a.equipamento_id
+                LEFT JOIN contadores_uso c ON c.equipamento_id = a.equipamento_id
+                WHERE a.ordem_id IS NULL AND a.dia_previsto > ? AND a.dia_previsto <= ?
+                ORDER BY a.dia_previsto
+            """, (dia_hoje, dia_hoje + dias_a_frente))
+            proximas = [dict(row) for row in cursor.fetchall()]
+            return pendentes, proximas
+    
+    def concluir_manutencao_preventiva(self, ordem_id, custo=None, responsavel=None, hoje=None):
+        """Conclui a ordem e reinicia a contagem de uso da regra a partir do uso atual do equipamento"""
+        dia_hoje = para_epoch(hoje or date.today()) // 86400
+        agora = int(time.time())
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute("BEGIN IMMEDIATE")
+            linha = cursor.execute("""
+                SELECT a.regra_id, a.equipamento_id, r.medida,
+                       COALESCE(c.peca_dias, 0) + COALESCE(c.em_campo, 0) * MAX(0, ? - c.dia_referencia),
+                       COALESCE(c.unidades_enviadas, 0)
+                FROM agenda_manutencao a
+                JOIN regras_manutencao r ON r.id = a.regra_id
+                LEFT JOIN contadores_uso c ON c.equipamento_id = a.equipamento_id
+                WHERE a.ordem_id = ?
+            """, (dia_hoje, ordem_id)).fetchone()
+            if linha is None:
+                conn.rollback()
+                return False
+            regra_id, equipamento_id, medida, peca_dias, enviadas = linha
+            cursor.execute("""
+                UPDATE manutencoes
+                SET status = 'concluida', data_conclusao = datetime(?, 'unixepoch'),
+                    custo = COALESCE(?, custo), responsavel = COALESCE(?, responsavel)
+                WHERE id = ?
+            """, (agora, custo, responsavel or None, ordem_id))
+            cursor.execute("""
+                UPDATE agenda_manutencao SET base = ?, ordem_id = NULL, dia_previsto = NULL, dia_atraso = NULL
+                WHERE regra_id = ? AND equipamento_id = ?
+            """, (enviadas if medida == "ciclos" else peca_dias, regra_id, equipamento_id))
+            cursor.execute("UPDATE contadores_uso SET alterado = 1 WHERE equipamento_id = ?", (equipamento_id,))
+            self._somar_resumo_manutencao(cursor, equipamento_id, agora, "preventiva", concluidas=1, custo=custo or 0)
+            conn.commit()
+            return True
+    
+    # Métodos para peças com serial
+    def _transicao_peca(self, tipo, obra_id, deposito_id, deposito_destino_id):
+        """((estado, local) exigidos, (estado, local) final) das peças na movimentação, com os ids resolvidos"""
+        tipo_id = TIPO_ID[tipo]
+        origem, destino = TRANSICAO_PERDA_OBRA if tipo_id == PERDA and obra_id else TRANSICOES_PECA[tipo_id]
+        locais = {"deposito": deposito_id or DEPOSITO_PRINCIPAL, "obra": obra_id, "destino": deposito_destino_id, None: None}
+        return (origem[0], locais[origem[1]]), (destino[0], locais[destino[1]])
+    
+    def _contar_pecas(self, cursor, estado, local=None, equipamento_id=None):
+        """{equipamento_id: peças etiquetadas no estado/local} pelo índice idx_pecas_local"""
+        condicoes, parametros = ["estado = ?"], [estado]
+        if local is not None:
+            condicoes.append("local_atual = ?")
+            parametros.append(local)
+        if equipamento_id is not None:
+            condicoes.append("equipamento_id = ?")
+            parametros.append(equipamento_id)
+        linhas = cursor.execute(f"""
+            SELECT equipamento_id, COUNT(*) FROM pecas
+            WHERE {" AND ".join(condicoes)}
+            GROUP BY equipamento_id
+        """, parametros).fetchall()
+        return {linha[0]: linha[1] for linha in linhas}
+    
+    def get_pecas_etiquetadas(self, tipo, obra_id=None, deposito_id=None, deposito_destino_id=None):
+        """{equipamento_id: peças com serial} no local de onde a movimentação retira peças.
+        
+        Movimentações sem seriais só podem usar as peças não etiquetadas desse local.
+        """
+        (estado, local), _ = self._transicao_peca(tipo, obra_id, deposito_id, deposito_destino_id)
+        with self.get_connection() as conn:
+            return self._contar_pecas(conn.cursor(), estado, local)
+    
+    def add_pecas(self, equipamento_id, seriais, deposito_id=None):
+        """Etiqueta peças já em estoque no depósito. Retorna (cadastradas, repetidas, erros); com erro nada é gravado."""
+        seriais, repetidas = normalizar_seriais(seriais)
+        deposito_id = deposito_id or DEPOSITO_PRINCIPAL
+        if not seriais:
+            return 0, repetidas, ["Nenhum serial informado"]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            existentes = []
+            for inicio in range(0, len(seriais), 500):
+                lote = seriais[inicio:inicio + 500]
+                existentes += [row[0] for row in cursor.execute(
+                    f"SELECT serial FROM pecas WHERE serial IN ({', '.join('?' * len(lote))})", lote)]
+            if existentes:
+                return 0, repetidas, [f"Serial já cadastrado: {serial}" for serial in existentes]
+            # Peças etiquetadas não podem passar do estoque agregado do depósito
+            estoque = cursor.execute("""
+                SELECT disponivel FROM estoque_depositos WHERE equipamento_id = ? AND deposito_id = ?
+            """, (equipamento_id, deposito_id)).fetchone()
+            etiquetadas = self._contar_pecas(cursor, "disponivel", deposito_id, equipamento_id).get(equipamento_id, 0)
+            livres = (estoque[0] if estoque else 0) - etiquetadas
+            if len(seriais) > livres:
+                return 0, repetidas, [f"Depósito tem {livres} peça(s) sem etiqueta deste equipamento; "
+                                      f"{len(seriais)} serial(is) informado(s)"]
+            cursor.executemany("""
+                INSERT INTO pecas (serial, equipamento_id, estado, local_atual) VALUES (?, ?, 'disponivel', ?)
+            """, [(serial, equipamento_id, deposito_id) for serial in seriais])
+            conn.commit()
+            return len(seriais), repetidas, []
+    
+    def registrar_leitura_pecas(self, tipo, seriais, obra_id=None, responsavel=None, observacoes=None,
+                                data_movimentacao=None, tipo_manutencao=None, custo=None,
+                                deposito_id=None, deposito_destino_id=None):
+        """Registra uma remessa lida por coletor: seriais repetidos são descartados, cada peça precisa estar
+        no estado/local de origem do tipo e é gravada uma movimentação por equipamento, tudo em uma transação.
+        
+        Retorna {'movimentacoes': {equipamento_id: (movimentacao_id, quantidade)}, 'pecas', 'repetidas', 'erros'};
+        com qualquer erro nada é gravado. O custo (retorno de manutenção) é rateado pelas peças.
+        """
+        seriais, repetidas = normalizar_seriais(seriais)
+        resultado = {'movimentacoes': {}, 'pecas': len(seriais), 'repetidas': repetidas, 'erros': []}
+        if not seriais:
+            resultado['erros'].append("Nenhum serial lido")
+            return resultado
+        if tipo in ("envio", "retorno") and not obra_id:
+            resultado['erros'].append("Obra é obrigatória para envios e retornos")
+            return resultado
+        if tipo == "transferencia" and (not deposito_destino_id or deposito_destino_id == (deposito_id or DEPOSITO_PRINCIPAL)):
+            resultado['erros'].append("Informe um depósito de destino diferente do de origem")
+            return resultado
+        (estado_origem, local_origem), (estado_destino, local_destino) = self._transicao_peca(
+            tipo, obra_id, deposito_id, deposito_destino_id)
+        data_epoch = para_epoch(data_movimentacao) if data_movimentacao else int(time.time())
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Seriais lidos em tabela temporária: uma junção em vez de uma consulta por peça
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS leitura_pecas (serial TEXT PRIMARY KEY) WITHOUT ROWID")
+            cursor.execute("DELETE FROM temp.leitura_pecas")
+            cursor.executemany("INSERT INTO temp.leitura_pecas (serial) VALUES (?)", [(serial,) for serial in seriais])
+            pecas = cursor.execute("""
+                SELECT l.serial, p.equipamento_id, p.estado, p.local_atual
+                FROM temp.leitura_pecas l
+                LEFT JOIN pecas p ON p.serial = l.serial
+            """).fetchall()
             
-            quantidade_disponivel = quantidade_total - quantidade_indisponivel
+            por_equipamento = {}
+            for serial, equipamento_id, estado, local in pecas:
+                if equipamento_id is None:
+                    resultado['erros'].append(f"{serial}: serial não cadastrado")
+                elif estado != estado_origem or (local_origem is not None and local != local_origem):
+                    resultado['erros'].append(f"{serial}: peça {descrever_local_peca(estado, local)}, "
+                                              f"esperado {descrever_local_peca(estado_origem, local_origem)}")
+                else:
+                    por_equipamento.setdefault(equipamento_id, []).append(serial)
+            if resultado['erros']:
+                conn.rollback()
+                return resultado
             
-            return max(0, quantidade_disponivel)
+            custo_peca = (custo or 0) / len(seriais)
+            vinculos = []
+            for equipamento_id, seriais_equipamento in por_equipamento.items():
+                quantidade = len(seriais_equipamento)
+                movimentacao_id = self._registrar_movimentacao(
+                    cursor, tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_epoch,
+                    tipo_manutencao, custo_peca * quantidade, deposito_id, deposito_destino_id)
+                resultado['movimentacoes'][equipamento_id] = (movimentacao_id, quantidade)
+                vinculos += [(movimentacao_id, serial) for serial in seriais_equipamento]
+            cursor.executemany("INSERT INTO movimentacoes_pecas (movimentacao_id, serial) VALUES (?, ?)", vinculos)
+            cursor.execute("""
+                UPDATE pecas SET estado = ?, local_atual = ?
+                WHERE serial IN (SELECT serial FROM temp.leitura_pecas)
+            """, (estado_destino, local_destino))
+            cursor.execute("DELETE FROM temp.leitura_pecas")
+            conn.commit()
+        return resultado
+    
+    def get_peca(self, serial):
+        """Peça e seu histórico de movimentações (mais recentes primeiro)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            peca = cursor.execute("""
+                SELECT p.*, e.descricao as equipamento_descricao
+                FROM pecas p
+                LEFT JOIN equipamentos e ON e.id = p.equipamento_id
+                WHERE p.serial = ?
+            """, (serial.strip().upper(),)).fetchone()
+            if peca is None:
+                return None
+            peca = dict(peca)
+            cursor.execute("""
+                SELECT m.id, t.nome as tipo, datetime(m.data_epoch, 'unixepoch') as data_movimentacao,
+                       o.nome as obra_nome, d.nome as deposito_nome, m.responsavel
+                FROM movimentacoes_pecas mp
+                JOIN movimentacoes_dados m ON m.id = mp.movimentacao_id
+                JOIN tipos_movimentacao t ON t.id = m.tipo_id
+                LEFT JOIN obras o ON o.id = m.obra_id
+                LEFT JOIN depositos d ON d.id = m.deposito_id
+                WHERE mp.serial = ?
+                ORDER BY m.data_epoch DESC, m.id DESC
+            """, (peca['serial'],))
+            peca['historico'] = [dict(row) for row in cursor.fetchall()]
+            return peca
+    
+    def get_resumo_pecas(self, equipamento_id):
+        """Peças com serial do equipamento por estado"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT estado, COUNT(*) as pecas FROM pecas WHERE equipamento_id = ? GROUP BY estado
+            """, (equipamento_id,))
+            return {row['estado']: row['pecas'] for row in cursor.fetchall()}
+    
+    # Métodos para auditoria
+    def get_historico_registro(self, tabela, registro_id):
+        """Trilha de auditoria de um registro, da mais antiga para a mais recente (uma leitura de faixa no índice).
+        
+        Cada entrada traz momento, operacao (ver OPERACOES_AUDITORIA), ator e alteracoes {coluna: [antes, depois]}.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT datetime(momento, 'unixepoch') as momento, operacao, ator, alteracoes
+                FROM auditoria
+                WHERE tabela = ? AND registro_id = ?
+                ORDER BY momento, id
+            """, (tabela, registro_id))
+            return [dict(row, alteracoes=json.loads(row['alteracoes']) if row['alteracoes'] else {})
+                    for row in cursor.fetchall()]
+    
+    def get_auditoria_periodo(self, data_inicio, data_fim, tabela=None, limite=1000):
+        """Alterações auditadas entre as datas (inclusive), das mais recentes para as mais antigas"""
+        condicoes, parametros = ["momento >= ? AND momento < ?"], [para_epoch(data_inicio),
+                                                                   para_epoch(data_fim + timedelta(days=1))]
+        if tabela:
+            condicoes.append("tabela = ?")
+            parametros.append(tabela)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT datetime(momento, 'unixepoch') as momento, tabela, registro_id, operacao, ator, alteracoes
+                FROM auditoria
+                WHERE {" AND ".join(condicoes)}
+                ORDER BY momento DESC, id DESC
+                LIMIT ?
+            """, parametros + [limite])
+            return [dict(row, alteracoes=json.loads(row['alteracoes']) if row['alteracoes'] else {})
+                    for row in cursor.fetchall()]
+    
+    # Métodos para sincronização com os tablets de campo (servidor)
+    def get_ultimo_seq(self):
+        """Sequência da alteração mais recente do log"""
+        with self.get_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+    
+    def _linhas_por_chave(self, cursor, tabela, colunas_chave, chaves):
+        """(colunas, linhas) atuais da tabela para as chaves primárias informadas, em lotes"""
+        colunas, linhas = [], []
+        marcador = f"({', '.join('?' * len(colunas_chave))})"
+        for inicio in range(0, len(chaves), 500):
+            lote = chaves[inicio:inicio + 500]
+            cursor.execute(f"""
+                SELECT * FROM {tabela}
+                WHERE ({', '.join(colunas_chave)}) IN (VALUES {', '.join([marcador] * len(lote))})
+            """, [valor for chave in lote for valor in chave])
+            colunas = [descricao[0] for descricao in cursor.description]
+            linhas += [list(linha) for linha in cursor.fetchall()]
+        return colunas, linhas
+    
+    def get_alteracoes(self, desde_seq=0, limite=5000):
+        """Delta desde `desde_seq`: o estado atual de cada registro alterado depois dela.
+
+        Lê até `limite` entradas do log; um registro alterado várias vezes vai uma só vez. Retorna
+        {'ate_seq', 'mais', 'tabelas': {tabela: {'colunas', 'linhas', 'removidas'}}} (apenas listas, serializável em JSON).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            entradas = cursor.execute("""
+                SELECT seq, tabela, chave, operacao FROM alteracoes WHERE seq > ? ORDER BY seq LIMIT ?
+            """, (desde_seq, limite)).fetchall()
+            ultimas = {}
+            for _, tabela, chave, operacao in entradas:
+                ultimas[(tabela, chave)] = operacao
+            por_tabela = {}
+            for (tabela, chave), operacao in ultimas.items():
+                por_tabela.setdefault(tabela, ([], []))[operacao == "D"].append(tuple(json.loads(chave)))
+
+            tabelas = {}
+            for tabela, (alteradas, removidas) in por_tabela.items():
+                colunas_chave = TABELAS_SINCRONIZADAS[tabela]
+                colunas, linhas = self._linhas_por_chave(cursor, tabela, colunas_chave, alteradas)
+                # Removidas depois da leitura do log também vão como remoção
+                posicoes = [colunas.index(coluna) for coluna in colunas_chave] if colunas else []
+                encontradas = {tuple(linha[p] for p in posicoes) for linha in linhas}
+                removidas += [chave for chave in alteradas if chave not in encontradas]
+                tabelas[tabela] = {'colunas': colunas, 'linhas': linhas, 'removidas': [list(chave) for chave in removidas]}
+            return {'ate_seq': entradas[-1][0] if entradas else desde_seq, 'mais': len(entradas) == limite,
+                    'tabelas': tabelas}
+    
+    def compactar_alteracoes(self):
+        """Remove do log as entradas superadas por outra mais recente do mesmo registro.
+
+        O delta de qualquer sequência continua completo, pois cada registro mantém sua última entrada.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM alteracoes
+                WHERE EXISTS (SELECT 1 FROM alteracoes b
+                              WHERE b.tabela = alteracoes.tabela AND b.chave = alteracoes.chave AND b.seq > alteracoes.seq)
+            """)
+            conn.commit()
+            return cursor.rowcount
+    
+    def _saldo_sem_serial(self, cursor, tipo_id, equipamento_id, obra_id, deposito_id, deposito_destino_id):
+        """Saldo do local de onde a movimentação retira peças, pelas tabelas de saldos e sem as peças com serial"""
+        if tipo_id == RETORNO:
+            linha = cursor.execute("SELECT em_campo FROM saldos_obras WHERE obra_id = ? AND equipamento_id = ?",
+                                   (obra_id, equipamento_id)).fetchone()
+        elif tipo_id in (RETORNO_MANUTENCAO, RETORNO_PERDA):
+            saida = MANUTENCAO if tipo_id == RETORNO_MANUTENCAO else PERDA
+            linha = cursor.execute("""
+                SELECT SUM(CASE tipo_id WHEN ? THEN quantidade ELSE -quantidade END)
+                FROM movimentacoes_dados WHERE equipamento_id = ? AND tipo_id IN (?, ?)
+            """, (saida, equipamento_id, saida, tipo_id)).fetchone()
+        else:
+            linha = cursor.execute("SELECT disponivel FROM estoque_depositos WHERE equipamento_id = ? AND deposito_id = ?",
+                                   (equipamento_id, deposito_id)).fetchone()
+        saldo = (linha[0] or 0) if linha else 0
+        # Cada linha é aplicada isoladamente: a perda sai do depósito (a baixa da obra vem na linha de retorno anterior)
+        (estado, local), _ = self._transicao_peca(TIPOS_MOVIMENTACAO[tipo_id - 1], None if tipo_id == PERDA else obra_id,
+                                                  deposito_id, deposito_destino_id)
+        return saldo - self._contar_pecas(cursor, estado, local, equipamento_id).get(equipamento_id, 0)
+    
+    def _conferir_movimentacao_remota(self, cursor, tipo_id, equipamento_id, obra_id, quantidade, deposito_id,
+                                      deposito_destino_id):
+        """Motivo de rejeição de uma movimentação recebida de um tablet (None se pode ser gravada)"""
+        def existe(tabela, id):
+            return id is not None and cursor.execute(f"SELECT 1 FROM {tabela} WHERE id = ?", (id,)).fetchone()
+
+        if tipo_id is None:
+            return "Tipo de movimentação desconhecido"
+        if not quantidade or quantidade <= 0:
+            return "Quantidade inválida"
+        if not existe("equipamentos", equipamento_id):
+            return "Equipamento não cadastrado no servidor"
+        if tipo_id in (ENVIO, RETORNO) and not obra_id:
+            return "Obra é obrigatória para envios e retornos"
+        if obra_id and not existe("obras", obra_id):
+            return "Obra não cadastrada no servidor"
+        if not existe("depositos", deposito_id) or (deposito_destino_id and not existe("depositos", deposito_destino_id)):
+            return "Depósito não cadastrado no servidor"
+        if tipo_id == TRANSFERENCIA and (not deposito_destino_id or deposito_destino_id == deposito_id):
+            return "Informe um depósito de destino diferente do de origem"
+        return None
+    
+    def aplicar_movimentacoes_remotas(self, dispositivo, movimentacoes):
+        """Grava, na ordem e em uma transação, as movimentações registradas offline por um tablet.
+
+        Cada uma é conferida contra os saldos do servidor no momento em que é aplicada: acima do saldo a
+        quantidade é reduzida a ele ('ajustada'); sem saldo ou com cadastro inválido é 'rejeitada'. Reenvios
+        do mesmo id_local devolvem o resultado já gravado. Retorna {'resultados': [...], 'saldos':
+        [[equipamento_id, deposito_id, disponivel], ...], 'manutencoes': {...}} com o estoque atual dos depósitos
+        envolvidos e as ordens e o resumo de manutenção dos equipamentos que foram ou voltaram da manutenção.
+        """
+        resultados, tocados, em_manutencao = [], set(), set()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for mov in movimentacoes:
+                tipo_id = TIPO_ID.get(mov['tipo'])
+                equipamento_id, obra_id, pedida = mov['equipamento_id'], mov.get('obra_id'), mov['quantidade']
+                deposito_id = mov.get('deposito_id') or DEPOSITO_PRINCIPAL
+                destino = mov.get('deposito_destino_id') if tipo_id == TRANSFERENCIA else None
+                tocados.update((equipamento_id, deposito) for deposito in (deposito_id, destino) if deposito)
+                if tipo_id in (MANUTENCAO, RETORNO_MANUTENCAO):
+                    em_manutencao.add(equipamento_id)
+
+                anterior = cursor.execute("""
+                    SELECT situacao, movimentacao_id, quantidade FROM sincronizacao_recebidas
+                    WHERE dispositivo = ? AND id_local = ?
+                """, (dispositivo, mov['id_local'])).fetchone()
+                if anterior:
+                    resultados.append({'id_local': mov['id_local'], 'situacao': anterior[0], 'movimentacao_id': anterior[1],
+                                       'quantidade': anterior[2], 'motivo': "Já recebida"})
+                    continue
+
+                motivo = self._conferir_movimentacao_remota(cursor, tipo_id, equipamento_id, obra_id, pedida,
+                                                            deposito_id, destino)
+                quantidade, movimentacao_id = 0, None
+                if motivo is None:
+                    saldo = max(0, self._saldo_sem_serial(cursor, tipo_id, equipamento_id, obra_id, deposito_id, destino))
+                    quantidade = min(pedida, saldo)
+                    if quantidade < pedida:
+                        motivo = f"Saldo no servidor: {saldo}"
+                if quantidade:
+                    data_epoch = mov.get('data_epoch') or int(time.time())
+                    custo = mov.get('custo') if tipo_id == RETORNO_MANUTENCAO else None
+                    movimentacao_id = self._inserir_movimentacao(cursor, tipo_id, equipamento_id, obra_id, quantidade,
+                                                                 mov.get('responsavel'), mov.get('observacoes'),
+                                                                 data_epoch, deposito_id, destino, custo=custo,
+                                                                 baixa_perda=bool(mov.get('baixa_perda')))
+                    if tipo_id == MANUTENCAO:
+                        self._abrir_manutencao(cursor, movimentacao_id, equipamento_id, quantidade, data_epoch,
+                                               mov.get('tipo_manutencao') or TIPOS_MANUTENCAO[0],
+                                               mov.get('responsavel'), mov.get('observacoes'))
+                    elif tipo_id == RETORNO_MANUTENCAO:
+                        self._fechar_manutencoes(cursor, equipamento_id, quantidade, data_epoch, custo)
+                situacao = "aceita" if quantidade == pedida else "ajustada" if quantidade else "rejeitada"
+                cursor.execute("""
+                    INSERT INTO sincronizacao_recebidas (dispositivo, id_local, situacao, movimentacao_id, quantidade)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (dispositivo, mov['id_local'], situacao, movimentacao_id, quantidade))
+                resultados.append({'id_local': mov['id_local'], 'situacao': situacao, 'movimentacao_id': movimentacao_id,
+                                   'quantidade': quantidade, 'motivo': motivo})
+
+            tocados = sorted(tocados)
+            saldos = []
+            for inicio in range(0, len(tocados), 500):
+                lote = tocados[inicio:inicio + 500]
+                saldos += [list(linha) for linha in cursor.execute(f"""
+                    SELECT equipamento_id, deposito_id, disponivel FROM estoque_depositos
+                    WHERE (equipamento_id, deposito_id) IN (VALUES {', '.join(['(?, ?)'] * len(lote))})
+                """, [valor for chave in lote for valor in chave])]
+            manutencoes = {'equipamentos': sorted(em_manutencao), 'tabelas': {}}
+            for tabela in ("manutencoes", "manutencoes_resumo"):
+                colunas, linhas = self._linhas_por_equipamento(cursor, tabela, manutencoes['equipamentos'])
+                manutencoes['tabelas'][tabela] = {'colunas': colunas, 'linhas': linhas}
+            conn.commit()
+        return {'resultados': resultados, 'saldos': saldos, 'manutencoes': manutencoes}
+    
+    def _linhas_por_equipamento(self, cursor, tabela, equipamentos):
+        """(colunas, linhas) atuais da tabela para os equipamentos informados, em lotes"""
+        colunas, linhas = [], []
+        for inicio in range(0, len(equipamentos), 500):
+            lote = equipamentos[inicio:inicio + 500]
+            cursor.execute(f"SELECT * FROM {tabela} WHERE equipamento_id IN ({', '.join('?' * len(lote))})", lote)
+            colunas = [descricao[0] for descricao in cursor.description]
+            linhas += [list(linha) for linha in cursor.fetchall()]
+        return colunas, linhas
+    
+    def criar_copia_local(self, destino, dispositivo):
+        """Cópia consistente do banco para um tablet (backup online), marcada com a sequência do momento da cópia.
+
+        A primeira sincronização do tablet recebe apenas o que mudou depois dela. Retorna essa sequência.
+        """
+        with self.get_connection() as conn:
+            copia = sqlite3.connect(destino)
+            try:
+                conn.backup(copia)
+                ultimo_seq = copia.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+                copia.execute("UPDATE estado_sincronizacao SET dispositivo = ?, ultimo_seq_recebido = ?, aplicando_remoto = 0",
+                              (dispositivo, ultimo_seq))
+                # O log do tablet guarda apenas o que for alterado nele
+                copia.execute("DELETE FROM alteracoes")
+                copia.execute("DELETE FROM sincronizacao_recebidas")
+                for tabela in ("movimentacoes_dados", "manutencoes"):
+                    sequencia = copia.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                                              (MOVIMENTACAO_LOCAL - 1, tabela))
+                    if not sequencia.rowcount:
+                        copia.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                                      (tabela, MOVIMENTACAO_LOCAL - 1))
+                copia.commit()
+            finally:
+                copia.close()
+        return ultimo_seq
+    
+    # Métodos para sincronização com os tablets de campo (tablet)
+    def get_estado_sincronizacao(self):
+        """Dispositivo e última sequência do servidor aplicada neste banco"""
+        with self.get_connection() as conn:
+            return dict(conn.execute("SELECT dispositivo, ultimo_seq_recebido FROM estado_sincronizacao").fetchone())
+    
+    def get_movimentacoes_locais(self):
+        """Movimentações gravadas neste tablet e ainda não enviadas ao servidor, na ordem de registro"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT m.id as id_local, t.nome as tipo, m.equipamento_id, m.obra_id, m.quantidade, m.responsavel,
+                       m.observacoes, m.data_epoch, m.deposito_id, m.deposito_destino_id, m.custo, m.baixa_perda
+                FROM movimentacoes_dados m
+                JOIN tipos_movimentacao t ON t.id = m.tipo_id
+                WHERE m.id >= ?
+                ORDER BY m.id
+            """, (MOVIMENTACAO_LOCAL,))
+            movimentacoes = [dict(row) for row in cursor.fetchall()]
+            tipos_manutencao = dict(cursor.execute("""
+                SELECT movimentacao_id, tipo FROM manutencoes WHERE movimentacao_id >= ?
+            """, (MOVIMENTACAO_LOCAL,)).fetchall())
+            for mov in movimentacoes:
+                mov['tipo_manutencao'] = tipos_manutencao.get(mov['id_local'])
+            return movimentacoes
+    
+    def _somar_resumos_movimentacoes(self, cursor, ids, sinal):
+        """Soma (sinal 1) ou desfaz (sinal -1) nos contadores e resumos os efeitos das movimentações `ids` já
+        gravadas. O estoque dos depósitos fica de fora: no tablet ele vem pronto do servidor."""
+        for inicio in range(0, len(ids), 500):
+            lote = ids[inicio:inicio + 500]
+            for tipo_id, equipamento_id, obra_id, quantidade, data_epoch in cursor.execute(f"""
+                SELECT tipo_id, equipamento_id, obra_id, quantidade, data_epoch FROM movimentacoes_dados
+                WHERE id IN ({', '.join('?' * len(lote))})
+            """, lote).fetchall():
+                self._atualizar_resumos_movimentacao(cursor, tipo_id, equipamento_id, obra_id, sinal * quantidade,
+                                                     data_epoch)
+    
+    def _gravar_linhas_remotas(self, cursor, tabela, colunas, linhas):
+        """INSERT OR REPLACE de linhas recebidas do servidor, conferindo as colunas contra o schema local"""
+        validas = {row[1] for row in cursor.execute(f"PRAGMA table_info({tabela})")}
+        if not set(colunas) <= validas:
+            raise ValueError(f"Colunas desconhecidas em {tabela}: {sorted(set(colunas) - validas)}")
+        if linhas:
+            cursor.executemany(f"""
+                INSERT OR REPLACE INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})
+            """, linhas)
+    
+    def confirmar_movimentacoes_locais(self, ids_locais, saldos, manutencoes=None):
+        """Retira do tablet as movimentações recebidas pelo servidor (voltam com o id do servidor no próximo
+        delta), desfazendo o que somaram nos contadores e resumos, e troca os saldos provisórios dos depósitos
+        e as ordens e o resumo de manutenção dos equipamentos envolvidos pelos do servidor"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("UPDATE estado_sincronizacao SET aplicando_remoto = 1")
+            self._somar_resumos_movimentacoes(cursor, ids_locais, -1)
+            cursor.executemany("DELETE FROM movimentacoes_pecas WHERE movimentacao_id = ?", [(id,) for id in ids_locais])
+            cursor.executemany("DELETE FROM movimentacoes_dados WHERE id = ?", [(id,) for id in ids_locais])
+            cursor.executemany("""
+                INSERT OR REPLACE INTO estoque_depositos (equipamento_id, deposito_id, disponivel) VALUES (?, ?, ?)
+            """, saldos)
+            if manutencoes:
+                # Inclui as ordens abertas aqui (apontando para as movimentações locais retiradas acima)
+                cursor.executemany("DELETE FROM manutencoes WHERE equipamento_id = ?",
+                                   [(id,) for id in manutencoes['equipamentos']])
+                cursor.executemany("DELETE FROM manutencoes_resumo WHERE equipamento_id = ?",
+                                   [(id,) for id in manutencoes['equipamentos']])
+                for tabela, dados in manutencoes['tabelas'].items():
+                    self._gravar_linhas_remotas(cursor, tabela, dados['colunas'], dados['linhas'])
+            cursor.execute("DELETE FROM alteracoes")
+            cursor.execute("UPDATE estado_sincronizacao SET aplicando_remoto = 0")
+            conn.commit()
+    
+    def aplicar_alteracoes(self, pacote):
+        """Grava um delta recebido do servidor e avança ultimo_seq_recebido; retorna o número de registros aplicados.
+
+        Movimentações substituídas ou removidas têm seus efeitos nos contadores e resumos desfeitos e as
+        recebidas são somadas a eles, como se tivessem sido gravadas aqui.
+        """
+        aplicados = 0
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("UPDATE estado_sincronizacao SET aplicando_remoto = 1")
+            # Cadastros antes das movimentações (o resumo de perdas lê o cliente da obra)
+            for tabela in sorted(pacote['tabelas'], key=list(TABELAS_SINCRONIZADAS).index):
+                delta = pacote['tabelas'][tabela]
+                colunas_chave = TABELAS_SINCRONIZADAS[tabela]
+                movimentacoes = []
+                if tabela == "movimentacoes_dados":
+                    movimentacoes = [linha[delta['colunas'].index("id")] for linha in delta['linhas']]
+                    self._somar_resumos_movimentacoes(cursor, movimentacoes + [chave[0] for chave in delta['removidas']],
+                                                      -1)
+                if delta['removidas']:
+                    cursor.executemany(f"DELETE FROM {tabela} WHERE {' AND '.join(f'{c} = ?' for c in colunas_chave)}",
+                                       delta['removidas'])
+                self._gravar_linhas_remotas(cursor, tabela, delta['colunas'], delta['linhas'])
+                self._somar_resumos_movimentacoes(cursor, movimentacoes, 1)
+                aplicados += len(delta['removidas']) + len(delta['linhas'])
+            cursor.execute("""
+                UPDATE estado_sincronizacao SET ultimo_seq_recebido = MAX(ultimo_seq_recebido, ?), aplicando_remoto = 0
+            """, (pacote['ate_seq'],))
+            conn.commit()
+        return aplicados
+    
+    # Métodos para controle de estoque
+    def get_quantidade_disponivel(self, equipamento_id, deposito_id=None):
+        """Quantidade em estoque (não enviada, em manutenção ou perdida) em um depósito ou somando todos.
+        
+        Lê o saldo mantido em estoque_depositos pela chave primária, sem percorrer as movimentações.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if deposito_id:
+                cursor.execute("SELECT disponivel FROM estoque_depositos WHERE equipamento_id = ? AND deposito_id = ?",
+                               (equipamento_id, deposito_id))
+            else:
+                cursor.execute("SELECT SUM(disponivel) FROM estoque_depositos WHERE equipamento_id = ?",
+                               (equipamento_id,))
+            result = cursor.fetchone()
+            return max(0, result[0] or 0) if result else 0
     
     def get_equipamentos_enviados_obra(self, obra_id):
         """Retorna equipamentos enviados para uma obra específica com quantidades"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT e.id, e.descricao, 
-                       SUM(CASE WHEN m.tipo = 'envio' THEN m.quantidade ELSE 0 END) -
-                       SUM(CASE WHEN m.tipo = 'retorno' THEN m.quantidade ELSE 0 END) as quantidade_enviada
+                       SUM(CASE WHEN m.tipo_id = {ENVIO} THEN m.quantidade ELSE 0 END) -
+                       SUM(CASE WHEN m.tipo_id = {RETORNO} THEN m.quantidade ELSE 0 END) as quantidade_enviada
                 FROM equipamentos e
-                JOIN movimentacoes m ON e.id = m.equipamento_id
+                JOIN movimentacoes_dados m ON e.id = m.equipamento_id
                 WHERE m.obra_id = ?
                 GROUP BY e.id, e.descricao
                 HAVING quantidade_enviada > 0
@@ -422,12 +2765,12 @@ class DatabaseManager:
         """Calcula quantidade enviada para uma obra específica"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
-                    COALESCE(SUM(CASE WHEN tipo = 'envio' THEN quantidade ELSE 0 END), 0) as enviado,
-                    COALESCE(SUM(CASE WHEN tipo = 'retorno' THEN quantidade ELSE 0 END), 0) as retornado
-                FROM movimentacoes 
-                WHERE equipamento_id = ? AND obra_id = ? AND tipo IN ('envio', 'retorno')
+                    COALESCE(SUM(CASE WHEN tipo_id = {ENVIO} THEN quantidade ELSE 0 END), 0) as enviado,
+                    COALESCE(SUM(CASE WHEN tipo_id = {RETORNO} THEN quantidade ELSE 0 END), 0) as retornado
+                FROM movimentacoes_dados
+                WHERE equipamento_id = ? AND obra_id = ? AND tipo_id IN ({ENVIO}, {RETORNO})
             """, (equipamento_id, obra_id))
             
             result = cursor.fetchone()
@@ -440,11 +2783,11 @@ class DatabaseManager:
         """Calcula quantidade em manutenção (enviadas para manutenção - retornadas da manutenção)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
-                    COALESCE(SUM(CASE WHEN tipo = 'manutencao' THEN quantidade ELSE 0 END), 0) as total_manutencao,
-                    COALESCE(SUM(CASE WHEN tipo = 'retorno_manutencao' THEN quantidade ELSE 0 END), 0) as total_retorno_manutencao
-                FROM movimentacoes 
+                    COALESCE(SUM(CASE WHEN tipo_id = {MANUTENCAO} THEN quantidade ELSE 0 END), 0) as total_manutencao,
+                    COALESCE(SUM(CASE WHEN tipo_id = {RETORNO_MANUTENCAO} THEN quantidade ELSE 0 END), 0) as total_retorno_manutencao
+                FROM movimentacoes_dados
                 WHERE equipamento_id = ?
             """, (equipamento_id,))
             
@@ -458,11 +2801,11 @@ class DatabaseManager:
         """Calcula quantidade perdida (perdas - retornos de perda)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
-                    COALESCE(SUM(CASE WHEN tipo = 'perda' THEN quantidade ELSE 0 END), 0) as total_perdas,
-                    COALESCE(SUM(CASE WHEN tipo = 'retorno_perda' THEN quantidade ELSE 0 END), 0) as total_retorno_perdas
-                FROM movimentacoes 
+                    COALESCE(SUM(CASE WHEN tipo_id = {PERDA} THEN quantidade ELSE 0 END), 0) as total_perdas,
+                    COALESCE(SUM(CASE WHEN tipo_id = {RETORNO_PERDA} THEN quantidade ELSE 0 END), 0) as total_retorno_perdas
+                FROM movimentacoes_dados
                 WHERE equipamento_id = ?
             """, (equipamento_id,))
             
@@ -472,13 +2815,43 @@ class DatabaseManager:
             
             return max(0, total_perdas - total_retorno_perdas)
     
-    def validar_movimentacao(self, tipo, equipamento_id, obra_id, quantidade):
-        """Valida se a movimentação é possível"""
+    @cache_persistente("equipamentos", "movimentacoes")
+    def get_estoque_snapshot(self):
+        """Saldos de todos os equipamentos em uma única consulta (total, enviado, manutenção, perdido, disponível)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT e.id, e.descricao, e.codigo, e.quantidade, {SQL_SALDOS}
+                FROM equipamentos e
+                LEFT JOIN movimentacoes_dados m ON m.equipamento_id = e.id
+                WHERE e.excluido_em IS NULL
+                GROUP BY e.id
+                ORDER BY e.descricao
+            """)
+            snapshot = {}
+            for row in cursor.fetchall():
+                saldo = dict(row)
+                # Mesma regra de get_quantidade_disponivel / get_quantidade_em_manutencao / get_quantidade_perdida
+                saldo['disponivel'] = max(0, saldo['quantidade'] - saldo['enviado'] - saldo['em_manutencao'] - saldo['perdido'])
+                saldo['em_manutencao'] = max(0, saldo['em_manutencao'])
+                saldo['perdido'] = max(0, saldo['perdido'])
+                snapshot[saldo['id']] = saldo
+            return snapshot
+    
+    def validar_movimentacao(self, tipo, equipamento_id, obra_id, quantidade, deposito_id=None, deposito_destino_id=None):
+        """Valida se a movimentação é possível (saídas de estoque contra o depósito informado, se houver)"""
         if tipo == 'envio':
-            disponivel = self.get_quantidade_disponivel(equipamento_id)
+            disponivel = self.get_quantidade_disponivel(equipamento_id, deposito_id)
             if quantidade > disponivel:
                 return False, f"Quantidade disponível insuficiente. Disponível: {disponivel}"
         
+        elif tipo == 'transferencia':
+            if not deposito_destino_id or deposito_destino_id == (deposito_id or DEPOSITO_PRINCIPAL):
+                return False, "Informe um depósito de destino diferente do de origem"
+            disponivel = self.get_quantidade_disponivel(equipamento_id, deposito_id or DEPOSITO_PRINCIPAL)
+            if quantidade > disponivel:
+                return False, f"Quantidade insuficiente no depósito de origem. Disponível: {disponivel}"
+        
         elif tipo == 'retorno':
             if obra_id:
                 enviada = self.get_quantidade_enviada_obra(equipamento_id, obra_id)
@@ -488,7 +2861,7 @@ class DatabaseManager:
                 return False, "Obra é obrigatória para retornos"
         
         elif tipo == 'manutencao':
-            disponivel = self.get_quantidade_disponivel(equipamento_id)
+            disponivel = self.get_quantidade_disponivel(equipamento_id, deposito_id)
             if quantidade > disponivel:
                 return False, f"Quantidade disponível insuficiente para manutenção. Disponível: {disponivel}"
         
@@ -497,9 +2870,34 @@ class DatabaseManager:
             if quantidade > em_manutencao:
                 return False, f"Quantidade em manutenção insuficiente. Em manutenção: {em_manutencao}"
         
+        elif tipo == 'perda' and obra_id:
+            enviada = self.get_quantidade_enviada_obra(equipamento_id, obra_id)
+            if quantidade > enviada:
+                return False, f"Quantidade perdida superior ao saldo da obra. Enviado para esta obra: {enviada}"
+        
+        elif tipo == 'perda' and deposito_id:
+            disponivel = self.get_quantidade_disponivel(equipamento_id, deposito_id)
+            if quantidade > disponivel:
+                return False, f"Quantidade perdida superior ao estoque do depósito. Disponível: {disponivel}"
+        
         elif tipo == 'retorno_perda':
             perdidas = self.get_quantidade_perdida(equipamento_id)
             if quantidade > perdidas:
                 return False, f"Quantidade perdida insuficiente. Perdidas: {perdidas}"
         
+        # Peças com serial só se movimentam pela leitura dos seriais (mantém os saldos agregados consistentes)
+        (estado, local), _ = self._transicao_peca(tipo, obra_id, deposito_id, deposito_destino_id)
+        with self.get_connection() as conn:
+            etiquetadas = self._contar_pecas(conn.cursor(), estado, local, equipamento_id).get(equipamento_id, 0)
+        if etiquetadas:
+            saldo = {
+                "disponivel": lambda: self.get_quantidade_disponivel(equipamento_id, local),
+                "enviado": lambda: self.get_quantidade_enviada_obra(equipamento_id, obra_id),
+                "manutencao": lambda: self.get_quantidade_em_manutencao(equipamento_id),
+                "perdido": lambda: self.get_quantidade_perdida(equipamento_id),
+            }[estado]()
+            if quantidade > saldo - etiquetadas:
+                return False, (f"{etiquetadas} peça(s) com serial neste local só podem ser movimentadas pela leitura "
+                               f"de seriais. Sem serial: {max(0, saldo - etiquetadas)}")
+        
         return True, "Movimentação válida"
@@ -0,0 +1,162 @@
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Entradas mantidas em memória além do disco (evita ler o arquivo a cada rerun)
+MAXIMO_MEMORIA = 256
+# Entradas mantidas em disco; as menos usadas são descartadas acima disso
+MAXIMO_DISCO = 2000
+
+
+def caminho_cache(db_path):
+    """Arquivo de cache ao lado do banco: cmms_andaimes.db -> cmms_andaimes.cache.db"""
+    base, _ = os.path.splitext(db_path)
+    return f"{base}.cache.db"
+
+
+class DiskCache:
+    """Cache persistente de resultados derivados, marcado com a versão dos dados de origem.
+
+    Cada entrada guarda as versões (de versoes_dados) das tabelas das quais depende;
+    ela continua válida após um restart enquanto essas tabelas não mudarem. Os valores
+    são guardados serializados, então cada leitura devolve uma cópia independente.
+    """
+
+    def __init__(self, caminho, maximo_memoria=MAXIMO_MEMORIA, maximo_disco=MAXIMO_DISCO):
+        self.caminho = caminho
+        self.maximo_memoria = maximo_memoria
+        self.maximo_disco = maximo_disco
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    chave TEXT PRIMARY KEY,
+                    versoes TEXT NOT NULL,
+                    valor BLOB NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    usado_em REAL NOT NULL
+                )
+            """)
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def obter(self, chave, versoes):
+        """Retorna (True, valor) se houver entrada válida para as versões informadas"""
+        marca = repr(versoes)
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None and entrada[0] == marca:
+                self._memoria.move_to_end(chave)
+                dados = entrada[1]
+            else:
+                dados = None
+
+        if dados is None:
+            try:
+                with self._conectar() as conn:
+                    row = conn.execute("SELECT versoes, valor FROM cache WHERE chave = ?", (chave,)).fetchone()
+                    if row is not None and row[0] == marca:
+                        conn.execute("UPDATE cache SET usado_em = ? WHERE chave = ?", (time.time(), chave))
+                        dados = row[1]
+            except sqlite3.Error:
+                dados = None
+            if dados is not None:
+                self._guardar_memoria(chave, marca, dados)
+
+        if dados is None:
+            self.falhas += 1
+            return False, None
+        try:
+            valor = pickle.loads(dados)
+        except Exception:
+            self.falhas += 1
+            return False, None
+        self.acertos += 1
+        return True, valor
+
+    def gravar(self, chave, versoes, valor):
+        marca = repr(versoes)
+        try:
+            dados = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        self._guardar_memoria(chave, marca, dados)
+        try:
+            with self._conectar() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO cache (chave, versoes, valor, tamanho, usado_em)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (chave, marca, dados, len(dados), time.time()))
+                total = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                if total > self.maximo_disco:
+                    conn.execute("""
+                        DELETE FROM cache WHERE chave IN (
+                            SELECT chave FROM cache ORDER BY usado_em LIMIT ?
+                        )
+                    """, (total - self.maximo_disco,))
+        except sqlite3.Error:
+            # Cache é apenas otimização: falha de escrita não pode derrubar a página
+            pass
+
+    def _guardar_memoria(self, chave, marca, dados):
+        with self._lock:
+            self._memoria[chave] = (marca, dados)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.maximo_memoria:
+                self._memoria.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._memoria.clear()
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def estatisticas(self):
+        with self._conectar() as conn:
+            entradas, tamanho = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM cache").fetchone()
+        return {"entradas": entradas, "bytes": tamanho, "acertos": self.acertos, "falhas": self.falhas}
+
+
+def chave_cache(nome, args, kwargs):
+    texto = f"{nome}|{args!r}|{sorted(kwargs.items())!r}"
+    return f"{nome}:{hashlib.sha1(texto.encode('utf-8')).hexdigest()}"
+
+
+def cache_persistente(*tabelas, nome=None):
+    """Decorador para funções f(db, ...) cujo resultado depende apenas das tabelas informadas.
+
+    O resultado é reaproveitado (inclusive entre restarts) até que alguma dessas
+    tabelas seja alterada; as demais entradas do cache continuam válidas.
+    """
+    def decorador(funcao):
+        identificador = nome or f"{funcao.__module__}.{funcao.__qualname__}"
+
+        @functools.wraps(funcao)
+        def wrapper(db, *args, **kwargs):
+            cache = getattr(db, "cache", None)
+            if cache is None:
+                return funcao(db, *args, **kwargs)
+            versoes = db.get_versoes_dados(tabelas)
+            chave = chave_cache(identificador, args, kwargs)
+            encontrado, valor = cache.obter(chave, versoes)
+            if encontrado:
+                return valor
+            valor = funcao(db, *args, **kwargs)
+            cache.gravar(chave, versoes, valor)
+            return valor
+
+        wrapper.sem_cache = funcao
+        return wrapper
+    return decorador
@@ -0,0 +1,33 @@
+import streamlit as st
+from database import OPERACOES_AUDITORIA
+
+
+def formatar_alteracoes(alteracoes):
+    """{coluna: [antes, depois]} -> 'coluna: antes → depois; ...'"""
+    return "; ".join(f"{coluna}: {antes if antes is not None else '—'} → {depois if depois is not None else '—'}"
+                     for coluna, (antes, depois) in alteracoes.items())
+
+
+def show_historico_alteracoes(db, tabela, registro_id):
+    """Trilha de auditoria de um registro; consultada só quando o usuário abre o histórico"""
+    if not st.toggle("🕓 Histórico de alterações", key=f"historico_{tabela}_{registro_id}"):
+        return
+
+    historico = db.get_historico_registro(tabela, registro_id)
+    if not historico:
+        st.caption("Nenhuma alteração registrada.")
+        return
+
+    linhas = []
+    for entrada in historico:
+        alteracoes = entrada['alteracoes']
+        if entrada['operacao'] == "D":
+            # Remoção física: valores que o registro tinha
+            alteracoes = {coluna: [valor, None] for coluna, valor in alteracoes.items()}
+        linhas.append({
+            "Quando (UTC)": entrada['momento'],
+            "Operação": OPERACOES_AUDITORIA.get(entrada['operacao'], entrada['operacao']),
+            "Usuário": entrada['ator'],
+            "Alterações": formatar_alteracoes(alteracoes),
+        })
+    st.dataframe(linhas, hide_index=True, use_container_width=True)
@@ -1,217 +1,346 @@
 import streamlit as st
 import pandas as pd
+from profiler import secao, registrar_df
+from database import STATUS_EQUIPAMENTO, DEPOSITO_PRINCIPAL
+from modules.auditoria import show_historico_alteracoes
 
 def show_equipamentos_page(db, contexto=None):
     st.title("🔧 Gestão de Equipamentos")
     
-    # Abas
-    tab1, tab2 = st.tabs(["Lista de Equipamentos", "Cadastrar Equipamento"])
+    # Abas (somente a aba selecionada é executada a cada rerun)
+    tab1, tab2, tab3 = st.tabs(["Lista de Equipamentos", "Cadastrar Equipamento", "Depósitos"],
+                               key="equipamentos_aba", on_change="rerun")
     
-    with tab1:
-        st.subheader("Equipamentos Cadastrados")
+    if tab1.open:
+        with tab1, secao("Lista de Equipamentos"):
+            show_lista_equipamentos_tab(db)
+    
+    if tab2.open:
+        with tab2, secao("Cadastrar Equipamento"):
+            show_cadastro_equipamento_tab(db)
+    
+    if tab3.open:
+        with tab3, secao("Depósitos"):
+            show_depositos_tab(db)
+
+
+# Linhas por página da grade de equipamentos
+EQUIPAMENTOS_POR_PAGINA = 50
+
+STATUS_EMOJI = {
+    "disponivel": "🟢",
+    "enviado": "🔵", 
+    "manutencao": "🟡",
+    "perdido": "🔴"
+}
+
+
+def show_lista_equipamentos_tab(db):
+    st.subheader("Equipamentos Cadastrados")
+    
+    if not db.get_total_equipamentos():
+        st.info("Nenhum equipamento cadastrado ainda.")
+        return
+    
+    # Filtros (aplicados no banco, não em memória)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        search = st.text_input("Buscar equipamento:", placeholder="Digite a descrição ou código...")
+    with col2:
+        status_filter = st.selectbox("Filtrar por status:", ["Todos"] + STATUS_EQUIPAMENTO)
+    with col3:
+        sort_by = st.selectbox("Ordenar por:", ["Descrição", "Quantidade", "Status"])
+    status = None if status_filter == "Todos" else status_filter
+    
+    # Estatísticas rápidas com controle real de estoque (uma consulta agregada, cache por versão dos dados)
+    resumo = db.get_equipamentos_resumo(search or None, status)
+    st.markdown("### 📊 Resumo")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total de Itens", resumo['itens'])
+    with col2:
+        st.metric("Quantidade Total", resumo['quantidade'])
+    with col3:
+        st.metric("Realmente Disponíveis", resumo['disponivel'])
+    with col4:
+        st.metric("Em Manutenção", resumo['em_manutencao'])
+    
+    st.markdown("---")
+    
+    if not resumo['itens']:
+        st.info("Nenhum equipamento encontrado com os filtros selecionados.")
+        return
+    
+    # Paginação: filtro ou ordenação novos voltam para a primeira página
+    total_paginas = -(-resumo['itens'] // EQUIPAMENTOS_POR_PAGINA)
+    filtros = (search, status_filter, sort_by)
+    if st.session_state.get("equip_filtros") != filtros:
+        st.session_state["equip_filtros"] = filtros
+        st.session_state["equip_pagina"] = 1
+    if st.session_state.get("equip_pagina", 1) > total_paginas:
+        st.session_state["equip_pagina"] = total_paginas
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key="equip_pagina")
+    with col2:
+        st.caption(f"{resumo['itens']} equipamento(s) — página {pagina} de {total_paginas}. "
+                   "Clique em uma linha para ver detalhes e editar.")
+    
+    linhas, _ = db.get_equipamentos_pagina(search or None, status, sort_by, pagina - 1, EQUIPAMENTOS_POR_PAGINA)
+    df = registrar_df(pd.DataFrame(linhas), "equipamentos")
+    df.insert(0, "situacao", [STATUS_EMOJI.get(s, "⚪") + " " + (s or "") for s in df['status']])
+    
+    evento = st.dataframe(
+        df,
+        hide_index=True,
+        use_container_width=True,
+        key="equipamentos_grid",
+        on_select="rerun",
+        selection_mode="single-row",
+        column_order=["situacao", "descricao", "codigo", "medida", "quantidade", "disponivel",
+                      "enviado", "em_manutencao", "perdido"],
+        column_config={
+            "situacao": "Status",
+            "descricao": "Descrição",
+            "codigo": "Código",
+            "medida": "Medida",
+            "quantidade": "Total",
+            "disponivel": "Disponível",
+            "enviado": "Enviado",
+            "em_manutencao": "Manutenção",
+            "perdido": "Perdido",
+        },
+    )
+    
+    selecionadas = evento.selection.rows
+    if selecionadas and selecionadas[0] < len(linhas):
+        show_detalhe_equipamento(db, linhas[selecionadas[0]])
+
+
+def show_detalhe_equipamento(db, equip):
+    """Painel de detalhes/edição do equipamento selecionado na grade"""
+    st.markdown("---")
+    st.markdown(f"### {STATUS_EMOJI.get(equip['status'], '⚪')} {equip['descricao']}")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    
+    with col1:
+        st.write(f"**Código:** {equip['codigo'] or 'N/A'}")
+        st.write(f"**Medida:** {equip['medida'] or 'N/A'}")
+        if equip['observacoes']:
+            st.write(f"**Obs:** {equip['observacoes']}")
+    
+    with col2:
+        st.write(f"**Quantidade Total:** {equip['quantidade']}")
+        st.write(f"**Disponível:** {equip['disponivel']}")
+        st.write(f"**Enviado:** {equip['quantidade'] - equip['disponivel'] - equip['em_manutencao']}")
+        st.write(f"**Em Manutenção:** {equip['em_manutencao']}")
+        por_deposito = db.get_estoque_por_deposito(equip['id'])
+        if len(por_deposito) > 1:
+            st.caption(" · ".join(f"{d['nome']}: {d['disponivel']}" for d in por_deposito))
+    
+    with col3:
+        confirmar = st.checkbox("Confirmar exclusão", key=f"confirm_delete_equip_{equip['id']}")
+        if st.button("🗑️ Excluir", key=f"delete_equip_{equip['id']}", disabled=not confirmar):
+            db.delete_equipamento(equip['id'])
+            st.success("Equipamento excluído com sucesso!")
+            st.rerun()
+    
+    show_pecas_equipamento(db, equip)
+    show_historico_alteracoes(db, "equipamentos", equip['id'])
+    
+    # Formulário de edição
+    with st.form(f"edit_equip_form_{equip['id']}"):
+        st.write("**Editar Equipamento:**")
+        descricao_input = st.text_input("Descrição *", value=equip['descricao'],
+                                        help="💡 Será convertido automaticamente para MAIÚSCULAS")
+        # Converter automaticamente para maiúsculas
+        descricao = descricao_input.upper() if descricao_input else ""
+        
+        # Mostrar prévia se há mudança
+        if descricao_input and descricao_input != descricao:
+            st.caption(f"📝 Prévia: **{descricao}**")
+        codigo = st.text_input("Código", value=equip['codigo'] or "")
+        medida = st.text_input("Medida", value=equip['medida'] or "")
+        quantidade = st.number_input("Quantidade *", min_value=1, value=equip['quantidade'])
+        valor_diaria = st.number_input("Valor da diária (R$)", min_value=0.0, value=float(equip['valor_diaria'] or 0),
+                                       step=0.5, format="%.2f")
+        status = st.selectbox("Status", STATUS_EQUIPAMENTO,
+                              index=STATUS_EQUIPAMENTO.index(equip['status']) if equip['status'] in STATUS_EQUIPAMENTO else 0)
+        observacoes = st.text_area("Observações", value=equip['observacoes'] or "")
         
-        equipamentos = db.get_equipamentos()
+        if st.form_submit_button("💾 Salvar"):
+            if descricao and quantidade > 0:
+                # Verificar se já existe equipamento com essa descrição (excluindo o atual)
+                if db.equipamento_existe(descricao, equip['id']):
+                    st.error(f"❌ Já existe outro equipamento com a descrição '{descricao}'. Use uma descrição diferente!")
+                else:
+                    db.update_equipamento(equip['id'], descricao, codigo, medida, 
+                                          quantidade, status, observacoes, valor_diaria)
+                    st.success("✅ Equipamento atualizado com sucesso!")
+                    st.rerun()
+            else:
+                st.error("❌ Descrição e quantidade são obrigatórios!")
+
+
+def show_pecas_equipamento(db, equip):
+    """Peças com serial do equipamento e etiquetagem de peças do estoque"""
+    resumo = db.get_resumo_pecas(equip['id'])
+    titulo = f"🏷️ Peças com serial ({sum(resumo.values())})" if resumo else "🏷️ Peças com serial"
+    with st.expander(titulo):
+        if resumo:
+            st.write(" · ".join(f"**{STATUS_EMOJI.get(estado, '⚪')} {estado}:** {pecas}"
+                                for estado, pecas in resumo.items()))
+        with st.form(f"pecas_form_{equip['id']}"):
+            seriais = st.text_area("Seriais a etiquetar", placeholder="Um serial por linha",
+                                   help="Peças já em estoque no depósito; passam a ser movimentadas pela leitura de seriais")
+            depositos = {d['nome']: d['id'] for d in db.get_depositos()}
+            deposito_id = None
+            if len(depositos) > 1:
+                deposito_id = depositos[st.selectbox("Depósito", list(depositos))]
+            if st.form_submit_button("🏷️ Etiquetar"):
+                cadastradas, repetidas, erros = db.add_pecas(equip['id'], seriais, deposito_id)
+                if erros:
+                    for erro in erros[:20]:
+                        st.error(f"❌ {erro}")
+                else:
+                    st.success(f"✅ {cadastradas} peça(s) etiquetada(s)"
+                               + (f"; {repetidas} repetida(s) ignorada(s)" if repetidas else ""))
+
+
+def show_cadastro_equipamento_tab(db):
+    st.subheader("Cadastrar Novo Equipamento")
+    
+    with st.form("equipamento_form"):
+        st.markdown("#### Informações do Equipamento")
         
-        if equipamentos:
-            df = pd.DataFrame(equipamentos)
-            
-            # Filtros
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                search = st.text_input("Buscar equipamento:", placeholder="Digite a descrição...")
-            with col2:
-                status_filter = st.selectbox("Filtrar por status:", 
-                                             ["Todos", "disponivel", "enviado", "manutencao", "perdido"])
-            with col3:
-                sort_by = st.selectbox("Ordenar por:", ["Descrição", "Quantidade", "Status"])
-            
-            # Aplicar filtros
-            if search:
-                df = df[df['descricao'].str.contains(search, case=False, na=False)]
-            
-            if status_filter != "Todos":
-                df = df[df['status'] == status_filter]
-            
-            # Ordenação
-            if sort_by == "Descrição":
-                df = df.sort_values('descricao')
-            elif sort_by == "Quantidade":
-                df = df.sort_values('quantidade', ascending=False)
-            elif sort_by == "Status":
-                df = df.sort_values('status')
-            
-            # Estatísticas rápidas com controle real de estoque
-            st.markdown("### 📊 Resumo")
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                total_itens = len(df)
-                st.metric("Total de Itens", total_itens)
-            with col2:
-                total_quantidade = df['quantidade'].sum()
-                st.metric("Quantidade Total", total_quantidade)
-            with col3:
-                # Calcular disponível real baseado em movimentações
-                total_disponivel = sum(db.get_quantidade_disponivel(equip['id']) for _, equip in df.iterrows())
-                st.metric("Realmente Disponíveis", total_disponivel)
-            with col4:
-                # Calcular em manutenção
-                total_manutencao = sum(db.get_quantidade_em_manutencao(equip['id']) for _, equip in df.iterrows())
-                st.metric("Em Manutenção", total_manutencao)
-            
-            st.markdown("---")
-            
-            # Mostrar equipamentos
-            for idx, equip in df.iterrows():
-                status_emoji = {
-                    "disponivel": "🟢",
-                    "enviado": "🔵", 
-                    "manutencao": "🟡",
-                    "perdido": "🔴"
-                }.get(equip['status'], "⚪")
-                
-                # Calcular quantidades reais
-                disponivel = db.get_quantidade_disponivel(equip['id'])
-                em_manutencao = db.get_quantidade_em_manutencao(equip['id'])
-                enviado = equip['quantidade'] - disponivel - em_manutencao
-                
-                with st.expander(f"{status_emoji} {equip['descricao']} (Total: {equip['quantidade']}, Disp: {disponivel}, Manut: {em_manutencao})"):
-                    col1, col2, col3 = st.columns([2, 2, 1])
-                    
-                    with col1:
-                        st.write(f"**Descrição:** {equip['descricao']}")
-                        st.write(f"**Código:** {equip['codigo'] or 'N/A'}")
-                        st.write(f"**Medida:** {equip['medida'] or 'N/A'}")
-                    
-                    with col2:
-                        st.write(f"**Quantidade Total:** {equip['quantidade']}")
-                        st.write(f"**Disponível:** {disponivel}")
-                        st.write(f"**Enviado:** {enviado}")
-                        st.write(f"**Em Manutenção:** {em_manutencao}")
-                        if equip['observacoes']:
-                            st.write(f"**Obs:** {equip['observacoes']}")
-                    
-                    with col3:
-                        if st.button("✏️ Editar", key=f"edit_equip_{equip['id']}"):
-                            st.session_state[f"edit_equip_{equip['id']}"] = True
-                            
-                        if st.button("🗑️ Excluir", key=f"delete_equip_{equip['id']}"):
-                            if st.confirm("Tem certeza que deseja excluir este equipamento?"):
-                                db.delete_equipamento(equip['id'])
-                                st.success("Equipamento excluído com sucesso!")
-                                st.rerun()
-                    
-                    # Formulário de edição
-                    if st.session_state.get(f"edit_equip_{equip['id']}", False):
-                        st.markdown("---")
-                        st.write("**Editar Equipamento:**")
-                        
-                        with st.form(f"edit_equip_form_{equip['id']}"):
-                            descricao_input = st.text_input("Descrição *", value=equip['descricao'],
-                                                            help="💡 Será convertido automaticamente para MAIÚSCULAS")
-                            # Converter automaticamente para maiúsculas
-                            descricao = descricao_input.upper() if descricao_input else ""
-                            
-                            # Mostrar prévia se há mudança
-                            if descricao_input and descricao_input != descricao:
-                                st.caption(f"📝 Prévia: **{descricao}**")
-                            codigo = st.text_input("Código", value=equip['codigo'] or "")
-                            medida = st.text_input("Medida", value=equip['medida'] or "")
-                            quantidade = st.number_input("Quantidade *", min_value=1, value=equip['quantidade'])
-                            status = st.selectbox("Status", 
-                                                  ["disponivel", "enviado", "manutencao", "perdido"],
-                                                  index=["disponivel", "enviado", "manutencao", "perdido"].index(equip['status']))
-                            observacoes = st.text_area("Observações", value=equip['observacoes'] or "")
-                            
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                if st.form_submit_button("💾 Salvar"):
-                                    if descricao and quantidade > 0:
-                                        # Verificar se já existe equipamento com essa descrição (excluindo o atual)
-                                        if db.equipamento_existe(descricao, equip['id']):
-                                            st.error(f"❌ Já existe outro equipamento com a descrição '{descricao}'. Use uma descrição diferente!")
-                                        else:
-                                            db.update_equipamento(equip['id'], descricao, codigo, medida, 
-                                                                  quantidade, status, observacoes)
-                                            st.success("✅ Equipamento atualizado com sucesso!")
-                                            st.session_state[f"edit_equip_{equip['id']}"] = False
-                                            st.rerun()
-                                    else:
-                                        st.error("❌ Descrição e quantidade são obrigatórios!")
-                            
-                            with col2:
-                                if st.form_submit_button("❌ Cancelar"):
-                                    st.session_state[f"edit_equip_{equip['id']}"] = False
-                                    st.rerun()
-        else:
-            st.info("Nenhum equipamento cadastrado ainda.")
-    
-    with tab2:
-        st.subheader("Cadastrar Novo Equipamento")
+        descricao_input = st.text_input("Descrição do Equipamento *", 
+                                        placeholder="Ex: tubo de andaime 2m",
+                                        help="💡 Será convertido automaticamente para MAIÚSCULAS. Não pode ser duplicada.")
+        # Converter automaticamente para maiúsculas
+        descricao = descricao_input.upper() if descricao_input else ""
         
-        with st.form("equipamento_form"):
-            st.markdown("#### Informações do Equipamento")
-            
-            descricao_input = st.text_input("Descrição do Equipamento *", 
-                                            placeholder="Ex: tubo de andaime 2m",
-                                            help="💡 Será convertido automaticamente para MAIÚSCULAS. Não pode ser duplicada.")
-            # Converter automaticamente para maiúsculas
-            descricao = descricao_input.upper() if descricao_input else ""
-            
-            # Mostrar prévia e verificar duplicatas
-            if descricao_input and descricao_input != descricao:
-                st.caption(f"📝 Prévia: **{descricao}**")
-            
-            # Verificar se descrição já existe (feedback em tempo real)
-            if descricao and db.equipamento_existe(descricao):
-                st.warning(f"⚠️ Já existe um equipamento com a descrição '{descricao}'")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                codigo = st.text_input("Código (opcional)", 
-                                       placeholder="Ex: TAD-2M-001")
-            with col2:
-                medida = st.text_input("Medida (opcional)", 
-                                       placeholder="Ex: 2m x 48mm")
-            
+        # Mostrar prévia e verificar duplicatas
+        if descricao_input and descricao_input != descricao:
+            st.caption(f"📝 Prévia: **{descricao}**")
+        
+        # Verificar se descrição já existe (feedback em tempo real)
+        if descricao and db.equipamento_existe(descricao):
+            st.warning(f"⚠️ Já existe um equipamento com a descrição '{descricao}'")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            codigo = st.text_input("Código (opcional)", 
+                                   placeholder="Ex: TAD-2M-001")
+        with col2:
+            medida = st.text_input("Medida (opcional)", 
+                                   placeholder="Ex: 2m x 48mm")
+        
+        col1, col2 = st.columns(2)
+        with col1:
             quantidade = st.number_input("Quantidade *", min_value=1, value=1, step=1)
-            
-            # Status fixo como "disponível" (não editável)
-            st.info("📍 Status inicial fixo: **Disponível**")
-            status = "disponivel"
-            
-            observacoes = st.text_area("Observações", 
-                                       placeholder="Informações adicionais sobre o equipamento...")
-            
-            if st.form_submit_button("💾 Cadastrar Equipamento"):
-                if descricao and quantidade > 0:
-                    # Verificar se já existe equipamento com essa descrição
-                    if db.equipamento_existe(descricao):
-                        st.error(f"❌ Já existe um equipamento com a descrição '{descricao}'. Use uma descrição diferente!")
-                    else:
-                        db.add_equipamento(descricao, codigo if codigo else None, 
-                                           medida if medida else None, quantidade, 
-                                           observacoes if observacoes else None)
-                        st.success("✅ Equipamento cadastrado com sucesso!")
-                        st.rerun()
+        with col2:
+            valor_diaria = st.number_input("Valor da diária (R$)", min_value=0.0, value=0.0, step=0.5, format="%.2f",
+                                           help="Valor cobrado por peça e por dia em obra")
+        
+        # Estoque inicial entra em um depósito (só há escolha com mais de um cadastrado)
+        depositos = {d['nome']: d['id'] for d in db.get_depositos()}
+        deposito_id = None
+        if len(depositos) > 1:
+            deposito_id = depositos[st.selectbox("Depósito *", list(depositos))]
+        
+        # Status fixo como "disponível" (não editável)
+        st.info("📍 Status inicial fixo: **Disponível**")
+        status = "disponivel"
+        
+        observacoes = st.text_area("Observações", 
+                                   placeholder="Informações adicionais sobre o equipamento...")
+        
+        if st.form_submit_button("💾 Cadastrar Equipamento"):
+            if descricao and quantidade > 0:
+                # Verificar se já existe equipamento com essa descrição
+                if db.equipamento_existe(descricao):
+                    st.error(f"❌ Já existe um equipamento com a descrição '{descricao}'. Use uma descrição diferente!")
                 else:
-                    st.error("❌ Descrição e quantidade são obrigatórios!")
+                    db.add_equipamento(descricao, codigo if codigo else None, 
+                                       medida if medida else None, quantidade, 
+                                       observacoes if observacoes else None, valor_diaria, deposito_id)
+                    st.success("✅ Equipamento cadastrado com sucesso!")
+                    st.rerun()
+            else:
+                st.error("❌ Descrição e quantidade são obrigatórios!")
+    
+    st.caption("* Campos obrigatórios")
+    
+    # Dicas
+    with st.expander("💡 Dicas para Cadastro"):
+        st.markdown("""
+        **Descrição:** Seja específico e claro (ex: "Tubo de andaime 2m", "Braçadeira giratória")
         
-        st.caption("* Campos obrigatórios")
+        **Código:** Use um padrão consistente para facilitar a identificação
         
-        # Dicas
-        with st.expander("💡 Dicas para Cadastro"):
-            st.markdown("""
-            **Descrição:** Seja específico e claro (ex: "Tubo de andaime 2m", "Braçadeira giratória")
-            
-            **Código:** Use um padrão consistente para facilitar a identificação
-            
-            **Medida:** Inclua dimensões importantes (comprimento, diâmetro, peso)
-            
-            **Quantidade:** Registre a quantidade total disponível no estoque
-            
-            **Status:** 
-            - **Disponível:** Equipamento pronto para uso
-            - **Enviado:** Equipamento em uso em obra
-            - **Manutenção:** Equipamento em reparo
-            - **Perdido:** Equipamento perdido ou danificado irreparavelmente
-            """)
+        **Medida:** Inclua dimensões importantes (comprimento, diâmetro, peso)
+        
+        **Quantidade:** Registre a quantidade total disponível no estoque
+        
+        **Status:** 
+        - **Disponível:** Equipamento pronto para uso
+        - **Enviado:** Equipamento em uso em obra
+        - **Manutenção:** Equipamento em reparo
+        - **Perdido:** Equipamento perdido ou danificado irreparavelmente
+        """)
+
+
+def show_depositos_tab(db):
+    st.subheader("Depósitos")
+    
+    depositos = db.get_depositos(incluir_inativos=True)
+    df = pd.DataFrame(depositos)
+    df['situacao'] = df['ativo'].map({1: "🟢 Ativo", 0: "⚪ Inativo"})
+    st.dataframe(df[['nome', 'endereco', 'pecas', 'situacao']], hide_index=True, use_container_width=True,
+                 column_config={"nome": "Depósito", "endereco": "Endereço", "pecas": "Peças em Estoque",
+                                "situacao": "Situação"})
+    
+    # Estoque de um depósito: lido do saldo mantido por (equipamento, depósito), sem somar movimentações
+    opcoes = {d['nome']: d for d in depositos}
+    deposito = opcoes[st.selectbox("Ver estoque do depósito:", list(opcoes), key="deposito_estoque")]
+    estoque = db.get_estoque_deposito(deposito['id'])
+    if estoque:
+        equipamentos = {e['id']: e['descricao'] for e in db.get_equipamentos()}
+        df_estoque = pd.DataFrame({"descricao": [equipamentos.get(e, f"#{e}") for e in estoque],
+                                   "disponivel": list(estoque.values())}).sort_values("descricao")
+        st.dataframe(df_estoque, hide_index=True, use_container_width=True,
+                     column_config={"descricao": "Equipamento", "disponivel": "No Depósito"})
+    else:
+        st.info("Nenhuma peça neste depósito.")
+    
+    with st.expander("✏️ Editar depósito"):
+        with st.form(f"editar_deposito_{deposito['id']}"):
+            nome = st.text_input("Nome *", value=deposito['nome'])
+            endereco = st.text_input("Endereço", value=deposito['endereco'] or "")
+            ativo = st.checkbox("Ativo", value=bool(deposito['ativo']),
+                                disabled=deposito['id'] == DEPOSITO_PRINCIPAL,
+                                help="Depósitos inativos não aparecem nas movimentações")
+            if st.form_submit_button("💾 Salvar"):
+                if not nome:
+                    st.error("❌ Nome é obrigatório!")
+                elif not ativo and deposito["pecas"] > 0:
+                    st.error("❌ Transfira as peças antes de desativar o depósito.")
+                else:
+                    db.update_deposito(deposito['id'], nome, endereco or None, ativo)
+                    st.success("✅ Depósito atualizado!")
+                    st.rerun()
+    
+    with st.form("deposito_form"):
+        st.markdown("#### Novo Depósito")
+        nome = st.text_input("Nome *", placeholder="Ex: Pátio Cubatão")
+        endereco = st.text_input("Endereço")
+        if st.form_submit_button("💾 Cadastrar Depósito"):
+            if not nome:
+                st.error("❌ Nome é obrigatório!")
+            elif nome in opcoes:
+                st.error(f"❌ Já existe um depósito '{nome}'.")
+            else:
+                db.add_deposito(nome, endereco or None)
+                st.success("✅ Depósito cadastrado! Use transferências para movimentar estoque entre depósitos.")
+                st.rerun()
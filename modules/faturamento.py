@@ -0,0 +1,159 @@
+import streamlit as st
+import pandas as pd
+from profiler import secao, registrar_df
+from locacao import gerar_faturas_mensais, competencias_recentes, calcular_locacao
+from datetime import date
+
+def show_faturamento_page(db, contexto=None):
+    st.title("💰 Faturamento de Locação")
+
+    # Consultas e exportação de faturas pelo pool somente leitura
+    leitura = db.somente_leitura()
+
+    # Abas (somente a aba selecionada é executada a cada rerun)
+    tab1, tab2, tab3 = st.tabs(["Faturas do Mês", "Simular Período", "Valores das Diárias"],
+                               key="faturamento_aba", on_change="rerun")
+
+    if tab1.open:
+        with tab1, secao("Faturas do Mês"):
+            show_faturas_mes_tab(db, leitura)
+
+    if tab2.open:
+        with tab2, secao("Simular Período"):
+            show_simulacao_tab(leitura)
+
+    if tab3.open:
+        with tab3, secao("Valores das Diárias"):
+            show_valores_diarias_tab(db)
+
+
+def show_faturas_mes_tab(db, leitura):
+    st.subheader("Faturas Mensais")
+    st.caption("Cobrança por peça e por dia em obra: do dia do envio (inclusive) ao dia do retorno (exclusive).")
+
+    competencias = competencias_recentes(24)
+    rotulos = {f"{mes:02d}/{ano}": (ano, mes) for ano, mes in competencias}
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        rotulo = st.selectbox("Competência:", list(rotulos.keys()))
+    ano, mes = rotulos[rotulo]
+    competencia = f"{ano:04d}-{mes:02d}"
+    with col2:
+        st.write("")
+        if st.button("⚙️ Gerar faturas do mês", help="Calcula todas as obras de uma vez e substitui as faturas já geradas"):
+            faturas = gerar_faturas_mensais(db, ano, mes)
+            st.success(f"✅ {len(faturas)} fatura(s) gerada(s) para {rotulo}")
+
+    faturas = leitura.get_faturas(competencia)
+    if not faturas:
+        st.info("Nenhuma fatura gerada para esta competência.")
+        return
+
+    df = registrar_df(pd.DataFrame(faturas), "faturas")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Faturas", len(df))
+    with col2:
+        st.metric("Equipamento-dias", f"{int(df['equipamento_dias'].sum()):,}".replace(",", "."))
+    with col3:
+        st.metric("Total (R$)", f"{df['valor_total'].sum():,.2f}")
+
+    st.dataframe(df[['obra_nome', 'cliente_nome', 'equipamento_dias', 'valor_total', 'gerada_em']],
+                 hide_index=True, use_container_width=True,
+                 column_config={
+                     "obra_nome": "Obra",
+                     "cliente_nome": "Cliente",
+                     "equipamento_dias": "Equipamento-dias",
+                     "valor_total": st.column_config.NumberColumn("Total (R$)", format="%.2f"),
+                     "gerada_em": "Gerada em",
+                 })
+
+    # Detalhe de uma fatura
+    opcoes = {f"{f['obra_nome']} - {f['cliente_nome'] or 'Cliente N/A'}": f for f in faturas}
+    escolha = st.selectbox("Ver itens da fatura:", list(opcoes.keys()))
+    fatura = opcoes[escolha]
+    itens = leitura.get_itens_fatura(fatura['id'])
+    df_itens = registrar_df(pd.DataFrame(itens), "itens_fatura")
+    st.dataframe(df_itens[['equipamento_descricao', 'equipamento_dias', 'saldo_final', 'valor_diaria', 'valor']],
+                 hide_index=True, use_container_width=True,
+                 column_config={
+                     "equipamento_descricao": "Equipamento",
+                     "equipamento_dias": "Equipamento-dias",
+                     "saldo_final": "Em obra no fim do mês",
+                     "valor_diaria": st.column_config.NumberColumn("Diária (R$)", format="%.2f"),
+                     "valor": st.column_config.NumberColumn("Valor (R$)", format="%.2f"),
+                 })
+
+    st.download_button(
+        label="📥 Baixar Fatura CSV",
+        data=df_itens.to_csv(index=False),
+        file_name=f"fatura_{competencia}_{fatura['obra_id']}.csv",
+        mime="text/csv"
+    )
+
+
+def show_simulacao_tab(db):
+    st.subheader("Simular Período")
+    st.caption("Equipamento-dias e valores de qualquer período, sem gravar faturas.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        data_inicio = st.date_input("Data Início:", value=date.today().replace(day=1),
+                                    format="DD/MM/YYYY", key="sim_inicio")
+    with col2:
+        data_fim = st.date_input("Data Fim:", value=date.today(), format="DD/MM/YYYY", key="sim_fim")
+
+    if data_fim < data_inicio:
+        st.error("❌ A data fim deve ser posterior à data início.")
+        return
+
+    itens = calcular_locacao(db, data_inicio, data_fim)
+    if not itens:
+        st.info("Nenhum equipamento em obra no período.")
+        return
+
+    obras = {o['id']: o['nome'] for o in db.get_obras(incluir_excluidas=True)}
+    df = registrar_df(pd.DataFrame(itens), "locacao")
+    df.insert(0, 'obra_nome', df['obra_id'].map(obras))
+
+    resumo = df.groupby('obra_nome', as_index=False)[['equipamento_dias', 'valor']].sum()
+    st.dataframe(resumo, hide_index=True, use_container_width=True,
+                 column_config={
+                     "obra_nome": "Obra",
+                     "equipamento_dias": "Equipamento-dias",
+                     "valor": st.column_config.NumberColumn("Valor (R$)", format="%.2f"),
+                 })
+    with st.expander("Detalhe por equipamento"):
+        st.dataframe(df.drop(columns=['obra_id', 'equipamento_id']), hide_index=True, use_container_width=True)
+
+
+def show_valores_diarias_tab(db):
+    st.subheader("Valores das Diárias")
+
+    equipamentos = db.get_equipamentos()
+    if not equipamentos:
+        st.info("Nenhum equipamento cadastrado ainda.")
+        return
+
+    df = registrar_df(pd.DataFrame(equipamentos)[['id', 'descricao', 'codigo', 'valor_diaria']], "diarias")
+    editado = st.data_editor(
+        df,
+        hide_index=True,
+        use_container_width=True,
+        disabled=['id', 'descricao', 'codigo'],
+        column_config={
+            "id": None,
+            "descricao": "Descrição",
+            "codigo": "Código",
+            "valor_diaria": st.column_config.NumberColumn("Diária (R$)", min_value=0.0, format="%.2f"),
+        },
+        key="editor_diarias",
+    )
+
+    if st.button("💾 Salvar valores"):
+        alterados = editado[editado['valor_diaria'] != df['valor_diaria']]
+        for _, linha in alterados.iterrows():
+            db.update_valor_diaria(int(linha['id']), float(linha['valor_diaria'] or 0))
+        st.success(f"✅ {len(alterados)} valor(es) atualizado(s)!")
+        st.rerun()
@@ -1,386 +1,545 @@
-import streamlit as st
 import pandas as pd
-from datetime import datetime
+import streamlit as st
+from profiler import secao, registrar_df
+from disk_cache import cache_persistente
+from database import TIPOS_MOVIMENTACAO, TIPOS_MANUTENCAO, DEPOSITO_PRINCIPAL
+from modules.seletor_equipamentos import seletor_equipamento, carrinho_equipamentos
+from datetime import datetime, date, timedelta
+
+# Tabelas das quais dependem os saldos de estoque
+TABELAS_SALDO = ("equipamentos", "movimentacoes", "pecas")
 
 def show_movimentacao_page(db, contexto=None):
     st.title("📦 Movimentação de Equipamentos")
     
-    # Abas
-    tab1, tab2, tab3 = st.tabs(["📋 Histórico", "➕ Nova Movimentação", "📦 Movimentação em Lote"])
+    # Abas (somente a aba selecionada é executada a cada rerun)
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📋 Histórico", "➕ Nova Movimentação", "📦 Movimentação em Lote",
+                                            "🏷️ Leitura de Peças", "🧾 Romaneios"],
+                                           key="movimentacao_aba", on_change="rerun")
     
-    with tab1:
-        st.subheader("Histórico de Movimentações")
-        
-        movimentacoes = db.get_movimentacoes()
+    if tab1.open:
+        with tab1, secao("Histórico"):
+            show_historico_tab(db)
+    
+    if tab2.open:
+        with tab2, secao("Nova Movimentação"):
+            show_nova_movimentacao_tab(db)
+    
+    if tab3.open:
+        with tab3, secao("Movimentação em Lote"):
+            show_movimentacao_lote_tab(db)
+    
+    if tab4.open:
+        with tab4, secao("Leitura de Peças"):
+            show_leitura_pecas_tab(db)
+    
+    if tab5.open:
+        with tab5, secao("Romaneios"):
+            show_romaneios_tab(db)
+
+
+def show_historico_tab(db):
+    st.subheader("Histórico de Movimentações")
+    
+    # Filtros (o período vai para a consulta: o banco lê só as movimentações dele pelo índice de data)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        tipo_filter = st.selectbox("Tipo:", ["Todos"] + TIPOS_MOVIMENTACAO)
+    with col2:
+        data_inicio = st.date_input("Data Início:", format="DD/MM/YYYY")
+    with col3:
+        data_fim = st.date_input("Data Fim:", format="DD/MM/YYYY")
+    
+    df = registrar_df(db.get_movimentacoes_df(data_inicio, data_fim), "movimentacoes")
+    
+    if tipo_filter != "Todos":
+        df = df[df['tipo'] == tipo_filter]
+    
+    if not df.empty:
+        # Mostrar movimentações
+        df_sorted = df.sort_values('data_movimentacao', ascending=False)
         
-        if movimentacoes:
-            df = pd.DataFrame(movimentacoes)
-            df['data_movimentacao'] = pd.to_datetime(df['data_movimentacao'])
-            
-            # Filtros
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                tipo_filter = st.selectbox("Tipo:", ["Todos", "envio", "retorno", "manutencao", "retorno_manutencao", "perda", "retorno_perda"])
-            with col2:
-                data_inicio = st.date_input("Data Início:", format="DD/MM/YYYY")
-            with col3:
-                data_fim = st.date_input("Data Fim:", format="DD/MM/YYYY")
+        for idx, mov in df_sorted.iterrows():
+            tipo_emoji = {
+                "envio": "📤",
+                "retorno": "📥", 
+                "manutencao": "🔧",
+                "retorno_manutencao": "🔧✅",
+                "perda": "❌",
+                "retorno_perda": "🔄",
+                "transferencia": "🔁"
+            }.get(mov['tipo'], "📦")
             
-            # Aplicar filtros
-            if tipo_filter != "Todos":
-                df = df[df['tipo'] == tipo_filter]
+            data_formatada = mov['data_movimentacao'].strftime("%d/%m/%Y")
             
-            if data_inicio:
-                df = df[df['data_movimentacao'].dt.date >= data_inicio]
-            
-            if data_fim:
-                df = df[df['data_movimentacao'].dt.date <= data_fim]
-            
-            # Mostrar movimentações
-            df_sorted = df.sort_values('data_movimentacao', ascending=False)
-            
-            for idx, mov in df_sorted.iterrows():
-                tipo_emoji = {
-                    "envio": "📤",
-                    "retorno": "📥", 
-                    "manutencao": "🔧",
-                    "retorno_manutencao": "🔧✅",
-                    "perda": "❌",
-                    "retorno_perda": "🔄"
-                }.get(mov['tipo'], "📦")
+            with st.expander(f"{tipo_emoji} {mov['tipo'].title()} - {mov['equipamento_descricao']} - {data_formatada}"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write(f"**Equipamento:** {mov['equipamento_descricao']}")
+                    st.write(f"**Obra:** {texto_ou_na(mov['obra_nome'])}")
+                    if mov['tipo'] == "transferencia":
+                        st.write(f"**Depósitos:** {texto_ou_na(mov['deposito_nome'])} → "
+                                 f"{texto_ou_na(mov['deposito_destino_nome'])}")
+                    else:
+                        st.write(f"**Depósito:** {texto_ou_na(mov['deposito_nome'])}")
+                    st.write(f"**Quantidade:** {mov['quantidade']}")
                 
-                data_formatada = mov['data_movimentacao'].strftime("%d/%m/%Y")
+                with col2:
+                    st.write(f"**Tipo:** {mov['tipo'].title()}")
+                    st.write(f"**Responsável:** {texto_ou_na(mov['responsavel'])}")
+                    st.write(f"**Data:** {data_formatada}")
                 
-                with st.expander(f"{tipo_emoji} {mov['tipo'].title()} - {mov['equipamento_descricao']} - {data_formatada}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write(f"**Equipamento:** {mov['equipamento_descricao']}")
-                        st.write(f"**Obra:** {mov['obra_nome'] or 'N/A'}")
-                        st.write(f"**Quantidade:** {mov['quantidade']}")
-                    
-                    with col2:
-                        st.write(f"**Tipo:** {mov['tipo'].title()}")
-                        st.write(f"**Responsável:** {mov['responsavel'] or 'N/A'}")
-                        st.write(f"**Data:** {data_formatada}")
-                    
-                    if mov['observacoes']:
-                        st.write(f"**Observações:** {mov['observacoes']}")
+                if not pd.isna(mov['observacoes']) and mov['observacoes']:
+                    st.write(f"**Observações:** {mov['observacoes']}")
+    else:
+        st.info("Nenhuma movimentação registrada no período.")
+
+
+def texto_ou_na(valor):
+    """Texto de uma coluna do DataFrame; vazios (None ou NaN das colunas categóricas) viram 'N/A'"""
+    return 'N/A' if pd.isna(valor) or not valor else valor
+
+
+def show_nova_movimentacao_tab(db):
+    st.subheader("Registrar Nova Movimentação")
+    
+    if not db.get_total_equipamentos():
+        st.warning("⚠️ É necessário cadastrar equipamentos antes de registrar movimentações.")
+    else:
+        formulario_movimentacao(db)
+        st.caption("* Campos obrigatórios")
+
+
+@st.fragment
+def formulario_movimentacao(db):
+    """Formulário isolado: alterar um campo reexecuta apenas este fragmento, não a página inteira"""
+    # Tipo de movimentação
+    tipo = st.selectbox("Tipo de Movimentação *", TIPOS_MOVIMENTACAO)
+    
+    # Obra (para retornos, precisa ser selecionada antes dos equipamentos)
+    obra_id = selecionar_obra(db, tipo)
+    deposito_id, deposito_destino_id = selecionar_depositos(db, tipo, obra_id)
+    if deposito_id is None:
+        return
+    
+    # Equipamentos elegíveis e máximos vêm de um único snapshot de saldos por (tipo, obra, depósito, versão dos dados)
+    saldos = saldos_movimentacao(db, tipo, obra_id, deposito_id)
+    
+    if not saldos['equipamentos']:
+        if tipo in ("retorno", "perda") and obra_id:
+            st.warning(f"⚠️ Nenhum equipamento foi enviado para esta obra.")
         else:
-            st.info("Nenhuma movimentação registrada ainda.")
+            st.warning(f"⚠️ Nenhum equipamento disponível para {tipo.replace('_', ' ')}.")
+        return
+    
+    # Busca paginada: apenas a página atual de resultados vai para o navegador
+    equip = seletor_equipamento(db, saldos['equipamentos'], key="mov_equip")
+    if equip is None:
+        return
     
-    with tab2:
-        st.subheader("Registrar Nova Movimentação")
+    # Quantidade limitada ao saldo do equipamento selecionado (sem nova consulta ao banco)
+    quantidade = st.number_input(f"Quantidade * (Máximo: {equip['max_qtd']})", 
+                                 min_value=1, max_value=equip['max_qtd'], value=1)
+    
+    with st.form("movimentacao_form"):
+        # Campo de data com data atual preenchida
+        data_movimentacao = st.date_input("Data da Movimentação *", 
+                                         value=datetime.now().date(),
+                                         format="DD/MM/YYYY",
+                                         help="Data em que a movimentação foi realizada")
         
-        equipamentos = db.get_equipamentos()
-        obras = db.get_obras()
+        responsavel = st.text_input("Responsável", placeholder="Nome do responsável pela movimentação")
+        observacoes = st.text_area("Observações", placeholder="Informações adicionais...")
         
-        if not equipamentos:
-            st.warning("⚠️ É necessário cadastrar equipamentos antes de registrar movimentações.")
-        else:
-            # Tipo de movimentação (fora do form para permitir atualizações dinâmicas)
-            tipo = st.selectbox("Tipo de Movimentação *", 
-                              ["envio", "retorno", "manutencao", "retorno_manutencao", "perda", "retorno_perda"])
-            
-            # Obra (para retornos, precisa ser selecionada antes dos equipamentos)
-            obra_id = None
-            if tipo in ["envio", "retorno"]:
-                if obras:
-                    obra_options = {f"{o['nome']} - {o['cliente_nome'] or 'Cliente N/A'}": o['id'] for o in obras}
-                    obra_key = st.selectbox("Obra *", options=list(obra_options.keys()))
-                    obra_id = obra_options[obra_key] if obra_key else None
-                else:
-                    st.warning("⚠️ É necessário cadastrar obras para registrar envios/retornos.")
-            elif tipo in ["manutencao", "retorno_manutencao", "perda", "retorno_perda"]:
-                st.info("ℹ️ Movimentações de manutenção e perda não precisam de obra específica.")
-
-            with st.form("movimentacao_form"):
-                # Equipamento (filtrado por tipo e obra se necessário)
-                equip_options = {}
-                equipamentos_disponiveis = []
-                
-                for e in equipamentos:
-                    disponivel = db.get_quantidade_disponivel(e['id'])
-                    em_manutencao = db.get_quantidade_em_manutencao(e['id'])
-                    
-                    # Filtrar equipamentos baseado no tipo de movimentação
-                    incluir = False
-                    if tipo in ["envio", "manutencao"] and disponivel > 0:
-                        incluir = True
-                        label = f"{e['descricao']} (Disponível: {disponivel})"
-                    elif tipo == "retorno_manutencao" and em_manutencao > 0:
-                        incluir = True
-                        label = f"{e['descricao']} (Em Manutenção: {em_manutencao})"
-                    elif tipo == "perda" and e['quantidade'] > 0:
-                        incluir = True
-                        label = f"{e['descricao']} (Total: {e['quantidade']})"
-                    elif tipo == "retorno_perda":
-                        # Para retorno de perda, calcular quantas foram perdidas
-                        qtd_perdida = db.get_quantidade_perdida(e['id'])
-                        if qtd_perdida > 0:
-                            incluir = True
-                            label = f"{e['descricao']} (Perdidas: {qtd_perdida})"
-                    elif tipo == "retorno" and obra_id:
-                        # Para retorno, só mostrar equipamentos que foram enviados para esta obra
-                        qtd_enviada = db.get_quantidade_enviada_obra(e['id'], obra_id)
-                        if qtd_enviada > 0:
-                            incluir = True
-                            label = f"{e['descricao']} (Enviado: {qtd_enviada})"
-                    
-                    if incluir:
-                        equip_options[label] = e['id']
-                        equipamentos_disponiveis.append(e)
-                
-                if not equip_options:
-                    if tipo == "retorno" and obra_id:
-                        st.warning(f"⚠️ Nenhum equipamento foi enviado para esta obra.")
-                    else:
-                        st.warning(f"⚠️ Nenhum equipamento disponível para {tipo.replace('_', ' ')}.")
-                    equipamento_id = None
-                    equip_key = None
-                else:
-                    equip_key = st.selectbox("Equipamento *", options=list(equip_options.keys()))
-                    equipamento_id = equip_options[equip_key] if equip_key else None
+        # Envio para manutenção abre uma ordem; o retorno fecha as ordens abertas com o custo informado
+        tipo_manutencao, custo = None, None
+        if tipo == "manutencao":
+            tipo_manutencao = st.selectbox("Tipo de Manutenção", TIPOS_MANUTENCAO)
+        elif tipo == "retorno_manutencao":
+            custo = st.number_input("Custo do reparo (R$)", min_value=0.0, step=10.0, format="%.2f")
+        
+        if st.form_submit_button("📦 Registrar Movimentação"):
+            if tipo in ["envio", "retorno"] and not obra_id:
+                st.error("Obra é obrigatória para envios e retornos!")
+            else:
+                valido, mensagem = validar_com_snapshot(db, saldos, tipo, equip, obra_id, quantidade,
+                                                        deposito_id, deposito_destino_id)
                 
-                # Quantidade com validação
-                if equipamento_id:
-                    if tipo == "envio":
-                        max_qtd = db.get_quantidade_disponivel(equipamento_id)
-                        if max_qtd <= 0:
-                            st.error("⚠️ Nenhuma unidade disponível para envio deste equipamento!")
-                            quantidade = 0
-                        else:
-                            quantidade = st.number_input(f"Quantidade * (Máximo disponível: {max_qtd})", 
-                                                       min_value=1, max_value=max_qtd, value=1)
-                    elif tipo == "retorno" and obra_id:
-                        max_qtd = db.get_quantidade_enviada_obra(equipamento_id, obra_id)
-                        if max_qtd <= 0:
-                            st.error("⚠️ Nenhuma unidade enviada deste equipamento para esta obra!")
-                            quantidade = 0
-                        else:
-                            quantidade = st.number_input(f"Quantidade * (Máximo enviado: {max_qtd})", 
-                                                       min_value=1, max_value=max_qtd, value=1)
-                    elif tipo == "manutencao":
-                        max_qtd = db.get_quantidade_disponivel(equipamento_id)
-                        if max_qtd <= 0:
-                            st.error("⚠️ Nenhuma unidade disponível para enviar à manutenção!")
-                            quantidade = 0
-                        else:
-                            quantidade = st.number_input(f"Quantidade * (Máximo disponível: {max_qtd})", 
-                                                       min_value=1, max_value=max_qtd, value=1)
-                    elif tipo == "retorno_manutencao":
-                        max_qtd = db.get_quantidade_em_manutencao(equipamento_id)
-                        if max_qtd <= 0:
-                            st.error("⚠️ Nenhuma unidade em manutenção para retornar!")
-                            quantidade = 0
-                        else:
-                            quantidade = st.number_input(f"Quantidade * (Máximo em manutenção: {max_qtd})", 
-                                                       min_value=1, max_value=max_qtd, value=1)
-                    elif tipo == "retorno_perda":
-                        max_qtd = db.get_quantidade_perdida(equipamento_id)
-                        if max_qtd <= 0:
-                            st.error("⚠️ Nenhuma unidade perdida para retornar!")
-                            quantidade = 0
-                        else:
-                            quantidade = st.number_input(f"Quantidade * (Máximo perdido: {max_qtd})", 
-                                                       min_value=1, max_value=max_qtd, value=1)
-                    else:
-                        equip_selecionado = next(e for e in equipamentos if e['id'] == equipamento_id)
-                        quantidade = st.number_input("Quantidade *", min_value=1, 
-                                                   max_value=equip_selecionado['quantidade'], value=1)
+                if not valido:
+                    st.error(f"❌ {mensagem}")
                 else:
-                    quantidade = st.number_input("Quantidade *", min_value=1, value=1)
-                
-                # Campo de data com data atual preenchida
-                data_movimentacao = st.date_input("Data da Movimentação *", 
-                                                 value=datetime.now().date(),
-                                                 format="DD/MM/YYYY",
-                                                 help="Data em que a movimentação foi realizada")
-                
-                responsavel = st.text_input("Responsável", placeholder="Nome do responsável pela movimentação")
-                observacoes = st.text_area("Observações", placeholder="Informações adicionais...")
-                
-                if st.form_submit_button("📦 Registrar Movimentação"):
-                    if equipamento_id and quantidade > 0:
-                        if tipo in ["envio", "retorno"] and not obra_id:
-                            st.error("Obra é obrigatória para envios e retornos!")
-                        else:
-                            # Validar movimentação antes de registrar
-                            valido, mensagem = db.validar_movimentacao(tipo, equipamento_id, obra_id, quantidade)
-                            
-                            if not valido:
-                                st.error(f"❌ {mensagem}")
-                            else:
-                                db.add_movimentacao(tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, data_movimentacao)
-                                st.success("✅ Movimentação registrada com sucesso!")
-                                st.rerun()
-                    else:
-                        st.error("Selecione um equipamento e informe a quantidade!")
-            
-            st.caption("* Campos obrigatórios")
+                    db.add_movimentacao(tipo, equip['id'], obra_id, quantidade, responsavel, observacoes, data_movimentacao,
+                                        tipo_manutencao=tipo_manutencao, custo=custo,
+                                        deposito_id=deposito_id, deposito_destino_id=deposito_destino_id)
+                    st.success("✅ Movimentação registrada com sucesso!")
+                    st.rerun()
+
+
+def selecionar_obra(db, tipo, key=None):
+    """Obra da movimentação: obrigatória para envio/retorno e opcional para perda (perda ocorrida na obra)"""
+    if tipo not in ["envio", "retorno", "perda"]:
+        st.info("ℹ️ Movimentações de manutenção, recuperação de perda e transferência não precisam de obra específica.")
+        return None
+    obras = db.get_obras()
+    if not obras:
+        if tipo != "perda":
+            st.warning("⚠️ É necessário cadastrar obras para registrar envios/retornos.")
+        return None
+    obra_options = {f"{o['nome']} - {o['cliente_nome'] or 'Cliente N/A'}": o['id'] for o in obras}
+    if tipo == "perda":
+        obra_options = {"Sem obra (estoque)": None, **obra_options}
+        obra_key = st.selectbox("Obra onde ocorreu a perda", options=list(obra_options.keys()), key=key,
+                                help="Perda em obra baixa o saldo da obra e entra nas taxas de perda por obra e cliente")
+    else:
+        obra_key = st.selectbox("Obra *", options=list(obra_options.keys()), key=key)
+    return obra_options[obra_key] if obra_key else None
+
+
+def selecionar_depositos(db, tipo, obra_id, key=""):
+    """Depósito de origem (saídas do estoque) ou de destino (retornos) e, na transferência, o destino.
     
-    with tab3:
-        st.subheader("📦 Movimentação em Lote")
-        st.info("💡 Selecione múltiplos equipamentos para movimentar de uma só vez!")
-        
-        equipamentos = db.get_equipamentos()
-        obras = db.get_obras()
+    Com um único depósito não há o que escolher; retorna (None, None) se a transferência não é possível.
+    """
+    opcoes = {d['nome']: d['id'] for d in db.get_depositos()}
+    if tipo == "transferencia":
+        if len(opcoes) < 2:
+            st.warning("⚠️ Cadastre ao menos dois depósitos para registrar transferências.")
+            return None, None
+        origem = st.selectbox("Depósito de origem *", list(opcoes), key=f"{key}deposito_origem")
+        destino = st.selectbox("Depósito de destino *", [nome for nome in opcoes if nome != origem],
+                               key=f"{key}deposito_destino")
+        return opcoes[origem], opcoes[destino]
+    # Perda em obra não passa pelo estoque (baixa da obra e perda no mesmo depósito)
+    if len(opcoes) < 2 or (tipo == "perda" and obra_id):
+        return DEPOSITO_PRINCIPAL, None
+    rotulo = "Depósito de destino *" if tipo.startswith("retorno") else "Depósito de origem *"
+    return opcoes[st.selectbox(rotulo, list(opcoes), key=f"{key}deposito")], None
+
+
+@cache_persistente(*TABELAS_SALDO)
+def saldos_movimentacao(db, tipo, obra_id, deposito_id=DEPOSITO_PRINCIPAL):
+    """Equipamentos elegíveis para o tipo/obra/depósito, com o máximo movimentável de cada um"""
+    versoes = db.get_versoes_dados(TABELAS_SALDO)
+    snapshot = db.get_estoque_snapshot()
+    enviados_obra = {}
+    if tipo in ("retorno", "perda") and obra_id:
+        enviados_obra = {e['id']: e['quantidade_enviada'] for e in db.get_equipamentos_enviados_obra(obra_id)}
+    # Saídas do estoque são limitadas ao que está fisicamente no depósito de origem
+    estoque_deposito = db.get_estoque_deposito(deposito_id)
+    # Peças com serial no local de origem só saem pela leitura de seriais
+    etiquetadas = db.get_pecas_etiquetadas(tipo, obra_id, deposito_id)
+    
+    equipamentos = []
+    for saldo in snapshot.values():
+        # Filtrar equipamentos baseado no tipo de movimentação
+        if tipo in ["envio", "manutencao"]:
+            max_qtd, rotulo = estoque_deposito.get(saldo['id'], 0), "Disponível"
+        elif tipo == "transferencia":
+            max_qtd, rotulo = estoque_deposito.get(saldo['id'], 0), "No depósito"
+        elif tipo == "retorno_manutencao":
+            max_qtd, rotulo = saldo['em_manutencao'], "Em Manutenção"
+        elif tipo == "perda" and obra_id:
+            max_qtd, rotulo = enviados_obra.get(saldo['id'], 0), "Na obra"
+        elif tipo == "perda":
+            max_qtd, rotulo = estoque_deposito.get(saldo['id'], 0), "No depósito"
+        elif tipo == "retorno_perda":
+            max_qtd, rotulo = saldo['perdido'], "Perdidas"
+        elif tipo == "retorno":
+            # Para retorno, só mostrar equipamentos que foram enviados para esta obra
+            max_qtd, rotulo = enviados_obra.get(saldo['id'], 0), "Enviado"
+        else:
+            max_qtd = 0
         
-        if not equipamentos:
-            st.warning("⚠️ É necessário cadastrar equipamentos antes de registrar movimentações.")
+        max_qtd -= etiquetadas.get(saldo['id'], 0)
+        if max_qtd > 0:
+            equipamentos.append({
+                'id': saldo['id'],
+                'descricao': saldo['descricao'],
+                'label': f"{saldo['descricao']} ({rotulo}: {max_qtd})",
+                'max_qtd': max_qtd
+            })
+    
+    return {'versoes': versoes, 'equipamentos': equipamentos}
+
+
+def validar_com_snapshot(db, saldos, tipo, equip, obra_id, quantidade, deposito_id=None, deposito_destino_id=None):
+    """Valida pelo snapshot se os dados não mudaram desde que ele foi calculado; senão consulta o banco"""
+    if db.get_versoes_dados(TABELAS_SALDO) != saldos['versoes']:
+        return db.validar_movimentacao(tipo, equip['id'], obra_id, quantidade, deposito_id, deposito_destino_id)
+    if quantidade > equip['max_qtd']:
+        return False, f"Quantidade superior ao saldo. Máximo: {equip['max_qtd']}"
+    return True, "Movimentação válida"
+
+
+def show_movimentacao_lote_tab(db):
+    st.subheader("📦 Movimentação em Lote")
+    st.info("💡 Busque e adicione ao lote os equipamentos para movimentar de uma só vez!")
+    
+    if not db.get_total_equipamentos():
+        st.warning("⚠️ É necessário cadastrar equipamentos antes de registrar movimentações.")
+    else:
+        formulario_movimentacao_lote(db)
+        st.caption("* Campos obrigatórios")
+
+
+@st.fragment
+def formulario_movimentacao_lote(db):
+    """Lote montado em um carrinho: só as linhas escolhidas geram widgets, não o catálogo inteiro"""
+    if "ultimo_romaneio" in st.session_state:
+        # Mostrado uma vez: some na próxima interação com o formulário
+        romaneio_id, sucessos, erros = st.session_state.pop("ultimo_romaneio")
+        st.success(f"✅ Romaneio nº {romaneio_id}: {sucessos} movimentação(ões) registrada(s) com sucesso!")
+        for erro in erros:
+            st.warning(f"⚠️ Não registrado - {erro}")
+        baixar_nota_entrega(db.somente_leitura(), romaneio_id, key="lote_nota")
+    
+    # Tipo de movimentação
+    tipo = st.selectbox("Tipo de Movimentação *", TIPOS_MOVIMENTACAO, key="lote_tipo")
+    
+    # Obra (para retornos, precisa ser selecionada antes dos equipamentos)
+    obra_id = selecionar_obra(db, tipo, key="lote_obra")
+    deposito_id, deposito_destino_id = selecionar_depositos(db, tipo, obra_id, key="lote_")
+    if deposito_id is None:
+        return
+
+    # Equipamentos elegíveis (mesmo snapshot de saldos do formulário individual)
+    equipamentos_disponiveis = saldos_movimentacao(db, tipo, obra_id, deposito_id)['equipamentos']
+    
+    if not equipamentos_disponiveis:
+        if tipo in ("retorno", "perda") and obra_id:
+            st.warning(f"⚠️ Nenhum equipamento foi enviado para esta obra.")
         else:
-            # Tipo de movimentação
-            tipo = st.selectbox("Tipo de Movimentação *", 
-                              ["envio", "retorno", "manutencao", "retorno_manutencao", "perda", "retorno_perda"],
-                              key="lote_tipo")
-            
-            # Obra (para retornos, precisa ser selecionada antes dos equipamentos)
-            obra_id = None
-            if tipo in ["envio", "retorno"]:
-                if obras:
-                    obra_options = {f"{o['nome']} - {o['cliente_nome'] or 'Cliente N/A'}": o['id'] for o in obras}
-                    obra_key = st.selectbox("Obra *", options=list(obra_options.keys()), key="lote_obra")
-                    obra_id = obra_options[obra_key] if obra_key else None
-                else:
-                    st.warning("⚠️ É necessário cadastrar obras para registrar envios/retornos.")
-            elif tipo in ["manutencao", "retorno_manutencao", "perda", "retorno_perda"]:
-                st.info("ℹ️ Movimentações de manutenção e perda não precisam de obra específica.")
+            st.warning(f"⚠️ Nenhum equipamento disponível para {tipo.replace('_', ' ')}.")
+        return
+    
+    # Trocar tipo, obra ou depósito esvazia o carrinho, pois os saldos máximos mudam
+    equipamentos_para_processar = carrinho_equipamentos(db, equipamentos_disponiveis, key="lote",
+                                                        contexto=(tipo, obra_id, deposito_id, deposito_destino_id))
 
-            # Equipamentos disponíveis para seleção múltipla
-            equipamentos_disponiveis = []
-            
-            for e in equipamentos:
-                disponivel = db.get_quantidade_disponivel(e['id'])
-                em_manutencao = db.get_quantidade_em_manutencao(e['id'])
-                
-                # Filtrar equipamentos baseado no tipo de movimentação
-                incluir = False
-                max_qtd = 0
-                if tipo in ["envio", "manutencao"] and disponivel > 0:
-                    incluir = True
-                    max_qtd = disponivel
-                    label = f"{e['descricao']} (Disponível: {disponivel})"
-                elif tipo == "retorno_manutencao" and em_manutencao > 0:
-                    incluir = True
-                    max_qtd = em_manutencao
-                    label = f"{e['descricao']} (Em Manutenção: {em_manutencao})"
-                elif tipo == "perda" and e['quantidade'] > 0:
-                    incluir = True
-                    max_qtd = e['quantidade']
-                    label = f"{e['descricao']} (Total: {e['quantidade']})"
-                elif tipo == "retorno_perda":
-                    qtd_perdida = db.get_quantidade_perdida(e['id'])
-                    if qtd_perdida > 0:
-                        incluir = True
-                        max_qtd = qtd_perdida
-                        label = f"{e['descricao']} (Perdidas: {qtd_perdida})"
-                elif tipo == "retorno" and obra_id:
-                    qtd_enviada = db.get_quantidade_enviada_obra(e['id'], obra_id)
-                    if qtd_enviada > 0:
-                        incluir = True
-                        max_qtd = qtd_enviada
-                        label = f"{e['descricao']} (Enviado: {qtd_enviada})"
-                
-                if incluir:
-                    equipamentos_disponiveis.append({
-                        'id': e['id'],
-                        'label': label,
-                        'descricao': e['descricao'],
-                        'max_qtd': max_qtd
-                    })
-            
-            if not equipamentos_disponiveis:
-                if tipo == "retorno" and obra_id:
-                    st.warning(f"⚠️ Nenhum equipamento foi enviado para esta obra.")
-                else:
-                    st.warning(f"⚠️ Nenhum equipamento disponível para {tipo.replace('_', ' ')}.")
+    with st.form("movimentacao_lote_form"):
+        # Mostrar resumo dos selecionados
+        if equipamentos_para_processar:
+            st.markdown("### Resumo da seleção:")
+            total_itens = 0
+            for equip_data in equipamentos_para_processar:
+                st.write(f"• {equip_data['descricao']}: {equip_data['quantidade']} unidades")
+                total_itens += equip_data['quantidade']
+            st.info(f"📊 Total: {len(equipamentos_para_processar)} equipamentos, {total_itens} itens")
+        
+        # Campos comuns
+        st.markdown("### Informações da movimentação:")
+        # Campo de data com data atual preenchida
+        data_movimentacao = st.date_input("Data da Movimentação *", 
+                                         value=datetime.now().date(),
+                                         format="DD/MM/YYYY",
+                                         help="Data em que a movimentação foi realizada",
+                                         key="lote_data")
+        
+        responsavel = st.text_input("Responsável", placeholder="Nome do responsável pela movimentação", key="lote_responsavel")
+        observacoes = st.text_area("Observações", placeholder="Informações adicionais...", key="lote_observacoes")
+        
+        tipo_manutencao, custo_unidade = None, 0.0
+        if tipo == "manutencao":
+            tipo_manutencao = st.selectbox("Tipo de Manutenção", TIPOS_MANUTENCAO, key="lote_tipo_manutencao")
+        elif tipo == "retorno_manutencao":
+            custo_unidade = st.number_input("Custo do reparo por unidade (R$)", min_value=0.0, step=1.0,
+                                            format="%.2f", key="lote_custo")
+        
+        if st.form_submit_button("📦 Registrar Movimentações em Lote"):
+            if not equipamentos_para_processar:
+                st.error("⚠️ Selecione pelo menos um equipamento!")
+            elif tipo in ["envio", "retorno"] and not obra_id:
+                st.error("⚠️ Obra é obrigatória para envios e retornos!")
             else:
-                st.markdown("### Selecione os equipamentos e quantidades:")
+                # Validar todas as linhas; as válidas são registradas juntas sob um romaneio
+                erros = []
+                itens = []
                 
-                # Mostrar todos os equipamentos com checkboxes e campos de quantidade
-                equipamentos_selecionados = {}
-                
-                for i, equip in enumerate(equipamentos_disponiveis):
-                    col1, col2 = st.columns([3, 1])
-                    
-                    with col1:
-                        selecionado = st.checkbox(equip['label'], key=f"lote_check_{equip['id']}")
+                for equip in equipamentos_para_processar:
+                    valido, mensagem = db.validar_movimentacao(tipo, equip['id'], obra_id, equip['quantidade'],
+                                                               deposito_id, deposito_destino_id)
                     
-                    with col2:
-                        # Sempre mostrar o campo de quantidade, mas desabilitar se não selecionado
-                        quantidade = st.number_input(
-                            f"Qtd (máx: {equip['max_qtd']})",
-                            min_value=1,
-                            max_value=equip['max_qtd'],
-                            value=1,
-                            disabled=not selecionado,
-                            key=f"lote_qtd_{equip['id']}"
-                        )
-                        
-                        if selecionado:
-                            equipamentos_selecionados[equip['id']] = {
-                                'id': equip['id'],
-                                'descricao': equip['descricao'],
-                                'quantidade': quantidade,
-                                'max_qtd': equip['max_qtd']
-                            }
-
-                with st.form("movimentacao_lote_form"):
-                    # Mostrar resumo dos selecionados
-                    if equipamentos_selecionados:
-                        st.markdown("### Resumo da seleção:")
-                        total_itens = 0
-                        for equip_data in equipamentos_selecionados.values():
-                            st.write(f"• {equip_data['descricao']}: {equip_data['quantidade']} unidades")
-                            total_itens += equip_data['quantidade']
-                        st.info(f"📊 Total: {len(equipamentos_selecionados)} equipamentos, {total_itens} itens")
+                    if not valido:
+                        erros.append(f"{equip['descricao']}: {mensagem}")
                     else:
-                        st.info("👆 Selecione os equipamentos acima")
-                    
-                    # Converter dict para lista para compatibilidade
-                    equipamentos_para_processar = list(equipamentos_selecionados.values())
-                    
-                    # Campos comuns
-                    st.markdown("### Informações da movimentação:")
-                    # Campo de data com data atual preenchida
-                    data_movimentacao = st.date_input("Data da Movimentação *", 
-                                                     value=datetime.now().date(),
-                                                     format="DD/MM/YYYY",
-                                                     help="Data em que a movimentação foi realizada",
-                                                     key="lote_data")
-                    
-                    responsavel = st.text_input("Responsável", placeholder="Nome do responsável pela movimentação", key="lote_responsavel")
-                    observacoes = st.text_area("Observações", placeholder="Informações adicionais...", key="lote_observacoes")
-                    
-                    if st.form_submit_button("📦 Registrar Movimentações em Lote"):
-                        if not equipamentos_para_processar:
-                            st.error("⚠️ Selecione pelo menos um equipamento!")
-                        elif tipo in ["envio", "retorno"] and not obra_id:
-                            st.error("⚠️ Obra é obrigatória para envios e retornos!")
-                        else:
-                            # Validar e registrar todas as movimentações
-                            erros = []
-                            sucessos = 0
-                            
-                            for equip in equipamentos_para_processar:
-                                valido, mensagem = db.validar_movimentacao(tipo, equip['id'], obra_id, equip['quantidade'])
-                                
-                                if not valido:
-                                    erros.append(f"{equip['descricao']}: {mensagem}")
-                                else:
-                                    db.add_movimentacao(tipo, equip['id'], obra_id, equip['quantidade'], responsavel, observacoes, data_movimentacao)
-                                    sucessos += 1
-                            
-                            # Mostrar resultados
-                            if sucessos > 0:
-                                st.success(f"✅ {sucessos} movimentação(ões) registrada(s) com sucesso!")
-                            
-                            if erros:
-                                st.error("❌ Erros encontrados:")
-                                for erro in erros:
-                                    st.write(f"- {erro}")
-                            
-                            if sucessos > 0:
-                                st.rerun()
+                        itens.append((equip['id'], equip['quantidade']))
+                
+                if erros:
+                    st.error("❌ Erros encontrados:")
+                    for erro in erros:
+                        st.write(f"- {erro}")
                 
-                st.caption("* Campos obrigatórios")
+                if itens:
+                    romaneio_id = db.add_romaneio(tipo, itens, obra_id, responsavel, observacoes, data_movimentacao,
+                                                  tipo_manutencao=tipo_manutencao, custo_unidade=custo_unidade,
+                                                  deposito_id=deposito_id, deposito_destino_id=deposito_destino_id)
+                    # Exibido (com a nota de entrega) depois do rerun
+                    st.session_state["ultimo_romaneio"] = (romaneio_id, len(itens), erros)
+                    st.session_state["lote_carrinho"] = {}
+                    st.rerun()
+
+
+# Problemas de leitura exibidos (o restante é apenas contado)
+ERROS_LEITURA_EXIBIDOS = 50
+
+
+def show_leitura_pecas_tab(db):
+    st.subheader("🏷️ Leitura de Peças")
+    st.info("💡 Leia com o coletor (ou cole) os seriais da remessa, um por linha. Leituras repetidas são ignoradas "
+            "e a remessa só é gravada se todas as peças estiverem no local esperado.")
+    formulario_leitura_pecas(db)
+    
+    st.markdown("---")
+    st.write("### 🔎 Consultar Peça")
+    serial = st.text_input("Serial:", key="consulta_serial")
+    if serial:
+        peca = db.get_peca(serial)
+        if peca is None:
+            st.warning("Serial não cadastrado.")
+        else:
+            st.write(f"**{peca['serial']}** — {peca['equipamento_descricao']} — estado: **{peca['estado']}**")
+            if peca['historico']:
+                st.dataframe(peca['historico'], hide_index=True, use_container_width=True,
+                             column_config={"id": None, "tipo": "Tipo", "data_movimentacao": "Data",
+                                            "obra_nome": "Obra", "deposito_nome": "Depósito",
+                                            "responsavel": "Responsável"})
+            else:
+                st.caption("Peça ainda sem movimentações por serial.")
+
+
+@st.fragment
+def formulario_leitura_pecas(db):
+    """Remessa por seriais: uma movimentação por equipamento, gravadas em uma única transação"""
+    tipo = st.selectbox("Tipo de Movimentação *", TIPOS_MOVIMENTACAO, key="leitura_tipo")
+    obra_id = selecionar_obra(db, tipo, key="leitura_obra")
+    deposito_id, deposito_destino_id = selecionar_depositos(db, tipo, obra_id, key="leitura_")
+    if deposito_id is None:
+        return
+    
+    with st.form("leitura_pecas_form"):
+        seriais = st.text_area("Seriais lidos *", height=200, placeholder="TORRE-0001\nTORRE-0002\n...")
+        data_movimentacao = st.date_input("Data da Movimentação *", value=datetime.now().date(), format="DD/MM/YYYY")
+        responsavel = st.text_input("Responsável", placeholder="Nome do responsável pela movimentação")
+        observacoes = st.text_area("Observações", placeholder="Informações adicionais...")
+        
+        tipo_manutencao, custo = None, None
+        if tipo == "manutencao":
+            tipo_manutencao = st.selectbox("Tipo de Manutenção", TIPOS_MANUTENCAO)
+        elif tipo == "retorno_manutencao":
+            custo = st.number_input("Custo total do reparo (R$)", min_value=0.0, step=10.0, format="%.2f")
+        
+        if st.form_submit_button("🏷️ Registrar Leitura"):
+            resultado = db.registrar_leitura_pecas(tipo, seriais, obra_id, responsavel, observacoes, data_movimentacao,
+                                                   tipo_manutencao=tipo_manutencao, custo=custo,
+                                                   deposito_id=deposito_id, deposito_destino_id=deposito_destino_id)
+            erros = resultado['erros']
+            if erros:
+                st.error(f"❌ Nenhuma movimentação gravada: {len(erros)} problema(s) na leitura.")
+                for erro in erros[:ERROS_LEITURA_EXIBIDOS]:
+                    st.write(f"- {erro}")
+                if len(erros) > ERROS_LEITURA_EXIBIDOS:
+                    st.caption(f"... e mais {len(erros) - ERROS_LEITURA_EXIBIDOS}.")
+            else:
+                mensagem = (f"✅ {resultado['pecas']} peça(s) em {len(resultado['movimentacoes'])} "
+                            f"movimentação(ões)")
+                if resultado['repetidas']:
+                    mensagem += f"; {resultado['repetidas']} leitura(s) repetida(s) ignorada(s)"
+                st.toast(mensagem)
+                st.rerun()
+
+
+# Romaneios listados na aba (os mais recentes do filtro)
+LIMITE_ROMANEIOS = 500
+
+
+def baixar_nota_entrega(db, romaneio_id, key):
+    """Botão com o PDF da nota de entrega de um romaneio (gerado na hora, sem o pool)"""
+    from romaneios import nome_arquivo, nota_do_romaneio
+    st.download_button("📄 Nota de entrega (PDF)", data=nota_do_romaneio(db, romaneio_id),
+                       file_name=nome_arquivo(romaneio_id), mime="application/pdf", key=key, on_click="ignore")
+
+
+def show_romaneio(db, romaneio):
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Tipo", romaneio['tipo'].replace('_', ' ').capitalize())
+    col2.metric("Data", datetime.strptime(romaneio['data_movimentacao'], "%Y-%m-%d").strftime("%d/%m/%Y"))
+    col3.metric("Equipamentos / peças", f"{romaneio['total_linhas']} / {romaneio['total_itens']}")
+    col4.metric("Diária total", f"R$ {romaneio['valor_diario']:,.2f}")
+    local = f"🏗️ {romaneio['obra_nome']} ({romaneio['cliente_nome'] or 'Cliente N/A'}) · " if romaneio['obra_nome'] else ""
+    destino = f" → {romaneio['deposito_destino_nome']}" if romaneio['deposito_destino_nome'] else ""
+    st.caption(f"{local}🏬 {romaneio['deposito_nome']}{destino} · 👤 {romaneio['responsavel'] or '-'}")
+    st.dataframe(db.get_itens_romaneio(romaneio['id']), hide_index=True, use_container_width=True,
+                 column_order=["codigo", "descricao", "medida", "quantidade"],
+                 column_config={"codigo": "Código", "descricao": "Descrição", "medida": "Medida",
+                                "quantidade": "Quantidade"})
+    baixar_nota_entrega(db, romaneio['id'], key=f"nota_romaneio_{romaneio['id']}")
+
+
+def show_romaneios_tab(db):
+    st.subheader("🧾 Romaneios")
+    
+    # Busca pelo número: cabeçalho (com os totais) pela chave primária e linhas pelo índice do romaneio,
+    # pelo pool somente leitura
+    numero = st.number_input("Romaneio nº", min_value=1, value=None, step=1, placeholder="Número do romaneio",
+                             key="romaneio_numero")
+    leitura = db.somente_leitura()
+    if numero:
+        romaneio = leitura.get_romaneio(int(numero))
+        if romaneio is None:
+            st.warning("⚠️ Romaneio não encontrado.")
+        else:
+            show_romaneio(leitura, romaneio)
+    
+    st.markdown("### Romaneios emitidos")
+    obras = {"Todas as obras": None,
+             **{f"{o['nome']} - {o['cliente_nome'] or 'Cliente N/A'}": o['id'] for o in leitura.get_obras()}}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        obra = st.selectbox("Obra:", list(obras.keys()), key="romaneios_obra")
+    with col2:
+        data_inicio = st.date_input("Data Início:", value=date.today() - timedelta(days=30), format="DD/MM/YYYY",
+                                    key="romaneios_inicio")
+    with col3:
+        data_fim = st.date_input("Data Fim:", value=date.today(), format="DD/MM/YYYY", key="romaneios_fim")
+    
+    romaneios = leitura.get_romaneios(obras[obra], data_inicio, data_fim, limite=LIMITE_ROMANEIOS)
+    if not romaneios:
+        st.info("Nenhum romaneio no período.")
+        return
+    
+    evento = st.dataframe(
+        romaneios,
+        hide_index=True,
+        use_container_width=True,
+        key="romaneios_grid",
+        on_select="rerun",
+        selection_mode="multi-row",
+        column_order=["id", "data_movimentacao", "tipo", "obra_nome", "cliente_nome", "deposito_nome",
+                      "responsavel", "total_linhas", "total_itens", "valor_diario"],
+        column_config={
+            "id": st.column_config.NumberColumn("Nº", format="%d"),
+            "data_movimentacao": "Data",
+            "tipo": "Tipo",
+            "obra_nome": "Obra",
+            "cliente_nome": "Cliente",
+            "deposito_nome": "Depósito",
+            "responsavel": "Responsável",
+            "total_linhas": "Equipamentos",
+            "total_itens": "Peças",
+            "valor_diario": st.column_config.NumberColumn("Diária total", format="R$ %.2f"),
+        },
+    )
+    limitado = f" (os {LIMITE_ROMANEIOS} mais recentes)" if len(romaneios) == LIMITE_ROMANEIOS else ""
+    st.caption(f"{len(romaneios)} romaneio(s){limitado}. Selecione linhas para gerar só as notas delas.")
+    
+    selecionados = [romaneios[i]['id'] for i in evento.selection.rows if i < len(romaneios)]
+    ids = selecionados or [romaneio['id'] for romaneio in romaneios]
+    if st.button(f"📄 Gerar notas de entrega ({len(ids)})", key="romaneios_gerar"):
+        from romaneios import gerar_notas, zip_notas
+        # Lotes grandes são divididos entre os processos do pool
+        with st.spinner("Gerando notas de entrega..."):
+            notas = gerar_notas(db.db_path, ids)
+        st.download_button("📥 Baixar notas (ZIP)", data=zip_notas(notas), mime="application/zip",
+                           file_name=f"notas_entrega_{data_inicio}_{data_fim}.zip", key="romaneios_zip",
+                           on_click="ignore")
@@ -1,344 +1,721 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from profiler import secao, registrar_df
+from disk_cache import cache_persistente
+from database import MEDIDAS_USO, TIPOS_MOVIMENTACAO
 from datetime import datetime, timedelta, date
+import json
+import os
+
+# Períodos maiores que isso no Relatório de Movimentações são gerados em segundo plano
+LIMITE_DIAS_NA_PAGINA = 366
+# Segundos entre consultas ao estado enquanto houver relatório em segundo plano em andamento
+INTERVALO_TAREFAS = 2
 
 def show_relatorios_page(db, contexto=None):
     st.title("📊 Relatórios e Análises")
     
-    # Abas
-    tab1, tab2, tab3, tab4 = st.tabs(["Dashboard Executivo", "Relatório de Equipamentos", 
-                                      "Relatório de Movimentações", "Perdas e Manutenções"])
+    # Consultas e exportações pelo pool somente leitura; só a manutenção preventiva grava (via db)
+    leitura = db.somente_leitura()
+    
+    show_tarefas_relatorio(leitura)
+    
+    # Abas (somente a aba selecionada é executada a cada rerun)
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Dashboard Executivo", "Relatório de Equipamentos", 
+                                                  "Relatório de Movimentações", "Perdas e Manutenções",
+                                                  "Utilização da Frota", "Projeção de Disponibilidade"],
+                                                 key="relatorios_aba", on_change="rerun")
+    
+    if tab1.open:
+        with tab1, secao("Dashboard Executivo"):
+            show_dashboard_executivo_tab(leitura, (contexto or {}).get('roteador'))
+    
+    if tab2.open:
+        with tab2, secao("Relatório de Equipamentos"):
+            show_relatorio_equipamentos_tab(leitura)
+    
+    if tab3.open:
+        with tab3, secao("Relatório de Movimentações"):
+            show_relatorio_movimentacoes_tab(leitura)
+    
+    if tab4.open:
+        with tab4, secao("Perdas e Manutenções"):
+            show_perdas_manutencoes_tab(db, leitura)
+    
+    if tab5.open:
+        with tab5, secao("Utilização da Frota"):
+            show_utilizacao_frota_tab(leitura)
+    
+    if tab6.open:
+        with tab6, secao("Projeção de Disponibilidade"):
+            show_projecao_disponibilidade_tab(leitura)
+
+
+@st.cache_resource
+def obter_fila_relatorios(db_path, _db):
+    """Fila de relatórios em segundo plano do banco (uma por processo do app)"""
+    from tarefas import FilaRelatorios
+    return FilaRelatorios(_db)
+
+
+def enfileirar_relatorio(db, relatorio, parametros, chave):
+    """Formato e botão que mandam o relatório para o pool de processos, fora do script da página"""
+    from tarefas import FORMATOS
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        formato = st.selectbox("Formato:", list(FORMATOS), key=f"{chave}_formato", label_visibility="collapsed")
+    with col2:
+        if not st.button("⏳ Gerar em segundo plano", key=f"{chave}_segundo_plano"):
+            return
+    tarefa_id, nova = obter_fila_relatorios(db.db_path, db).enfileirar(relatorio, parametros, formato)
+    tarefas = st.session_state.setdefault("tarefas_relatorio", [])
+    if tarefa_id not in tarefas:
+        tarefas.append(tarefa_id)
+    st.toast("📨 Relatório enviado para a fila" if nova else "♻️ Relatório igual já pedido: reaproveitado")
+    # Exibe o painel de acompanhamento no topo da página
+    st.rerun()
+
+
+def show_tarefas_relatorio(db):
+    """Relatórios em segundo plano pedidos nesta sessão; o painel se atualiza sozinho até todos terminarem"""
+    from tarefas import ATIVAS
+    ids = st.session_state.get("tarefas_relatorio")
+    if not ids:
+        return
+    fila = obter_fila_relatorios(db.db_path, db)
+    acompanhando = any(tarefa['estado'] in ATIVAS for tarefa in fila.get_tarefas(ids))
+    st.fragment(painel_tarefas_relatorio, run_every=INTERVALO_TAREFAS if acompanhando else None)(fila, ids, acompanhando)
+
+
+def painel_tarefas_relatorio(fila, ids, acompanhando):
+    from tarefas import ATIVAS, FORMATOS, RELATORIOS
+    tarefas = fila.get_tarefas(ids)
+    avisadas = st.session_state.setdefault("tarefas_avisadas", set())
+    for tarefa in tarefas:
+        if tarefa['estado'] not in ATIVAS and tarefa['id'] not in avisadas:
+            avisadas.add(tarefa['id'])
+            titulo = RELATORIOS[tarefa['relatorio']].titulo
+            st.toast(f"✅ {titulo} pronto para baixar" if tarefa['estado'] == "concluida" else f"❌ {titulo} falhou")
+    
+    emojis = {"pendente": "🕓", "executando": "⚙️", "concluida": "✅", "erro": "❌"}
+    with st.expander("⏳ Relatórios em segundo plano", expanded=acompanhando):
+        for tarefa in reversed(tarefas):
+            parametros = json.loads(tarefa['parametros'])
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.write(f"{emojis.get(tarefa['estado'], '⚪')} **{RELATORIOS[tarefa['relatorio']].titulo}** · "
+                         f"{parametros.get('data_inicio')} a {parametros.get('data_fim')} · {tarefa['formato'].upper()}")
+                if tarefa['estado'] == "concluida":
+                    st.caption(f"{tarefa['linhas']} linha(s) em {tarefa['concluida_em'] - tarefa['iniciada_em']:.1f} s")
+                elif tarefa['estado'] == "erro":
+                    st.caption(tarefa['erro'])
+            with col2:
+                if tarefa['estado'] == "concluida" and os.path.exists(tarefa['arquivo']):
+                    with open(tarefa['arquivo'], "rb") as arquivo:
+                        st.download_button("📥 Baixar", data=arquivo.read(), mime=FORMATOS[tarefa['formato']],
+                                           file_name=f"{tarefa['relatorio']}_{tarefa['id']}.{tarefa['formato']}",
+                                           key=f"baixar_tarefa_{tarefa['id']}")
+    
+    if acompanhando and not any(tarefa['estado'] in ATIVAS for tarefa in tarefas):
+        # Todos terminaram: um rerun da página desliga a atualização periódica
+        st.rerun()
+
+
+def show_dashboard_executivo_tab(db, roteador=None):
+    st.subheader("📈 Dashboard Executivo")
+    
+    # Período de análise
+    col1, col2 = st.columns(2)
+    with col1:
+        data_inicio = st.date_input("Data Início:", value=date.today() - timedelta(days=30))
+    with col2:
+        data_fim = st.date_input("Data Fim:", value=date.today())
+    
+    if roteador is not None and st.toggle("Consolidar todas as bases", key="dashboard_consolidado"):
+        show_dashboard_consolidado(roteador, data_inicio, data_fim)
+        return
+    
+    # KPIs principais
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        total_equipamentos = db.get_total_equipamentos()
+        st.metric("Total de Equipamentos", total_equipamentos)
+    
+    with col2:
+        total_clientes = db.get_total_clientes()
+        st.metric("Clientes Ativos", total_clientes)
+    
+    with col3:
+        obras_ativas = len([o for o in db.get_obras() if o['status'] == 'ativa'])
+        st.metric("Obras Ativas", obras_ativas)
+    
+    with col4:
+        movimentacoes_periodo = db.get_movimentacoes_por_dia(data_inicio, data_fim)
+        st.metric("Movimentações (Período)", sum(m['quantidade'] for m in movimentacoes_periodo))
     
-    with tab1:
-        st.subheader("📈 Dashboard Executivo")
+    st.markdown("---")
+    
+    # Gráficos (reaproveitados do cache em disco enquanto os dados não mudam)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("Status dos Equipamentos")
+        fig = grafico_status_equipamentos(db)
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("Sem dados para exibir")
+    
+    with col2:
+        st.subheader("Movimentações por Tipo")
+        if movimentacoes_periodo:
+            st.plotly_chart(grafico_movimentacoes_por_tipo(db, data_inicio, data_fim), use_container_width=True)
+        else:
+            st.info("Sem movimentações no período")
+    
+    # Timeline de movimentações
+    st.subheader("Timeline de Movimentações")
+    if movimentacoes_periodo:
+        st.plotly_chart(grafico_timeline_movimentacoes(db, data_inicio, data_fim), use_container_width=True)
+    else:
+        st.info("Sem dados para timeline")
+
+
+def show_dashboard_consolidado(roteador, data_inicio, data_fim):
+    """KPIs e frota somados em todos os bancos (consultados em paralelo)"""
+    kpis = roteador.get_kpis(data_inicio, data_fim)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total de Equipamentos", kpis['total_equipamentos'])
+    col2.metric("Clientes Ativos", kpis['total_clientes'])
+    col3.metric("Obras Ativas", kpis['obras_ativas'])
+    col4.metric("Movimentações (Período)", kpis['movimentacoes'])
+    
+    st.subheader("Frota em Todas as Bases")
+    frota = roteador.get_frota()
+    if frota:
+        st.dataframe(pd.DataFrame(frota), hide_index=True, use_container_width=True,
+                     column_config={
+                         "descricao": "Equipamento",
+                         "quantidade": "Total",
+                         "enviado": "Enviado",
+                         "em_manutencao": "Em Manutenção",
+                         "perdido": "Perdido",
+                         "disponivel": "Disponível",
+                         "shards": "Bases",
+                     })
+    else:
+        st.info("Nenhum equipamento cadastrado ainda.")
+
+
+def show_relatorio_equipamentos_tab(db):
+    st.subheader("📦 Relatório de Equipamentos")
+    
+    df_equipamentos = registrar_df(db.get_equipamentos_df(), "equipamentos")
+    
+    if not df_equipamentos.empty:
         
-        # Período de análise
-        col1, col2 = st.columns(2)
+        # Filtros
+        col1, col2, col3 = st.columns(3)
         with col1:
-            data_inicio = st.date_input("Data Início:", value=date.today() - timedelta(days=30))
+            status_filter = st.multiselect("Status:", 
+                                         ["disponivel", "enviado", "manutencao", "perdido"],
+                                         default=["disponivel", "enviado", "manutencao", "perdido"])
         with col2:
-            data_fim = st.date_input("Data Fim:", value=date.today())
+            search_equip = st.text_input("Buscar equipamento:")
+        with col3:
+            ordenar_por = st.selectbox("Ordenar por:", ["Descrição", "Quantidade", "Status"])
         
-        # KPIs principais
-        col1, col2, col3, col4 = st.columns(4)
+        # Aplicar filtros
+        df_filtered = df_equipamentos[df_equipamentos['status'].isin(status_filter)]
         
-        with col1:
-            total_equipamentos = db.get_total_equipamentos()
-            st.metric("Total de Equipamentos", total_equipamentos)
+        if search_equip:
+            df_filtered = df_filtered[df_filtered['descricao'].str.contains(search_equip, case=False, na=False)]
         
-        with col2:
-            total_clientes = db.get_total_clientes()
-            st.metric("Clientes Ativos", total_clientes)
+        # Ordenação
+        if ordenar_por == "Descrição":
+            df_filtered = df_filtered.sort_values('descricao')
+        elif ordenar_por == "Quantidade":
+            df_filtered = df_filtered.sort_values('quantidade', ascending=False)
+        else:
+            df_filtered = df_filtered.sort_values('status')
         
+        # Estatísticas
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Tipos de Equipamentos", len(df_filtered))
+        with col2:
+            st.metric("Quantidade Total", df_filtered['quantidade'].sum())
         with col3:
-            obras_ativas = len([o for o in db.get_obras() if o['status'] == 'ativa'])
-            st.metric("Obras Ativas", obras_ativas)
+            valor_total = len(df_filtered) * 1000  # Estimativa
+            st.metric("Valor Estimado (R$)", f"{valor_total:,.2f}")
         
-        with col4:
-            movimentacoes = db.get_movimentacoes()
-            movimentacoes_periodo = [m for m in movimentacoes 
-                                   if data_inicio <= pd.to_datetime(m['data_movimentacao']).date() <= data_fim]
-            st.metric("Movimentações (Período)", len(movimentacoes_periodo))
+        # Tabela detalhada
+        st.subheader("Equipamentos Detalhados")
         
-        st.markdown("---")
+        # Preparar dados para exibição
+        df_display = df_filtered.copy()
+        df_display['Status'] = df_display['status'].map({
+            'disponivel': '🟢 Disponível',
+            'enviado': '🔵 Enviado',
+            'manutencao': '🟡 Manutenção',
+            'perdido': '🔴 Perdido'
+        })
         
-        # Gráficos
-        col1, col2 = st.columns(2)
+        # Seleção de colunas para exibir
+        colunas_exibir = st.multiselect("Colunas:", 
+                                      ['descricao', 'codigo', 'medida', 'quantidade', 'Status', 'observacoes'],
+                                      default=['descricao', 'quantidade', 'Status'])
         
-        with col1:
-            st.subheader("Status dos Equipamentos")
-            status_data = db.get_equipamentos_status_summary()
-            if status_data:
-                df_status = pd.DataFrame(status_data)
-                fig = px.pie(df_status, values='quantidade', names='status', 
-                           title="Distribuição por Status",
-                           color_discrete_map={
-                               'disponivel': '#28a745',
-                               'enviado': '#007bff', 
-                               'manutencao': '#ffc107',
-                               'perdido': '#dc3545'
-                           })
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("Sem dados para exibir")
+        if colunas_exibir:
+            st.dataframe(df_display[colunas_exibir], use_container_width=True)
         
-        with col2:
-            st.subheader("Movimentações por Tipo")
-            if movimentacoes_periodo:
-                df_mov = pd.DataFrame(movimentacoes_periodo)
-                mov_por_tipo = df_mov.groupby('tipo').size().reset_index(name='quantidade')
-                fig = px.bar(mov_por_tipo, x='tipo', y='quantidade', 
-                           title="Movimentações por Tipo (Período)")
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("Sem movimentações no período")
+        # Download CSV
+        csv = df_filtered.to_csv(index=False)
+        st.download_button(
+            label="📥 Baixar Relatório CSV",
+            data=csv,
+            file_name=f"relatorio_equipamentos_{datetime.now().strftime('%Y%m%d')}.csv",
+            mime="text/csv"
+        )
         
-        # Timeline de movimentações
-        st.subheader("Timeline de Movimentações")
-        if movimentacoes_periodo:
-            df_timeline = pd.DataFrame(movimentacoes_periodo)
-            df_timeline['data'] = pd.to_datetime(df_timeline['data_movimentacao']).dt.date
-            timeline_data = df_timeline.groupby(['data', 'tipo']).size().reset_index(name='quantidade')
-            
-            fig = px.line(timeline_data, x='data', y='quantidade', color='tipo',
-                         title="Movimentações ao Longo do Tempo")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("Sem dados para timeline")
+    else:
+        st.info("Nenhum equipamento cadastrado.")
+
+
+def show_relatorio_movimentacoes_tab(db):
+    st.subheader("📋 Relatório de Movimentações")
+    import plotly.express as px
     
-    with tab2:
-        st.subheader("📦 Relatório de Equipamentos")
-        
-        equipamentos = db.get_equipamentos()
-        
-        if equipamentos:
-            df_equipamentos = pd.DataFrame(equipamentos)
-            
-            # Filtros
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                status_filter = st.multiselect("Status:", 
-                                             ["disponivel", "enviado", "manutencao", "perdido"],
-                                             default=["disponivel", "enviado", "manutencao", "perdido"])
-            with col2:
-                search_equip = st.text_input("Buscar equipamento:")
-            with col3:
-                ordenar_por = st.selectbox("Ordenar por:", ["Descrição", "Quantidade", "Status"])
-            
-            # Aplicar filtros
-            df_filtered = df_equipamentos[df_equipamentos['status'].isin(status_filter)]
-            
-            if search_equip:
-                df_filtered = df_filtered[df_filtered['descricao'].str.contains(search_equip, case=False, na=False)]
-            
-            # Ordenação
-            if ordenar_por == "Descrição":
-                df_filtered = df_filtered.sort_values('descricao')
-            elif ordenar_por == "Quantidade":
-                df_filtered = df_filtered.sort_values('quantidade', ascending=False)
-            else:
-                df_filtered = df_filtered.sort_values('status')
-            
-            # Estatísticas
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Tipos de Equipamentos", len(df_filtered))
-            with col2:
-                st.metric("Quantidade Total", df_filtered['quantidade'].sum())
-            with col3:
-                valor_total = len(df_filtered) * 1000  # Estimativa
-                st.metric("Valor Estimado (R$)", f"{valor_total:,.2f}")
-            
-            # Tabela detalhada
-            st.subheader("Equipamentos Detalhados")
-            
-            # Preparar dados para exibição
-            df_display = df_filtered.copy()
-            df_display['Status'] = df_display['status'].map({
-                'disponivel': '🟢 Disponível',
-                'enviado': '🔵 Enviado',
-                'manutencao': '🟡 Manutenção',
-                'perdido': '🔴 Perdido'
-            })
-            
-            # Seleção de colunas para exibir
-            colunas_exibir = st.multiselect("Colunas:", 
-                                          ['descricao', 'codigo', 'medida', 'quantidade', 'Status', 'observacoes'],
-                                          default=['descricao', 'quantidade', 'Status'])
-            
-            if colunas_exibir:
-                st.dataframe(df_display[colunas_exibir], use_container_width=True)
-            
-            # Download CSV
-            csv = df_filtered.to_csv(index=False)
-            st.download_button(
-                label="📥 Baixar Relatório CSV",
-                data=csv,
-                file_name=f"relatorio_equipamentos_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
-            
-        else:
-            st.info("Nenhum equipamento cadastrado.")
+    # Filtros
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        tipos_mov = st.multiselect("Tipos:", TIPOS_MOVIMENTACAO, default=TIPOS_MOVIMENTACAO)
+    with col2:
+        data_inicio_mov = st.date_input("Data Início:", 
+                                      value=date.today() - timedelta(days=30),
+                                      key="mov_inicio")
+    with col3:
+        data_fim_mov = st.date_input("Data Fim:", value=date.today(), key="mov_fim")
+    
+    parametros = {"data_inicio": data_inicio_mov, "data_fim": data_fim_mov, "tipos": tipos_mov}
+    enfileirar_relatorio(db, "movimentacoes", parametros, "mov")
+    if (data_fim_mov - data_inicio_mov).days > LIMITE_DIAS_NA_PAGINA:
+        st.info("📅 Período longo: use \"Gerar em segundo plano\" para não travar a página.")
+        return
+    
+    # Período filtrado no banco: só as linhas do intervalo são carregadas
+    df_mov = registrar_df(db.get_movimentacoes_df(data_inicio_mov, data_fim_mov), "movimentacoes")
     
-    with tab3:
-        st.subheader("📋 Relatório de Movimentações")
+    if not df_mov.empty:
+        df_mov_filtered = df_mov[df_mov['tipo'].isin(tipos_mov)]
         
-        movimentacoes = db.get_movimentacoes()
+        # Estatísticas do período
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            envios = len(df_mov_filtered[df_mov_filtered['tipo'] == 'envio'])
+            st.metric("Envios", envios)
+        with col2:
+            retornos = len(df_mov_filtered[df_mov_filtered['tipo'] == 'retorno'])
+            st.metric("Retornos", retornos)
+        with col3:
+            manutencoes = len(df_mov_filtered[df_mov_filtered['tipo'] == 'manutencao'])
+            st.metric("Manutenções", manutencoes)
+        with col4:
+            perdas = len(df_mov_filtered[df_mov_filtered['tipo'] == 'perda'])
+            st.metric("Perdas", perdas)
         
-        if movimentacoes:
-            df_mov = pd.DataFrame(movimentacoes)
-            df_mov['data_movimentacao'] = pd.to_datetime(df_mov['data_movimentacao'])
-            
-            # Filtros
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                tipos_mov = st.multiselect("Tipos:", 
-                                         ["envio", "retorno", "manutencao", "retorno_manutencao", "perda", "retorno_perda"],
-                                         default=["envio", "retorno", "manutencao", "retorno_manutencao", "perda", "retorno_perda"])
-            with col2:
-                data_inicio_mov = st.date_input("Data Início:", 
-                                              value=date.today() - timedelta(days=30),
-                                              key="mov_inicio")
-            with col3:
-                data_fim_mov = st.date_input("Data Fim:", value=date.today(), key="mov_fim")
-            
-            # Aplicar filtros
-            df_mov_filtered = df_mov[
-                (df_mov['tipo'].isin(tipos_mov)) &
-                (df_mov['data_movimentacao'].dt.date >= data_inicio_mov) &
-                (df_mov['data_movimentacao'].dt.date <= data_fim_mov)
-            ]
-            
-            # Estatísticas do período
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                envios = len(df_mov_filtered[df_mov_filtered['tipo'] == 'envio'])
-                st.metric("Envios", envios)
-            with col2:
-                retornos = len(df_mov_filtered[df_mov_filtered['tipo'] == 'retorno'])
-                st.metric("Retornos", retornos)
-            with col3:
-                manutencoes = len(df_mov_filtered[df_mov_filtered['tipo'] == 'manutencao'])
-                st.metric("Manutenções", manutencoes)
-            with col4:
-                perdas = len(df_mov_filtered[df_mov_filtered['tipo'] == 'perda'])
-                st.metric("Perdas", perdas)
-            
-            # Gráfico de movimentações por dia
-            st.subheader("Movimentações Diárias")
-            df_mov_filtered['data'] = df_mov_filtered['data_movimentacao'].dt.date
-            mov_diarias = df_mov_filtered.groupby(['data', 'tipo']).size().reset_index(name='quantidade')
-            
-            fig = px.bar(mov_diarias, x='data', y='quantidade', color='tipo',
-                        title="Movimentações por Dia e Tipo")
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Tabela de movimentações
-            st.subheader("Movimentações Detalhadas")
-            df_display_mov = df_mov_filtered.copy()
-            df_display_mov['Data'] = df_display_mov['data_movimentacao'].dt.strftime('%d/%m/%Y %H:%M')
-            df_display_mov['Tipo'] = df_display_mov['tipo'].map({
-                'envio': '📤 Envio',
-                'retorno': '📥 Retorno',
-                'manutencao': '🔧 Manutenção',
-                'retorno_manutencao': '🔧✅ Retorno Manutenção',
-                'perda': '❌ Perda',
-                'retorno_perda': '🔄 Retorno Perda'
-            })
-            
-            colunas_mov = ['Data', 'Tipo', 'equipamento_descricao', 'obra_nome', 'quantidade', 'responsavel']
-            st.dataframe(df_display_mov[colunas_mov], use_container_width=True)
-            
-            # Download
-            csv_mov = df_mov_filtered.to_csv(index=False)
-            st.download_button(
-                label="📥 Baixar Relatório de Movimentações CSV",
-                data=csv_mov,
-                file_name=f"relatorio_movimentacoes_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
-            
-        else:
-            st.info("Nenhuma movimentação registrada.")
-    
-    with tab4:
-        st.subheader("⚠️ Perdas e Manutenções")
+        # Gráfico de movimentações por dia
+        st.subheader("Movimentações Diárias")
+        df_mov_filtered['data'] = df_mov_filtered['data_movimentacao'].dt.date
+        mov_diarias = df_mov_filtered.groupby(['data', 'tipo']).size().reset_index(name='quantidade')
         
-        # Equipamentos em manutenção
-        equipamentos_manutencao = db.get_equipamentos_by_status("manutencao")
-        equipamentos_perdidos = db.get_equipamentos_by_status("perdido")
+        fig = px.bar(mov_diarias, x='data', y='quantidade', color='tipo',
+                    title="Movimentações por Dia e Tipo")
+        st.plotly_chart(fig, use_container_width=True)
         
-        col1, col2 = st.columns(2)
+        # Tabela de movimentações
+        st.subheader("Movimentações Detalhadas")
+        df_display_mov = df_mov_filtered.copy()
+        df_display_mov['Data'] = df_display_mov['data_movimentacao'].dt.strftime('%d/%m/%Y %H:%M')
+        df_display_mov['Tipo'] = df_display_mov['tipo'].map({
+            'envio': '📤 Envio',
+            'retorno': '📥 Retorno',
+            'manutencao': '🔧 Manutenção',
+            'retorno_manutencao': '🔧✅ Retorno Manutenção',
+            'perda': '❌ Perda',
+            'retorno_perda': '🔄 Retorno Perda'
+        })
         
-        with col1:
-            st.write("### 🔧 Equipamentos em Manutenção")
-            if equipamentos_manutencao:
-                for equip in equipamentos_manutencao:
-                    st.write(f"- **{equip['descricao']}** (Qtd: {equip['quantidade']})")
-                    if equip['observacoes']:
-                        st.caption(f"  Obs: {equip['observacoes']}")
-            else:
-                st.info("Nenhum equipamento em manutenção")
+        colunas_mov = ['Data', 'Tipo', 'equipamento_descricao', 'obra_nome', 'quantidade', 'responsavel']
+        st.dataframe(df_display_mov[colunas_mov], use_container_width=True)
         
-        with col2:
-            st.write("### ❌ Equipamentos Perdidos")
-            if equipamentos_perdidos:
-                for equip in equipamentos_perdidos:
-                    st.write(f"- **{equip['descricao']}** (Qtd: {equip['quantidade']})")
-                    if equip['observacoes']:
-                        st.caption(f"  Obs: {equip['observacoes']}")
-            else:
-                st.info("Nenhum equipamento perdido")
+        # Download
+        csv_mov = df_mov_filtered.to_csv(index=False)
+        st.download_button(
+            label="📥 Baixar Relatório de Movimentações CSV",
+            data=csv_mov,
+            file_name=f"relatorio_movimentacoes_{datetime.now().strftime('%Y%m%d')}.csv",
+            mime="text/csv"
+        )
         
-        # Histórico de manutenções
-        st.write("### 📋 Histórico de Manutenções")
-        manutencoes = db.get_manutencoes()
+    else:
+        st.info("Nenhuma movimentação registrada no período.")
+
+
+def show_perdas_manutencoes_tab(db, leitura):
+    st.subheader("⚠️ Perdas e Manutenções")
+    
+    # Equipamentos em manutenção
+    equipamentos_manutencao = leitura.get_equipamentos_by_status("manutencao")
+    equipamentos_perdidos = leitura.get_equipamentos_by_status("perdido")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.write("### 🔧 Equipamentos em Manutenção")
+        if equipamentos_manutencao:
+            for equip in equipamentos_manutencao:
+                st.write(f"- **{equip['descricao']}** (Qtd: {equip['quantidade']})")
+                if equip['observacoes']:
+                    st.caption(f"  Obs: {equip['observacoes']}")
+        else:
+            st.info("Nenhum equipamento em manutenção")
+    
+    with col2:
+        st.write("### ❌ Equipamentos Perdidos")
+        if equipamentos_perdidos:
+            for equip in equipamentos_perdidos:
+                st.write(f"- **{equip['descricao']}** (Qtd: {equip['quantidade']})")
+                if equip['observacoes']:
+                    st.caption(f"  Obs: {equip['observacoes']}")
+        else:
+            st.info("Nenhum equipamento perdido")
+    
+    show_manutencao_preventiva(db)
+    
+    # Histórico de manutenções: totais vêm do resumo mensal incremental, a tabela só das ordens do período
+    st.write("### 📋 Histórico de Manutenções")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        data_inicio_manut = st.date_input("Data Início:", 
+                                        value=date.today() - timedelta(days=90),
+                                        key="manut_inicio")
+    with col2:
+        data_fim_manut = st.date_input("Data Fim:", value=date.today(), key="manut_fim")
+    
+    mes_inicio, mes_fim = data_inicio_manut.strftime("%Y-%m"), data_fim_manut.strftime("%Y-%m")
+    totais = (leitura.get_resumo_manutencoes(mes_inicio, mes_fim, agrupar_por=None) or [{}])[0]
+    
+    # Estatísticas de manutenção
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Ordens Abertas", totais.get('abertas') or 0)
+    with col2:
+        st.metric("Custo Total (R$)", f"{totais.get('custo') or 0:,.2f}")
+    with col3:
+        prazo = totais.get('prazo_medio')
+        st.metric("Prazo Médio (dias/unidade)", f"{prazo:.1f}" if prazo is not None else "-")
+    with col4:
+        st.metric("Em Andamento (hoje)", leitura.get_total_manutencoes_abertas())
+    st.caption(f"Totais dos meses de {data_inicio_manut.strftime('%m/%Y')} a {data_fim_manut.strftime('%m/%Y')}.")
+    
+    if totais.get('abertas') or totais.get('custo'):
+        agrupamentos = {"Mês": "mes", "Tipo": "tipo", "Equipamento": "equipamento"}
+        agrupar = st.radio("Custos e prazos por:", list(agrupamentos.keys()), horizontal=True, key="manut_agrupar")
+        resumo = pd.DataFrame(leitura.get_resumo_manutencoes(mes_inicio, mes_fim, agrupamentos[agrupar]))
+        st.dataframe(resumo[['grupo', 'abertas', 'concluidas', 'quantidade_concluida', 'custo', 'prazo_medio']],
+                     hide_index=True, use_container_width=True,
+                     column_config={
+                         "grupo": agrupar,
+                         "abertas": "Ordens Abertas",
+                         "concluidas": "Ordens Concluídas",
+                         "quantidade_concluida": "Unidades Reparadas",
+                         "custo": st.column_config.NumberColumn("Custo (R$)", format="%.2f"),
+                         "prazo_medio": st.column_config.NumberColumn("Prazo Médio (dias)", format="%.1f"),
+                     })
+    
+    df_manut = registrar_df(leitura.get_manutencoes_df(data_inicio_manut, data_fim_manut), "manutencoes")
+    if not df_manut.empty:
+        df_display_manut = df_manut.copy()
+        df_display_manut['Data'] = df_display_manut['data_manutencao'].dt.strftime('%d/%m/%Y')
+        df_display_manut['Conclusão'] = df_display_manut['data_conclusao'].dt.strftime('%d/%m/%Y')
+        df_display_manut['Status'] = df_display_manut['status'].map({
+            'pendente': '🟡 Pendente',
+            'em_andamento': '🔵 Em Andamento',
+            'concluida': '🟢 Concluída'
+        })
         
-        if manutencoes:
-            df_manut = pd.DataFrame(manutencoes)
-            df_manut['data_manutencao'] = pd.to_datetime(df_manut['data_manutencao'])
-            
-            # Filtro por período
-            col1, col2 = st.columns(2)
+        colunas_manut = ['Data', 'equipamento_descricao', 'tipo', 'quantidade', 'Status', 'Conclusão', 'responsavel', 'custo']
+        st.dataframe(df_display_manut[colunas_manut], use_container_width=True)
+    else:
+        st.info("Nenhuma manutenção registrada no período.")
+    
+    # Análise de perdas por período
+    st.write("### 📊 Análise de Perdas")
+    fig = grafico_perdas_por_mes(leitura)
+    
+    if fig is not None:
+        st.plotly_chart(fig, use_container_width=True)
+        show_ranking_perdas(leitura)
+    else:
+        st.info("Nenhuma perda registrada.")
+
+
+def show_ranking_perdas(db):
+    st.write("#### 🏗️ Taxa de Perda por Obra, Cliente e Equipamento")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        data_inicio = st.date_input("Data Início:", value=date.today() - timedelta(days=365), key="perdas_inicio")
+    with col2:
+        data_fim = st.date_input("Data Fim:", value=date.today(), key="perdas_fim")
+    with col3:
+        agrupamentos = {"Obra": "obra", "Cliente": "cliente", "Equipamento": "equipamento"}
+        agrupar = st.selectbox("Agrupar por:", list(agrupamentos.keys()), key="perdas_agrupar")
+    
+    ranking = db.get_ranking_perdas(data_inicio.strftime("%Y-%m"), data_fim.strftime("%Y-%m"),
+                                    agrupamentos[agrupar], limite=20)
+    if not ranking:
+        st.info("Nenhuma perda no período.")
+        return
+    
+    df_ranking = pd.DataFrame(ranking)
+    sem_obra = "Sem obra (estoque)" if agrupar != "Equipamento" else "-"
+    df_ranking['nome'] = df_ranking['nome'].where(df_ranking['id'] != 0, sem_obra)
+    st.dataframe(df_ranking[['nome', 'perdidas', 'recuperadas', 'equipamento_dias', 'taxa']],
+                 hide_index=True, use_container_width=True,
+                 column_config={
+                     "nome": agrupar,
+                     "perdidas": "Perdidas",
+                     "recuperadas": "Recuperadas",
+                     "equipamento_dias": st.column_config.NumberColumn("Equipamento-dias em obra", format="%d"),
+                     "taxa": st.column_config.NumberColumn("Perdas por 1000 equip.-dias", format="%.2f"),
+                 })
+    st.caption(f"Meses de {data_inicio.strftime('%m/%Y')} a {data_fim.strftime('%m/%Y')}; "
+               "perdas líquidas (perdidas - recuperadas) em relação aos equipamento-dias em obra no período.")
+    enfileirar_relatorio(db, "perdas", {"data_inicio": data_inicio, "data_fim": data_fim,
+                                        "agrupar_por": agrupamentos[agrupar]}, "perdas")
+
+
+def show_manutencao_preventiva(db):
+    st.write("### 🗓️ Manutenção Preventiva")
+    
+    # Reavalia só os equipamentos cujos contadores de uso mudaram desde a última visita
+    novas = db.avaliar_manutencoes_preventivas()
+    if novas:
+        st.toast(f"🔔 {novas} nova(s) ordem(ns) de manutenção preventiva")
+    
+    pendentes, proximas = db.get_manutencoes_preventivas()
+    if pendentes:
+        for ordem in pendentes:
+            situacao = "🔴 Atrasada" if ordem['atrasada'] else "🟡 Vencida"
+            col1, col2, col3 = st.columns([4, 1, 1])
+            with col1:
+                st.write(f"{situacao} — **{ordem['equipamento_descricao']}**: {ordem['regra']} "
+                         f"({MEDIDAS_USO[ordem['medida']]}: {ordem['uso_atual']:.1f} de {ordem['limite']:g})")
+            with col2:
+                custo = st.number_input("Custo (R$)", min_value=0.0, step=10.0, format="%.2f",
+                                        key=f"preventiva_custo_{ordem['ordem_id']}", label_visibility="collapsed")
+            with col3:
+                if st.button("✅ Concluir", key=f"preventiva_concluir_{ordem['ordem_id']}"):
+                    db.concluir_manutencao_preventiva(ordem['ordem_id'], custo=custo)
+                    st.success("Manutenção preventiva concluída!")
+                    st.rerun()
+    else:
+        st.info("Nenhuma manutenção preventiva vencida.")
+    
+    if proximas:
+        st.caption("Vencimentos previstos nos próximos 30 dias:")
+        df_proximas = pd.DataFrame(proximas)
+        df_proximas['medida'] = df_proximas['medida'].map(MEDIDAS_USO)
+        st.dataframe(df_proximas[['data_prevista', 'equipamento_descricao', 'regra', 'medida', 'uso_atual', 'limite']],
+                     hide_index=True, use_container_width=True,
+                     column_config={
+                         "data_prevista": "Previsão",
+                         "equipamento_descricao": "Equipamento",
+                         "regra": "Regra",
+                         "medida": "Medida",
+                         "uso_atual": st.column_config.NumberColumn("Uso Atual", format="%.1f"),
+                         "limite": "Limite",
+                     })
+    
+    with st.expander("⚙️ Regras de manutenção preventiva"):
+        for regra in db.get_regras_manutencao():
+            col1, col2 = st.columns([5, 1])
             with col1:
-                data_inicio_manut = st.date_input("Data Início:", 
-                                                value=date.today() - timedelta(days=90),
-                                                key="manut_inicio")
+                alvo = regra['equipamento_descricao'] or "Todos os equipamentos"
+                st.write(f"**{regra['descricao']}** — {alvo}: a cada {regra['limite']:g} "
+                         f"({MEDIDAS_USO[regra['medida']].lower()}), tolerância {regra['tolerancia']:g}")
             with col2:
-                data_fim_manut = st.date_input("Data Fim:", value=date.today(), key="manut_fim")
-            
-            # Filtrar por período
-            df_manut_filtered = df_manut[
-                (df_manut['data_manutencao'].dt.date >= data_inicio_manut) &
-                (df_manut['data_manutencao'].dt.date <= data_fim_manut)
-            ]
-            
-            # Estatísticas de manutenção
+                if st.button("🗑️", key=f"regra_desativar_{regra['id']}"):
+                    db.desativar_regra_manutencao(regra['id'])
+                    st.rerun()
+        
+        equipamentos = {"Todos os equipamentos": None}
+        equipamentos.update({e['descricao']: e['id'] for e in db.get_equipamentos()})
+        with st.form("regra_manutencao_form"):
+            descricao = st.text_input("Descrição *", placeholder="Ex.: Inspeção de solda")
             col1, col2, col3 = st.columns(3)
             with col1:
-                total_manut = len(df_manut_filtered)
-                st.metric("Total de Manutenções", total_manut)
+                medida = st.selectbox("Medida", list(MEDIDAS_USO.keys()), format_func=MEDIDAS_USO.get)
             with col2:
-                custo_total = df_manut_filtered['custo'].sum() if 'custo' in df_manut_filtered.columns else 0
-                st.metric("Custo Total (R$)", f"{custo_total:,.2f}")
+                limite = st.number_input("A cada", min_value=1.0, value=180.0, step=1.0)
             with col3:
-                manut_pendentes = len(df_manut_filtered[df_manut_filtered['status'] == 'pendente'])
-                st.metric("Pendentes", manut_pendentes)
-            
-            # Tabela de manutenções
-            if not df_manut_filtered.empty:
-                df_display_manut = df_manut_filtered.copy()
-                df_display_manut['Data'] = df_display_manut['data_manutencao'].dt.strftime('%d/%m/%Y')
-                df_display_manut['Status'] = df_display_manut['status'].map({
-                    'pendente': '🟡 Pendente',
-                    'em_andamento': '🔵 Em Andamento',
-                    'concluida': '🟢 Concluída'
-                })
-                
-                colunas_manut = ['Data', 'equipamento_descricao', 'tipo', 'Status', 'responsavel', 'custo']
-                st.dataframe(df_display_manut[colunas_manut], use_container_width=True)
-            
-        else:
-            st.info("Nenhuma manutenção registrada.")
-        
-        # Análise de perdas por período
-        st.write("### 📊 Análise de Perdas")
-        movimentacoes_perda = [m for m in db.get_movimentacoes() if m['tipo'] == 'perda']
-        
-        if movimentacoes_perda:
-            df_perdas = pd.DataFrame(movimentacoes_perda)
-            df_perdas['data_movimentacao'] = pd.to_datetime(df_perdas['data_movimentacao'])
-            df_perdas['mes'] = df_perdas['data_movimentacao'].dt.to_period('M')
-            
-            perdas_por_mes = df_perdas.groupby('mes')['quantidade'].sum().reset_index()
-            perdas_por_mes['mes'] = perdas_por_mes['mes'].astype(str)
-            
-            fig = px.bar(perdas_por_mes, x='mes', y='quantidade',
-                        title="Perdas por Mês")
-            st.plotly_chart(fig, use_container_width=True)
-            
-        else:
-            st.info("Nenhuma perda registrada.")
+                tolerancia = st.number_input("Tolerância", min_value=0.0, value=0.0, step=1.0,
+                                             help="Uso além do limite antes de a ordem ser considerada atrasada")
+            alvo = st.selectbox("Equipamento", list(equipamentos.keys()))
+            if st.form_submit_button("💾 Adicionar Regra"):
+                if descricao:
+                    db.add_regra_manutencao(descricao, medida, limite, tolerancia, equipamentos[alvo])
+                    st.success("Regra cadastrada com sucesso!")
+                    st.rerun()
+                else:
+                    st.error("Descrição é obrigatória!")
+
+
+def show_utilizacao_frota_tab(db):
+    from utilizacao import utilizacao, GRANULARIDADES
+    import plotly.express as px
+    
+    st.subheader("📦 Utilização da Frota")
+    st.caption("Fração do estoque em obra, em manutenção, perdida ou ociosa ao fim de cada dia.")
+    
+    equipamentos = db.get_equipamentos()
+    opcoes = {"Toda a frota": None}
+    opcoes.update({e['descricao']: e['id'] for e in equipamentos})
+    
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        escolha = st.selectbox("Equipamento:", list(opcoes.keys()), key="util_equipamento")
+    with col2:
+        data_inicio = st.date_input("Data Início:", value=date.today() - timedelta(days=365),
+                                    format="DD/MM/YYYY", key="util_inicio")
+    with col3:
+        data_fim = st.date_input("Data Fim:", value=date.today(), format="DD/MM/YYYY", key="util_fim")
+    with col4:
+        granularidade = st.radio("Agrupar por:", list(GRANULARIDADES.keys()), index=1, key="util_granularidade")
+    
+    if data_fim < data_inicio:
+        st.error("❌ A data fim deve ser posterior à data início.")
+        return
+    
+    fracoes = registrar_df(utilizacao(db, data_inicio, data_fim, opcoes[escolha], granularidade), "utilizacao")
+    if fracoes.empty:
+        st.info("Sem dados para o período selecionado.")
+        return
+    
+    # Médias do período
+    medias = fracoes.mean()
+    for coluna, (situacao, media) in zip(st.columns(len(medias)), medias.items()):
+        with coluna:
+            st.metric(f"{situacao} (média)", f"{media:.1%}")
+    
+    dados = fracoes.reset_index().melt(id_vars="data", var_name="Situação", value_name="Fração")
+    fig = px.area(dados, x="data", y="Fração", color="Situação",
+                  title=f"Utilização - {escolha}",
+                  color_discrete_map={
+                      'Em obra': '#007bff',
+                      'Em manutenção': '#ffc107',
+                      'Perdido': '#dc3545',
+                      'Ocioso': '#28a745'
+                  })
+    fig.update_yaxes(tickformat=".0%", range=[0, 1])
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.download_button(
+        label="📥 Baixar Série CSV",
+        data=fracoes.to_csv(),
+        file_name=f"utilizacao_{data_inicio}_{data_fim}.csv",
+        mime="text/csv"
+    )
+    enfileirar_relatorio(db, "utilizacao", {"data_inicio": data_inicio, "data_fim": data_fim,
+                                            "equipamento_id": opcoes[escolha], "granularidade": granularidade}, "util")
+
+
+def show_projecao_disponibilidade_tab(db):
+    from projecao import disponibilidade_projetada, projecao_disponibilidade, SEMANAS_PADRAO
+    import plotly.express as px
+    
+    st.subheader("📅 Projeção de Disponibilidade")
+    st.caption("Disponível hoje mais o saldo em obra que deve retornar até o fim de cada semana, "
+               "pela data de fim prevista de cada obra somada ao atraso histórico de devolução do cliente.")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        busca = st.text_input("Buscar equipamento:", placeholder="Descrição...", key="proj_busca")
+    with col2:
+        semanas = st.number_input("Semanas:", min_value=1, max_value=52, value=SEMANAS_PADRAO, key="proj_semanas")
+    
+    projecao = registrar_df(disponibilidade_projetada(db, int(semanas)), "projecao")
+    if projecao.empty:
+        st.info("Nenhum equipamento cadastrado ainda.")
+        return
+    
+    st.metric("Atraso típico de devolução (dias após a data fim)", projecao_disponibilidade(db).atraso_geral)
+    
+    descricoes = {e['id']: e['descricao'] for e in db.get_equipamentos(incluir_excluidos=True)}
+    tabela = projecao.copy()
+    tabela.columns = ["Hoje"] + [f"Até {d.strftime('%d/%m')}" for d in tabela.columns[1:]]
+    tabela.insert(0, "Equipamento", tabela.index.map(descricoes))
+    if busca:
+        tabela = tabela[tabela["Equipamento"].str.contains(busca, case=False, na=False)]
+    st.dataframe(tabela, hide_index=True, use_container_width=True)
+    
+    if not tabela.empty:
+        escolha = st.selectbox("Gráfico do equipamento:", list(tabela["Equipamento"]), key="proj_equipamento")
+        equipamento_id = tabela.index[tabela["Equipamento"] == escolha][0]
+        serie = projecao.loc[equipamento_id].rename_axis("data").reset_index(name="disponivel")
+        fig = px.line(serie, x="data", y="disponivel", markers=True,
+                      title=f"Disponibilidade projetada - {escolha}")
+        st.plotly_chart(fig, use_container_width=True)
+
+
+# Gráficos derivados, guardados no cache em disco e marcados com a versão das tabelas de origem
+@cache_persistente("equipamentos")
+def grafico_status_equipamentos(db):
+    import plotly.express as px
+    
+    status_data = db.get_equipamentos_status_summary()
+    if not status_data:
+        return None
+    df_status = pd.DataFrame(status_data)
+    return px.pie(df_status, values='quantidade', names='status', 
+                  title="Distribuição por Status",
+                  color_discrete_map={
+                      'disponivel': '#28a745',
+                      'enviado': '#007bff', 
+                      'manutencao': '#ffc107',
+                      'perdido': '#dc3545'
+                  })
+
+
+@cache_persistente("movimentacoes")
+def grafico_movimentacoes_por_tipo(db, data_inicio, data_fim):
+    import plotly.express as px
+    
+    df_mov = pd.DataFrame(db.get_movimentacoes_por_dia(data_inicio, data_fim))
+    mov_por_tipo = df_mov.groupby('tipo')['quantidade'].sum().reset_index()
+    return px.bar(mov_por_tipo, x='tipo', y='quantidade', 
+                  title="Movimentações por Tipo (Período)")
+
+
+@cache_persistente("movimentacoes")
+def grafico_timeline_movimentacoes(db, data_inicio, data_fim):
+    import plotly.express as px
+    
+    timeline_data = pd.DataFrame(db.get_movimentacoes_por_dia(data_inicio, data_fim))
+    return px.line(timeline_data, x='data', y='quantidade', color='tipo',
+                   title="Movimentações ao Longo do Tempo")
+
+
+@cache_persistente("movimentacoes")
+def grafico_perdas_por_mes(db):
+    import plotly.express as px
+    
+    perdas_por_mes = db.get_perdas_por_mes()
+    if not perdas_por_mes:
+        return None
+    return px.bar(pd.DataFrame(perdas_por_mes), x='mes', y='quantidade',
+                  title="Perdas por Mês")
@@ -0,0 +1,187 @@
+import streamlit as st
+import threading
+import unicodedata
+from bisect import bisect_left
+
+# Quantidade de equipamentos exibidos por página no seletor
+LIMITE_RESULTADOS = 20
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos, para que 'braca' encontre 'BRAÇADEIRA'"""
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode("ascii")
+    return texto.lower()
+
+
+class IndicePrefixos:
+    """Índice em memória por prefixo das palavras de descrição e código dos equipamentos"""
+
+    def __init__(self, equipamentos):
+        # Posição na ordem alfabética da descrição: os resultados saem já ordenados
+        ordenados = sorted(equipamentos, key=lambda e: normalizar(e['descricao']))
+        self.ordem = {e['id']: posicao for posicao, e in enumerate(ordenados)}
+        self.ids_ordenados = [e['id'] for e in ordenados]
+        entradas = set()
+        for e in ordenados:
+            for campo in (e['descricao'], e.get('codigo')):
+                texto = normalizar(campo)
+                if texto:
+                    entradas.add((texto, e['id']))
+                for palavra in texto.replace("-", " ").replace("/", " ").split():
+                    entradas.add((palavra, e['id']))
+        self.entradas = sorted(entradas)
+        self.termos = [termo for termo, _ in self.entradas]
+
+    def _ids_com_prefixo(self, prefixo):
+        ids = set()
+        posicao = bisect_left(self.termos, prefixo)
+        while posicao < len(self.termos) and self.termos[posicao].startswith(prefixo):
+            ids.add(self.entradas[posicao][1])
+            posicao += 1
+        return ids
+
+    def buscar(self, consulta, elegiveis=None, inicio=0, limite=LIMITE_RESULTADOS):
+        """Retorna (ids da página, total de resultados); cada palavra da consulta precisa casar um prefixo"""
+        palavras = normalizar(consulta).split()
+        if palavras:
+            encontrados = None
+            for palavra in palavras:
+                ids = self._ids_com_prefixo(palavra)
+                encontrados = ids if encontrados is None else encontrados & ids
+                if not encontrados:
+                    return [], 0
+            if elegiveis is not None:
+                encontrados = encontrados & elegiveis
+            resultado = sorted(encontrados, key=self.ordem.__getitem__)
+        elif elegiveis is not None:
+            resultado = [i for i in self.ids_ordenados if i in elegiveis]
+        else:
+            resultado = self.ids_ordenados
+        return resultado[inicio:inicio + limite], len(resultado)
+
+
+_indices = {}
+_lock_indices = threading.Lock()
+
+
+def indice_equipamentos(db):
+    """Índice do catálogo, reconstruído apenas quando a tabela de equipamentos muda"""
+    versao = db.get_versoes_dados(("equipamentos",))
+    with _lock_indices:
+        atual = _indices.get(db.db_path)
+        if atual is not None and atual[0] == versao:
+            return atual[1]
+    indice = IndicePrefixos(db.get_equipamentos())
+    with _lock_indices:
+        _indices[db.db_path] = (versao, indice)
+    return indice
+
+
+def _mudar_pagina(key, passo):
+    st.session_state[f"{key}_pagina"] = st.session_state.get(f"{key}_pagina", 0) + passo
+
+
+def _pagina_resultados(db, equipamentos, key, limite):
+    """Campo de busca + paginação; retorna os equipamentos (com saldos) da página atual"""
+    por_id = {e['id']: e for e in equipamentos}
+    busca = st.text_input("🔎 Buscar equipamento", key=f"{key}_busca", placeholder="Descrição ou código...")
+
+    # Nova busca ou outro conjunto de elegíveis (outra obra, outro tipo de movimentação) volta para a
+    # primeira página
+    elegiveis = set(por_id)
+    assinatura = (busca, hash(frozenset(elegiveis)))
+    if st.session_state.get(f"{key}_busca_anterior") != assinatura:
+        st.session_state[f"{key}_busca_anterior"] = assinatura
+        st.session_state[f"{key}_pagina"] = 0
+    pagina = st.session_state.get(f"{key}_pagina", 0)
+
+    indice = indice_equipamentos(db)
+    ids, total = indice.buscar(busca, elegiveis, pagina * limite, limite)
+    total_paginas = max(1, -(-total // limite))
+    # A página guardada pode passar do fim (ex.: equipamentos excluídos do índice): fica na última
+    if pagina >= total_paginas:
+        pagina = st.session_state[f"{key}_pagina"] = total_paginas - 1
+        ids, total = indice.buscar(busca, elegiveis, pagina * limite, limite)
+
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        st.button("◀", key=f"{key}_anterior", disabled=pagina == 0,
+                  on_click=_mudar_pagina, args=(key, -1))
+    with col2:
+        st.caption(f"{total} equipamento(s) encontrado(s) — página {pagina + 1} de {total_paginas}")
+    with col3:
+        st.button("▶", key=f"{key}_proxima", disabled=pagina + 1 >= total_paginas,
+                  on_click=_mudar_pagina, args=(key, 1))
+
+    return [por_id[i] for i in ids]
+
+
+def seletor_equipamento(db, equipamentos, key, limite=LIMITE_RESULTADOS):
+    """Seletor paginado e pesquisável; envia ao navegador apenas a página atual de resultados.
+
+    `equipamentos` são os itens elegíveis (com 'id', 'label' e 'max_qtd'); retorna o escolhido ou None.
+    """
+    resultados = _pagina_resultados(db, equipamentos, key, limite)
+    if not resultados:
+        st.info("Nenhum equipamento encontrado para a busca.")
+        return None
+
+    opcoes = {e['label']: e for e in resultados}
+    escolha = st.selectbox("Equipamento *", options=list(opcoes.keys()), key=f"{key}_escolha")
+    return opcoes.get(escolha)
+
+
+def carrinho_equipamentos(db, equipamentos, key, contexto, limite=LIMITE_RESULTADOS):
+    """Seleção em lote: busca paginada para adicionar itens e um carrinho com apenas as linhas escolhidas.
+
+    O carrinho é esvaziado quando `contexto` (ex.: tipo e obra) muda. Retorna a lista de itens do
+    carrinho com 'id', 'descricao', 'quantidade' e 'max_qtd'.
+    """
+    chave_carrinho = f"{key}_carrinho"
+    if st.session_state.get(f"{chave_carrinho}_contexto") != contexto:
+        st.session_state[f"{chave_carrinho}_contexto"] = contexto
+        st.session_state[chave_carrinho] = {}
+    carrinho = st.session_state.setdefault(chave_carrinho, {})
+    por_id = {e['id']: e for e in equipamentos}
+
+    st.markdown("### Adicionar equipamentos:")
+    for equip in _pagina_resultados(db, equipamentos, key, limite):
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.write(equip['label'])
+        with col2:
+            if equip['id'] in carrinho:
+                st.caption("✅ No lote")
+            else:
+                st.button("➕ Adicionar", key=f"{key}_add_{equip['id']}",
+                          on_click=carrinho.__setitem__, args=(equip['id'], 1))
+
+    st.markdown("### Itens do lote:")
+    itens = []
+    if not carrinho:
+        st.info("👆 Adicione equipamentos ao lote")
+    for equip_id in list(carrinho):
+        equip = por_id.get(equip_id)
+        if equip is None:
+            # Saldo zerou desde que o item foi adicionado
+            del carrinho[equip_id]
+            continue
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            st.write(equip['label'])
+        with col2:
+            quantidade = st.number_input(f"Qtd (máx: {equip['max_qtd']})", min_value=1,
+                                         max_value=equip['max_qtd'],
+                                         value=min(carrinho[equip_id], equip['max_qtd']),
+                                         key=f"{key}_qtd_{equip_id}")
+            carrinho[equip_id] = quantidade
+        with col3:
+            st.button("🗑️", key=f"{key}_remover_{equip_id}",
+                      on_click=carrinho.pop, args=(equip_id, None))
+        itens.append({
+            'id': equip_id,
+            'descricao': equip['descricao'],
+            'quantidade': quantidade,
+            'max_qtd': equip['max_qtd']
+        })
+    return itens
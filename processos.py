@@ -0,0 +1,130 @@
+"""Pool de processos que não depende do __main__ de quem o cria.
+
+Os processos do multiprocessing (spawn) importam o __main__ do pai ao subir; no Streamlit ele é a página,
+trocada a cada rerun, e os processos executariam o app inteiro. Aqui o pool vive em um processo
+intermediário iniciado por `python processos.py` (cujo __main__ é este módulo, sem efeitos ao importar):
+os pedidos (função, argumentos) e as respostas trafegam por um socket entre os dois processos.
+"""
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+
+
+class PoolProcessos:
+    """Executor com submit/shutdown como o ProcessPoolExecutor, com os processos no intermediário.
+
+    As funções e os argumentos precisam ser serializáveis por referência (funções de módulos, não da página).
+    Se o intermediário morrer, os pedidos pendentes falham e os próximos levantam BrokenProcessPool.
+    """
+
+    def __init__(self, workers):
+        local, remoto = socket.socketpair()
+        with remoto:
+            self._processo = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(workers),
+                                               str(remoto.fileno())], pass_fds=(remoto.fileno(),))
+        self._socket = local
+        self._conexao = Connection(os.dup(local.fileno()))
+        self._futuros = {}
+        self._chaves = itertools.count()
+        self._trava = threading.Lock()
+        self._encerrado = False
+        self._leitor = threading.Thread(target=self._receber, name="cmms-pool-processos", daemon=True)
+        self._leitor.start()
+
+    def submit(self, funcao, *args):
+        futuro = Future()
+        with self._trava:
+            if self._encerrado:
+                raise BrokenProcessPool("O processo intermediário do pool terminou")
+            chave = next(self._chaves)
+            self._futuros[chave] = futuro
+            try:
+                self._conexao.send((chave, funcao, args))
+            except OSError as erro:
+                del self._futuros[chave]
+                raise BrokenProcessPool("O processo intermediário do pool terminou") from erro
+        return futuro
+
+    def _receber(self):
+        try:
+            while True:
+                chave, erro, resultado = self._conexao.recv()
+                with self._trava:
+                    futuro = self._futuros.pop(chave)
+                if erro is None:
+                    futuro.set_result(resultado)
+                else:
+                    futuro.set_exception(erro)
+        except (EOFError, OSError):
+            pass
+        with self._trava:
+            self._encerrado = True
+            pendentes, self._futuros = self._futuros, {}
+        for futuro in pendentes.values():
+            futuro.set_exception(BrokenProcessPool("O processo intermediário do pool terminou antes de responder"))
+        self._conexao.close()
+        self._socket.close()
+        self._processo.wait()
+
+    def shutdown(self, wait=True):
+        """Fecha o envio de pedidos; o intermediário termina os pendentes e sai"""
+        with self._trava:
+            if not self._encerrado:
+                try:
+                    self._socket.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+        if wait:
+            self._leitor.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.shutdown(wait=True)
+
+
+def _responder(conexao, trava, chave, futuro):
+    erro = futuro.exception()
+    with trava:
+        try:
+            try:
+                conexao.send((chave, erro, None if erro else futuro.result()))
+            except Exception as falha:  # resultado que não pode ser serializado
+                conexao.send((chave, falha, None))
+        except OSError:
+            pass  # quem pediu já fechou a conexão
+
+
+def hospedar(workers, descritor):
+    """Laço do intermediário: executa os pedidos recebidos em um pool spawn e devolve (chave, erro, resultado)"""
+    conexao = Connection(descritor)
+    trava = threading.Lock()
+    pool = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+    while True:
+        try:
+            chave, funcao, args = conexao.recv()
+        except EOFError:
+            break
+        try:
+            futuro = pool.submit(funcao, *args)
+        except BrokenProcessPool:
+            # Um processo do pool morreu: os próximos pedidos vão para um pool novo
+            pool.shutdown(wait=False)
+            pool = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+            futuro = pool.submit(funcao, *args)
+        futuro.add_done_callback(partial(_responder, conexao, trava, chave))
+    pool.shutdown(wait=True)
+    conexao.close()
+
+
+if __name__ == "__main__":
+    hospedar(int(sys.argv[1]), int(sys.argv[2]))
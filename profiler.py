@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from slow_query_log import tempo_banco
+
+# Perfil opcional: ative com CMMS_PROFILE=1 ou com ?perfil=1 na URL
+ARQUIVO_METRICAS = os.environ.get("CMMS_PROFILE_LOG", "profiling_metrics.jsonl")
+
+_estado = threading.local()
+# Seções raiz medindo memória agora, em todas as sessões; o tracemalloc fica ligado só enquanto houver alguma
+_trava_tracemalloc = threading.Lock()
+_medindo = 0
+_tracemalloc_externo = False
+
+
+def _ligar_tracemalloc():
+    global _medindo, _tracemalloc_externo
+    with _trava_tracemalloc:
+        if _medindo == 0:
+            # Ligado por fora (PYTHONTRACEMALLOC, depuração): não é desligado aqui
+            _tracemalloc_externo = tracemalloc.is_tracing()
+            if not _tracemalloc_externo:
+                tracemalloc.start()
+        _medindo += 1
+
+
+def _desligar_tracemalloc():
+    global _medindo
+    with _trava_tracemalloc:
+        _medindo -= 1
+        if _medindo == 0 and not _tracemalloc_externo:
+            # O rastreamento deixa toda alocação mais lenta, inclusive nas sessões sem perfil
+            tracemalloc.stop()
+
+
+class Secao:
+    def __init__(self, nome, pai=None):
+        self.nome = nome
+        self.pai = pai
+        self.filhos = []
+        self.profundidade = pai.profundidade + 1 if pai else 0
+        self.inicio = 0.0
+        self.wall_ms = 0.0
+        self.db_ms = 0.0
+        self.consultas = 0
+        self.memoria_base = 0
+        self.pico_bytes = 0
+        self.dataframes = []
+
+    @property
+    def caminho(self):
+        return f"{self.pai.caminho} / {self.nome}" if self.pai else self.nome
+
+    def percorrer(self):
+        yield self
+        for filho in self.filhos:
+            yield from filho.percorrer()
+
+
+class PageProfiler:
+    """Mede tempo total, tempo de banco, pico de memória e DataFrames por página/seção.
+
+    O tracemalloc fica ligado apenas enquanto uma seção raiz está aberta. O pico de memória é do processo
+    inteiro: só é confiável com uma única sessão sendo perfilada por vez.
+    """
+
+    def __init__(self, arquivo=ARQUIVO_METRICAS):
+        self.arquivo = arquivo
+        self.raizes = []
+        self._pilha = []
+        self._origem = time.perf_counter()
+
+    @contextmanager
+    def secao(self, nome):
+        pai = self._pilha[-1] if self._pilha else None
+        if pai is None:
+            _ligar_tracemalloc()
+        secao = Secao(nome, pai)
+        (pai.filhos if pai else self.raizes).append(secao)
+
+        atual, pico = tracemalloc.get_traced_memory()
+        if pai:
+            pai.pico_bytes = max(pai.pico_bytes, pico - pai.memoria_base)
+        tracemalloc.reset_peak()
+        secao.memoria_base = atual
+        consultas_inicio, db_inicio = tempo_banco()
+        secao.inicio = time.perf_counter()
+        self._pilha.append(secao)
+        try:
+            yield secao
+        finally:
+            self._pilha.pop()
+            secao.wall_ms = (time.perf_counter() - secao.inicio) * 1000
+            consultas_fim, db_fim = tempo_banco()
+            secao.consultas = consultas_fim - consultas_inicio
+            secao.db_ms = db_fim - db_inicio
+            _, pico = tracemalloc.get_traced_memory()
+            secao.pico_bytes = max(secao.pico_bytes, pico - secao.memoria_base)
+            if pai:
+                pai.pico_bytes = max(pai.pico_bytes, secao.pico_bytes + secao.memoria_base - pai.memoria_base)
+            tracemalloc.reset_peak()
+            if pai is None:
+                # Também ao sair por exceção (st.rerun, st.stop)
+                _desligar_tracemalloc()
+
+    def registrar_df(self, df, nome=None):
+        if not self._pilha:
+            return
+        self._pilha[-1].dataframes.append({
+            "nome": nome,
+            "linhas": int(len(df)),
+            "colunas": int(len(df.columns)),
+            "bytes": int(df.memory_usage(deep=True).sum()),
+        })
+
+    def linhas(self):
+        """Uma linha por seção, na ordem de execução"""
+        resultado = []
+        for raiz in self.raizes:
+            for secao in raiz.percorrer():
+                resultado.append({
+                    "secao": secao.caminho,
+                    "nome": secao.nome,
+                    "profundidade": secao.profundidade,
+                    "inicio_ms": round((secao.inicio - self._origem) * 1000, 2),
+                    "wall_ms": round(secao.wall_ms, 2),
+                    "db_ms": round(secao.db_ms, 2),
+                    "consultas": secao.consultas,
+                    "pico_kb": round(secao.pico_bytes / 1024, 1),
+                    "df_linhas": sum(d["linhas"] for d in secao.dataframes),
+                    "df_kb": round(sum(d["bytes"] for d in secao.dataframes) / 1024, 1),
+                })
+        return resultado
+
+    def salvar(self):
+        if not self.raizes:
+            return
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(self.arquivo, "a", encoding="utf-8") as f:
+            for linha in self.linhas():
+                f.write(json.dumps({"timestamp": timestamp, **linha}, ensure_ascii=False) + "\n")
+
+
+def perfil_habilitado():
+    if os.environ.get("CMMS_PROFILE") == "1":
+        return True
+    import streamlit as st
+    return st.query_params.get("perfil") == "1"
+
+
+def iniciar_perfil():
+    """Cria o perfilador desta execução do script (ou None se desabilitado)"""
+    _estado.perfil = PageProfiler() if perfil_habilitado() else None
+    return _estado.perfil
+
+
+def perfil_atual():
+    return getattr(_estado, "perfil", None)
+
+
+@contextmanager
+def secao(nome):
+    """Mede um bloco da página; não faz nada quando o perfil está desabilitado"""
+    perfil = perfil_atual()
+    if perfil is None:
+        yield None
+        return
+    with perfil.secao(nome) as s:
+        yield s
+
+
+def registrar_df(df, nome=None):
+    perfil = perfil_atual()
+    if perfil is not None:
+        perfil.registrar_df(df, nome)
+    return df
+
+
+def mostrar_perfil():
+    """Exibe o gráfico estilo flame das seções e grava as métricas em arquivo"""
+    perfil = perfil_atual()
+    if perfil is None or not perfil.raizes:
+        return
+    import streamlit as st
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    perfil.salvar()
+    df = pd.DataFrame(perfil.linhas())
+
+    with st.expander("⏱️ Perfil de desempenho", expanded=False):
+        fig = go.Figure(go.Bar(
+            base=df["inicio_ms"] - df["inicio_ms"].min(),
+            x=df["wall_ms"],
+            y=df["profundidade"],
+            orientation="h",
+            text=df["nome"],
+            textposition="inside",
+            insidetextanchor="start",
+            customdata=df[["db_ms", "consultas", "pico_kb", "df_kb"]],
+            hovertemplate=("<b>%{text}</b><br>%{x:.1f} ms<br>Banco: %{customdata[0]:.1f} ms "
+                           "(%{customdata[1]} consultas)<br>Pico memória: %{customdata[2]:.0f} KB"
+                           "<br>DataFrames: %{customdata[3]:.0f} KB<extra></extra>"),
+            marker_color=df["db_ms"] / df["wall_ms"].where(df["wall_ms"] > 0, 1),
+            marker_colorscale="YlOrRd",
+        ))
+        fig.update_layout(
+            title="Tempo por seção (cor = fração no banco)",
+            xaxis_title="ms",
+            yaxis=dict(autorange="reversed", title="nível", dtick=1),
+            bargap=0.05,
+            height=120 + 40 * (df["profundidade"].max() + 1),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(df.drop(columns=["nome", "profundidade", "inicio_ms"]), use_container_width=True)
+        st.caption(f"Métricas acumuladas em {perfil.arquivo}")
@@ -0,0 +1,230 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import TIPOS_MOVIMENTACAO, ENVIO, RETORNO, MANUTENCAO, RETORNO_MANUTENCAO, PERDA, RETORNO_PERDA
+from locacao import numero_dia
+
+SEMANAS_PADRAO = 12
+# Dia previsto de retorno de obras ativas sem data_fim: fora de qualquer horizonte
+SEM_PREVISAO = np.iinfo(np.int64).max // 4
+
+# tipo_id -> (coluna do saldo por equipamento: enviado, manutenção, perdido; sinal); transferências não alteram saldos
+EFEITO_TIPO = {
+    ENVIO: (0, 1), RETORNO: (0, -1),
+    MANUTENCAO: (1, 1), RETORNO_MANUTENCAO: (1, -1),
+    PERDA: (2, 1), RETORNO_PERDA: (2, -1),
+}
+_COLUNA = np.zeros(len(TIPOS_MOVIMENTACAO) + 1, dtype=np.int64)
+_SINAL = np.zeros(len(TIPOS_MOVIMENTACAO) + 1, dtype=np.int64)
+for _tipo, (_coluna, _sinal) in EFEITO_TIPO.items():
+    _COLUNA[_tipo], _SINAL[_tipo] = _coluna, _sinal
+
+
+def _somar_por_chave(chaves, valores):
+    """Agrupa valores repetidos por chave (linhas de `chaves`): (chaves únicas ordenadas, somas), descartando
+    somas zero"""
+    unicas, posicao = np.unique(chaves, axis=0, return_inverse=True)
+    somas = np.bincount(posicao.reshape(-1), weights=valores, minlength=len(unicas)).astype(np.int64)
+    manter = somas != 0
+    return unicas[manter], somas[manter]
+
+
+def _alinhar(ids, valores, novos_ids, valor=0):
+    """Valores indexados pelos ids ordenados `novos_ids` (que contêm `ids`); ids novos recebem `valor`.
+
+    Os ids são esparsos (shards começam em N << 32), então os vetores guardam só os ids existentes.
+    """
+    alinhados = np.full((len(novos_ids),) + valores.shape[1:], valor, dtype=valores.dtype)
+    alinhados[np.searchsorted(novos_ids, ids)] = valores
+    return alinhados
+
+
+def _buscar(ids, valores, procurados, valor):
+    """valores do id de cada procurado, ou `valor` para os ausentes de `ids` (ordenados)"""
+    if not len(ids):
+        return np.full(len(procurados), valor, dtype=np.int64)
+    posicao = np.minimum(np.searchsorted(ids, procurados), len(ids) - 1)
+    return np.where(ids[posicao] == procurados, valores[posicao], valor)
+
+
+def atrasos_retorno(historico):
+    """Atraso típico (mediana, em dias) entre a data_fim prevista e o último retorno das obras já devolvidas.
+
+    Retorna ({cliente_id: atraso}, atraso geral); sem histórico o atraso geral é 0.
+    """
+    encerradas = [(cliente, ultimo - fim) for _, cliente, _, fim, ultimo, saldo in historico
+                  if fim is not None and ultimo is not None and saldo <= 0]
+    if not encerradas:
+        return {}, 0
+    clientes = np.array([c if c is not None else -1 for c, _ in encerradas], dtype=np.int64)
+    atrasos = np.array([a for _, a in encerradas], dtype=np.int64)
+    por_cliente = {int(c): int(np.median(atrasos[clientes == c])) for c in np.unique(clientes) if c >= 0}
+    return por_cliente, int(np.median(atrasos))
+
+
+class ProjecaoDisponibilidade:
+    """Saldos em obra por (obra, equipamento) mantidos incrementalmente e projeção semanal da disponibilidade.
+
+    A cada `atualizar` apenas as movimentações novas (id maior que o último lido) são aplicadas;
+    se houve alteração ou exclusão de movimentações (a versão avançou mais que o número de linhas
+    novas) os saldos são reconstruídos do zero. Obras e estoque são recarregados quando suas tabelas mudam.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.versoes = {}
+        self.ultimo_id = 0
+        # Saldo em obra por par, chaves = linhas (obra_id, equipamento_id) ordenadas
+        self.chaves = np.empty((0, 2), dtype=np.int64)
+        self.saldos = np.empty(0, dtype=np.int64)
+        # Por equipamento (ids ordenados em equipamentos_status): enviado, em manutenção, perdido
+        self.equipamentos_status = np.empty(0, dtype=np.int64)
+        self.status = np.zeros((0, 3), dtype=np.int64)
+        # Quantidade cadastrada por equipamento (ids ordenados em equipamentos_estoque)
+        self.equipamentos_estoque = np.empty(0, dtype=np.int64)
+        self.estoque = np.empty(0, dtype=np.int64)
+        # Por obra (ids ordenados em obras): dia previsto do retorno (data_fim + atraso histórico)
+        self.obras = np.empty(0, dtype=np.int64)
+        self.retorno_previsto = np.empty(0, dtype=np.int64)
+        self.atraso_geral = 0
+        self._projecoes = {}
+
+    def atualizar(self):
+        """Aplica o que mudou desde a última leitura; retorna True se algo mudou"""
+        versoes = dict(self.db.get_versoes_dados(("movimentacoes", "obras", "equipamentos")))
+        mudou = reconstruiu = False
+        novas = versoes["movimentacoes"] - self.versoes.get("movimentacoes", 0)
+        if "movimentacoes" not in self.versoes or novas:
+            ultimo_id, total, linhas = self.db.get_movimentacoes_agregadas(self.ultimo_id)
+            if "movimentacoes" in self.versoes and total == novas:
+                self.ultimo_id = ultimo_id
+                self._aplicar(linhas)
+            else:
+                self._reconstruir_saldos()
+                reconstruiu = True
+            mudou = True
+        # O atraso histórico (que varre o histórico de retornos) só é recalculado quando as obras
+        # mudam ou na reconstrução; movimentações novas não o deslocam de forma perceptível
+        if reconstruiu or versoes["obras"] != self.versoes.get("obras"):
+            self._carregar_obras()
+            mudou = True
+        if versoes["equipamentos"] != self.versoes.get("equipamentos"):
+            self._carregar_estoque()
+            mudou = True
+        self.versoes = versoes
+        if mudou:
+            self._projecoes.clear()
+        return mudou
+
+    def _reconstruir_saldos(self):
+        self.chaves = np.empty((0, 2), dtype=np.int64)
+        self.saldos = np.empty(0, dtype=np.int64)
+        self.equipamentos_status = np.empty(0, dtype=np.int64)
+        self.status = np.zeros((0, 3), dtype=np.int64)
+        self.ultimo_id, _, linhas = self.db.get_movimentacoes_agregadas(0)
+        self._aplicar(linhas)
+
+    def _aplicar(self, linhas):
+        if not linhas:
+            return
+        dados = np.array([(o if o is not None else -1, e, t, q) for o, e, t, q in linhas], dtype=np.int64)
+        obra, equip, tipo, quantidade = dados.T
+        delta = _SINAL[tipo] * quantidade
+
+        ids = np.union1d(self.equipamentos_status, equip)
+        self.status = _alinhar(self.equipamentos_status, self.status, ids)
+        self.equipamentos_status = ids
+        np.add.at(self.status, (np.searchsorted(ids, equip), _COLUNA[tipo]), delta)
+
+        em_obra = (obra >= 0) & ((tipo == ENVIO) | (tipo == RETORNO))
+        chaves = np.column_stack([obra[em_obra], equip[em_obra]])
+        self.chaves, self.saldos = _somar_por_chave(np.concatenate([self.chaves, chaves]),
+                                                    np.concatenate([self.saldos, delta[em_obra]]))
+
+    def _carregar_obras(self):
+        historico = self.db.get_historico_retorno_obras()
+        por_cliente, self.atraso_geral = atrasos_retorno(historico)
+        previstos = {}
+        for obra_id, cliente_id, status, dia_fim, _, _ in historico:
+            if dia_fim is not None:
+                previstos[obra_id] = dia_fim + por_cliente.get(cliente_id, self.atraso_geral)
+            elif status == "concluida":
+                # Obra encerrada sem data: o saldo que resta já deveria ter voltado
+                previstos[obra_id] = 0
+        self.obras = np.array(sorted(previstos), dtype=np.int64)
+        self.retorno_previsto = np.array([previstos[obra_id] for obra_id in self.obras.tolist()], dtype=np.int64)
+
+    def _carregar_estoque(self):
+        equipamentos = sorted((e['id'], e['quantidade']) for e in self.db.get_equipamentos())
+        self.equipamentos_estoque = np.array([id for id, _ in equipamentos], dtype=np.int64)
+        self.estoque = np.array([quantidade for _, quantidade in equipamentos], dtype=np.int64)
+
+    def projetar(self, semanas=SEMANAS_PADRAO, hoje=None):
+        """Disponível hoje e ao fim de cada uma das próximas `semanas` semanas, para todos os equipamentos.
+
+        Retorno vencido (previsto até hoje) conta a partir da primeira semana. Retorna um DataFrame
+        indexado por equipamento_id com uma coluna por data.
+        """
+        hoje = hoje or date.today()
+        chave = (hoje, semanas)
+        if chave not in self._projecoes:
+            self._projecoes[chave] = self._calcular(semanas, hoje)
+        return self._projecoes[chave]
+
+    def _calcular(self, semanas, hoje):
+        # Linhas = equipamentos cadastrados ou movimentados, pela posição do id em `todos`
+        todos = np.union1d(self.equipamentos_estoque, self.equipamentos_status)
+        estoque = _alinhar(self.equipamentos_estoque, self.estoque, todos, -1)
+        status = _alinhar(self.equipamentos_status, self.status, todos)
+        disponivel = np.clip(estoque - status.sum(axis=1), 0, None)
+
+        obra, equip = self.chaves[:, 0], self.chaves[:, 1]
+        previsto = _buscar(self.obras, self.retorno_previsto, obra, SEM_PREVISAO)
+        semana = np.maximum(1, -(-(previsto - numero_dia(hoje)) // 7))
+        dentro = (semana <= semanas) & (self.saldos > 0)
+
+        retornos = np.zeros((len(todos), semanas + 1), dtype=np.int64)
+        np.add.at(retornos, (np.searchsorted(todos, equip[dentro]), semana[dentro]), self.saldos[dentro])
+        projecao = disponivel[:, None] + np.cumsum(retornos, axis=1)
+
+        cadastrados = np.flatnonzero(estoque >= 0)
+        ids = todos[cadastrados]
+        datas = [hoje + timedelta(weeks=k) for k in range(semanas + 1)]
+        resultado = pd.DataFrame(projecao[cadastrados], index=pd.Index(ids, name="equipamento_id"), columns=datas)
+        return resultado
+
+
+_projecoes = {}
+_lock_projecoes = threading.Lock()
+
+
+def projecao_disponibilidade(db):
+    """Projeção compartilhada por banco, atualizada incrementalmente a cada chamada"""
+    with _lock_projecoes:
+        projecao = _projecoes.get(db.db_path)
+        if projecao is None:
+            projecao = _projecoes[db.db_path] = ProjecaoDisponibilidade(db)
+        projecao.atualizar()
+        return projecao
+
+
+def disponibilidade_projetada(db, semanas=SEMANAS_PADRAO, hoje=None):
+    """Quantidade disponível esperada por equipamento hoje e ao fim de cada uma das próximas semanas"""
+    projecao = projecao_disponibilidade(db)
+    with _lock_projecoes:
+        return projecao.projetar(semanas, hoje).copy()
+
+
+def disponivel_em(db, equipamento_id, data, hoje=None):
+    """Quantidade esperada disponível de um equipamento em uma data futura (para orçamentos)"""
+    hoje = hoje or date.today()
+    semanas = max(1, -(-(data - hoje).days // 7))
+    projecao = disponibilidade_projetada(db, semanas, hoje)
+    if equipamento_id not in projecao.index:
+        return 0
+    # Última semana encerrada até a data pedida
+    colunas = [d for d in projecao.columns if d <= data] or projecao.columns[:1]
+    return int(projecao.loc[equipamento_id, colunas[-1]])
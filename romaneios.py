@@ -0,0 +1,199 @@
+"""Notas de entrega (PDF) dos romaneios.
+
+Cada romaneio vira um PDF A4 com o cabeçalho (número, tipo, data, obra, cliente, depósitos, responsável),
+a lista de equipamentos e os totais já guardados no romaneio. O PDF é montado aqui mesmo, só com texto
+nas fontes padrão Helvetica, sem biblioteca externa. Lotes grandes são divididos em trechos entre os
+processos de um pool; cada processo abre o banco somente leitura e devolve os PDFs do seu trecho.
+
+    python romaneios.py --banco cmms_andaimes.db --ids 1-500 --pasta notas
+"""
+import argparse
+import io
+import os
+import sys
+import zipfile
+from datetime import date
+
+from database import DatabaseManager
+from tarefas import WORKERS_PADRAO, pool_processos
+
+# Romaneios por tarefa do pool: cada nota leva menos de 1 ms, e subir um processo com spawn custa
+# algumas centenas de ms; lotes menores que um trecho são gerados no próprio processo
+TRECHO = 500
+# Página A4 e margem, em pontos
+LARGURA, ALTURA, MARGEM = 595, 842, 50
+# Colunas da lista de equipamentos: (título, x, caracteres)
+COLUNAS = (("Código", 50, 12), ("Descrição", 125, 52), ("Medida", 420, 12), ("Qtd.", 505, 8))
+ALTURA_LINHA = 15
+
+
+def _texto_pdf(texto):
+    """String literal do PDF: WinAnsi (acentos do português), com parênteses e barras escapados"""
+    bruto = str(texto).encode("cp1252", errors="replace")
+    return bruto.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def escrever_pdf(paginas):
+    """PDF com uma página A4 por item de `paginas`, cada uma uma lista de (x, y, tamanho, texto, negrito)"""
+    # Objetos: 1 catálogo, 2 árvore de páginas, 3 e 4 fontes, depois (página, conteúdo) de cada página
+    paginas_ids = [5 + 2 * i for i in range(len(paginas))]
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % n for n in paginas_ids), len(paginas)),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    for pagina_id, textos in zip(paginas_ids, paginas):
+        conteudo = b"".join(b"BT /%s %d Tf %d %d Td (%s) Tj ET\n" % (b"F2" if negrito else b"F1", tamanho, x, y,
+                                                                      _texto_pdf(texto))
+                            for x, y, tamanho, texto, negrito in textos)
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                       b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                       % (LARGURA, ALTURA, pagina_id + 1))
+        objetos.append(b"<< /Length %d >>\nstream\n%sendstream" % (len(conteudo), conteudo))
+
+    saida = bytearray(b"%PDF-1.4\n")
+    posicoes = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posicoes.append(len(saida))
+        saida += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    inicio_xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    saida += b"".join(b"%010d 00000 n \n" % posicao for posicao in posicoes)
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(saida)
+
+
+def _cortar(texto, caracteres):
+    texto = "" if texto is None else str(texto)
+    return texto if len(texto) <= caracteres else texto[:caracteres - 1] + "…"
+
+
+def _moeda(valor):
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def nota_entrega(romaneio, itens):
+    """PDF da nota de entrega de um romaneio (cabeçalho de get_romaneio, linhas de get_itens_romaneio)"""
+    titulo = f"Romaneio nº {romaneio['id']} - {romaneio['tipo'].replace('_', ' ').capitalize()}"
+    data = date.fromisoformat(romaneio['data_movimentacao']).strftime("%d/%m/%Y")
+    cabecalho = [f"Data: {data}"]
+    if romaneio['obra_nome']:
+        cabecalho.append(f"Obra: {romaneio['obra_nome']}  ·  Cliente: {romaneio['cliente_nome'] or '-'}")
+        if romaneio['obra_endereco']:
+            cabecalho.append(f"Endereço: {romaneio['obra_endereco']}")
+    depositos = f"Depósito: {romaneio['deposito_nome']}"
+    if romaneio['deposito_destino_nome']:
+        depositos += f"  ->  {romaneio['deposito_destino_nome']}"
+    cabecalho += [depositos, f"Responsável: {romaneio['responsavel'] or '-'}"]
+    if romaneio['observacoes']:
+        cabecalho.append(f"Observações: {romaneio['observacoes']}")
+
+    paginas, textos, y = [], [], 0
+
+    def nova_pagina(continuacao):
+        nonlocal textos, y
+        textos = [(MARGEM, ALTURA - MARGEM, 16, titulo + (" (continuação)" if continuacao else ""), True)]
+        paginas.append(textos)
+        y = ALTURA - MARGEM - 28
+        if not continuacao:
+            for linha in cabecalho:
+                textos.append((MARGEM, y, 10, _cortar(linha, 95), False))
+                y -= ALTURA_LINHA
+            y -= 10
+        textos.extend((x, y, 10, nome, True) for nome, x, _ in COLUNAS)
+        y -= ALTURA_LINHA + 3
+
+    nova_pagina(False)
+    for item in itens:
+        # Reserva o espaço dos totais e assinaturas na última página
+        if y < MARGEM + 30:
+            nova_pagina(True)
+        valores = (item['codigo'], item['descricao'], item['medida'], item['quantidade'])
+        textos.extend((x, y, 10, _cortar(valor, caracteres), False)
+                      for (_, x, caracteres), valor in zip(COLUNAS, valores))
+        y -= ALTURA_LINHA
+    if y < MARGEM + 110:
+        nova_pagina(True)
+    y -= 10
+    textos.append((MARGEM, y, 11, f"Total: {romaneio['total_linhas']} equipamento(s), {romaneio['total_itens']} peça(s)"
+                                  f"  ·  Diária total: {_moeda(romaneio['valor_diario'])}", True))
+    y -= 45
+    textos.append((MARGEM, y, 10, "Entregue por: ______________________________", False))
+    textos.append((320, y, 10, "Recebido por: ______________________", False))
+    textos.append((320, y - 25, 10, "Data: ____/____/________", False))
+
+    for numero, pagina in enumerate(paginas, start=1):
+        pagina.append((LARGURA - MARGEM - 60, MARGEM - 20, 8, f"Página {numero} de {len(paginas)}", False))
+    return escrever_pdf(paginas)
+
+
+def nota_do_romaneio(db, romaneio_id):
+    """PDF do romaneio lido do banco (cabeçalho pela chave primária, linhas pelo índice de romaneio_id)"""
+    romaneio = db.get_romaneio(romaneio_id)
+    if romaneio is None:
+        raise ValueError(f"Romaneio {romaneio_id} não encontrado")
+    return nota_entrega(romaneio, db.get_itens_romaneio(romaneio_id))
+
+
+def _gerar_trecho(db_path, romaneio_ids):
+    """Executado nos processos do pool: [(romaneio_id, pdf)] de um trecho do lote"""
+    db = DatabaseManager(db_path).somente_leitura()
+    return [(romaneio_id, nota_do_romaneio(db, romaneio_id)) for romaneio_id in romaneio_ids]
+
+
+def gerar_notas(db_path, romaneio_ids, workers=None, trecho=TRECHO):
+    """{romaneio_id: pdf} de vários romaneios; lotes de mais de um trecho são divididos entre processos"""
+    ids = list(dict.fromkeys(romaneio_ids))
+    trechos = [ids[inicio:inicio + trecho] for inicio in range(0, len(ids), trecho)]
+    workers = min(workers or WORKERS_PADRAO, len(trechos))
+    if workers <= 1:
+        return dict(par for parte in trechos for par in _gerar_trecho(db_path, parte))
+    with pool_processos(workers) as pool:
+        futuros = [pool.submit(_gerar_trecho, db_path, parte) for parte in trechos]
+        return dict(par for futuro in futuros for par in futuro.result())
+
+
+def nome_arquivo(romaneio_id):
+    return f"romaneio_{romaneio_id}.pdf"
+
+
+def zip_notas(notas):
+    """Arquivo ZIP com um PDF por romaneio"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as arquivo:
+        for romaneio_id, pdf in sorted(notas.items()):
+            arquivo.writestr(nome_arquivo(romaneio_id), pdf)
+    return buffer.getvalue()
+
+
+def _faixas(texto):
+    """Faixas como "1-10,15" -> [1, ..., 10, 15]"""
+    ids = []
+    for parte in texto.split(","):
+        inicio, _, fim = parte.strip().partition("-")
+        ids += range(int(inicio), int(fim or inicio) + 1)
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--banco", default="cmms_andaimes.db")
+    parser.add_argument("--ids", required=True, help="Números dos romaneios, ex.: 1-200,350")
+    parser.add_argument("--pasta", default="notas_entrega")
+    parser.add_argument("--workers", type=int, default=WORKERS_PADRAO)
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager(args.banco)
+    existentes = [romaneio_id for romaneio_id in _faixas(args.ids) if db.get_romaneio(romaneio_id)]
+    notas = gerar_notas(args.banco, existentes, args.workers)
+    os.makedirs(args.pasta, exist_ok=True)
+    for romaneio_id, pdf in notas.items():
+        with open(os.path.join(args.pasta, nome_arquivo(romaneio_id)), "wb") as arquivo:
+            arquivo.write(pdf)
+    print(f"{len(notas)} nota(s) em {args.pasta}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""Modo com um banco por cliente ou grupo de clientes (shards).
+
+Cada shard é um banco completo do app (mesmo schema de database.py), com frota, depósitos e
+movimentações próprios, e gravações em shards diferentes não disputam o mesmo arquivo. O catálogo
+`catalogo.db` na pasta dos shards guarda o nome e o arquivo de cada um. Os ids gerados no shard N
+começam em N << BITS_SHARD: o id de um cliente, obra, equipamento ou movimentação já diz em que banco
+ele está, e o roteador encaminha a operação sem consultar nada. O shard 0 é reservado para o banco
+único que já existia (`registrar_banco_existente`), cujos ids ficam todos abaixo de 1 << BITS_SHARD.
+
+Relatórios de todas as bases rodam em paralelo, uma thread por shard com a sua conexão (o SQLite
+libera o GIL durante as consultas), e os resultados são combinados aqui.
+
+    python shards.py --pasta shards --criar "Construtora X"
+    python shards.py --pasta shards --listar
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from database import DatabaseManager, MOVIMENTACAO_LOCAL
+
+PASTA_PADRAO = os.environ.get("CMMS_SHARDS_DIR")
+CATALOGO = "catalogo.db"
+BITS_SHARD = 32
+# Acima disso os ids alcançariam a faixa das movimentações gravadas offline nos tablets
+MAXIMO_SHARDS = MOVIMENTACAO_LOCAL >> BITS_SHARD
+# Colunas somadas no total da frota (get_estoque_snapshot de cada shard)
+CAMPOS_FROTA = ("quantidade", "enviado", "em_manutencao", "perdido", "disponivel")
+
+
+def shard_do_id(registro_id):
+    """Shard em que o registro foi criado"""
+    return int(registro_id) >> BITS_SHARD
+
+
+class RoteadorShards:
+    """Encaminha cadastros e movimentações para o shard certo e consolida relatórios de todos os shards"""
+
+    def __init__(self, pasta, workers=None):
+        os.makedirs(pasta, exist_ok=True)
+        self.pasta = pasta
+        self.catalogo = os.path.join(pasta, CATALOGO)
+        self.workers = workers or int(os.environ.get("CMMS_SHARDS_WORKERS", "0")) or min(32, (os.cpu_count() or 1) + 4)
+        self._bancos = {}
+        self._trava = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shard")
+        with closing(sqlite3.connect(self.catalogo)) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    id INTEGER PRIMARY KEY,
+                    nome TEXT NOT NULL UNIQUE,
+                    arquivo TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+
+    @classmethod
+    def do_ambiente(cls):
+        """Roteador da pasta em CMMS_SHARDS_DIR, ou None quando o modo com shards está desligado"""
+        return cls(PASTA_PADRAO) if PASTA_PADRAO else None
+
+    # Catálogo
+    def get_shards(self):
+        with closing(sqlite3.connect(self.catalogo)) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute("SELECT id, nome, arquivo FROM shards ORDER BY id")]
+
+    def _caminho(self, arquivo):
+        return arquivo if os.path.isabs(arquivo) else os.path.join(self.pasta, arquivo)
+
+    def criar_shard(self, nome):
+        """Cria o banco de um novo cliente/grupo; retorna o id do shard"""
+        with closing(sqlite3.connect(self.catalogo, timeout=30)) as conn:
+            # Serializa criações concorrentes (o próximo id vem do catálogo)
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM shards WHERE nome = ?", (nome,)).fetchone():
+                raise ValueError(f"Já existe um shard chamado {nome!r}")
+            shard_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM shards").fetchone()[0]
+            if shard_id >= MAXIMO_SHARDS:
+                raise ValueError(f"Limite de {MAXIMO_SHARDS - 1} shards atingido")
+            arquivo = f"shard_{shard_id:03d}.db"
+            db = DatabaseManager(self._caminho(arquivo))
+            self._iniciar_sequencias(db, shard_id)
+            conn.execute("INSERT INTO shards (id, nome, arquivo) VALUES (?, ?, ?)", (shard_id, nome, arquivo))
+            conn.commit()
+        with self._trava:
+            self._bancos[shard_id] = db
+        return shard_id
+
+    def _iniciar_sequencias(self, db, shard_id):
+        """Faz os ids AUTOINCREMENT do shard começarem em shard_id << BITS_SHARD"""
+        base = (shard_id << BITS_SHARD) - 1
+        with db.get_connection() as conn:
+            tabelas = [row[0] for row in conn.execute("""
+                SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'
+            """)]
+            for tabela in tabelas:
+                if not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                                    (base, tabela)).rowcount:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (tabela, base))
+            conn.commit()
+
+    def registrar_banco_existente(self, caminho, nome):
+        """Registra o banco único anterior ao modo com shards como shard 0 (os ids dele já são dessa faixa)"""
+        with closing(sqlite3.connect(self.catalogo)) as conn:
+            conn.execute("INSERT INTO shards (id, nome, arquivo) VALUES (0, ?, ?)", (nome, os.path.abspath(caminho)))
+            conn.commit()
+        return 0
+
+    def shard_do_grupo(self, nome):
+        """Shard do cliente/grupo com esse nome, criado se ainda não existir"""
+        with closing(sqlite3.connect(self.catalogo)) as conn:
+            linha = conn.execute("SELECT id FROM shards WHERE nome = ?", (nome,)).fetchone()
+        return linha[0] if linha else self.criar_shard(nome)
+
+    # Roteamento
+    def db(self, shard_id):
+        """DatabaseManager do shard (um por shard, reaproveitado entre chamadas)"""
+        with self._trava:
+            db = self._bancos.get(shard_id)
+        if db is not None:
+            return db
+        with closing(sqlite3.connect(self.catalogo)) as conn:
+            linha = conn.execute("SELECT arquivo FROM shards WHERE id = ?", (shard_id,)).fetchone()
+        if not linha:
+            raise ValueError(f"Shard {shard_id} não cadastrado")
+        db = DatabaseManager(self._caminho(linha[0]))
+        if shard_id:
+            # Tabelas criadas por migrações posteriores à criação do shard (ex.: romaneios) entram na faixa dele
+            self._iniciar_sequencias(db, shard_id)
+        with self._trava:
+            return self._bancos.setdefault(shard_id, db)
+
+    def para_registro(self, registro_id):
+        """Banco em que está o cliente, obra, equipamento ou movimentação com esse id"""
+        return self.db(shard_do_id(registro_id))
+
+    def _shard_unico(self, *ids):
+        shards = {shard_do_id(registro_id) for registro_id in ids if registro_id is not None}
+        if len(shards) != 1:
+            raise ValueError("Equipamento e obra pertencem a bases diferentes")
+        return shards.pop()
+
+    def add_cliente(self, nome, contato, telefone, email, endereco, grupo=None):
+        """Cadastra o cliente no shard do grupo (sem grupo, um shard só dele)"""
+        return self.db(self.shard_do_grupo(grupo or nome)).add_cliente(nome, contato, telefone, email, endereco)
+
+    def add_obra(self, nome, cliente_id, endereco, responsavel, telefone, data_inicio, data_fim):
+        return self.para_registro(cliente_id).add_obra(nome, cliente_id, endereco, responsavel, telefone,
+                                                       data_inicio, data_fim)
+
+    def add_equipamento(self, shard_id, descricao, codigo, medida, quantidade, observacoes, valor_diaria=0,
+                        deposito_id=None):
+        return self.db(shard_id).add_equipamento(descricao, codigo, medida, quantidade, observacoes, valor_diaria,
+                                                 deposito_id)
+
+    def add_movimentacao(self, tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes, *args, **kwargs):
+        """add_movimentacao no shard do equipamento e da obra (que precisam ser do mesmo shard)"""
+        db = self.db(self._shard_unico(equipamento_id, obra_id))
+        return db.add_movimentacao(tipo, equipamento_id, obra_id, quantidade, responsavel, observacoes,
+                                   *args, **kwargs)
+
+    # Relatórios de todos os shards
+    def em_paralelo(self, funcao):
+        """{shard_id: funcao(db)} para todos os shards, executados em paralelo pelo pool de leitura de cada um"""
+        shard_ids = [shard['id'] for shard in self.get_shards()]
+        futuros = [self._executor.submit(lambda shard_id=shard_id: funcao(self.db(shard_id).somente_leitura()))
+                   for shard_id in shard_ids]
+        return {shard_id: futuro.result() for shard_id, futuro in zip(shard_ids, futuros)}
+
+    def get_kpis(self, data_inicio, data_fim):
+        """KPIs do dashboard executivo somados em todos os shards"""
+        totais = {'total_equipamentos': 0, 'total_clientes': 0, 'obras_ativas': 0, 'movimentacoes': 0}
+        for resultado in self.em_paralelo(lambda db: db.get_resumo_dashboard(data_inicio, data_fim)).values():
+            for chave, valor in resultado.items():
+                totais[chave] += valor
+        return totais
+
+    def get_movimentacoes_por_dia(self, data_inicio, data_fim):
+        totais = {}
+        for resultado in self.em_paralelo(lambda db: db.get_movimentacoes_por_dia(data_inicio, data_fim)).values():
+            for linha in resultado:
+                chave = (linha['data'], linha['tipo'])
+                totais[chave] = totais.get(chave, 0) + linha['quantidade']
+        return [{'data': data, 'tipo': tipo, 'quantidade': quantidade}
+                for (data, tipo), quantidade in sorted(totais.items())]
+
+    def get_equipamentos_status_summary(self):
+        totais = {}
+        for resultado in self.em_paralelo(lambda db: db.get_equipamentos_status_summary()).values():
+            for linha in resultado:
+                totais[linha['status']] = totais.get(linha['status'], 0) + (linha['quantidade'] or 0)
+        return [{'status': status, 'quantidade': quantidade} for status, quantidade in totais.items()]
+
+    def get_frota(self):
+        """Saldos da frota somados por descrição do equipamento (cada shard tem o seu cadastro)"""
+        frota = {}
+        for snapshot in self.em_paralelo(lambda db: db.get_estoque_snapshot()).values():
+            for saldo in snapshot.values():
+                total = frota.setdefault(saldo['descricao'], dict.fromkeys(CAMPOS_FROTA, 0) | {'shards': 0})
+                for campo in CAMPOS_FROTA:
+                    total[campo] += saldo[campo]
+                total['shards'] += 1
+        return [{'descricao': descricao, **total} for descricao, total in sorted(frota.items())]
+
+    def get_clientes(self):
+        clientes = [dict(cliente, shard_id=shard_id)
+                    for shard_id, lista in self.em_paralelo(lambda db: db.get_clientes()).items() for cliente in lista]
+        return sorted(clientes, key=lambda c: c['nome'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pasta", default=PASTA_PADRAO, required=PASTA_PADRAO is None)
+    parser.add_argument("--criar", metavar="NOME", help="Criar o shard de um cliente ou grupo")
+    parser.add_argument("--registrar-existente", metavar="BANCO", help="Registrar o banco único atual como shard 0")
+    parser.add_argument("--listar", action="store_true")
+    args = parser.parse_args(argv)
+
+    roteador = RoteadorShards(args.pasta)
+    if args.registrar_existente:
+        roteador.registrar_banco_existente(args.registrar_existente, os.path.basename(args.registrar_existente))
+    if args.criar:
+        print(roteador.criar_shard(args.criar))
+    if args.listar:
+        print(json.dumps(roteador.get_shards(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
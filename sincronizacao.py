@@ -0,0 +1,84 @@
+"""Sincronização offline dos tablets de campo com o servidor.
+
+O tablet trabalha sobre uma cópia local do banco (mesmo schema de database.py) e, quando há conexão:
+
+1. envia as movimentações gravadas offline; o servidor confere cada uma contra os próprios saldos
+   (ajustando ou rejeitando as que não cabem) e devolve o estoque atual dos depósitos envolvidos;
+2. recebe, em lotes, o delta do log `alteracoes` desde a última sequência confirmada.
+
+As chamadas ao servidor recebem e devolvem apenas listas/dicionários (JSON); em produção cada método de
+`TransporteLocal` corresponde a um endpoint HTTP.
+"""
+import json
+
+from database import DatabaseManager
+
+LOTE_PADRAO = 5000
+
+
+def provisionar_tablet(db_servidor, destino, dispositivo):
+    """Cria o banco local de um tablet a partir do servidor e retorna o DatabaseManager dele"""
+    db_servidor.criar_copia_local(destino, dispositivo)
+    return DatabaseManager(destino)
+
+
+class TransporteLocal:
+    """Servidor acessado no mesmo processo, com a ida e a volta serializadas em JSON como na rede"""
+
+    def __init__(self, db_servidor, serializar=True):
+        self.db = db_servidor
+        self.serializar = serializar
+        self.bytes_trafegados = 0
+
+    def _trafegar(self, dados):
+        if not self.serializar:
+            return dados
+        texto = json.dumps(dados, ensure_ascii=False)
+        self.bytes_trafegados += len(texto.encode("utf-8"))
+        return json.loads(texto)
+
+    def alteracoes(self, desde_seq, limite=LOTE_PADRAO):
+        return self._trafegar(self.db.get_alteracoes(self._trafegar(desde_seq), limite))
+
+    def enviar(self, dispositivo, movimentacoes):
+        return self._trafegar(self.db.aplicar_movimentacoes_remotas(dispositivo, self._trafegar(movimentacoes)))
+
+
+class ClienteSincronizacao:
+    """Lado do tablet: envia as movimentações pendentes e aplica os deltas recebidos"""
+
+    def __init__(self, db_local, servidor):
+        self.db = db_local
+        self.servidor = servidor
+
+    def enviar_pendentes(self):
+        """Envia as movimentações offline; retorna os resultados do servidor (aceita/ajustada/rejeitada)"""
+        pendentes = self.db.get_movimentacoes_locais()
+        if not pendentes:
+            return []
+        dispositivo = self.db.get_estado_sincronizacao()['dispositivo']
+        # Se a resposta se perder, o reenvio é reconhecido pelo servidor (mesmo dispositivo e id_local)
+        resposta = self.servidor.enviar(dispositivo, pendentes)
+        self.db.confirmar_movimentacoes_locais([mov['id_local'] for mov in pendentes], resposta['saldos'],
+                                               resposta.get('manutencoes'))
+        return resposta['resultados']
+
+    def receber(self, limite=LOTE_PADRAO):
+        """Aplica os deltas do servidor até alcançá-lo; retorna o número de registros aplicados"""
+        aplicados = 0
+        while True:
+            desde_seq = self.db.get_estado_sincronizacao()['ultimo_seq_recebido']
+            pacote = self.servidor.alteracoes(desde_seq, limite)
+            aplicados += self.db.aplicar_alteracoes(pacote)
+            if not pacote['mais']:
+                return aplicados
+
+    def sincronizar(self, limite=LOTE_PADRAO):
+        """Envio seguido de recebimento (o delta já traz as movimentações aceitas com o id do servidor)"""
+        resultados = self.enviar_pendentes()
+        recebidos = self.receber(limite)
+        situacoes = {}
+        for resultado in resultados:
+            situacoes[resultado['situacao']] = situacoes.get(resultado['situacao'], 0) + 1
+        return {'enviadas': len(resultados), 'situacoes': situacoes, 'recebidos': recebidos,
+                'conflitos': [r for r in resultados if r['situacao'] != "aceita"]}
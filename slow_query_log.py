@@ -0,0 +1,324 @@
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from logging.handlers import RotatingFileHandler
+
+# Configuração padrão (pode ser sobrescrita por variáveis de ambiente)
+LIMIAR_PADRAO_MS = float(os.environ.get("CMMS_SLOW_QUERY_MS", "200"))
+AMOSTRAGEM_PADRAO = float(os.environ.get("CMMS_SLOW_QUERY_SAMPLE", "1.0"))
+ARQUIVO_PADRAO = os.environ.get("CMMS_SLOW_QUERY_LOG", "slow_queries.jsonl")
+TAMANHO_MAXIMO = 5 * 1024 * 1024
+QUANTIDADE_BACKUPS = 3
+# Tabelas de armazenamento lidas no lugar das views de compatibilidade: o resumo usa o nome da view
+TABELAS_LOGICAS = {"movimentacoes_dados": "movimentacoes"}
+
+# Contadores acumulados por thread (cada sessão do Streamlit roda em sua própria thread)
+_contadores = threading.local()
+
+
+def tempo_banco():
+    """Retorna (consultas, tempo total em ms) acumulados na thread atual"""
+    return getattr(_contadores, "consultas", 0), getattr(_contadores, "total_ms", 0.0)
+
+
+class SlowQueryLog:
+    """Registra em arquivo rotativo as consultas que excedem o limiar configurado"""
+
+    def __init__(self, arquivo=ARQUIVO_PADRAO, limiar_ms=LIMIAR_PADRAO_MS, amostragem=AMOSTRAGEM_PADRAO,
+                 tamanho_maximo=TAMANHO_MAXIMO, backups=QUANTIDADE_BACKUPS):
+        self.arquivo = arquivo
+        self.limiar_ms = limiar_ms
+        self.amostragem = amostragem
+        self._logger = logging.getLogger(f"cmms.slow_query.{os.path.abspath(arquivo)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(arquivo, maxBytes=tamanho_maximo, backupCount=backups,
+                                          encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def deve_registrar(self, duracao_ms):
+        if duracao_ms < self.limiar_ms:
+            return False
+        return self.amostragem >= 1 or random.random() < self.amostragem
+
+    def registrar(self, conn, sql, parametros, duracao_ms, metodo, muitos=False):
+        entrada = {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "duracao_ms": round(duracao_ms, 3),
+            "metodo": metodo,
+            "sql": normalizar_sql(sql),
+            "parametros": formato_parametros(parametros, muitos),
+            "plano": capturar_plano(conn, sql, parametros, muitos),
+        }
+        self._logger.info(json.dumps(entrada, ensure_ascii=False))
+
+
+def normalizar_sql(sql):
+    """Colapsa espaços para que a mesma consulta seja agrupada no resumo"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def formato_parametros(parametros, muitos=False):
+    """Descreve apenas o formato dos parâmetros (tipos e quantidade), nunca os valores"""
+    if muitos:
+        linhas = parametros if isinstance(parametros, (list, tuple)) else list(parametros)
+        primeira = formato_parametros(linhas[0]) if linhas else []
+        return {"linhas": len(linhas), "colunas": primeira}
+    if isinstance(parametros, dict):
+        return {chave: type(valor).__name__ for chave, valor in parametros.items()}
+    return [type(valor).__name__ for valor in (parametros or ())]
+
+
+def capturar_plano(conn, sql, parametros, muitos=False):
+    """Executa EXPLAIN QUERY PLAN no momento do registro"""
+    comando = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    if comando not in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE"):
+        return []
+    if muitos:
+        parametros = parametros[0] if parametros else ()
+    try:
+        cursor = sqlite3.Connection.cursor(conn)
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros or ())
+        return [row[3] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        return [f"erro: {e}"]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mede execução + leitura dos resultados de cada comando"""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._pendente = None
+
+    def _medir(self, funcao, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args)
+        finally:
+            if self._pendente is not None:
+                self._pendente[3] += (time.perf_counter() - inicio) * 1000
+
+    def execute(self, sql, parametros=()):
+        self.finalizar()
+        self._pendente = [sql, parametros, False, 0.0]
+        self._medir(super().execute, sql, parametros)
+        return self
+
+    def executemany(self, sql, parametros):
+        self.finalizar()
+        parametros = list(parametros)
+        self._pendente = [sql, parametros, True, 0.0]
+        self._medir(super().executemany, sql, parametros)
+        self.finalizar()
+        return self
+
+    def fetchone(self):
+        row = self._medir(super().fetchone)
+        if row is None:
+            self.finalizar()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._medir(super().fetchmany, size if size is not None else self.arraysize)
+        if not rows:
+            self.finalizar()
+        return rows
+
+    def fetchall(self):
+        rows = self._medir(super().fetchall)
+        self.finalizar()
+        return rows
+
+    def close(self):
+        self.finalizar()
+        super().close()
+
+    def finalizar(self):
+        """Fecha a medição do comando atual e registra se for lento"""
+        if self._pendente is None:
+            return
+        sql, parametros, muitos, duracao_ms = self._pendente
+        self._pendente = None
+        _contadores.consultas = getattr(_contadores, "consultas", 0) + 1
+        _contadores.total_ms = getattr(_contadores, "total_ms", 0.0) + duracao_ms
+        conn = self.connection
+        log = getattr(conn, "slow_query_log", None)
+        if log is not None and log.deve_registrar(duracao_ms):
+            log.registrar(conn, sql, parametros, duracao_ms, metodo_chamador(conn.owner), muitos)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexão cujos cursores são instrumentados para o log de consultas lentas"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slow_query_log = None
+        self.owner = None
+        self._cursores = weakref.WeakSet()
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, InstrumentedCursor):
+            self._cursores.add(cursor)
+        return cursor
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def fechar_cursores(self):
+        """Fecha os cursores abertos, encerrando leituras que ficaram no meio"""
+        for cursor in list(self._cursores):
+            cursor.close()
+
+    def close(self):
+        for cursor in list(self._cursores):
+            cursor.finalizar()
+        super().close()
+
+
+def metodo_chamador(owner):
+    """Nome do método do DatabaseManager que originou a consulta"""
+    if owner is None:
+        return None
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_locals.get("self") is owner and frame.f_code.co_name != "get_connection":
+            return f"{type(owner).__name__}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+# Resumo em linha de comando
+def carregar_entradas(arquivo):
+    """Lê o arquivo atual e os arquivos rotacionados (.1, .2, ...)"""
+    arquivos = [arquivo] + [f"{arquivo}.{i}" for i in range(1, 100)]
+    entradas = []
+    for caminho in arquivos:
+        if not os.path.exists(caminho):
+            if caminho != arquivo:
+                break
+            continue
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if linha:
+                    try:
+                        entradas.append(json.loads(linha))
+                    except json.JSONDecodeError:
+                        continue
+    return entradas
+
+
+def varreduras_completas(sql, plano):
+    """Tabelas lidas por inteiro (todo passo SCAN), resolvendo os aliases da consulta.
+
+    "SCAN x USING [COVERING] INDEX i" também lê todas as linhas, só que na ordem do índice: essas
+    aparecem como "x (índice i)".
+    """
+    palavras_chave = {"WHERE", "LEFT", "RIGHT", "INNER", "JOIN", "ON", "GROUP", "ORDER", "LIMIT", "HAVING", "USING"}
+    aliases = {}
+    for tabela, alias in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+        aliases[tabela] = tabela
+        if alias and alias.upper() not in palavras_chave:
+            aliases[alias] = tabela
+    tabelas = set()
+    for passo in plano:
+        partes = passo.split()
+        # SQLite < 3.36 escreve "SCAN TABLE x"; as versões novas, "SCAN x"
+        if partes[1:2] == ["TABLE"]:
+            del partes[1]
+        if len(partes) >= 2 and partes[0] == "SCAN" and partes[1:3] != ["CONSTANT", "ROW"]:
+            tabela = aliases.get(partes[1], partes[1])
+            tabela = TABELAS_LOGICAS.get(tabela, tabela)
+            if "INDEX" in partes[2:-1]:
+                tabela = f"{tabela} (índice {partes[partes.index('INDEX') + 1]})"
+            tabelas.add(tabela)
+    return sorted(tabelas)
+
+
+def resumir(entradas, ordenar_por="total"):
+    """Agrupa as entradas por comando SQL e calcula os piores casos"""
+    grupos = {}
+    for entrada in entradas:
+        grupo = grupos.setdefault(entrada["sql"], {
+            "sql": entrada["sql"],
+            "ocorrencias": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "duracoes": [],
+            "metodos": set(),
+            "plano": entrada.get("plano") or [],
+        })
+        grupo["ocorrencias"] += 1
+        grupo["total_ms"] += entrada["duracao_ms"]
+        grupo["duracoes"].append(entrada["duracao_ms"])
+        if entrada["duracao_ms"] >= grupo["max_ms"]:
+            grupo["max_ms"] = entrada["duracao_ms"]
+            grupo["plano"] = entrada.get("plano") or grupo["plano"]
+        if entrada.get("metodo"):
+            grupo["metodos"].add(entrada["metodo"])
+
+    resumo = []
+    for grupo in grupos.values():
+        duracoes = sorted(grupo.pop("duracoes"))
+        grupo["p95_ms"] = duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.95))]
+        grupo["media_ms"] = grupo["total_ms"] / grupo["ocorrencias"]
+        grupo["varreduras"] = varreduras_completas(grupo["sql"], grupo["plano"])
+        grupo["metodos"] = sorted(grupo["metodos"])
+        resumo.append(grupo)
+
+    chave = {"total": "total_ms", "max": "max_ms", "p95": "p95_ms", "ocorrencias": "ocorrencias"}[ordenar_por]
+    return sorted(resumo, key=lambda g: g[chave], reverse=True)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resumo do log de consultas lentas do CMMS")
+    parser.add_argument("arquivo", nargs="?", default=ARQUIVO_PADRAO, help="Arquivo do log (padrão: %(default)s)")
+    parser.add_argument("--top", type=int, default=10, help="Quantidade de consultas exibidas")
+    parser.add_argument("--ordenar", choices=["total", "max", "p95", "ocorrencias"], default="total")
+    parser.add_argument("--tabela", help="Mostrar apenas consultas com varredura completa desta tabela "
+                                         "(inclusive em ordem de índice)")
+    args = parser.parse_args(argv)
+
+    entradas = carregar_entradas(args.arquivo)
+    if not entradas:
+        print(f"Nenhuma consulta lenta registrada em {args.arquivo}")
+        return 0
+
+    resumo = resumir(entradas, args.ordenar)
+    if args.tabela:
+        tabela = TABELAS_LOGICAS.get(args.tabela, args.tabela)
+        resumo = [g for g in resumo if any(v.split(" (")[0] == tabela for v in g["varreduras"])]
+
+    print(f"{len(entradas)} consultas lentas, {len(resumo)} comandos distintos\n")
+    for posicao, grupo in enumerate(resumo[:args.top], start=1):
+        print(f"#{posicao}  total {grupo['total_ms']:.1f} ms | {grupo['ocorrencias']}x | "
+              f"média {grupo['media_ms']:.1f} ms | p95 {grupo['p95_ms']:.1f} ms | máx {grupo['max_ms']:.1f} ms")
+        if grupo["metodos"]:
+            print(f"    métodos: {', '.join(grupo['metodos'])}")
+        print(f"    sql: {grupo['sql'][:200]}")
+        for passo in grupo["plano"]:
+            print(f"    plano: {passo}")
+        if grupo["varreduras"]:
+            print(f"    varredura completa: {', '.join(grupo['varreduras'])}")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
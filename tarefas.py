@@ -0,0 +1,294 @@
+"""Fila de relatórios em segundo plano.
+
+Pedidos de relatório (tipo, período, filtros, formato) rodam em um pool de processos local, um núcleo
+por processo, fora do script do Streamlit. O estado de cada tarefa fica em `<banco>.tarefas.db` e o
+arquivo gerado em `<banco>.tarefas/`, então ambos sobrevivem a um restart do app; tarefas que ficaram
+pela metade voltam para a fila. Um pedido idêntico sobre os mesmos dados (mesmas versões em
+versoes_dados) reaproveita a tarefa existente, em andamento ou concluída.
+
+    python tarefas.py movimentacoes --parametros '{"data_inicio": "2023-01-01", "data_fim": "2025-12-31"}'
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+
+from database import DatabaseManager
+from processos import PoolProcessos
+
+WORKERS_PADRAO = int(os.environ.get("CMMS_TAREFAS_WORKERS", "0")) or os.cpu_count() or 1
+# Tarefas concluídas (e seus arquivos) mantidas por este número de dias
+DIAS_PADRAO = int(os.environ.get("CMMS_TAREFAS_DIAS", "7"))
+FORMATOS = {"csv": "text/csv", "json": "application/json"}
+ATIVAS = ("pendente", "executando")
+
+Relatorio = namedtuple("Relatorio", "titulo funcao tabelas")
+
+
+def pool_processos(workers):
+    """Pool de processos para os relatórios e as notas: os processos sobem a partir de um intermediário
+    (processos.py) e não importam o __main__ deste processo, que no Streamlit é a página."""
+    return PoolProcessos(workers)
+
+
+def caminho_tarefas(db_path):
+    """Estado e arquivos das tarefas ao lado do banco: cmms_andaimes.db -> cmms_andaimes.tarefas.db e .tarefas/"""
+    base, _ = os.path.splitext(db_path)
+    return f"{base}.tarefas.db", f"{base}.tarefas"
+
+
+def _data(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(str(valor))
+
+
+# Relatórios disponíveis: funções f(db, **parametros) -> DataFrame, executadas nos processos do pool
+def relatorio_movimentacoes(db, data_inicio, data_fim, tipos=None):
+    """Movimentações do período, como no CSV do Relatório de Movimentações"""
+    df = db.get_movimentacoes_df(_data(data_inicio), _data(data_fim))
+    if tipos:
+        df = df[df['tipo'].isin(tipos)]
+    return df
+
+
+def relatorio_utilizacao(db, data_inicio, data_fim, equipamento_id=None, granularidade="Mês"):
+    """Frações da frota em obra, manutenção, perdida e ociosa no período"""
+    from utilizacao import utilizacao
+    return utilizacao(db, _data(data_inicio), _data(data_fim), equipamento_id, granularidade).reset_index()
+
+
+def relatorio_perdas(db, data_inicio, data_fim, agrupar_por="obra"):
+    """Taxa de perda de todas as obras, clientes ou equipamentos no período"""
+    import pandas as pd
+    return pd.DataFrame(db.get_ranking_perdas(_data(data_inicio).strftime("%Y-%m"), _data(data_fim).strftime("%Y-%m"),
+                                              agrupar_por, limite=-1))
+
+
+RELATORIOS = {
+    "movimentacoes": Relatorio("Movimentações", relatorio_movimentacoes, ("movimentacoes", "equipamentos", "obras",
+                                                                           "depositos")),
+    "utilizacao": Relatorio("Utilização da frota", relatorio_utilizacao, ("movimentacoes", "equipamentos")),
+    "perdas": Relatorio("Taxa de perda", relatorio_perdas, ("movimentacoes", "obras", "clientes", "equipamentos")),
+}
+
+
+class EstadoTarefas:
+    """Tabela de tarefas em disco, compartilhada pelo app e pelos processos do pool"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tarefas (
+                    id INTEGER PRIMARY KEY,
+                    chave TEXT NOT NULL,
+                    relatorio TEXT NOT NULL,
+                    parametros TEXT NOT NULL,
+                    formato TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendente',
+                    criada_em REAL NOT NULL,
+                    iniciada_em REAL,
+                    concluida_em REAL,
+                    arquivo TEXT,
+                    linhas INTEGER,
+                    erro TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_chave ON tarefas (chave, estado)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_estado ON tarefas (estado)")
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def criar_ou_reaproveitar(self, chave, relatorio, parametros, formato):
+        """(id, nova): a tarefa com a mesma chave que ainda vale (ativa, ou concluída com o arquivo) ou uma nova"""
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for tarefa in conn.execute("""
+                SELECT id, estado, arquivo FROM tarefas
+                WHERE chave = ? AND estado IN ('pendente', 'executando', 'concluida')
+                ORDER BY id DESC
+            """, (chave,)).fetchall():
+                if tarefa['estado'] != "concluida" or os.path.exists(tarefa['arquivo']):
+                    conn.rollback()
+                    return tarefa['id'], False
+            tarefa_id = conn.execute("""
+                INSERT INTO tarefas (chave, relatorio, parametros, formato, criada_em) VALUES (?, ?, ?, ?, ?)
+            """, (chave, relatorio, parametros, formato, time.time())).lastrowid
+            conn.commit()
+            return tarefa_id, True
+        finally:
+            conn.close()
+
+    def atualizar(self, tarefa_id, **campos):
+        with self._conectar() as conn:
+            conn.execute(f"UPDATE tarefas SET {', '.join(f'{campo} = ?' for campo in campos)} WHERE id = ?",
+                         (*campos.values(), tarefa_id))
+
+    def get_tarefa(self, tarefa_id):
+        with self._conectar() as conn:
+            linha = conn.execute("SELECT * FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()
+        return dict(linha) if linha else None
+
+    def get_tarefas(self, ids=None, estados=None):
+        condicoes, parametros = [], []
+        if ids is not None:
+            condicoes.append(f"id IN ({', '.join('?' * len(ids))})")
+            parametros += list(ids)
+        if estados:
+            condicoes.append(f"estado IN ({', '.join('?' * len(estados))})")
+            parametros += list(estados)
+        where = " WHERE " + " AND ".join(condicoes) if condicoes else ""
+        with self._conectar() as conn:
+            return [dict(linha) for linha in conn.execute(f"SELECT * FROM tarefas{where} ORDER BY id", parametros)]
+
+    def remover_antigas(self, antes_de):
+        """Remove tarefas terminadas antes do instante; retorna os arquivos que elas geraram"""
+        with self._conectar() as conn:
+            linhas = conn.execute("""
+                SELECT id, arquivo FROM tarefas WHERE estado NOT IN ('pendente', 'executando') AND criada_em < ?
+            """, (antes_de,)).fetchall()
+            conn.executemany("DELETE FROM tarefas WHERE id = ?", [(linha['id'],) for linha in linhas])
+        return [linha['arquivo'] for linha in linhas if linha['arquivo']]
+
+
+def executar_tarefa(db_path, tarefa_id):
+    """Corpo de uma tarefa, executado em um processo do pool: gera o arquivo e registra o resultado"""
+    caminho_estado, pasta = caminho_tarefas(db_path)
+    estado = EstadoTarefas(caminho_estado)
+    tarefa = estado.get_tarefa(tarefa_id)
+    estado.atualizar(tarefa_id, estado="executando", iniciada_em=time.time())
+    try:
+        db = DatabaseManager(db_path).somente_leitura()
+        df = RELATORIOS[tarefa['relatorio']].funcao(db, **json.loads(tarefa['parametros']))
+        os.makedirs(pasta, exist_ok=True)
+        arquivo = os.path.join(pasta, f"{tarefa_id}.{tarefa['formato']}")
+        temporario = f"{arquivo}.tmp"
+        if tarefa['formato'] == "json":
+            df.to_json(temporario, orient="records", date_format="iso", force_ascii=False)
+        else:
+            df.to_csv(temporario, index=False)
+        os.replace(temporario, arquivo)
+    except Exception as erro:
+        estado.atualizar(tarefa_id, estado="erro", concluida_em=time.time(), erro=f"{type(erro).__name__}: {erro}")
+        raise
+    estado.atualizar(tarefa_id, estado="concluida", concluida_em=time.time(), arquivo=arquivo, linhas=len(df))
+    return tarefa_id
+
+
+class FilaRelatorios:
+    """Enfileira relatórios no pool de processos e acompanha o estado deles (uma fila por banco e processo)"""
+
+    def __init__(self, db, workers=WORKERS_PADRAO, dias=DIAS_PADRAO):
+        self.db = db.somente_leitura()
+        self.db_path = db.db_path
+        caminho_estado, self.pasta = caminho_tarefas(db.db_path)
+        self.estado = EstadoTarefas(caminho_estado)
+        self.workers = workers
+        self._trava = threading.Lock()
+        self._executor = None
+        self._ouvintes = []
+        self.limpar(dias)
+        # Tarefas interrompidas por um restart voltam para a fila
+        for tarefa in self.estado.get_tarefas(estados=ATIVAS):
+            self.estado.atualizar(tarefa['id'], estado="pendente", iniciada_em=None)
+            self._submeter(tarefa['id'])
+
+    def _submeter(self, tarefa_id):
+        with self._trava:
+            try:
+                futuro = self._submeter_no_pool(tarefa_id)
+            except BrokenProcessPool:
+                # Um processo do pool morreu: as próximas tarefas vão para um pool novo
+                self._executor = None
+                futuro = self._submeter_no_pool(tarefa_id)
+        futuro.add_done_callback(lambda futuro: self._concluida(tarefa_id, futuro))
+
+    def _submeter_no_pool(self, tarefa_id):
+        if self._executor is None:
+            self._executor = pool_processos(self.workers)
+        return self._executor.submit(executar_tarefa, self.db_path, tarefa_id)
+
+    def _concluida(self, tarefa_id, futuro):
+        if futuro.exception() is not None and self.estado.get_tarefa(tarefa_id)['estado'] in ATIVAS:
+            # O processo morreu antes de registrar o erro
+            self.estado.atualizar(tarefa_id, estado="erro", concluida_em=time.time(), erro=repr(futuro.exception()))
+        tarefa = self.estado.get_tarefa(tarefa_id)
+        for ouvinte in list(self._ouvintes):
+            ouvinte(tarefa)
+
+    def ao_concluir(self, ouvinte):
+        """Chama ouvinte(tarefa) na thread do pool sempre que uma tarefa terminar (com sucesso ou erro)"""
+        self._ouvintes.append(ouvinte)
+
+    def enfileirar(self, relatorio, parametros, formato="csv"):
+        """Enfileira o relatório; retorna (tarefa_id, nova). Pedido igual sobre os mesmos dados reaproveita a tarefa"""
+        if relatorio not in RELATORIOS:
+            raise ValueError(f"Relatório desconhecido: {relatorio}")
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconhecido: {formato}")
+        parametros = json.dumps(parametros, sort_keys=True, default=str, ensure_ascii=False)
+        versoes = self.db.get_versoes_dados(RELATORIOS[relatorio].tabelas)
+        chave = hashlib.sha256(json.dumps([relatorio, parametros, formato, versoes]).encode("utf-8")).hexdigest()
+        tarefa_id, nova = self.estado.criar_ou_reaproveitar(chave, relatorio, parametros, formato)
+        if nova:
+            self._submeter(tarefa_id)
+        return tarefa_id, nova
+
+    def get_tarefa(self, tarefa_id):
+        return self.estado.get_tarefa(tarefa_id)
+
+    def get_tarefas(self, ids=None):
+        return self.estado.get_tarefas(ids)
+
+    def aguardar(self, tarefa_id, timeout=None, intervalo=0.2):
+        """Espera a tarefa terminar e retorna o estado final (ou o atual, se o tempo acabar)"""
+        limite = time.time() + timeout if timeout is not None else None
+        while True:
+            tarefa = self.estado.get_tarefa(tarefa_id)
+            if tarefa['estado'] not in ATIVAS or (limite is not None and time.time() >= limite):
+                return tarefa
+            time.sleep(intervalo)
+
+    def limpar(self, dias=DIAS_PADRAO):
+        """Remove tarefas terminadas há mais de `dias` dias e os arquivos delas"""
+        for arquivo in self.estado.remover_antigas(time.time() - dias * 86400):
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
+
+    def encerrar(self):
+        with self._trava:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("relatorio", choices=sorted(RELATORIOS))
+    parser.add_argument("--banco", default="cmms_andaimes.db")
+    parser.add_argument("--parametros", default="{}", help="Parâmetros do relatório em JSON")
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    args = parser.parse_args(argv)
+
+    fila = FilaRelatorios(DatabaseManager(args.banco), workers=1)
+    tarefa_id, nova = fila.enfileirar(args.relatorio, json.loads(args.parametros), args.formato)
+    tarefa = fila.aguardar(tarefa_id)
+    fila.encerrar()
+    print(json.dumps(dict(tarefa, reaproveitada=not nova), ensure_ascii=False, indent=2))
+    return 0 if tarefa['estado'] == "concluida" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from database import TIPOS_MOVIMENTACAO, ENVIO, RETORNO, MANUTENCAO, RETORNO_MANUTENCAO, PERDA, RETORNO_PERDA
+from disk_cache import cache_persistente
+
+# Situações com saldo acumulado; "ocioso" é o restante do estoque
+SITUACOES = ["em_obra", "manutencao", "perdido"]
+ROTULOS_SITUACAO = {"em_obra": "Em obra", "manutencao": "Em manutenção", "perdido": "Perdido", "ocioso": "Ocioso"}
+
+# tipo_id -> (coluna da situação, sinal); transferências entre depósitos não mudam a situação
+EFEITO_TIPO = {
+    ENVIO: (0, 1), RETORNO: (0, -1),
+    MANUTENCAO: (1, 1), RETORNO_MANUTENCAO: (1, -1),
+    PERDA: (2, 1), RETORNO_PERDA: (2, -1),
+}
+
+# Granularidade do gráfico -> regra de reamostragem do pandas
+GRANULARIDADES = {"Dia": None, "Semana": "W-MON", "Mês": "MS"}
+
+
+def saldos_diarios(linhas, dia_fim):
+    """Saldo por situação ao fim de cada dia a partir das linhas (dia, tipo_id, quantidade).
+
+    Retorna (primeiro_dia, matriz dias x 3) com uma soma acumulada vetorizada por coluna.
+    """
+    if not linhas:
+        return dia_fim, np.zeros((1, len(SITUACOES)), dtype=np.int64)
+    dados = np.array(linhas, dtype=np.int64)
+    dia, tipo, quantidade = dados[:, 0], dados[:, 1], dados[:, 2]
+
+    coluna = np.full(len(TIPOS_MOVIMENTACAO) + 1, -1, dtype=np.int64)
+    sinal = np.zeros(len(TIPOS_MOVIMENTACAO) + 1, dtype=np.int64)
+    for tipo_id, (indice, fator) in EFEITO_TIPO.items():
+        coluna[tipo_id], sinal[tipo_id] = indice, fator
+
+    primeiro_dia = min(int(dia.min()), dia_fim)
+    total_dias = max(int(dia.max()), dia_fim) - primeiro_dia + 1
+    deltas = np.zeros((total_dias, len(SITUACOES)), dtype=np.int64)
+    np.add.at(deltas, (dia - primeiro_dia, coluna[tipo]), sinal[tipo] * quantidade)
+    return primeiro_dia, np.cumsum(deltas, axis=0)[:dia_fim - primeiro_dia + 1]
+
+
+@cache_persistente("equipamentos", "movimentacoes")
+def serie_utilizacao(db, equipamento_id=None, ate=None):
+    """Quantidades diárias em obra, em manutenção, perdidas e ociosas de um equipamento
+    (ou da frota inteira) desde a primeira movimentação até `ate` (padrão: hoje).
+
+    Usa o estoque atual como total de todos os dias (o cadastro não guarda histórico de estoque).
+    """
+    ate = ate or date.today()
+    dia_fim = (ate - date(1970, 1, 1)).days
+    primeiro_dia, saldos = saldos_diarios(db.get_quantidades_por_dia(equipamento_id), dia_fim)
+
+    serie = pd.DataFrame(saldos, columns=SITUACOES,
+                         index=pd.to_datetime(np.arange(primeiro_dia, dia_fim + 1), unit="D"))
+    serie.index.name = "data"
+    serie["estoque"] = db.get_estoque_total(equipamento_id)
+    serie["ocioso"] = (serie["estoque"] - serie[SITUACOES].sum(axis=1)).clip(lower=0)
+    return serie
+
+
+def utilizacao(db, data_inicio, data_fim, equipamento_id=None, granularidade="Dia"):
+    """Frações do estoque em cada situação no período, reamostradas por dia, semana ou mês (média)"""
+    serie = serie_utilizacao(db, equipamento_id, max(data_fim, date.today()))
+    serie = serie.loc[pd.Timestamp(data_inicio):pd.Timestamp(data_fim)]
+    regra = GRANULARIDADES[granularidade]
+    if regra is not None and not serie.empty:
+        serie = serie.resample(regra, label="left", closed="left").mean()
+
+    estoque = serie["estoque"].where(serie["estoque"] > 0)
+    fracoes = serie[SITUACOES + ["ocioso"]].div(estoque, axis=0).fillna(0.0)
+    return fracoes.rename(columns=ROTULOS_SITUACAO)